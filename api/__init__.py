@@ -4,6 +4,12 @@
 # 导演规划层(director_planner) + 角色演出层(character_actor) + 故事规划层(story_planner)
 # 固定事件管理器(fixed_event_manager)
 # 【v9新增】世界观加载器(world_loader) + 事件树引擎(event_tree_engine) + 场景验证器(scene_validator)
+# Prompt缓存(prompt_cache) + 场景预取器(scene_prefetcher) + LLM网关(llm_gateway)
+# 世界状态存储(world_state) + 条件语言(conditions) + 角色注册表(character_registry)
+# 关键词扫描器(pattern_scanner) + 紧凑输出格式(compact_schema) + 日文台词按需生成(jp_translator)
+# 响应缓存(response_cache) + LLM 传输层(llm_transport: live / record / replay / synthetic)
+# 本地模拟 LLM 服务器(stub_server) + LLM 请求调度器(llm_scheduler: 优先级 / 会话轮转 / 令牌桶)
+# API Key 池(key_pool: 最少在途分流 / 限流冷却 / 故障转移)
 # ============================================================================
 
 from .director_planner import DirectorPlanner, ScenePlan, Beat
@@ -16,6 +22,48 @@ from .world_loader import WorldLoader, get_world_loader
 from .event_tree_engine import EventTreeEngine, DayPlan, TriggerResult, ArcUpdate
 from .scene_validator import SceneValidator, ValidationResult
 
+# 世界状态
+from .world_state import WorldState, get_world_state
+
+# 条件语言
+from .conditions import ConditionState, CompiledCondition, compile_condition
+
+# 角色注册表
+from .character_registry import CharacterRegistry, PersonaCard, get_character_registry
+
+# 关键词扫描
+from .pattern_scanner import PatternScanner, ScanResult, Hit, get_dialogue_scanner
+
+# 紧凑输出格式
+from .compact_schema import build_cast, expand_scene_dialogue, expand_scene_plan
+
+# 日文台词按需生成
+from .jp_translator import JapaneseTranslator, get_jp_translator
+
+# 响应缓存
+from .response_cache import ResponseCache, get_response_cache
+
+# LLM 网关
+from .llm_gateway import LLMGateway, Completion, get_gateway
+from .llm_scheduler import LLMScheduler, RequestCancelled, llm_request
+from .key_pool import KeyPool
+
+# LLM 传输层
+from .llm_transport import Transport, ReplayMissError, create_transport
+from .stub_server import StubLLMServer
+
+# Prompt 缓存
+from .prompt_cache import (
+    PromptCacheStats, PromptCacheHeartbeat,
+    get_prompt_cache_stats, get_prompt_cache_heartbeat
+)
+
+# 场景预取
+from .scene_prefetcher import ScenePrefetcher, PrefetchedScene
+
+# NPC 角色表
+from .npc_table import NPCTable, NPCMovement
+
 __all__ = [
     # 导演规划层
     'DirectorPlanner',
@@ -40,5 +88,55 @@ __all__ = [
     'TriggerResult',
     'ArcUpdate',
     'SceneValidator',
-    'ValidationResult'
+    'ValidationResult',
+    # 世界状态
+    'WorldState',
+    'get_world_state',
+    # 条件语言
+    'ConditionState',
+    'CompiledCondition',
+    'compile_condition',
+    # 角色注册表
+    'CharacterRegistry',
+    'PersonaCard',
+    'get_character_registry',
+    # 关键词扫描
+    'PatternScanner',
+    'ScanResult',
+    'Hit',
+    'get_dialogue_scanner',
+    # 紧凑输出格式
+    'build_cast',
+    'expand_scene_dialogue',
+    'expand_scene_plan',
+    # 日文台词按需生成
+    'JapaneseTranslator',
+    'get_jp_translator',
+    # 响应缓存
+    'ResponseCache',
+    'get_response_cache',
+    # LLM 网关
+    'LLMGateway',
+    'Completion',
+    'get_gateway',
+    'LLMScheduler',
+    'RequestCancelled',
+    'llm_request',
+    'KeyPool',
+    # LLM 传输层
+    'Transport',
+    'ReplayMissError',
+    'create_transport',
+    'StubLLMServer',
+    # Prompt 缓存
+    'PromptCacheStats',
+    'PromptCacheHeartbeat',
+    'get_prompt_cache_stats',
+    'get_prompt_cache_heartbeat',
+    # 场景预取
+    'ScenePrefetcher',
+    'PrefetchedScene',
+    # NPC 角色表
+    'NPCTable',
+    'NPCMovement'
 ]
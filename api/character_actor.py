@@ -9,25 +9,47 @@
 # 5. 【v10新增】空内容检测+重试、幻觉角色名修正、地点一致性验证
 # ============================================================================
 
-import anthropic
+import copy
 import json
-import yaml
 import re
 import random
+import threading
+import time
+import contextvars
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Iterator
 from dataclasses import dataclass, field
 import sys
 
 # 添加父目录到路径以导入config
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from config import get_api_key, MODEL, MAX_TOKENS
+from config import MODEL, MAX_TOKENS, LLM_MAX_CONTINUATIONS, COMPACT_OUTPUT, LAZY_JP
 
 # 导入Beat类型
 from .director_planner import Beat, ScenePlan
 
 # 导入公共工具函数
-from .utils import parse_json_with_diagnostics
+from .utils import parse_json_with_diagnostics, StreamingJSONScanner
+from .world_loader import get_world_loader
+from .llm_gateway import get_gateway, continuation_messages
+from .llm_scheduler import llm_request, current_priority
+from .world_state import WorldState, get_world_state
+from .world_bundle import get_world_bundle
+from .character_registry import get_character_registry
+from .pattern_scanner import get_dialogue_scanner
+from .compact_schema import (
+    ACTOR_FORMAT, ACTOR_FORMAT_CN, build_cast, format_cast,
+    expand_scene_dialogue, expand_line, expand_beat
+)
+from .prompt_cache import (
+    build_cached_system, format_world_rules,
+    get_prompt_cache_stats, get_prompt_cache_heartbeat
+)
+
+# 空 Beat 修复时每个 Beat 的输出 token 上限
+REPAIR_TOKENS_PER_BEAT = 1024
 
 
 # ============================================================================
@@ -58,6 +80,33 @@ class ChoiceResponse:
     effects: Dict[str, Any]
 
 
+class PendingChoiceResponses(Mapping):
+    """
+    预选回应的延迟结果 - 与场景对话并发生成
+
+    用法与 Dict[str, ChoiceResponse] 相同；第一次读取（in / [] / 遍历）时才等待生成完成，
+    所以只要在选择点之前完成，玩家就不会感到等待。
+    """
+
+    def __init__(self, future: Future):
+        self._future = future
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def _resolve(self) -> Dict[str, ChoiceResponse]:
+        return self._future.result()
+
+    def __getitem__(self, choice_id: str) -> ChoiceResponse:
+        return self._resolve()[choice_id]
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self) -> int:
+        return len(self._resolve())
+
+
 # ============================================================================
 # 工具函数
 # ============================================================================
@@ -67,8 +116,7 @@ def load_json(filepath: str) -> dict:
         return json.load(f)
 
 def load_yaml(filepath: str) -> dict:
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    return get_world_bundle().load_yaml(filepath)
 
 
 
@@ -135,18 +183,31 @@ class CharacterActor:
         "走廊": ["书架", "餐桌", "牢房里", "庭院里", "花草"],
     }
 
-    def __init__(self, project_root: Path = None):
-        self.client = anthropic.Anthropic(api_key=get_api_key("character"))
+    def __init__(self, project_root: Path = None, world_state: WorldState = None):
+        self.gateway = get_gateway()
         self.project_root = project_root or Path(__file__).parent.parent
+        self.world_state = world_state or get_world_state(self.project_root)
         self.prompt_template = self._load_prompt_template()
-        self._character_cache = {}  # 角色数据缓存
+        self.characters = get_character_registry(self.project_root)  # 角色数据（进程内共享）
+        self.scanner = get_dialogue_scanner(self.project_root)  # 关键词校验（一行只扫一遍）
+        self.scanner.register("hallucination", self.HALLUCINATION_PATTERNS)
+        self.scanner.register_many("location_conflict", self.LOCATION_CONFLICTS)
+        self._static_system = None  # 静态 system 块（prompt 缓存前缀）
+        self.compact_output = COMPACT_OUTPUT  # 整场对话使用紧凑输出格式
+        self.lazy_jp = LAZY_JP  # 整场对话只生成中文，日文由 JapaneseTranslator 按需生成
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ChoiceResponses")  # 预选回应并发生成
+
+    def for_world(self, world_state: WorldState) -> "CharacterActor":
+        """绑定到另一份世界状态（WorldSnapshot）的浅拷贝，场景预取在上面演出"""
+        view = copy.copy(self)
+        view.world_state = world_state
+        return view
 
     def _load_prompt_template(self) -> str:
         """加载prompt模板"""
         prompt_path = self.project_root / "prompts" / "character_actor_prompt.txt"
         if prompt_path.exists():
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            return get_world_bundle(self.project_root).read_text(prompt_path)
         return self._get_default_prompt()
 
     def _get_default_prompt(self) -> str:
@@ -171,36 +232,13 @@ class CharacterActor:
 """
 
     def load_character_data(self, char_id: str) -> Dict:
-        """加载角色数据（带缓存）"""
-        if char_id in self._character_cache:
-            return self._character_cache[char_id]
-
-        char_path = self.project_root / "characters" / char_id
-
-        try:
-            core = load_yaml(char_path / "core.yaml")
-            personality = load_yaml(char_path / "personality.yaml")
-            speech = load_yaml(char_path / "speech.yaml")
-
-            data = {
-                "core": core,
-                "personality": personality,
-                "speech": speech
-            }
-            self._character_cache[char_id] = data
-            return data
-        except Exception as e:
-            print(f"[CharacterActor] 加载角色数据失败 {char_id}: {e}")
-            return {
-                "core": {"name": {"zh": char_id}},
-                "personality": {"versions": {"simple": "性格未知"}},
-                "speech": {"first_person": "我", "verbal_tics": []}
-            }
+        """加载角色数据（角色注册表，进程内只读一次）"""
+        return self.characters.get(char_id)
 
     def load_character_state(self, char_id: str) -> Dict:
         """加载角色当前状态"""
         try:
-            states = load_json(self.project_root / "world_state" / "character_states.json")
+            states = self.world_state.get("character_states")
             return states.get(char_id, {
                 "stress": 50,
                 "madness": 0,
@@ -248,7 +286,8 @@ class CharacterActor:
 
         # 调用API
         try:
-            response = self.client.messages.create(
+            response = self.gateway.create(
+                "character",
                 model=MODEL,
                 max_tokens=MAX_TOKENS,
                 messages=[{"role": "user", "content": prompt}]
@@ -288,23 +327,30 @@ class CharacterActor:
             char_state
         )
 
+        completion = None
         try:
-            response = self.client.messages.create(
+            completion = self.gateway.create_text(
+                "character",
                 model=MODEL,
                 max_tokens=MAX_TOKENS,
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": prompt}],
+                cache="choice_responses"
             )
+            for response in completion.responses:
+                get_prompt_cache_stats().record("CharacterActor.choice", response)
 
-            raw_text = response.content[0].text
+            raw_text = completion.text
             # 使用公共函数解析 JSON（三次尝试：原始→清理→修复）
             result = parse_json_with_diagnostics(raw_text, "选项回应", "CharacterActor")
             return self._parse_choice_responses(result)
 
         except json.JSONDecodeError as e:
             print(f"[CharacterActor] JSON 解析最终失败，使用回退回应")
+            self.gateway.forget(completion)
             return self._create_fallback_responses(choice_point, main_char)
         except Exception as e:
             print(f"[CharacterActor] 预生成回应失败: {type(e).__name__}: {e}")
+            self.gateway.forget(completion)
             return self._create_fallback_responses(choice_point, main_char)
 
     def _build_actor_prompt(self, beat: Beat, characters_info: Dict) -> str:
@@ -530,6 +576,55 @@ class CharacterActor:
 
         return empty
 
+    def _repair_empty_beats(
+        self,
+        scene_plan: ScenePlan,
+        characters_info: Dict,
+        outputs: List[DialogueOutput],
+        empty_beats: List[str]
+    ) -> List[DialogueOutput]:
+        """
+        只为空 Beat 重新生成对话，合并回整场结果
+
+        prompt 只包含这些 Beat 的大纲和相邻 Beat 的摘要，max_tokens 按 Beat 数计算，
+        重试的开销与出错的 Beat 数成正比，而不是整个场景。
+        """
+        indices = [i for i, output in enumerate(outputs) if output.beat_id in empty_beats]
+        if not indices:
+            return outputs
+
+        system, prompt = self._build_beat_repair_prompt(scene_plan, characters_info, outputs, indices)
+        print(f"  [CharacterActor] 正在重新生成 {len(indices)} 个 Beat 的对话...")
+        completion = self.gateway.create_text(
+            "character",
+            model=MODEL,
+            max_tokens=min(4096, REPAIR_TOKENS_PER_BEAT * len(indices)),
+            system=system,
+            messages=[{"role": "user", "content": prompt}],
+            cache="beat_repair"
+        )
+        for response in completion.responses:
+            get_prompt_cache_stats().record("CharacterActor", response)
+
+        result = parse_json_with_diagnostics(completion.text, "空 Beat 修复", "CharacterActor")
+        result = self._expand_scene_result(result, characters_info)
+        beats_data = [b for b in result.get("beats", []) if isinstance(b, dict)]
+        by_id = {b.get("beat_id"): b for b in beats_data}
+
+        merged = list(outputs)
+        for n, i in enumerate(indices):
+            beat = scene_plan.beats[i]
+            # 按 beat_id 对应；模型没写 beat_id 时按顺序对应
+            beat_data = by_id.get(beat.beat_id) or (beats_data[n] if n < len(beats_data) else None)
+            if beat_data is None:
+                continue
+            merged[i] = DialogueOutput(
+                beat_id=beat.beat_id,
+                dialogue=[self._parse_dialogue_line(line) for line in beat_data.get("dialogue", [])],
+                effects=beat_data.get("effects", {})
+            )
+        return merged
+
     def _fill_empty_beats_with_fallback(
         self,
         outputs: List[DialogueOutput],
@@ -626,14 +721,12 @@ class CharacterActor:
 
     def _validate_character_names(self, text: str) -> Tuple[bool, List[str]]:
         """检查文本中是否有无效角色名"""
-        invalid_names = []
-        for pattern in self.HALLUCINATION_PATTERNS:
-            if pattern in text:
-                invalid_names.append(pattern)
+        invalid_names = self.scanner.scan(text).keywords("hallucination")
         return len(invalid_names) == 0, invalid_names
 
-    def _fix_invalid_names(self, text: str, context_characters: List[str]) -> str:
-        """替换无效角色名为上下文中的有效角色"""
+    def _fix_invalid_names(self, text: str, context_characters: List[str],
+                           invalid_names: List[str] = None) -> str:
+        """替换无效角色名为上下文中的有效角色（invalid_names 为已扫描出的名字）"""
         # 获取上下文角色的名字
         valid_replacements = []
         for char_id in context_characters:
@@ -645,11 +738,12 @@ class CharacterActor:
             valid_replacements = ["某人", "那个人", "她"]
 
         # 替换无效名字
+        if invalid_names is None:
+            invalid_names = self._validate_character_names(text)[1]
         result = text
-        for pattern in self.HALLUCINATION_PATTERNS:
-            if pattern in result:
-                replacement = random.choice(valid_replacements + ["她", "那个人"])
-                result = result.replace(pattern, replacement)
+        for pattern in invalid_names:
+            replacement = random.choice(valid_replacements + ["她", "那个人"])
+            result = result.replace(pattern, replacement)
 
         return result
 
@@ -672,11 +766,7 @@ class CharacterActor:
 
     def _validate_location_consistency(self, text: str, target_location: str) -> Tuple[bool, List[str]]:
         """检查文本是否与目标地点一致"""
-        conflicts = self.LOCATION_CONFLICTS.get(target_location, [])
-        found_conflicts = []
-        for conflict_word in conflicts:
-            if conflict_word in text:
-                found_conflicts.append(conflict_word)
+        found_conflicts = self.scanner.scan(text).keywords(f"location_conflict:{target_location}")
         return len(found_conflicts) == 0, found_conflicts
 
     def _fix_location_references(self, text: str, correct_location: str) -> str:
@@ -707,85 +797,105 @@ class CharacterActor:
         """验证并修正对话内容"""
         for output in outputs:
             for line in output.dialogue:
-                # 1. 验证说话者
-                line.speaker = self._validate_speaker(line.speaker)
+                self._validate_and_fix_line(line, scene_characters, location)
+
+        return outputs
+
+    def _validate_and_fix_line(
+        self,
+        line: DialogueLine,
+        scene_characters: List[str],
+        location: str
+    ) -> DialogueLine:
+        """验证并修正单行对话（流式模式下逐行调用）"""
+        # 1. 验证说话者
+        line.speaker = self._validate_speaker(line.speaker)
 
-                # 2. 检查幻觉角色名
-                is_valid, invalid_names = self._validate_character_names(line.text_cn)
-                if not is_valid:
-                    print(f"⚠️ 检测到幻觉角色名: {invalid_names}")
-                    line.text_cn = self._fix_invalid_names(line.text_cn, scene_characters)
+        # 一次扫描同时得到幻觉角色名和地点冲突词
+        # （替换用的都是有效角色名/代词，不会引入新的冲突词）
+        result = self.scanner.scan(line.text_cn)
 
-                # 3. 检查地点一致性
-                is_valid, conflicts = self._validate_location_consistency(line.text_cn, location)
-                if not is_valid:
-                    print(f"⚠️ 检测到地点冲突: {conflicts}（当前地点：{location}）")
-                    line.text_cn = self._fix_location_references(line.text_cn, location)
+        # 2. 检查幻觉角色名
+        invalid_names = result.keywords("hallucination")
+        if invalid_names:
+            print(f"⚠️ 检测到幻觉角色名: {invalid_names}")
+            line.text_cn = self._fix_invalid_names(line.text_cn, scene_characters, invalid_names)
 
-        return outputs
+        # 3. 检查地点一致性
+        conflicts = result.keywords(f"location_conflict:{location}")
+        if conflicts:
+            print(f"⚠️ 检测到地点冲突: {conflicts}（当前地点：{location}）")
+            line.text_cn = self._fix_location_references(line.text_cn, location)
+
+        return line
 
     def generate_scene_dialogue(
         self,
         scene_plan: ScenePlan
-    ) -> Tuple[List[DialogueOutput], Optional[Dict[str, ChoiceResponse]]]:
+    ) -> Tuple[List[DialogueOutput], Optional[PendingChoiceResponses]]:
         """
         一次性生成整个场景的所有对话和预选回应（优化延迟）
 
         输入：ScenePlan（包含所有 Beat）
-        输出：Tuple[List[DialogueOutput], Optional[Dict[str, ChoiceResponse]]]
+        输出：Tuple[List[DialogueOutput], Optional[PendingChoiceResponses]]
             - 整场景的对话列表
-            - 预选回应字典（如果有选择点），否则为 None
+            - 预选回应（如果有选择点），否则为 None
+              与对话并发生成，首次读取时才等待，调用方请用 `is not None` 判断
         """
         if not scene_plan.beats:
             return [], None
 
-        # 收集所有角色信息
-        all_characters = set()
-        for beat in scene_plan.beats:
-            all_characters.update(beat.characters)
+        # ★ 选项在 ScenePlan 中已确定，预选回应与整场对话并发生成
+        choice_responses = self.start_choice_responses(scene_plan)
 
-        characters_info = {}
-        for char_id in all_characters:
-            char_data = self.load_character_data(char_id)
-            char_state = self.load_character_state(char_id)
-            characters_info[char_id] = {
-                "name": char_data["core"].get("name", {}).get("zh", char_id),
-                "personality": char_data["personality"].get("versions", {}).get("simple", ""),
-                "first_person": char_data["speech"].get("first_person", "我"),
-                "verbal_tics": char_data["speech"].get("verbal_tics", [])[:3],
-                "stress": char_state.get("stress", 50),
-                "emotion": char_state.get("emotion", "neutral")
-            }
+        # 收集所有角色信息
+        all_characters = self._collect_scene_characters(scene_plan)
+        characters_info = self._build_scene_characters_info(all_characters)
 
-        # 构建整场景的 prompt
-        prompt = self._build_scene_prompt(scene_plan, characters_info)
+        # 构建整场景的 prompt（静态 system 块 + 动态 user 块）
+        system, prompt = self._build_scene_prompt(scene_plan, characters_info)
 
-        # 单次 API 调用生成对话（带重试）
+        # 单次 API 调用生成对话；之后的重试只重新生成空 Beat（带重试）
         dialogue_outputs = []
         max_retries = 2
         scene_characters = list(all_characters)
 
         for attempt in range(max_retries + 1):
             try:
-                print(f"  [CharacterActor] 正在生成 {len(scene_plan.beats)} 个 Beat 的对话...")
-                response = self.client.messages.create(
-                    model=MODEL,
-                    max_tokens=4096,  # 增大 token 限制以容纳整场对话
-                    messages=[{"role": "user", "content": prompt}]
-                )
-
-                raw_text = response.content[0].text
-                print(f"  [CharacterActor] 对话生成完成 (响应长度: {len(raw_text)} 字符)")
-
-                # 解析整场对话
-                result = parse_json_with_diagnostics(raw_text, "场景对话", "CharacterActor")
-                dialogue_outputs = self._parse_scene_dialogue(result, scene_plan.beats)
+                if not dialogue_outputs:
+                    print(f"  [CharacterActor] 正在生成 {len(scene_plan.beats)} 个 Beat 的对话...")
+                    # 输出达到 max_tokens 时由网关续写，拼接后再解析
+                    completion = self.gateway.create_text(
+                        "character",
+                        model=MODEL,
+                        max_tokens=4096,  # 增大 token 限制以容纳整场对话
+                        system=system,
+                        messages=[{"role": "user", "content": prompt}],
+                        cache="scene_dialogue"
+                    )
+                    for response in completion.responses:
+                        get_prompt_cache_stats().record("CharacterActor", response)
+                    get_prompt_cache_heartbeat().register("CharacterActor", "character", system)
+
+                    raw_text = completion.text
+                    print(f"  [CharacterActor] 对话生成完成 (响应长度: {len(raw_text)} 字符"
+                          f"{f'，续写 {completion.continuations} 次' if completion.continuations else ''})")
+
+                    # 解析整场对话
+                    result = parse_json_with_diagnostics(raw_text, "场景对话", "CharacterActor")
+                    result = self._expand_scene_result(result, characters_info)
+                    dialogue_outputs = self._parse_scene_dialogue(result, scene_plan.beats)
+                else:
+                    # 只重新生成空 Beat，已成功的 Beat 原样保留
+                    dialogue_outputs = self._repair_empty_beats(
+                        scene_plan, characters_info, dialogue_outputs, empty_beats
+                    )
 
                 # 【v10新增】验证空内容
                 empty_beats = self._check_empty_beats(dialogue_outputs)
                 if empty_beats:
                     if attempt < max_retries:
-                        print(f"⚠️ 检测到 {len(empty_beats)} 个空 Beat，重试中... ({attempt+1}/{max_retries})")
+                        print(f"⚠️ 检测到 {len(empty_beats)} 个空 Beat，只重新生成这些 Beat... ({attempt+1}/{max_retries})")
                         continue  # 重试
                     else:
                         print(f"⚠️ 重试后仍有空 Beat，使用回退内容填充")
@@ -801,29 +911,98 @@ class CharacterActor:
                 )
                 break  # 成功，跳出重试循环
 
-            except json.JSONDecodeError as e:
-                print(f"[CharacterActor] JSON 解析失败，使用回退对话")
-                dialogue_outputs = self._create_fallback_scene_dialogue(scene_plan.beats, characters_info)
-                break
             except Exception as e:
-                print(f"[CharacterActor] API 调用失败: {type(e).__name__}: {e}")
-                dialogue_outputs = self._create_fallback_scene_dialogue(scene_plan.beats, characters_info)
+                if isinstance(e, json.JSONDecodeError):
+                    print(f"[CharacterActor] JSON 解析失败，使用回退对话")
+                else:
+                    print(f"[CharacterActor] API 调用失败: {type(e).__name__}: {e}")
+                if not dialogue_outputs:
+                    dialogue_outputs = self._create_fallback_scene_dialogue(scene_plan.beats, characters_info)
+                    break
+                # 修复空 Beat 时失败：保留已成功的 Beat，只有空 Beat 使用回退内容
+                dialogue_outputs = self._fill_empty_beats_with_fallback(
+                    dialogue_outputs, empty_beats, scene_plan.beats
+                )
+                dialogue_outputs = self._validate_and_fix_dialogue(
+                    dialogue_outputs, scene_characters, scene_plan.location
+                )
                 break
 
-        # ★ 新增：如果有选择点，同时生成预选回应
-        choice_responses = None
-        if scene_plan.player_choice_point:
-            print(f"  [CharacterActor] 正在生成预选回应...")
-            # 获取选择点后的主要角色
-            characters = self._get_choice_responders(scene_plan)
-            choice_responses = self.generate_choice_responses(
-                scene_plan.player_choice_point,
-                characters
-            )
-            print(f"  [CharacterActor] 预选回应生成完成")
-
         return dialogue_outputs, choice_responses
 
+    def start_choice_responses(self, scene_plan: ScenePlan) -> Optional[PendingChoiceResponses]:
+        """在后台开始生成选择点的预选回应（无选择点时返回 None）"""
+        if not scene_plan.player_choice_point:
+            return None
+
+        print(f"  [CharacterActor] 预选回应与对话并发生成中...")
+        # 获取选择点后的主要角色
+        characters = self._get_choice_responders(scene_plan)
+        # 复制当前上下文，让 usage 统计等上下文状态跟随到线程池
+        context = contextvars.copy_context()
+        # 玩家还没走到选择点：以 choice 优先级排队（预取中的仍按 speculative）
+        priority = "choice" if current_priority() == "interactive" else None
+        future = self._executor.submit(
+            context.run,
+            self._pregenerate_choice_responses,
+            scene_plan.player_choice_point,
+            characters,
+            priority
+        )
+        return PendingChoiceResponses(future)
+
+    def _pregenerate_choice_responses(self, choice_point: Dict, characters: List[str], priority: Optional[str]):
+        with llm_request(priority=priority):
+            return self.generate_choice_responses(choice_point, characters)
+
+    def close(self):
+        """关闭预选回应线程池（不等待进行中的任务）"""
+        self._executor.shutdown(wait=False)
+
+    def _collect_scene_characters(self, scene_plan: ScenePlan) -> List[str]:
+        """收集场景中出现的所有角色（按首次出场顺序，保证 prompt 每次相同）"""
+        all_characters = []
+        for beat in scene_plan.beats:
+            for char_id in beat.characters:
+                if char_id not in all_characters:
+                    all_characters.append(char_id)
+        return all_characters
+
+    def _build_scene_characters_info(self, characters) -> Dict:
+        """构建整场景 prompt 用的角色信息"""
+        characters_info = {}
+        for char_id in characters:
+            char_data = self.load_character_data(char_id)
+            char_state = self.load_character_state(char_id)
+            characters_info[char_id] = {
+                "name": char_data["core"].get("name", {}).get("zh", char_id),
+                "personality": char_data["personality"].get("versions", {}).get("simple", ""),
+                "first_person": char_data["speech"].get("first_person", "我"),
+                "verbal_tics": char_data["speech"].get("verbal_tics", [])[:3],
+                "stress": char_state.get("stress", 50),
+                "emotion": char_state.get("emotion", "neutral")
+            }
+        return characters_info
+
+    def stream_scene_dialogue(self, scene_plan: ScenePlan, jp_translator: Any = None) -> "DialogueStream":
+        """
+        【流式】生成整场景对话，逐行交付
+
+        与 generate_scene_dialogue 使用同一个 prompt，但以流的方式读取响应：
+        每当 beats[i].dialogue[j] 闭合就立即交付该行，玩家无需等待整场生成完毕。
+
+        Args:
+            scene_plan: 场景计划
+            jp_translator: 需要日文时传入 JapaneseTranslator——每个 Beat 结束就把该 Beat
+                缺日文的台词作为一批交给它在后台生成（LAZY_JP 模式下）
+
+        Returns:
+            DialogueStream（后台线程已启动）
+        """
+        stream = DialogueStream(self, scene_plan, jp_translator)
+        stream.start()
+        return stream
+
     def _get_choice_responders(self, scene_plan: ScenePlan) -> List[str]:
         """获取选择点的回应角色"""
         # 找到选择点之后的 beat，获取其角色
@@ -847,36 +1026,10 @@ class CharacterActor:
                     all_chars.append(char)
         return all_chars[:1] if all_chars else []
 
-    def _build_scene_prompt(self, scene_plan: ScenePlan, characters_info: Dict) -> str:
-        """构建整场景的 prompt（双语输出）"""
-
-        # 格式化角色信息（包含日文口癖）
-        chars_str = ""
-        for char_id, info in characters_info.items():
-            verbal_tics_jp = info.get('verbal_tics_jp', info['verbal_tics'])
-            chars_str += f"""
-【{info['name']}】({char_id})
-  性格: {info['personality'][:80]}
-  日文第一人称: 「{info['first_person']}」
-  日文口癖: {', '.join(verbal_tics_jp) if verbal_tics_jp else '无'}
-  口癖中文翻译: {', '.join(info['verbal_tics']) if info['verbal_tics'] else '无'}
-  当前情绪: {info['emotion']} | 压力: {info['stress']}/100
-"""
-
-        # 格式化 Beat 列表
-        beats_str = ""
-        for i, beat in enumerate(scene_plan.beats, 1):
-            emotion_targets_str = ", ".join([f"{k}→{v}" for k, v in beat.emotion_targets.items()])
-            beats_str += f"""
-Beat {i} ({beat.beat_id}): {beat.beat_type}
-  描述: {beat.description}
-  角色: {', '.join(beat.characters)}
-  说话顺序: {' → '.join(beat.speaker_order)}
-  情绪目标: {emotion_targets_str}
-  张力等级: {beat.tension_level}/10
-  对话数: {beat.dialogue_count}行
-  导演指示: {beat.direction_notes}
-"""
+    def _get_static_system(self) -> Any:
+        """静态 system 块：白名单 + 背景 + 全体角色档案 + 输出语言要求 + 输出格式（回合间不变，可缓存）"""
+        if self._static_system is not None:
+            return self._static_system
 
         # 输出格式（双语）
         output_format = """{
@@ -897,59 +1050,58 @@ Beat {i} ({beat.beat_id}): {beat.beat_type}
   ]
 }"""
 
-        # 【v10新增】获取地点关键词
-        location = scene_plan.location
-        location_keywords = self.LOCATION_KEYWORDS.get(location, [])
-        location_conflicts = self.LOCATION_CONFLICTS.get(location, [])
-
-        prompt = f"""你是一位专业的视觉小说对话编剧。根据导演的场景规划，一次性生成整个场景的所有对话。
+        intro = """你是一位专业的视觉小说对话编剧。根据导演的场景规划，一次性生成整个场景的所有对话。
 
 【重要：角色名白名单】
 本游戏只有13名角色：艾玛、希罗、安安、诺亚、蕾雅、米莉亚、玛尔戈、菜乃香、爱丽莎、雪莉、汉娜、可可、梅露露
 ❌ 禁止使用：美咲、亚美、千夏、真由、沙织、花子等任何其他名字
 ✅ 泛指他人时用：「她」「那个人」「某人」「其他人」
 
-【重要：地点一致性】
-当前地点是「{location}」，所有描写必须与此地点相关。
-✅ 应该出现的元素：{', '.join(location_keywords)}
-❌ 不应该出现：{', '.join(location_conflicts)}
-例如：如果在「走廊」，不要写"图书馆深处"或"书架旁边"
-
 【游戏背景】
-《魔法少女的魔女审判》- 13名少女被关在孤岛监牢的推理解谜游戏。
-
-【场景信息】
-场景名: {scene_plan.scene_name}
-地点: {location}（必须一致！）
-整体弧线: {scene_plan.overall_arc}
-Beat数量: {len(scene_plan.beats)}
-
-【参与角色】
-{chars_str}
+《魔法少女的魔女审判》- 13名少女被关在孤岛监牢的推理解谜游戏。"""
 
-【Beat大纲】
-{beats_str}
+        text_cn_rules = """   - 第一人称统一用「我」
+   - 口癖翻译成自然的中文表达
+   - 例：「我觉得...唔，怎么说呢...」"""
 
-【重要：双语输出要求】
+        if self.lazy_jp:
+            # 只生成中文：日文台词在显示/TTS 需要时由 JapaneseTranslator 另行生成
+            output_format = output_format.replace(
+                '          "text_jp": "日本語の台詞（一人称とキャラ口癖をそのまま保持）",\n', ''
+            )
+            language = f"""【输出语言】
+每句对话只输出中文 text_cn（不要输出 text_jp）：
+{text_cn_rules}"""
+            task = """为每个 Beat 生成对话。要求：
+1. 情绪按张力曲线自然变化
+2. 对话要连贯，前后 Beat 要有呼应
+3. 张力等级：1-3平静 / 4-5略紧张 / 6-7紧张 / 8-10激动
+4. 【重要】每个Beat必须有实质内容，不能只有"...\""""
+        else:
+            language = f"""【重要：双语输出要求】
 每句对话必须同时输出 text_cn 和 text_jp：
 
 1. text_cn（中文显示用）：
-   - 第一人称统一用「我」
-   - 口癖翻译成自然的中文表达
-   - 例：「我觉得...唔，怎么说呢...」
+{text_cn_rules}
 
 2. text_jp（日文TTS用）：
    - 保留角色原本的第一人称（私/俺/ウチ/あたし等）
    - 保留原汁原味的口癖
-   - 例：「あたしは...えっと、なんていうか...」
-
-【任务】
-为每个 Beat 生成双语对话。要求：
+   - 例：「あたしは...えっと、なんていうか...」"""
+            task = """为每个 Beat 生成双语对话。要求：
 1. 情绪按张力曲线自然变化
 2. 对话要连贯，前后 Beat 要有呼应
 3. 张力等级：1-3平静 / 4-5略紧张 / 6-7紧张 / 8-10激动
 4. 中日文内容要对应，但表达方式可以各自自然
-5. 【重要】每个Beat必须有实质内容，不能只有"..."
+5. 【重要】每个Beat必须有实质内容，不能只有"...\""""
+
+        if self.compact_output:
+            output_format = ACTOR_FORMAT_CN if self.lazy_jp else ACTOR_FORMAT
+
+        instructions = f"""{language}
+
+【任务】
+{task}
 
 【输出格式】严格 JSON：
 {output_format}
@@ -958,7 +1110,173 @@ Beat数量: {len(scene_plan.beats)}
 
 请直接输出JSON，不要使用markdown代码块。"""
 
-        return prompt
+        world_loader = get_world_loader(project_root=self.project_root)
+        self._static_system = build_cached_system(
+            intro,
+            format_world_rules(world_loader),
+            self.characters.cards_text(),
+            instructions
+        )
+        return self._static_system
+
+    def _build_scene_prompt(self, scene_plan: ScenePlan, characters_info: Dict) -> Tuple[Any, str]:
+        """
+        构建整场景的 prompt（双语输出；LAZY_JP 时只输出中文）
+
+        Returns:
+            (system, user)：system 为可缓存的静态块，user 为本场景的动态内容
+        """
+
+        # 格式化角色状态（性格/第一人称/口癖见 system 中的角色档案）
+        chars_str = ""
+        for char_id, info in characters_info.items():
+            chars_str += f"""
+【{info['name']}】({char_id})
+  当前情绪: {info['emotion']} | 压力: {info['stress']}/100
+"""
+
+        # 格式化 Beat 列表
+        beats_str = ""
+        for i, beat in enumerate(scene_plan.beats, 1):
+            beats_str += self._format_beat(i, beat)
+
+        location = scene_plan.location
+        # 结尾的要求与 system 中的 language / task 使用同一个开关，避免诱导模型输出 text_jp
+        closing = "请按 system 中的要求输出整场景的中文对话JSON（不要输出日文）。" if self.lazy_jp \
+            else "请按 system 中的要求输出整场景的双语对话JSON。"
+        prompt = f"""{self._location_guidance(location)}
+
+【场景信息】
+场景名: {scene_plan.scene_name}
+地点: {location}（必须一致！）
+整体弧线: {scene_plan.overall_arc}
+Beat数量: {len(scene_plan.beats)}
+
+【参与角色】
+{chars_str}
+{self._cast_line(characters_info)}
+
+【Beat大纲】
+{beats_str}
+
+{closing}"""
+
+        return self._get_static_system(), prompt
+
+    def _scene_cast(self, characters_info: Dict) -> List[str]:
+        """紧凑格式的角色序号表（prompt 与解码共用）"""
+        return build_cast(characters_info)
+
+    def _cast_line(self, characters_info: Dict) -> str:
+        """紧凑格式下 prompt 中的角色序号说明（详细格式时为空）"""
+        if not self.compact_output:
+            return ""
+        names = {char_id: info["name"] for char_id, info in characters_info.items()}
+        return format_cast(self._scene_cast(characters_info), names)
+
+    def _expand_scene_result(self, result: Dict, characters_info: Dict) -> Dict:
+        """紧凑格式 -> 详细格式（之后照常解析成 DialogueOutput）"""
+        if not self.compact_output:
+            return result
+        return expand_scene_dialogue(result, self._scene_cast(characters_info), bilingual=not self.lazy_jp)
+
+    def _format_beat(self, number: int, beat: Beat) -> str:
+        """Beat 大纲（整场 prompt 与空 Beat 修复 prompt 共用）"""
+        emotion_targets_str = ", ".join([f"{k}→{v}" for k, v in beat.emotion_targets.items()])
+        return f"""
+Beat {number} ({beat.beat_id}): {beat.beat_type}
+  描述: {beat.description}
+  角色: {', '.join(beat.characters)}
+  说话顺序: {' → '.join(beat.speaker_order)}
+  情绪目标: {emotion_targets_str}
+  张力等级: {beat.tension_level}/10
+  对话数: {beat.dialogue_count}行
+  导演指示: {beat.direction_notes}
+"""
+
+    def _location_guidance(self, location: str) -> str:
+        """【v10新增】地点一致性要求"""
+        location_keywords = self.LOCATION_KEYWORDS.get(location, [])
+        location_conflicts = self.LOCATION_CONFLICTS.get(location, [])
+        return f"""【重要：地点一致性】
+当前地点是「{location}」，所有描写必须与此地点相关。
+✅ 应该出现的元素：{', '.join(location_keywords)}
+❌ 不应该出现：{', '.join(location_conflicts)}
+例如：如果在「走廊」，不要写"图书馆深处"或"书架旁边\""""
+
+    def _summarize_beat(self, output: DialogueOutput, lines: int = 2) -> str:
+        """相邻 Beat 的摘要：最后几句台词"""
+        tail = [line for line in output.dialogue if line.text_cn and line.text_cn.strip()][-lines:]
+        if not tail:
+            return "（无对话）"
+        return " / ".join(f"{line.speaker}:「{line.text_cn.strip()}」" for line in tail)
+
+    def _build_beat_repair_prompt(
+        self,
+        scene_plan: ScenePlan,
+        characters_info: Dict,
+        outputs: List[DialogueOutput],
+        indices: List[int]
+    ) -> Tuple[Any, str]:
+        """
+        空 Beat 修复的 prompt：只含要重写的 Beat，以及前后 Beat 的摘要（保证衔接）
+
+        system 与整场 prompt 相同，可以命中同一份缓存。
+        """
+        characters = []
+        for i in indices:
+            for char_id in scene_plan.beats[i].characters:
+                if char_id in characters_info and char_id not in characters:
+                    characters.append(char_id)
+        chars_str = ""
+        for char_id in characters:
+            info = characters_info[char_id]
+            chars_str += f"""
+【{info['name']}】({char_id})
+  当前情绪: {info['emotion']} | 压力: {info['stress']}/100
+"""
+
+        beats_str = ""
+        for i in indices:
+            beat = scene_plan.beats[i]
+            if i > 0:
+                beats_str += f"\n（前一个 Beat {scene_plan.beats[i - 1].beat_id} 的结尾：{self._summarize_beat(outputs[i - 1])}）"
+            beats_str += self._format_beat(i + 1, beat)
+            if i + 1 < len(scene_plan.beats) and (i + 1) not in indices:
+                beats_str += f"（后一个 Beat {scene_plan.beats[i + 1].beat_id}：{scene_plan.beats[i + 1].description}）\n"
+
+        beat_ids = ", ".join(scene_plan.beats[i].beat_id for i in indices)
+        prompt = f"""{self._location_guidance(scene_plan.location)}
+
+【场景信息】
+场景名: {scene_plan.scene_name}
+地点: {scene_plan.location}（必须一致！）
+整体弧线: {scene_plan.overall_arc}
+
+【参与角色】
+{chars_str}
+{self._cast_line(characters_info)}
+
+【需要重写的 Beat】
+以下 Beat 的对话缺失，其余 Beat 已经完成。请只为这些 Beat 生成对话，并与前后内容自然衔接。
+{beats_str}
+
+请按 system 中的输出格式输出JSON，beats 中只包含：{beat_ids}（beat_id 保持不变）。"""
+
+        return self._get_static_system(), prompt
+
+    def _parse_dialogue_line(self, line: Dict) -> DialogueLine:
+        """解析单行对话（双语）"""
+        text_cn = line.get("text_cn", "...")
+        # 如果没有日文，使用中文；LAZY_JP 模式下留空，需要时由 JapaneseTranslator 生成
+        text_jp = line.get("text_jp", "" if self.lazy_jp else text_cn)
+        return DialogueLine(
+            speaker=line.get("speaker", "narrator"),
+            text_cn=text_cn,
+            text_jp=text_jp,
+            emotion=line.get("emotion", "neutral"),
+            action=line.get("action")
+        )
 
     def _parse_scene_dialogue(self, result: Dict, beats: List[Beat]) -> List[DialogueOutput]:
         """解析整场对话结果（双语）"""
@@ -968,17 +1286,7 @@ Beat数量: {len(scene_plan.beats)}
         for i, beat in enumerate(beats):
             if i < len(beats_data):
                 beat_data = beats_data[i]
-                dialogue = []
-                for line in beat_data.get("dialogue", []):
-                    text_cn = line.get("text_cn", "...")
-                    text_jp = line.get("text_jp", text_cn)  # 如果没有日文，使用中文
-                    dialogue.append(DialogueLine(
-                        speaker=line.get("speaker", "narrator"),
-                        text_cn=text_cn,
-                        text_jp=text_jp,
-                        emotion=line.get("emotion", "neutral"),
-                        action=line.get("action")
-                    ))
+                dialogue = [self._parse_dialogue_line(line) for line in beat_data.get("dialogue", [])]
                 all_dialogue.append(DialogueOutput(
                     beat_id=beat_data.get("beat_id", beat.beat_id),
                     dialogue=dialogue,
@@ -1002,6 +1310,218 @@ Beat数量: {len(scene_plan.beats)}
         return all_dialogue
 
 
+# ============================================================================
+# 流式场景对话
+# ============================================================================
+
+class DialogueStream:
+    """
+    流式场景对话 - 后台线程消费 API 流，按 Beat 逐行交付
+
+    用法：
+        stream = actor.stream_scene_dialogue(scene_plan)
+        for i, beat in enumerate(scene_plan.beats):
+            for line in stream.iter_beat(i):   # 行一闭合就交付
+                display_dialogue_line(line)
+            output = stream.beat_output(i)      # Beat 结束后的完整输出（含 effects）
+        outputs, choice_responses = stream.wait()
+
+    传入 jp_translator 时，每个 Beat 结束后该 Beat 的台词作为一批在后台生成日文，
+    显示时 jp_translator.get(line) 只等待这一批。
+
+    指标（stats）：
+        time_to_first_line: 从发起请求到第一行可显示的秒数
+        total_time: 整场生成耗时
+        line_count: 交付的对话行数
+    """
+
+    def __init__(self, actor: CharacterActor, scene_plan: ScenePlan, jp_translator: Any = None):
+        self.actor = actor
+        self.scene_plan = scene_plan
+        self.jp_translator = jp_translator
+        self.beats = scene_plan.beats
+        self.scene_characters = list(actor._collect_scene_characters(scene_plan))
+        self.characters_info = actor._build_scene_characters_info(self.scene_characters)
+
+        self._lines: List[List[DialogueLine]] = [[] for _ in self.beats]
+        self._effects: List[Dict] = [{} for _ in self.beats]
+        self._beat_done: List[bool] = [False] * len(self.beats)
+        self._outputs: List[Optional[DialogueOutput]] = [None] * len(self.beats)
+        self._choice_responses: Optional[PendingChoiceResponses] = None
+        self._done = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+
+        self.stats = {"time_to_first_line": None, "total_time": None, "line_count": 0}
+
+    def start(self):
+        """启动后台生成线程"""
+        self._started_at = time.perf_counter()
+        # 预选回应与流式对话并发生成
+        self._choice_responses = self.actor.start_choice_responses(self.scene_plan)
+        # 复制当前上下文，让 usage 统计跟随到生成线程
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # 消费端
+    # ------------------------------------------------------------------
+
+    def iter_beat(self, index: int) -> Iterator[DialogueLine]:
+        """逐行交付第 index 个 Beat 的对话，Beat 结束时返回"""
+        sent = 0
+        while True:
+            with self._cond:
+                while sent >= len(self._lines[index]) and not self._beat_done[index]:
+                    self._cond.wait()
+                pending = self._lines[index][sent:]
+                finished = self._beat_done[index]
+            for line in pending:
+                yield line
+            sent += len(pending)
+            if finished and sent >= len(self._lines[index]):
+                return
+
+    def beat_output(self, index: int) -> DialogueOutput:
+        """等待第 index 个 Beat 结束并返回其完整输出"""
+        with self._cond:
+            while not self._beat_done[index]:
+                self._cond.wait()
+            return self._outputs[index]
+
+    def wait(self) -> Tuple[List[DialogueOutput], Optional[PendingChoiceResponses]]:
+        """等待整场结束，返回与 generate_scene_dialogue 相同的结构"""
+        with self._cond:
+            while not self._done:
+                self._cond.wait()
+        return list(self._outputs), self._choice_responses
+
+    # ------------------------------------------------------------------
+    # 生产端（后台线程）
+    # ------------------------------------------------------------------
+
+    def _push_line(self, index: int, line_data: Dict):
+        if index >= len(self.beats) or self._beat_done[index]:
+            return
+        line = self.actor._parse_dialogue_line(line_data)
+        self.actor._validate_and_fix_line(line, self.scene_characters, self.scene_plan.location)
+        with self._cond:
+            if self.stats["time_to_first_line"] is None:
+                self.stats["time_to_first_line"] = time.perf_counter() - self._started_at
+            self._lines[index].append(line)
+            self.stats["line_count"] += 1
+            self._cond.notify_all()
+
+    def _finish_beat(self, index: int, beat_data: Optional[Dict] = None):
+        if index >= len(self.beats) or self._beat_done[index]:
+            return
+        beat = self.beats[index]
+        if beat_data and not self._lines[index]:
+            for line_data in beat_data.get("dialogue", []):
+                self._push_line(index, line_data)
+        with self._cond:
+            effects = (beat_data or {}).get("effects", {}) or self._effects[index]
+            output = DialogueOutput(
+                beat_id=(beat_data or {}).get("beat_id", beat.beat_id),
+                dialogue=list(self._lines[index]),
+                effects=effects
+            )
+
+        # 空 Beat：流式模式下已无法整场重试，直接用地点感知的回退叙述补位
+        if not output.dialogue:
+            print(f"⚠️ Beat {beat.beat_id} 为空，使用回退内容填充")
+            output.dialogue = self.actor._generate_fallback_narration(beat, self.scene_plan.location)
+
+        with self._cond:
+            # 回退内容也要交付给正在等待的 iter_beat
+            self._lines[index] = list(output.dialogue)
+            self._outputs[index] = output
+            self._beat_done[index] = True
+            self._cond.notify_all()
+
+        # 整个 Beat 一批生成日文（已有 text_jp 的台词会被跳过）
+        if self.jp_translator is not None:
+            self.jp_translator.prefetch(output.dialogue)
+
+    def _run(self):
+        actor = self.actor
+        system, prompt = actor._build_scene_prompt(self.scene_plan, self.characters_info)
+        compact = actor.compact_output
+        bilingual = not actor.lazy_jp
+        cast = actor._scene_cast(self.characters_info)
+        if compact:
+            scanner = StreamingJSONScanner([("b", "*", "d", "*"), ("b", "*")])
+        else:
+            scanner = StreamingJSONScanner([("beats", "*", "dialogue", "*"), ("beats", "*")])
+
+        try:
+            print(f"  [CharacterActor] 正在流式生成 {len(self.beats)} 个 Beat 的对话...")
+            messages = [{"role": "user", "content": prompt}]
+            for attempt in range(LLM_MAX_CONTINUATIONS + 1):
+                # 输出达到 max_tokens 时以已收到的文本预填续写，接着往同一个扫描器里喂
+                if attempt:
+                    print(f"  [CharacterActor] 输出达到 max_tokens，续写中... ({attempt}/{LLM_MAX_CONTINUATIONS})")
+                    # 预填会去掉末尾空白，扫描器的缓冲区也要对齐（与 create_text 相同）
+                    scanner.rstrip()
+                with actor.gateway.stream(
+                    "character",
+                    model=MODEL,
+                    max_tokens=4096,
+                    system=system,
+                    messages=continuation_messages(messages, scanner.text) if attempt else messages
+                ) as response_stream:
+                    for chunk in response_stream.text_stream:
+                        for path, value in scanner.feed(chunk):
+                            if len(path) == 4:
+                                self._push_line(path[1], expand_line(value, cast, bilingual) if compact else value)
+                            else:
+                                # Beat 闭合：之前的 Beat 也一并视为结束
+                                for j in range(path[1]):
+                                    self._finish_beat(j)
+                                self._finish_beat(path[1], expand_beat(value, cast, bilingual) if compact else value)
+                    final_message = response_stream.get_final_message()
+                    get_prompt_cache_stats().record("CharacterActor", final_message)
+                if getattr(final_message, "stop_reason", None) != "max_tokens":
+                    break
+            get_prompt_cache_heartbeat().register("CharacterActor", "character", system)
+
+            # 流结束后用完整文本补齐未闭合的 Beat（截断等情况）
+            if not all(self._beat_done):
+                try:
+                    result = parse_json_with_diagnostics(scanner.text, "场景对话", "CharacterActor")
+                    beats_data = actor._expand_scene_result(result, self.characters_info).get("beats", [])
+                except json.JSONDecodeError:
+                    beats_data = []
+                for i in range(len(self.beats)):
+                    if self._beat_done[i]:
+                        continue
+                    self._finish_beat(i, beats_data[i] if i < len(beats_data) else None)
+
+        except Exception as e:
+            print(f"[CharacterActor] 流式 API 调用失败: {type(e).__name__}: {e}")
+            for i, beat in enumerate(self.beats):
+                if not self._beat_done[i]:
+                    if not self._lines[i]:
+                        fallback = actor._create_fallback_dialogue(beat, self.characters_info)
+                        with self._cond:
+                            self._lines[i] = list(fallback.dialogue)
+                    self._finish_beat(i)
+
+        self.stats["total_time"] = time.perf_counter() - self._started_at
+        ttfl = self.stats["time_to_first_line"]
+        ttfl_str = f"{ttfl:.2f}s" if ttfl is not None else "无"
+        print(f"  [CharacterActor] 流式生成完成: 首行延迟 {ttfl_str} / 整场 {self.stats['total_time']:.2f}s")
+
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+
+    def choice_responses(self) -> Optional[PendingChoiceResponses]:
+        """返回预选回应（不等待整场结束；首次读取时才等待回应生成完成）"""
+        return self._choice_responses
+
+
 # ============================================================================
 # 测试
 # ============================================================================
@@ -0,0 +1,180 @@
+# ============================================================================
+# 角色注册表 (Character Registry)
+# ============================================================================
+# 职责：
+# 1. 进程内唯一的角色数据来源：每个角色的 core / personality / speech /
+#    relationships 只加载一次，导演层、演出层、故事规划层和原型脚本共用
+# 2. 预先生成各层 prompt 共用的「角色档案卡」文本，并附带 token 估算
+# ============================================================================
+
+import math
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .world_bundle import get_world_bundle
+
+
+# 加载失败时的默认数据（各字段与正常数据结构一致）
+def _fallback_data(char_id: str) -> Dict:
+    return {
+        "core": {"name": {"zh": char_id}},
+        "personality": {"versions": {"simple": "性格未知"}},
+        "speech": {"first_person": "我", "verbal_tics": []},
+        "relationships": {},
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数（不调用 API）
+
+    中日文字符约 1 token/字，其余字符约 4 字符/token。
+    """
+    wide = sum(1 for ch in text if ord(ch) > 0x2E7F)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+# ============================================================================
+# 数据类
+# ============================================================================
+
+@dataclass
+class PersonaCard:
+    """角色档案卡（prompt 用的精简人设）"""
+    char_id: str
+    name: str
+    personality: str                 # 简版性格（空白已规整）
+    first_person: str
+    verbal_tics: List[str]           # 前3个口癖
+    tone: Dict[str, str] = field(default_factory=dict)  # 情绪 -> 语气（tone_by_emotion）
+    text: str = ""                   # 档案卡文本（静态 system 块中的原文）
+    tokens: int = 0                  # text 的 token 估算
+
+
+def _build_card(char_id: str, data: Dict) -> PersonaCard:
+    core = data.get("core") or {}
+    personality = data.get("personality") or {}
+    speech = data.get("speech") or {}
+
+    name = core.get("name", {}).get("zh", char_id)
+    simple = " ".join(str(personality.get("versions", {}).get("simple", "性格未知")).split())
+    first_person = speech.get("first_person", "我")
+    verbal_tics = list(speech.get("verbal_tics", [])[:3])
+
+    text = f"""【{name}】({char_id})
+  性格: {simple}
+  第一人称: 「{first_person}」
+  口癖: {', '.join(verbal_tics) if verbal_tics else '无'}"""
+
+    return PersonaCard(
+        char_id=char_id,
+        name=name,
+        personality=simple,
+        first_person=first_person,
+        verbal_tics=verbal_tics,
+        tone=dict(speech.get("tone_by_emotion") or {}),
+        text=text,
+        tokens=estimate_tokens(text),
+    )
+
+
+# ============================================================================
+# 角色注册表
+# ============================================================================
+
+class CharacterRegistry:
+    """角色注册表 - 角色数据与档案卡的进程级缓存"""
+
+    def __init__(self, project_root: Path = None):
+        self.project_root = Path(project_root or Path(__file__).parent.parent)
+        self.char_dir = self.project_root / "characters"
+
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict] = {}
+        self._cards: Dict[str, PersonaCard] = {}
+        self._ids: Optional[List[str]] = None
+        self.stats = {"loads": 0, "lookups": 0}
+
+    def ids(self) -> List[str]:
+        """characters/ 目录下的全部角色ID（排序后，保证静态块稳定）"""
+        if self._ids is None:
+            if not self.char_dir.exists():
+                self._ids = []
+            else:
+                self._ids = sorted(p.name for p in self.char_dir.iterdir() if (p / "core.yaml").exists())
+        return list(self._ids)
+
+    def exists(self, char_id: str) -> bool:
+        return (self.char_dir / char_id / "core.yaml").exists()
+
+    def get(self, char_id: str) -> Dict:
+        """
+        角色完整数据 {"core", "personality", "speech", "relationships"}
+
+        只在首次访问时读取；返回的对象各调用方共享，不要原地修改。
+        加载失败时返回默认数据（同样缓存，不会每次重试）。
+        """
+        with self._lock:
+            self.stats["lookups"] += 1
+            if char_id not in self._data:
+                self._data[char_id] = self._load(char_id)
+                self.stats["loads"] += 1
+            return self._data[char_id]
+
+    def _load(self, char_id: str) -> Dict:
+        char_path = self.char_dir / char_id
+        bundle = get_world_bundle(self.project_root)
+        try:
+            relationships_path = char_path / "relationships.yaml"
+            return {
+                "core": bundle.load_yaml(char_path / "core.yaml") or {},
+                "personality": bundle.load_yaml(char_path / "personality.yaml") or {},
+                "speech": bundle.load_yaml(char_path / "speech.yaml") or {},
+                "relationships": (bundle.load_yaml(relationships_path) or {}) if relationships_path.exists() else {},
+            }
+        except Exception as e:
+            print(f"[CharacterRegistry] 加载角色数据失败 {char_id}: {e}")
+            return _fallback_data(char_id)
+
+    # ------------------------------------------------------------------
+    # 档案卡
+    # ------------------------------------------------------------------
+
+    def card(self, char_id: str) -> PersonaCard:
+        """角色档案卡（首次访问时生成）"""
+        card = self._cards.get(char_id)
+        if card is None:
+            card = _build_card(char_id, self.get(char_id))
+            with self._lock:
+                self._cards.setdefault(char_id, card)
+        return card
+
+    def cards_text(self, char_ids: List[str] = None) -> str:
+        """多个角色的档案卡（默认全体角色，用于静态 system 块）"""
+        if char_ids is None:
+            char_ids = self.ids()
+        return "【角色档案】\n" + "\n\n".join(self.card(char_id).text for char_id in char_ids)
+
+    def cards_tokens(self, char_ids: List[str] = None) -> int:
+        """cards_text 的 token 估算（按卡片累加）"""
+        if char_ids is None:
+            char_ids = self.ids()
+        return sum(self.card(char_id).tokens for char_id in char_ids)
+
+    def name(self, char_id: str) -> str:
+        return self.card(char_id).name
+
+
+# 全局实例
+_registries: Dict[Path, CharacterRegistry] = {}
+_registries_lock = threading.Lock()
+
+def get_character_registry(project_root: Path = None) -> CharacterRegistry:
+    """获取角色注册表单例（按项目根目录）"""
+    root = Path(project_root or Path(__file__).parent.parent).resolve()
+    with _registries_lock:
+        if root not in _registries:
+            _registries[root] = CharacterRegistry(root)
+        return _registries[root]
@@ -0,0 +1,284 @@
+# ============================================================================
+# 紧凑输出格式 (Compact Schema)
+# ============================================================================
+# 职责：
+# 1. 定义演出层（整场对话）与规划层（场景规划）的紧凑输出格式：
+#    短键 + 定长数组，说话者用本场景「角色序号」表示，JSON 不换行不缩进
+# 2. 解码：把紧凑格式还原成原来的详细格式（dict），之后照常由
+#    _parse_scene_dialogue / _parse_scene_plan 转成 DialogueLine / Beat / ScenePlan
+# 3. 编码：详细格式 -> 紧凑格式（基准测试与回放用）
+# 4. LAZY_JP（只生成中文）时对话行不含日文：[说话者, 中文, 情绪, 动作]
+#
+# 由 config.COMPACT_OUTPUT 开启；模型仍输出详细格式时解码器原样放行。
+# ============================================================================
+
+from typing import Any, Dict, Iterable, List, Optional
+
+
+NARRATOR = "narrator"
+
+
+# ============================================================================
+# 角色序号
+# ============================================================================
+
+def build_cast(char_ids: Iterable[str]) -> List[str]:
+    """本场景的角色表：0 号固定为旁白，其余按角色ID排序（prompt 与解码两端一致）"""
+    return [NARRATOR] + sorted(set(char_ids) - {NARRATOR})
+
+
+def format_cast(cast: List[str], names: Dict[str, str] = None) -> str:
+    """prompt 中的角色序号说明，如「0=旁白 1=艾玛(aima)」"""
+    names = names or {}
+    items = []
+    for index, char_id in enumerate(cast):
+        if char_id == NARRATOR:
+            items.append(f"{index}=旁白")
+        else:
+            items.append(f"{index}={names.get(char_id, char_id)}({char_id})")
+    return "【角色序号】" + " ".join(items)
+
+
+def _speaker(value: Any, cast: List[str]) -> str:
+    """序号 -> 角色ID；模型直接写了角色ID时原样返回"""
+    if isinstance(value, bool):
+        return NARRATOR
+    if isinstance(value, int):
+        return cast[value] if 0 <= value < len(cast) else NARRATOR
+    if isinstance(value, str) and value.isdigit():
+        return _speaker(int(value), cast)
+    return value if isinstance(value, str) and value else NARRATOR
+
+
+def _speakers(values: Any, cast: List[str]) -> List[str]:
+    return [_speaker(value, cast) for value in values] if isinstance(values, list) else []
+
+
+def _index(char_id: str, cast: List[str]) -> Any:
+    return cast.index(char_id) if char_id in cast else char_id
+
+
+def _at(row: List, i: int, default: Any = None) -> Any:
+    return row[i] if i < len(row) and row[i] is not None else default
+
+
+# ============================================================================
+# 演出层：整场对话
+# ============================================================================
+# {"b":[{"i":"beat_1","d":[[说话者序号,"中文","日本語","情绪","动作"]],"e":[[角色序号,压力变化,"新情绪"]]}]}
+
+ACTOR_FORMAT = """{"b":[{"i":"beat_1","d":[[说话者序号,"中文对话","日本語の台詞","情绪","动作"]],"e":[[角色序号,压力变化值,"新情绪"]]}]}
+
+紧凑格式说明：
+- b: Beat 列表；i: beat_id；d: 对话；e: 状态变化
+- 每句对话是一个数组：[说话者序号, text_cn, text_jp, 情绪, 动作]，没有动作时省略最后一项
+- 说话者序号见用户消息中的【角色序号】，0 为旁白
+- 输出单行 JSON，不要换行和缩进"""
+
+ACTOR_FORMAT_CN = """{"b":[{"i":"beat_1","d":[[说话者序号,"中文对话","情绪","动作"]],"e":[[角色序号,压力变化值,"新情绪"]]}]}
+
+紧凑格式说明：
+- b: Beat 列表；i: beat_id；d: 对话；e: 状态变化
+- 每句对话是一个数组：[说话者序号, text_cn, 情绪, 动作]，没有动作时省略最后一项
+- 说话者序号见用户消息中的【角色序号】，0 为旁白
+- 输出单行 JSON，不要换行和缩进"""
+
+
+def expand_line(row: Any, cast: List[str], bilingual: bool = True) -> Dict:
+    """一句对话：[说话者, 中文, 日文, 情绪, 动作]（只有中文时没有日文一项）-> 详细格式"""
+    if isinstance(row, dict):
+        if "speaker" in row:
+            return row
+        row = [row.get("s"), row.get("c"), row.get("j"), row.get("m"), row.get("a")]
+    elif isinstance(row, list) and not bilingual:
+        row = row[:2] + [None] + row[2:]
+    if not isinstance(row, list):
+        return {"speaker": NARRATOR, "text_cn": str(row), "text_jp": str(row), "emotion": "neutral"}
+    text_cn = _at(row, 1, "...")
+    line = {
+        "speaker": _speaker(_at(row, 0, 0), cast),
+        "text_cn": text_cn,
+        "emotion": _at(row, 3, "neutral"),
+    }
+    if bilingual or _at(row, 2):
+        line["text_jp"] = _at(row, 2, text_cn)
+    if _at(row, 4):
+        line["action"] = row[4]
+    return line
+
+
+def expand_effects(effects: Any, cast: List[str]) -> Dict:
+    """[[角色序号, 压力变化, 新情绪]] -> {角色ID: {"stress", "emotion"}}"""
+    if isinstance(effects, dict):
+        return effects
+    expanded = {}
+    for row in effects if isinstance(effects, list) else []:
+        if not isinstance(row, list) or not row:
+            continue
+        effect = {}
+        if _at(row, 1) is not None:
+            effect["stress"] = row[1]
+        if _at(row, 2):
+            effect["emotion"] = row[2]
+        expanded[_speaker(row[0], cast)] = effect
+    return expanded
+
+
+def expand_beat(beat: Any, cast: List[str], bilingual: bool = True) -> Dict:
+    """一个 Beat 的对话 -> 详细格式"""
+    if not isinstance(beat, dict):
+        return {"dialogue": [], "effects": {}}
+    if "dialogue" in beat:
+        return beat
+    expanded = {
+        "dialogue": [expand_line(row, cast, bilingual) for row in beat.get("d") or []],
+        "effects": expand_effects(beat.get("e"), cast),
+    }
+    if beat.get("i"):
+        expanded["beat_id"] = beat["i"]
+    return expanded
+
+
+def expand_scene_dialogue(data: Any, cast: List[str], bilingual: bool = True) -> Dict:
+    """整场对话：紧凑格式 -> {"beats": [...]}（已是详细格式时原样返回）"""
+    if not isinstance(data, dict) or "beats" in data:
+        return data if isinstance(data, dict) else {"beats": []}
+    return {"beats": [expand_beat(beat, cast, bilingual) for beat in data.get("b") or []]}
+
+
+def compact_scene_dialogue(data: Dict, cast: List[str], bilingual: bool = True) -> Dict:
+    """整场对话：详细格式 -> 紧凑格式"""
+    beats = []
+    for beat in data.get("beats", []):
+        rows = []
+        for line in beat.get("dialogue", []):
+            row = [_index(line.get("speaker", NARRATOR), cast), line.get("text_cn", "")]
+            if bilingual:
+                row.append(line.get("text_jp", ""))
+            row.append(line.get("emotion", "neutral"))
+            if line.get("action"):
+                row.append(line["action"])
+            rows.append(row)
+        effects = [[_index(char_id, cast), effect.get("stress"), effect.get("emotion")]
+                   for char_id, effect in (beat.get("effects") or {}).items()]
+        beats.append({"i": beat.get("beat_id"), "d": rows, "e": effects})
+    return {"b": beats}
+
+
+# ============================================================================
+# 规划层：场景规划
+# ============================================================================
+# Beat：[beat_id, 类型, 描述, [角色], [说话顺序], [[角色, 情绪目标]], 张力, 对话数, 导演指示]
+
+PLANNER_FORMAT = """{"id":"场景ID","n":"场景名称","loc":"地点","t":5,"arc":"整体情感弧线描述",
+"b":[["beat_1","opening|development|tension|climax|resolution","这个beat要表达什么",[角色序号],[说话顺序序号],[[角色序号,"情绪"]],张力1-10,对话数3-6,"导演指示"]],
+"km":["关键时刻1","关键时刻2"],
+"pc":{"after":"beat_id","p":"提示语","o":[["A","选项A","正面"],["B","选项B","中性"],["C","选项C","危险"]]},
+"oc":{"s":[[角色序号,压力变化值]],"r":{},"f":[]},
+"bgm":"BGM名称"}
+
+紧凑格式说明：
+- 每个 Beat 是一个定长数组，顺序为：beat_id, beat_type, description, characters,
+  speaker_order, emotion_targets, tension_level, dialogue_count, direction_notes
+- 角色一律用用户消息中【角色序号】的序号表示，0 为旁白
+- pc 为玩家选择点（after_beat / prompt / options），oc 为结果（s: stress_changes，
+  r: relationship_changes，f: flags_to_set）
+- 输出单行 JSON，不要换行和缩进"""
+
+_PLAN_KEYS = {
+    "id": "scene_id", "n": "scene_name", "loc": "location", "t": "time_estimate_minutes",
+    "arc": "overall_arc", "km": "key_moments", "bgm": "recommended_bgm",
+    "end": "ending_type", "hint": "next_scene_hint", "carry": "carryover_elements",
+}
+
+
+def expand_plan_beat(row: Any, cast: List[str]) -> Dict:
+    if isinstance(row, dict):
+        return row
+    if not isinstance(row, list):
+        return {}
+    targets = _at(row, 5, [])
+    if isinstance(targets, list):
+        targets = {_speaker(pair[0], cast): _at(pair, 1, "neutral")
+                   for pair in targets if isinstance(pair, list) and pair}
+    elif isinstance(targets, dict):
+        targets = {_speaker(key, cast): value for key, value in targets.items()}
+    return {
+        "beat_id": _at(row, 0, "unknown"),
+        "beat_type": _at(row, 1, "development"),
+        "description": _at(row, 2, ""),
+        "characters": _speakers(_at(row, 3, []), cast),
+        "speaker_order": _speakers(_at(row, 4, []), cast),
+        "emotion_targets": targets,
+        "tension_level": _at(row, 6, 5),
+        "dialogue_count": _at(row, 7, 3),
+        "direction_notes": _at(row, 8, ""),
+    }
+
+
+def _expand_choice_point(point: Any) -> Optional[Dict]:
+    if not isinstance(point, dict) or "options" in point:
+        return point
+    return {
+        "after_beat": point.get("after", ""),
+        "prompt": point.get("p", ""),
+        "options": [
+            {"id": _at(option, 0, ""), "text": _at(option, 1, ""), "leads_to": _at(option, 2, "")}
+            if isinstance(option, list) else option
+            for option in point.get("o") or []
+        ],
+    }
+
+
+def _expand_outcomes(outcomes: Any, cast: List[str]) -> Dict:
+    if not isinstance(outcomes, dict) or "s" not in outcomes and "r" not in outcomes and "f" not in outcomes:
+        return outcomes if isinstance(outcomes, dict) else {}
+    stress = outcomes.get("s") or []
+    if isinstance(stress, list):
+        stress = {_speaker(pair[0], cast): _at(pair, 1, 0) for pair in stress if isinstance(pair, list) and pair}
+    return {
+        "stress_changes": stress,
+        "relationship_changes": outcomes.get("r") or {},
+        "flags_to_set": outcomes.get("f") or [],
+    }
+
+
+def expand_scene_plan(data: Any, cast: List[str]) -> Dict:
+    """场景规划：紧凑格式 -> 详细格式（已是详细格式时原样返回）"""
+    if not isinstance(data, dict) or "beats" in data:
+        return data if isinstance(data, dict) else {}
+    expanded = {full: data[short] for short, full in _PLAN_KEYS.items() if short in data}
+    expanded["beats"] = [expand_plan_beat(row, cast) for row in data.get("b") or []]
+    if "pc" in data:
+        expanded["player_choice_point"] = _expand_choice_point(data["pc"])
+    if "oc" in data:
+        expanded["outcomes"] = _expand_outcomes(data["oc"], cast)
+    return expanded
+
+
+def compact_scene_plan(data: Dict, cast: List[str]) -> Dict:
+    """场景规划：详细格式 -> 紧凑格式"""
+    compact = {short: data[full] for short, full in _PLAN_KEYS.items() if full in data}
+    compact["b"] = [
+        [beat.get("beat_id"), beat.get("beat_type"), beat.get("description"),
+         [_index(c, cast) for c in beat.get("characters", [])],
+         [_index(c, cast) for c in beat.get("speaker_order", [])],
+         [[_index(c, cast), emotion] for c, emotion in beat.get("emotion_targets", {}).items()],
+         beat.get("tension_level"), beat.get("dialogue_count"), beat.get("direction_notes")]
+        for beat in data.get("beats", [])
+    ]
+    point = data.get("player_choice_point")
+    if point:
+        compact["pc"] = {
+            "after": point.get("after_beat", ""),
+            "p": point.get("prompt", ""),
+            "o": [[o.get("id"), o.get("text"), o.get("leads_to")] for o in point.get("options", [])],
+        }
+    outcomes = data.get("outcomes")
+    if outcomes:
+        compact["oc"] = {
+            "s": [[_index(c, cast), v] for c, v in (outcomes.get("stress_changes") or {}).items()],
+            "r": outcomes.get("relationship_changes") or {},
+            "f": outcomes.get("flags_to_set") or [],
+        }
+    return compact
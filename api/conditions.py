@@ -0,0 +1,684 @@
+# ============================================================================
+# 条件语言编译器 (Conditions)
+# ============================================================================
+# 职责：
+# 1. triggers.yaml / character_arcs.yaml / endings.yaml / fixed_events.yaml 中的
+#    条件表达式统一在这里解析，加载时编译一次，之后每回合只调用闭包
+# 2. 递归下降解析 -> AST -> 闭包；按表达式文本缓存（同一模板只编译一次）
+# 3. 在类型化的状态视图 ConditionState 上求值，不再字符串替换 + eval
+# 4. 兼容 fixed_events.yaml 的旧式命名条件（flag_xxx / highest_madness_above_70 ...）
+# 5. 每个条件声明依赖的状态键；ConditionIndex 只重算依赖被修改过的条件
+# ============================================================================
+#
+# 语法：
+#   expr    := or
+#   or      := and (("or" | "OR") and)*
+#   and     := not (("and" | "AND") not)*
+#   not     := ("not" | "NOT") not | compare
+#   compare := sum (("==" | "!=" | ">=" | "<=" | ">" | "<" | "in" | "not in") sum)*
+#   sum     := term (("+" | "-") term)*
+#   term    := unary (("*" | "/") unary)*
+#   unary   := "-" unary | atom
+#   atom    := 数字 | 字符串 | true/false/null | "[" 列表 "]" | "(" expr ")"
+#            | 函数 "(" expr ")" | 路径
+#
+# 路径：
+#   day / period / phase / event_count ...   current_day 字段（其次查 flags）
+#   alive_count / all_alive                  由角色状态计算
+#   {char}.stress / hannah.madness           角色属性（{char} 为模板占位符）
+#   player.location / player.madness         玩家
+#   flag.x                                   current_day.flags.x
+#   rel.a.b.trust                            角色 a 对 b 的关系值
+#   interactions.x                           与角色 x 的互动次数
+#   seen.x                                   事件 x 是否已触发
+#   all_characters.affection / alive.madness 属性列表，配合 avg/max/min/sum/count/all/any
+#
+# 比较运算右侧和列表中的裸标识符按字符串字面量处理：
+#   trial_result == wrong_person、period in [evening, night]
+#
+# 依赖键（与 WorldState.publish_changes 产出的变更键同一格式）：
+#   day.<字段>  flag.<名称>  char.<角色>.<属性>   角色为 * 表示任意角色
+# ============================================================================
+
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class ConditionError(ValueError):
+    """条件表达式无法解析"""
+
+
+# 旧式命名条件 -> 条件语言（fixed_events.yaml 与 director_api_v2 使用）
+NAMED_CONDITIONS = {
+    "default": "true",
+    "highest_madness_above_70": "max(alive.madness) > 70",
+    "player_madness_above_80": "player.madness > 80",
+    # FixedEventManager 一直按 period 判断且不限 madness；director_api_v2 的版本见 DIRECTOR_NAMED_CONDITIONS
+    "day3_night_no_murder": "day == 3 and period == night and not flag.murder_occurred",
+    "all_stress_70_to_85_and_library_clue_and_all_alive":
+        "all_alive and flag.library_clue_found and 70 <= min(all_characters.stress) and max(all_characters.stress) <= 85",
+    "player_at_library": "player.location == 图书室",
+    "investigation_count_zero_or_time_expired": "investigation_count <= 0",
+    "debate_finished": "flag.debate_finished",
+    "vote_result_correct": "flag.vote_result_correct",
+    "vote_result_player": "flag.vote_result_player",
+    "vote_result_wrong": "flag.vote_result_wrong",
+}
+
+# current_day 字段缺省时的默认值
+DAY_FIELD_DEFAULTS = {
+    "day": 1,
+    "period": "dawn",
+    "phase": "free_time",
+    "event_count": 0,
+    "daily_event_count": 0,
+    "investigation_count": 5,   # 调查尚未开始时不算「调查次数用完」
+}
+
+# 角色属性缺省时的默认值（其余属性缺省为 0）
+CHARACTER_ATTR_DEFAULTS = {
+    "affection": 50,
+}
+
+
+# ============================================================================
+# 状态视图
+# ============================================================================
+
+@dataclass
+class ConditionState:
+    """
+    条件求值用的状态视图（每回合构建一次，所有条件共用）
+
+    current_day / character_states 直接引用 WorldState 的文档，不做拷贝。
+    """
+    current_day: Dict = field(default_factory=dict)
+    character_states: Dict = field(default_factory=dict)
+    player: Dict = field(default_factory=dict)
+    bindings: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_context(cls, context: Dict, **player) -> "ConditionState":
+        """由 load_game_context() 的结果构建"""
+        return cls(
+            current_day=context.get("current_day") or {},
+            character_states=context.get("character_states") or {},
+            player=player,
+        )
+
+    @property
+    def flags(self) -> Dict:
+        return self.current_day.get("flags") or {}
+
+    def lookup(self, name: str) -> Any:
+        """裸标识符：计算字段 > current_day 字段 > flags > None"""
+        if name == "alive_count":
+            return sum(1 for state in self._npcs() if state.get("alive", True))
+        if name == "all_alive":
+            return all(state.get("status", "alive") == "alive" for state in self._npcs())
+        if name in self.current_day:
+            return self.current_day[name]
+        if name in DAY_FIELD_DEFAULTS:
+            return DAY_FIELD_DEFAULTS[name]
+        return self.flags.get(name)
+
+    def character(self, char_id: str) -> Dict:
+        if char_id == "player":
+            player = dict(self.character_states.get("player") or {})
+            if "player_location" in self.current_day:
+                player.setdefault("location", self.current_day["player_location"])
+            player.update(self.player)
+            return player
+        return self.character_states.get(char_id) or {}
+
+    def attr(self, char_id: str, name: str) -> Any:
+        return self.character(char_id).get(name, CHARACTER_ATTR_DEFAULTS.get(name, 0))
+
+    def collect(self, group: str, name: str) -> List[Any]:
+        """all_characters.x / alive.x -> 属性值列表"""
+        default = CHARACTER_ATTR_DEFAULTS.get(name, 0)
+        states = self._npcs()
+        if group == "alive":
+            states = [s for s in states if s.get("status", "alive") == "alive"]
+        return [s.get(name, default) for s in states]
+
+    def _npcs(self) -> List[Dict]:
+        return [state for char_id, state in self.character_states.items() if char_id != "player"]
+
+
+# ============================================================================
+# 词法分析
+# ============================================================================
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<string>'[^']*'|"[^"]*")
+  | (?P<op>>=|<=|==|!=|>|<|[-+*/()\[\],.])
+  | (?P<name>(?:\{\w+\}|[^\W\d])(?:\{\w+\}|\w)*)
+""", re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not", "in", "true", "false", "null", "none"}
+
+
+def _tokenize(text: str) -> List[Tuple[str, Any]]:
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise ConditionError(f"无法识别的字符 {text[pos]!r} (位置 {pos})")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "ws":
+            continue
+        if kind == "number":
+            tokens.append(("num", float(value) if "." in value else int(value)))
+        elif kind == "string":
+            tokens.append(("str", value[1:-1]))
+        elif kind == "name" and value.lower() in _KEYWORDS:
+            tokens.append(("kw", value.lower()))
+        else:
+            tokens.append((kind, value))
+    tokens.append(("end", None))
+    return tokens
+
+
+# ============================================================================
+# 语法分析（递归下降，产出元组形式的 AST）
+# ============================================================================
+# 节点：("lit", v) ("path", [段...]) ("list", [节点...]) ("call", 函数名, 节点)
+#       ("not", 节点) ("and", [节点...]) ("or", [节点...])
+#       ("cmp", 首节点, [(运算符, 节点)...]) ("arith", 运算符, 左, 右) ("neg", 节点)
+
+_COMPARE_OPS = {"==", "!=", ">=", "<=", ">", "<"}
+_FUNCTIONS = {"avg", "max", "min", "sum", "count", "len", "all", "any"}
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> Tuple[str, Any]:
+        return self.tokens[self.pos + offset]
+
+    def take(self) -> Tuple[str, Any]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def accept(self, kind: str, value: Any = None) -> bool:
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind: str, value: Any = None):
+        if not self.accept(kind, value):
+            raise ConditionError(f"期望 {value or kind}，实际为 {self.peek()[1]!r}")
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek()[0] != "end":
+            raise ConditionError(f"多余的内容: {self.peek()[1]!r}")
+        return node
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.accept("kw", "or"):
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else ("or", items)
+
+    def parse_and(self):
+        items = [self.parse_not()]
+        while self.accept("kw", "and"):
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else ("and", items)
+
+    def parse_not(self):
+        if self.accept("kw", "not"):
+            return ("not", self.parse_not())
+        return self.parse_compare()
+
+    def parse_compare(self):
+        first = self.parse_sum()
+        rest = []
+        while True:
+            kind, value = self.peek()
+            if kind == "op" and value in _COMPARE_OPS:
+                self.take()
+                rest.append((value, self.parse_sum()))
+            elif kind == "kw" and value == "in":
+                self.take()
+                rest.append(("in", self.parse_sum()))
+            elif kind == "kw" and value == "not" and self.peek(1) == ("kw", "in"):
+                self.pos += 2
+                rest.append(("not in", self.parse_sum()))
+            else:
+                break
+        return ("cmp", first, rest) if rest else first
+
+    def parse_sum(self):
+        node = self.parse_term()
+        while self.peek()[0] == "op" and self.peek()[1] in ("+", "-"):
+            node = ("arith", self.take()[1], node, self.parse_term())
+        return node
+
+    def parse_term(self):
+        node = self.parse_unary()
+        while self.peek()[0] == "op" and self.peek()[1] in ("*", "/"):
+            node = ("arith", self.take()[1], node, self.parse_unary())
+        return node
+
+    def parse_unary(self):
+        if self.accept("op", "-"):
+            return ("neg", self.parse_unary())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.take()
+        if kind in ("num", "str"):
+            return ("lit", value)
+        if kind == "kw" and value in ("true", "false"):
+            return ("lit", value == "true")
+        if kind == "kw" and value in ("null", "none"):
+            return ("lit", None)
+        if kind == "op" and value == "(":
+            node = self.parse_or()
+            self.expect("op", ")")
+            return node
+        if kind == "op" and value == "[":
+            items = []
+            if not self.accept("op", "]"):
+                items.append(self.parse_sum())
+                while self.accept("op", ","):
+                    items.append(self.parse_sum())
+                self.expect("op", "]")
+            return ("list", items)
+        if kind == "name":
+            if value in _FUNCTIONS and self.accept("op", "("):
+                arg = self.parse_sum()
+                self.expect("op", ")")
+                return ("call", value, arg)
+            segments = [value]
+            while self.accept("op", "."):
+                seg_kind, seg_value = self.take()
+                if seg_kind not in ("name", "num", "kw"):
+                    raise ConditionError(f"路径中出现非法片段: {seg_value!r}")
+                segments.append(str(seg_value))
+            return ("path", segments)
+        raise ConditionError(f"意外的符号: {value!r}")
+
+
+# ============================================================================
+# 编译（AST -> 闭包）
+# ============================================================================
+# 闭包签名：fn(state: ConditionState, bindings: Dict) -> Any
+
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+
+def _segment(text: str) -> Callable[[Dict], str]:
+    """路径片段：静态字符串或含 {占位符} 的模板"""
+    if "{" not in text:
+        return lambda b: text
+    return lambda b: text.format_map(b)
+
+
+def _compile_path(segments: List[str], literal: bool) -> Callable:
+    head, rest = segments[0], segments[1:]
+    parts = [_segment(s) for s in segments]
+
+    if not rest:
+        if "{" in head:
+            value = parts[0]
+            return lambda s, b: value(b)              # 占位符：取绑定值
+        if literal:
+            return lambda s, b: head                  # 比较右侧的裸标识符：字面量
+        return lambda s, b: s.lookup(head)
+
+    if head in ("flag", "flags"):
+        name = ".".join(rest)
+        if "{" not in name:
+            return lambda s, b: s.flags.get(name, False)
+        return lambda s, b: s.flags.get(name.format_map(b), False)
+
+    if head == "seen" and len(rest) == 1:
+        event = parts[1]
+        return lambda s, b: event(b) in (s.current_day.get("triggered_events") or [])
+
+    if head == "interactions" and len(rest) == 1:
+        char = parts[1]
+        return lambda s, b: s.character(char(b)).get("interactions", 0)
+
+    if head == "rel" and len(rest) == 3:
+        a, b_, attr = parts[1], parts[2], parts[3]
+        def rel(s, b):
+            relations = s.character(a(b)).get("relationships") or {}
+            return (relations.get(b_(b)) or {}).get(attr(b), 0)
+        return rel
+
+    if head in ("all_characters", "alive") and len(rest) == 1:
+        attr = rest[0]
+        return lambda s, b: s.collect(head, attr)
+
+    if len(rest) == 1:
+        char, attr = parts[0], parts[1]
+        return lambda s, b: s.attr(char(b), attr(b))
+
+    raise ConditionError(f"无法解析的路径: {'.'.join(segments)}")
+
+
+def _path_deps(segments: List[str], literal: bool) -> List[str]:
+    """路径读取的状态键（与 _compile_path 的分支一一对应）"""
+    head, rest = segments[0], segments[1:]
+
+    if not rest:
+        if "{" in head or literal:
+            return []
+        if head == "alive_count":
+            return ["char.*.alive"]
+        if head == "all_alive":
+            return ["char.*.status"]
+        return [f"day.{head}", f"flag.{head}"]
+    if head in ("flag", "flags"):
+        return [f"flag.{'.'.join(rest)}"]
+    if head == "seen":
+        return ["day.triggered_events"]
+    if head == "interactions":
+        return [f"char.{rest[0]}.interactions"]
+    if head == "rel":
+        return [f"char.{rest[0]}.relationships"]
+    if head == "all_characters":
+        return [f"char.*.{rest[0]}"]
+    if head == "alive":
+        return [f"char.*.{rest[0]}", "char.*.status"]
+    if head == "player":
+        return [f"char.player.{rest[0]}", "day.player_location"]
+    return [f"char.{head}.{rest[0]}"]
+
+
+def _collect_deps(node, deps: Set[str], literal: bool = False):
+    kind = node[0]
+    if kind == "path":
+        deps.update(_path_deps(node[1], literal))
+    elif kind == "list":
+        for item in node[1]:
+            _collect_deps(item, deps, literal=True)
+    elif kind in ("not", "neg"):
+        _collect_deps(node[1], deps)
+    elif kind in ("and", "or"):
+        for item in node[1]:
+            _collect_deps(item, deps)
+    elif kind == "call":
+        _collect_deps(node[2], deps)
+    elif kind == "cmp":
+        _collect_deps(node[1], deps)
+        for _, operand in node[2]:
+            _collect_deps(operand, deps, literal=True)
+    elif kind == "arith":
+        _collect_deps(node[2], deps)
+        _collect_deps(node[3], deps)
+
+
+def _avg(values):
+    values = list(values)
+    return sum(values) / len(values) if values else 0
+
+
+_FUNCTION_IMPLS = {
+    "avg": _avg,
+    "max": lambda v: max(v, default=0),
+    "min": lambda v: min(v, default=0),
+    "sum": sum,
+    "count": len,
+    "len": len,
+    "all": all,
+    "any": any,
+}
+
+_COMPARE_IMPLS = {
+    "==": lambda x, y: x == y,
+    "!=": lambda x, y: x != y,
+    ">=": lambda x, y: x >= y,
+    "<=": lambda x, y: x <= y,
+    ">": lambda x, y: x > y,
+    "<": lambda x, y: x < y,
+    "in": lambda x, y: x in y,
+    "not in": lambda x, y: x not in y,
+}
+
+_ARITH_IMPLS = {
+    "+": lambda x, y: x + y,
+    "-": lambda x, y: x - y,
+    "*": lambda x, y: x * y,
+    "/": lambda x, y: x / y,
+}
+
+
+def _compile(node, literal: bool = False) -> Callable:
+    kind = node[0]
+
+    if kind == "lit":
+        value = node[1]
+        return lambda s, b: value
+
+    if kind == "path":
+        return _compile_path(node[1], literal)
+
+    if kind == "list":
+        items = [_compile(item, literal=True) for item in node[1]]
+        return lambda s, b: [item(s, b) for item in items]
+
+    if kind == "call":
+        func = _FUNCTION_IMPLS[node[1]]
+        arg = _compile(node[2])
+        return lambda s, b: func(arg(s, b))
+
+    if kind == "not":
+        inner = _compile(node[1])
+        return lambda s, b: not inner(s, b)
+
+    if kind == "and":
+        items = [_compile(item) for item in node[1]]
+        return lambda s, b: all(item(s, b) for item in items)
+
+    if kind == "or":
+        items = [_compile(item) for item in node[1]]
+        return lambda s, b: any(item(s, b) for item in items)
+
+    if kind == "cmp":
+        first = _compile(node[1])
+        chain = [(_COMPARE_IMPLS[op], _compile(operand, literal=True)) for op, operand in node[2]]
+        if len(chain) == 1:
+            (compare, right), = chain
+            return lambda s, b: compare(first(s, b), right(s, b))
+        def compare_chain(s, b):
+            left = first(s, b)
+            for compare, operand in chain:
+                right = operand(s, b)
+                if not compare(left, right):
+                    return False
+                left = right
+            return True
+        return compare_chain
+
+    if kind == "arith":
+        op = _ARITH_IMPLS[node[1]]
+        left, right = _compile(node[2]), _compile(node[3])
+        return lambda s, b: op(left(s, b), right(s, b))
+
+    if kind == "neg":
+        inner = _compile(node[1])
+        return lambda s, b: -inner(s, b)
+
+    raise ConditionError(f"未知节点: {kind}")
+
+
+# ============================================================================
+# 编译结果
+# ============================================================================
+
+class CompiledCondition:
+    """
+    编译后的条件（可直接调用）
+
+    求值出错（占位符未绑定、与 None 比较等）时按不满足处理；
+    解析失败的条件恒为 False，error 中保留原因。
+    """
+
+    __slots__ = ("source", "placeholders", "deps", "error", "_fn")
+
+    def __init__(self, source: str, fn: Optional[Callable], error: Optional[str] = None,
+                 deps: frozenset = frozenset()):
+        self.source = source
+        self.placeholders = frozenset(_PLACEHOLDER_RE.findall(source))
+        self.deps = deps
+        self.error = error
+        self._fn = fn
+
+    def __call__(self, state: ConditionState, bindings: Optional[Dict[str, str]] = None) -> bool:
+        if self._fn is None:
+            return False
+        try:
+            return bool(self._fn(state, bindings if bindings is not None else state.bindings))
+        except Exception:
+            return False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def dependencies(self, bindings: Optional[Dict[str, str]] = None) -> Set[str]:
+        """代入绑定后的依赖键；未绑定的占位符所在片段变为通配符 *"""
+        resolved = set()
+        for dep in self.deps:
+            if "{" in dep:
+                dep = ".".join(
+                    _format_or_wildcard(part, bindings or {}) for part in dep.split(".")
+                )
+            resolved.add(dep)
+        return resolved
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"error={self.error}"
+        return f"CompiledCondition({self.source!r}, {status})"
+
+
+def _format_or_wildcard(part: str, bindings: Dict[str, str]) -> str:
+    try:
+        return part.format_map(bindings)
+    except KeyError:
+        return "*"
+
+
+def is_named_condition(text: str) -> bool:
+    """是否为已知的旧式命名条件（含 flag_xxx）"""
+    return text in NAMED_CONDITIONS or text.startswith("flag_")
+
+
+def _expand_named(text: str) -> str:
+    if text in NAMED_CONDITIONS:
+        return NAMED_CONDITIONS[text]
+    if text.startswith("flag_"):
+        return f"flag.{text[5:]}"
+    return text
+
+
+@lru_cache(maxsize=2048)
+def compile_condition(text: str) -> CompiledCondition:
+    """编译条件表达式（按文本缓存，同一表达式只解析一次）"""
+    source = (text or "").strip()
+    if not source:
+        return CompiledCondition(source, lambda s, b: True)
+    try:
+        tree = _Parser(_expand_named(source)).parse()
+        deps = set()
+        _collect_deps(tree, deps)
+        return CompiledCondition(source, _compile(tree), deps=frozenset(deps))
+    except ConditionError as e:
+        return CompiledCondition(source, None, error=str(e))
+
+
+def compile_all(conditions: List[str]) -> List[CompiledCondition]:
+    """批量编译（加载 YAML 时调用）"""
+    return [compile_condition(str(c)) for c in conditions or []]
+
+
+def evaluate(text: str, state: ConditionState, bindings: Optional[Dict[str, str]] = None) -> bool:
+    """编译（命中缓存）并求值"""
+    return compile_condition(text)(state, bindings)
+
+
+# ============================================================================
+# 依赖索引
+# ============================================================================
+
+def _candidate_deps(change: str) -> Tuple[str, ...]:
+    """一个变更键可能命中的依赖键（含通配符形式）"""
+    kind, _, rest = change.partition(".")
+    if kind == "char":
+        char_id, _, attr = rest.partition(".")
+        return (change, f"char.*.{attr}")
+    if kind == "flag":
+        return (change, "flag.*")
+    return (change,)
+
+
+class ConditionIndex:
+    """
+    按依赖键索引的条件结果缓存
+
+    条件结果在其依赖的状态键被修改前一直有效；invalidate() 接收
+    WorldState.publish_changes 产出的变更键，只让受影响的条件失效。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Tuple[CompiledCondition, Optional[Dict[str, str]]]] = {}
+        self._by_dep: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._results: Dict[Hashable, bool] = {}
+        self.stats = {"evaluated": 0, "skipped": 0}
+
+    def add(self, key: Hashable, condition: CompiledCondition, bindings: Optional[Dict[str, str]] = None):
+        """登记条件（key 由调用方决定，例如 ("trigger", trigger_id, 0)）"""
+        with self._lock:
+            self._entries[key] = (condition, bindings)
+            for dep in condition.dependencies(bindings):
+                self._by_dep[dep].add(key)
+            self._results.pop(key, None)
+
+    def invalidate(self, changes: Iterable[str]):
+        """让依赖这些状态键的条件失效；"*" 表示全部失效"""
+        with self._lock:
+            for change in changes:
+                if change == "*":
+                    self._results.clear()
+                    return
+                for dep in _candidate_deps(change):
+                    for key in self._by_dep.get(dep, ()):
+                        self._results.pop(key, None)
+
+    def evaluate(self, key: Hashable, state: ConditionState, cached: bool = True) -> bool:
+        """
+        求值登记过的条件
+
+        cached=False 时强制重算且不写入缓存（state 不是 WorldState 的文档时使用）。
+        """
+        with self._lock:
+            if cached and key in self._results:
+                self.stats["skipped"] += 1
+                return self._results[key]
+            condition, bindings = self._entries[key]
+            result = condition(state, bindings)
+            self.stats["evaluated"] += 1
+            if cached:
+                self._results[key] = result
+            return result
@@ -9,9 +9,8 @@
 # 5. 【v9新增】从世界观库读取约束，确保场景符合arc阶段要求
 # ============================================================================
 
-import anthropic
+import copy
 import json
-import yaml
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, field
@@ -21,15 +20,24 @@ from datetime import datetime
 
 # 添加父目录到路径以导入config
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from config import get_api_key, MODEL, MAX_TOKENS
+from config import MODEL, MAX_TOKENS, COMPACT_OUTPUT
 
 # 导入公共工具函数
-from .utils import clean_json_response, fix_truncated_json, parse_json_with_diagnostics
+from .utils import parse_json_with_diagnostics
 
 # 【v9新增】导入世界观库和事件树引擎
 from .world_loader import WorldLoader, get_world_loader
 from .event_tree_engine import EventTreeEngine
 from .scene_validator import SceneValidator
+from .llm_gateway import get_gateway
+from .world_state import WorldState, get_world_state
+from .world_bundle import get_world_bundle
+from .character_registry import get_character_registry
+from .compact_schema import PLANNER_FORMAT, build_cast, format_cast, expand_scene_plan
+from .prompt_cache import (
+    build_cached_system, format_world_rules, format_tone_guidance,
+    get_prompt_cache_stats, get_prompt_cache_heartbeat
+)
 
 
 # ============================================================================
@@ -79,8 +87,7 @@ def load_json(filepath: str) -> dict:
         return json.load(f)
 
 def load_yaml(filepath: str) -> dict:
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    return get_world_bundle().load_yaml(filepath)
 
 # ============================================================================
 # 导演规划层
@@ -89,29 +96,37 @@ def load_yaml(filepath: str) -> dict:
 class DirectorPlanner:
     """导演规划层 - 生成场景规划(ScenePlan)"""
 
-    def __init__(self, project_root: Path = None):
-        self.client = anthropic.Anthropic(api_key=get_api_key("director"))
+    def __init__(self, project_root: Path = None, world_state: WorldState = None):
+        self.gateway = get_gateway()
         self.project_root = project_root or Path(__file__).parent.parent
+        self.world_state = world_state or get_world_state(self.project_root)
+        self.characters = get_character_registry(self.project_root)
         self.prompt_template = self._load_prompt_template()
 
         # 【v9新增】世界观库和事件树引擎
         self.world_loader = get_world_loader(project_root=self.project_root)
-        self.event_engine = EventTreeEngine(self.world_loader, self.project_root)
+        self.event_engine = EventTreeEngine(self.world_loader, self.project_root, self.world_state)
         self.scene_validator = SceneValidator(self.world_loader, self.project_root)
-        self.scene_history = self._load_scene_history()
-
-    def _load_scene_history(self) -> Dict:
-        """【v9新增】加载场景历史"""
-        path = self.project_root / "world_state" / "scene_history.json"
-        if path.exists():
-            return load_json(path)
-        return {"scenes": [], "location_last_used": {}, "character_last_focus": {}, "activity_last_used": {}}
+        self._static_system = None  # 静态 system 块（prompt 缓存前缀）
+        self.compact_output = COMPACT_OUTPUT  # 场景规划使用紧凑输出格式
+
+    def for_world(self, world_state: WorldState) -> "DirectorPlanner":
+        """绑定到另一份世界状态（WorldSnapshot）的浅拷贝，场景预取在上面规划"""
+        view = copy.copy(self)
+        view.world_state = world_state
+        view.event_engine = self.event_engine.for_world(world_state)
+        return view
+
+    @property
+    def scene_history(self) -> Dict:
+        """【v9新增】场景历史（WorldState 中的共享副本）"""
+        if not self.world_state.exists("scene_history"):
+            self.world_state.set("scene_history", self.world_state.get("scene_history"))
+        return self.world_state.get("scene_history")
 
     def _save_scene_history(self):
-        """【v9新增】保存场景历史"""
-        path = self.project_root / "world_state" / "scene_history.json"
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(self.scene_history, f, ensure_ascii=False, indent=2)
+        """【v9新增】保存场景历史（回合结束时统一落盘）"""
+        self.world_state.mark_dirty("scene_history")
 
     def _get_recent_scenes_summary(self, count: int = 5) -> str:
         """【v9新增】获取最近N个场景的摘要（用于prompt）"""
@@ -131,10 +146,8 @@ class DirectorPlanner:
 
     def _get_current_period(self) -> str:
         """【v9新增】获取当前时段"""
-        current_day_path = self.project_root / "world_state" / "current_day.json"
-        if current_day_path.exists():
-            data = load_json(current_day_path)
-            return data.get("period", "morning")
+        if self.world_state.exists("current_day"):
+            return self.world_state.get("current_day").get("period", "morning")
         return "morning"
 
     def _build_dynamic_constraints(self, day: int, context: Dict) -> str:
@@ -205,8 +218,7 @@ class DirectorPlanner:
         """加载prompt模板"""
         prompt_path = self.project_root / "prompts" / "director_planner_prompt.txt"
         if prompt_path.exists():
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            return get_world_bundle(self.project_root).read_text(prompt_path)
         return self._get_default_prompt()
 
     def _get_default_prompt(self) -> str:
@@ -229,8 +241,8 @@ class DirectorPlanner:
 
     def load_game_context(self) -> Dict:
         """加载游戏上下文"""
-        current_day = load_json(self.project_root / "world_state" / "current_day.json")
-        character_states = load_json(self.project_root / "world_state" / "character_states.json")
+        current_day = self.world_state.get("current_day")
+        character_states = self.world_state.get("character_states")
 
         return {
             "day": current_day.get("day", 1),
@@ -243,9 +255,8 @@ class DirectorPlanner:
 
     def _load_narrative_context(self) -> Dict:
         """【连续性新增】加载叙事上下文"""
-        narrative_path = self.project_root / "world_state" / "narrative_context.json"
-        if narrative_path.exists():
-            return load_json(narrative_path)
+        if self.world_state.exists("narrative_context"):
+            return self.world_state.get("narrative_context")
         return {
             "last_scene": None,
             "recent_scenes": [],
@@ -256,9 +267,7 @@ class DirectorPlanner:
 
     def _save_narrative_context(self, context: Dict):
         """【连续性新增】保存叙事上下文"""
-        narrative_path = self.project_root / "world_state" / "narrative_context.json"
-        with open(narrative_path, 'w', encoding='utf-8') as f:
-            json.dump(context, f, ensure_ascii=False, indent=2)
+        self.world_state.set("narrative_context", context)
 
     def _build_narrative_memory_prompt(self, narrative_ctx: Dict, characters: List[str]) -> str:
         """【连续性新增】构建叙事记忆prompt"""
@@ -317,33 +326,12 @@ class DirectorPlanner:
         return ""
 
     def load_character_data(self, char_id: str) -> Dict:
-        """加载角色完整数据"""
-        char_path = self.project_root / "characters" / char_id
-
-        try:
-            core = load_yaml(char_path / "core.yaml")
-            personality = load_yaml(char_path / "personality.yaml")
-            speech = load_yaml(char_path / "speech.yaml")
-            relationships = load_yaml(char_path / "relationships.yaml") if (char_path / "relationships.yaml").exists() else {}
-
-            return {
-                "core": core,
-                "personality": personality,
-                "speech": speech,
-                "relationships": relationships
-            }
-        except Exception as e:
-            print(f"[DirectorPlanner] 加载角色数据失败 {char_id}: {e}")
-            return {
-                "core": {"name": {"zh": char_id}},
-                "personality": {"versions": {"simple": "性格未知"}},
-                "speech": {"first_person": "我"},
-                "relationships": {}
-            }
+        """加载角色完整数据（角色注册表，进程内只读一次）"""
+        return self.characters.get(char_id)
 
     def get_characters_at_location(self, location: str) -> List[str]:
         """获取指定地点的角色列表"""
-        character_states = load_json(self.project_root / "world_state" / "character_states.json")
+        character_states = self.world_state.get("character_states")
         return [
             char_id for char_id, state in character_states.items()
             if state.get("location") == location
@@ -353,12 +341,11 @@ class DirectorPlanner:
 
     def _load_day_outline(self, day: int) -> Dict:
         """加载指定日期的大纲"""
-        outline_path = self.project_root / "world_state" / "chapter_outline.json"
-        if not outline_path.exists():
+        if not self.world_state.exists("chapter_outline"):
             return {"theme": "", "key_events": []}
 
         try:
-            outline = load_json(outline_path)
+            outline = self.world_state.get("chapter_outline")
             days = outline.get("days", [])
             for day_data in days:
                 if day_data.get("day") == day:
@@ -379,9 +366,16 @@ class DirectorPlanner:
         location: str,
         scene_type: str = "free",  # "free" | "fixed" | "investigation" | "trial"
         fixed_event_data: Optional[Dict] = None,
-        player_location: str = None
+        player_location: str = None,
+        commit: bool = True
     ) -> ScenePlan:
-        """生成场景规划"""
+        """
+        生成场景规划
+
+        Args:
+            commit: 是否把场景写入历史/叙事上下文。预取时传 False，
+                    玩家真正进入该场景时再调用 commit_scene()
+        """
 
         # 1. 加载上下文
         context = self.load_game_context()
@@ -429,8 +423,8 @@ class DirectorPlanner:
         game_context = self.event_engine.load_game_context()
         triggered_events = self.event_engine.check_triggers(game_context)
 
-        # 5. 构建prompt（传入大纲信息 + 约束 + 叙事记忆）
-        prompt = self._build_planner_prompt(
+        # 5. 构建prompt（静态 system 块 + 动态 user 块）
+        system, prompt = self._build_planner_prompt(
             context, characters_info, location, scene_type,
             fixed_event_data, day_outline,
             dynamic_constraints=dynamic_constraints,
@@ -440,39 +434,59 @@ class DirectorPlanner:
             triggered_events=triggered_events
         )
 
-        # 6. 调用API
+        # 6. 调用API（固定事件的规划可以复用响应缓存，自由场景每次重新生成）
+        completion = None
         try:
-            response = self.client.messages.create(
+            completion = self.gateway.create_text(
+                "director",
                 model=MODEL,
                 max_tokens=4096,
-                messages=[{"role": "user", "content": prompt}]
+                system=system,
+                messages=[{"role": "user", "content": prompt}],
+                cache="fixed_scene_plan" if fixed_event_data else "free_scene_plan"
             )
+            for response in completion.responses:
+                get_prompt_cache_stats().record("DirectorPlanner", response)
+            get_prompt_cache_heartbeat().register("DirectorPlanner", "director", system)
 
-            raw_text = response.content[0].text
-            print(f"[DirectorPlanner] API 响应长度: {len(raw_text)} 字符")
+            raw_text = completion.text
+            print(f"[DirectorPlanner] API 响应长度: {len(raw_text)} 字符"
+                  f"{f'（续写 {completion.continuations} 次）' if completion.continuations else ''}")
 
-            # 使用公共函数解析 JSON（三次尝试：原始→清理→修复）
+            # 使用公共函数解析 JSON（严格解析失败时单遍宽容解析）
             result = parse_json_with_diagnostics(raw_text, "场景规划", "DirectorPlanner")
+            if self.compact_output:
+                result = expand_scene_plan(result, build_cast(characters_info))
             scene_plan = self._parse_scene_plan(result, location)
 
             # 【v9新增】验证并修正场景
             scene_plan = self._validate_and_fix(scene_plan, day)
 
-            # 【v9新增】记录到历史
-            self._record_scene(scene_plan)
-
-            # 【连续性新增】保存到叙事上下文
-            self._save_scene_to_narrative(scene_plan, chars_at_location)
+            if commit:
+                self.commit_scene(scene_plan, chars_at_location)
 
             return scene_plan
 
         except json.JSONDecodeError as e:
             print(f"[DirectorPlanner] JSON 解析最终失败，使用回退场景")
+            self.gateway.forget(completion)
             return self._create_fallback_scene(location, chars_at_location)
         except Exception as e:
             print(f"[DirectorPlanner] API调用失败: {type(e).__name__}: {e}")
+            self.gateway.forget(completion)
             return self._create_fallback_scene(location, chars_at_location)
 
+    def commit_scene(self, scene_plan: ScenePlan, characters: Optional[List[str]] = None):
+        """把已规划的场景写入场景历史和叙事上下文（plan_scene(commit=False) 之后调用）"""
+        if characters is None:
+            characters = self.get_characters_at_location(scene_plan.location)
+
+        # 【v9新增】记录到历史
+        self._record_scene(scene_plan)
+
+        # 【连续性新增】保存到叙事上下文
+        self._save_scene_to_narrative(scene_plan, characters)
+
     def _validate_and_fix(self, scene_plan: ScenePlan, day: int) -> ScenePlan:
         """【v9新增】验证并修正场景是否符合约束"""
         return self.scene_validator.auto_fix(scene_plan, day)
@@ -569,6 +583,95 @@ class DirectorPlanner:
         self._save_narrative_context(narrative_ctx)
         print(f"[DirectorPlanner] 叙事上下文已更新: {scene_plan.ending_type}结尾")
 
+    def _get_static_system(self) -> Any:
+        """静态 system 块：模板说明 + 世界观规则 + 氛围指导 + 全体角色档案（回合间不变，可缓存）"""
+        if self._static_system is not None:
+            return self._static_system
+
+        # 输出格式
+        output_format = """{
+  "scene_id": "场景ID",
+  "scene_name": "场景名称",
+  "location": "地点",
+  "time_estimate_minutes": 5-10,
+  "overall_arc": "整体情感弧线描述",
+  "beats": [
+    {
+      "beat_id": "beat_1",
+      "beat_type": "opening|development|tension|climax|resolution",
+      "description": "这个beat要表达什么",
+      "characters": ["char_id1", "char_id2"],
+      "speaker_order": ["char_id1", "char_id2", "char_id1"],
+      "emotion_targets": {"char_id1": "情绪", "char_id2": "情绪"},
+      "tension_level": 1-10,
+      "dialogue_count": 3-6,
+      "direction_notes": "导演指示"
+    }
+  ],
+  "key_moments": ["关键时刻1", "关键时刻2"],
+  "player_choice_point": {
+    "after_beat": "beat_id",
+    "prompt": "提示语",
+    "options": [
+      {"id": "A", "text": "选项A", "leads_to": "正面"},
+      {"id": "B", "text": "选项B", "leads_to": "中性"},
+      {"id": "C", "text": "选项C", "leads_to": "危险"}
+    ]
+  },
+  "outcomes": {
+    "stress_changes": {"char_id": 变化值},
+    "relationship_changes": {},
+    "flags_to_set": []
+  },
+  "recommended_bgm": "BGM名称"
+}"""
+
+        if self.compact_output:
+            output_format = PLANNER_FORMAT
+
+        intro = """你是一位经验丰富的视觉小说导演。你的任务是规划一个场景的剧本大纲。
+
+【游戏背景】
+《魔法少女的魔女审判》是一款推理解谜视觉小说。
+13名少女被关在孤岛监牢中，如果发生杀人事件需要进行魔女审判投票。
+压力(stress)和疯狂(madness)值会影响角色行为，madness>70可能触发杀人。"""
+
+        instructions = f"""【场景故事性要求】最重要
+每个场景必须是一个完整的小故事，不是几句对话。
+必须包含：
+1. 【开场】环境描写，建立画面感（光线、声音、氛围）
+2. 【铺垫】角色状态，暗示即将发生的事
+3. 【发展】实质互动，对话+动作+细节
+4. 【转折】关键时刻，给玩家留下印象
+5. 【收尾】余韵，时间流逝感，悬念或情感落点
+
+对话要求：
+- 不是纯对话剧本，每2-3句对话穿插一次动作/神态/环境描写
+- 角色说话时要有「在做什么」「表情如何」「小动作」
+- 沉默也是表达，用「...」和动作描写代替
+
+【任务】
+请规划一个5-10分钟的场景，包含4-6个beat（戏剧节拍）。
+- opening: 场景开场，建立氛围（环境描写为主）
+- development: 发展，角色互动深入
+- tension: 紧张，冲突或压力升级
+- climax: 高潮，情感爆发点
+- resolution: 收尾，情绪缓和
+
+【输出格式】严格JSON：
+{output_format}
+
+请直接输出JSON，不要使用markdown代码块。"""
+
+        self._static_system = build_cached_system(
+            intro,
+            format_world_rules(self.world_loader),
+            format_tone_guidance(self.world_loader),
+            self.characters.cards_text(),
+            instructions
+        )
+        return self._static_system
+
     def _build_planner_prompt(
         self,
         context: Dict,
@@ -582,8 +685,13 @@ class DirectorPlanner:
         narrative_memory: str = "",  # 【连续性新增】
         repetition_warnings: List[str] = None,
         triggered_events: List = None
-    ) -> str:
-        """构建规划层prompt（v9增强版 + 连续性v11）"""
+    ) -> Tuple[Any, str]:
+        """
+        构建规划层prompt（v9增强版 + 连续性v11）
+
+        Returns:
+            (system, user)：system 为可缓存的静态块，user 为本回合的动态内容
+        """
 
         if repetition_warnings is None:
             repetition_warnings = []
@@ -613,53 +721,20 @@ class DirectorPlanner:
 
         context_str += day_theme + day_events
 
-        # 格式化角色信息
+        # 格式化角色状态（性格见 system 中的角色档案）
         chars_str = ""
         for char_id, info in characters_info.items():
             chars_str += f"""
 【{info['name']}】({char_id})
-  性格: {info['personality'][:100]}...
   压力: {info['stress']}/100 | 疯狂: {info['madness']}/100
   情绪: {info['emotion']} | 行为: {info['action']}
 """
 
-        # 输出格式
-        output_format = """{
-  "scene_id": "场景ID",
-  "scene_name": "场景名称",
-  "location": "地点",
-  "time_estimate_minutes": 5-10,
-  "overall_arc": "整体情感弧线描述",
-  "beats": [
-    {
-      "beat_id": "beat_1",
-      "beat_type": "opening|development|tension|climax|resolution",
-      "description": "这个beat要表达什么",
-      "characters": ["char_id1", "char_id2"],
-      "speaker_order": ["char_id1", "char_id2", "char_id1"],
-      "emotion_targets": {"char_id1": "情绪", "char_id2": "情绪"},
-      "tension_level": 1-10,
-      "dialogue_count": 3-6,
-      "direction_notes": "导演指示"
-    }
-  ],
-  "key_moments": ["关键时刻1", "关键时刻2"],
-  "player_choice_point": {
-    "after_beat": "beat_id",
-    "prompt": "提示语",
-    "options": [
-      {"id": "A", "text": "选项A", "leads_to": "正面"},
-      {"id": "B", "text": "选项B", "leads_to": "中性"},
-      {"id": "C", "text": "选项C", "leads_to": "危险"}
-    ]
-  },
-  "outcomes": {
-    "stress_changes": {"char_id": 变化值},
-    "relationship_changes": {},
-    "flags_to_set": []
-  },
-  "recommended_bgm": "BGM名称"
-}"""
+        # 紧凑格式：角色用序号表示
+        cast_str = ""
+        if self.compact_output:
+            names = {char_id: info['name'] for char_id, info in characters_info.items()}
+            cast_str = format_cast(build_cast(characters_info), names)
 
         # 【v9新增】格式化重复警告
         repetition_str = ""
@@ -673,15 +748,8 @@ class DirectorPlanner:
                 f"- {e.trigger_id}: {e.description}" for e in triggered_events[:3]
             )
 
-        # 组合prompt（v9增强版 + 连续性v11）
-        prompt = f"""你是一位经验丰富的视觉小说导演。你的任务是规划一个场景的剧本大纲。
-
-【游戏背景】
-《魔法少女的魔女审判》是一款推理解谜视觉小说。
-13名少女被关在孤岛监牢中，如果发生杀人事件需要进行魔女审判投票。
-压力(stress)和疯狂(madness)值会影响角色行为，madness>70可能触发杀人。
-
-{story_context}
+        # 动态部分（v9增强版 + 连续性v11）
+        prompt = f"""{story_context}
 
 {dynamic_constraints}
 
@@ -692,37 +760,13 @@ class DirectorPlanner:
 
 【在场角色】
 {chars_str}
+{cast_str}
 {repetition_str}
 {triggered_str}
 
-【场景故事性要求】最重要
-每个场景必须是一个完整的小故事，不是几句对话。
-必须包含：
-1. 【开场】环境描写，建立画面感（光线、声音、氛围）
-2. 【铺垫】角色状态，暗示即将发生的事
-3. 【发展】实质互动，对话+动作+细节
-4. 【转折】关键时刻，给玩家留下印象
-5. 【收尾】余韵，时间流逝感，悬念或情感落点
-
-对话要求：
-- 不是纯对话剧本，每2-3句对话穿插一次动作/神态/环境描写
-- 角色说话时要有「在做什么」「表情如何」「小动作」
-- 沉默也是表达，用「...」和动作描写代替
-
-【任务】
-请规划一个5-10分钟的场景，包含4-6个beat（戏剧节拍）。
-- opening: 场景开场，建立氛围（环境描写为主）
-- development: 发展，角色互动深入
-- tension: 紧张，冲突或压力升级
-- climax: 高潮，情感爆发点
-- resolution: 收尾，情绪缓和
-
-【输出格式】严格JSON：
-{output_format}
-
-请直接输出JSON，不要使用markdown代码块。"""
+请按 system 中的要求输出本场景的JSON规划。"""
 
-        return prompt
+        return self._get_static_system(), prompt
 
     def _parse_scene_plan(self, result: Dict, location: str) -> ScenePlan:
         """解析API返回的场景规划"""
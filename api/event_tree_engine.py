@@ -2,12 +2,13 @@
 事件树引擎 - 管理故事分支和条件触发
 """
 
-import json
-import re
+import copy
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from .world_loader import WorldLoader, get_world_loader
+from .world_state import WorldState, get_world_state
+from .conditions import ConditionState, ConditionIndex, compile_condition, compile_all
 
 
 @dataclass
@@ -56,10 +57,11 @@ class SceneParams:
 class EventTreeEngine:
     """事件树引擎 - 管理故事分支和条件触发"""
 
-    def __init__(self, world_loader: WorldLoader = None, project_root: Path = None):
+    def __init__(self, world_loader: WorldLoader = None, project_root: Path = None, world_state: WorldState = None):
         if project_root is None:
             project_root = Path(__file__).parent.parent
         self.project_root = project_root
+        self.world_state = world_state or get_world_state(project_root)
 
         if world_loader is None:
             self.world = get_world_loader(project_root=project_root)
@@ -72,6 +74,80 @@ class EventTreeEngine:
         self.character_arcs = self.world.load_character_arcs()
         self.endings = self.world.load_endings()
 
+        self._compile_conditions()
+
+    def for_world(self, world_state: WorldState) -> "EventTreeEngine":
+        """绑定到另一份世界状态（WorldSnapshot）的浅拷贝；已编译的条件共用"""
+        view = copy.copy(self)
+        view.world_state = world_state
+        return view
+
+    def _compile_conditions(self):
+        """
+        加载时把 triggers / character_arcs / endings 中的条件全部编译一次，
+        登记到依赖索引；WorldState 发布变更时只有依赖被修改的条件失效
+        """
+        self._index = ConditionIndex()
+        self.world_state.subscribe(self._index.invalidate)
+
+        def register(prefix, name, conditions, bindings=None):
+            keys = []
+            for i, condition in enumerate(conditions):
+                key = (prefix, name, i)
+                self._index.add(key, condition, bindings)
+                keys.append(key)
+            return keys
+
+        self._trigger_keys = {
+            trigger_id: register('trigger', trigger_id, compile_all(data.get('conditions', [])))
+            for trigger_id, data in self.triggers.get('trigger_templates', {}).items()
+        }
+        self._arc_prerequisite_keys = {}
+        self._arc_stage_keys = {}
+        for arc_name, arc_data in self.character_arcs.get('arcs', {}).items():
+            bindings = {'char': arc_data.get('character', '')}
+            self._arc_prerequisite_keys[arc_name] = register(
+                'arc', arc_name, compile_all(arc_data.get('prerequisites', [])), bindings
+            )
+            self._arc_stage_keys[arc_name] = [
+                register('arc_stage', (arc_name, i), [compile_condition(stage.get('trigger', ''))], bindings)
+                for i, stage in enumerate(arc_data.get('stages', []))
+            ]
+        self._ending_keys = {
+            ending_id: register('ending', ending_id, compile_all(data.get('trigger', [])))
+            for ending_id, data in self.endings.get('endings', {}).items()
+        }
+
+    def _condition_state(self, context: Dict) -> Tuple[ConditionState, bool]:
+        """
+        构建条件求值的状态视图
+
+        Returns:
+            (状态视图, 能否使用缓存结果)。context 直接引用 WorldState 的文档时
+            先发布变更再复用缓存；其他来源的 context 全部重新求值。
+        """
+        cached = (
+            not self.world_state.detached
+            and context.get('current_day') is self.world_state.get('current_day')
+            and context.get('character_states') is self.world_state.get('character_states')
+        )
+        if cached:
+            self.world_state.publish_changes()
+        return ConditionState.from_context(context), cached
+
+    def _all_met(self, keys: List, state: ConditionState, cached: bool) -> bool:
+        return all(self._index.evaluate(key, state, cached) for key in keys)
+
+    def trigger_stats(self) -> Dict[str, int]:
+        """条件求值统计（evaluated: 实际求值次数, skipped: 依赖未变化而复用结果的次数）"""
+        return dict(self._index.stats)
+
+    def print_trigger_stats(self):
+        stats = self.trigger_stats()
+        total = stats['evaluated'] + stats['skipped']
+        print(f"[EventTreeEngine] 条件求值 {stats['evaluated']} 次 / 跳过 {stats['skipped']} 次"
+              f"（共 {total} 次检查）")
+
     def get_day_plan(self, day: int) -> DayPlan:
         """获取指定日期的事件计划"""
         day_key = f"day_{day}"
@@ -95,53 +171,25 @@ class EventTreeEngine:
         )
 
     def load_game_context(self) -> Dict:
-        """加载游戏上下文"""
-        context = {}
-
-        # 加载current_day
-        current_day_path = self.project_root / "world_state" / "current_day.json"
-        if current_day_path.exists():
-            with open(current_day_path, 'r', encoding='utf-8') as f:
-                context['current_day'] = json.load(f)
-        else:
-            context['current_day'] = {'day': 1, 'period': 'dawn', 'event_count': 0, 'flags': {}}
-
-        # 加载character_states
-        char_states_path = self.project_root / "world_state" / "character_states.json"
-        if char_states_path.exists():
-            with open(char_states_path, 'r', encoding='utf-8') as f:
-                context['character_states'] = json.load(f)
-        else:
-            context['character_states'] = {}
-
-        # 加载scene_history
-        scene_history_path = self.project_root / "world_state" / "scene_history.json"
-        if scene_history_path.exists():
-            with open(scene_history_path, 'r', encoding='utf-8') as f:
-                context['scene_history'] = json.load(f)
-        else:
-            context['scene_history'] = {'scenes': [], 'location_last_used': {}, 'character_last_focus': {}, 'activity_last_used': {}}
-
-        return context
+        """加载游戏上下文（直接取 WorldState 内存副本，只读使用）"""
+        return {
+            'current_day': self.world_state.get('current_day'),
+            'character_states': self.world_state.get('character_states'),
+            'scene_history': self.world_state.get('scene_history'),
+        }
 
     def check_triggers(self, context: Dict) -> List[TriggerResult]:
         """检查所有触发条件，返回应触发的事件"""
         results = []
         trigger_templates = self.triggers.get('trigger_templates', {})
+        state, cached = self._condition_state(context)
 
         for trigger_id, trigger_data in trigger_templates.items():
-            conditions = trigger_data.get('conditions', [])
             probability = trigger_data.get('probability', 1.0)
             description = trigger_data.get('description', '')
 
-            # 检查所有条件
-            all_met = True
-            for condition in conditions:
-                if not self.evaluate_condition(condition, context):
-                    all_met = False
-                    break
-
-            if all_met:
+            # 检查所有条件（含未绑定占位符的模板条件视为不满足）
+            if self._all_met(self._trigger_keys[trigger_id], state, cached):
                 results.append(TriggerResult(
                     trigger_id=trigger_id,
                     trigger_type=trigger_id,
@@ -154,44 +202,8 @@ class EventTreeEngine:
         return results
 
     def evaluate_condition(self, condition: str, context: Dict) -> bool:
-        """评估条件表达式"""
-        try:
-            current_day = context.get('current_day', {})
-            character_states = context.get('character_states', {})
-
-            # 替换变量
-            condition = condition.strip()
-
-            # 处理简单的变量替换
-            # day相关
-            condition = condition.replace('day', str(current_day.get('day', 1)))
-
-            # 处理角色状态 {char}.xxx
-            char_pattern = r'\{(\w+)\}\.(\w+)'
-            matches = re.findall(char_pattern, condition)
-            for char_id, attr in matches:
-                char_state = character_states.get(char_id, {})
-                value = char_state.get(attr, 0)
-                condition = condition.replace(f'{{{char_id}}}.{attr}', str(value))
-
-            # 处理flag
-            flag_pattern = r'flag\.(\w+)'
-            flag_matches = re.findall(flag_pattern, condition)
-            for flag_name in flag_matches:
-                flag_value = current_day.get('flags', {}).get(flag_name, False)
-                condition = condition.replace(f'flag.{flag_name}', str(flag_value).lower())
-
-            # 尝试评估
-            # 将python布尔值转换
-            condition = condition.replace('true', 'True').replace('false', 'False')
-
-            # 安全评估
-            result = eval(condition, {"__builtins__": {}}, {})
-            return bool(result)
-
-        except Exception as e:
-            # 如果条件无法评估，返回False
-            return False
+        """评估条件表达式（编译结果按文本缓存）"""
+        return compile_condition(condition)(ConditionState.from_context(context))
 
     def get_available_scene_types(self, day: int, history: List) -> List[str]:
         """获取可用场景类型（排除最近用过的）"""
@@ -274,40 +286,29 @@ class EventTreeEngine:
         arcs = self.character_arcs.get('arcs', {})
         current_day = context.get('current_day', {})
         day = current_day.get('day', 1)
-        character_states = context.get('character_states', {})
+        state, cached = self._condition_state(context)
 
         for arc_name, arc_data in arcs.items():
             character = arc_data.get('character', '')
-            prerequisites = arc_data.get('prerequisites', [])
             stages = arc_data.get('stages', [])
 
             # 检查前置条件
-            prereqs_met = True
-            for prereq in prerequisites:
-                if not self.evaluate_condition(prereq, context):
-                    prereqs_met = False
-                    break
-
-            if not prereqs_met:
+            if not self._all_met(self._arc_prerequisite_keys[arc_name], state, cached):
                 continue
 
             # 检查每个阶段
-            for stage in stages:
+            for stage, stage_keys in zip(stages, self._arc_stage_keys[arc_name]):
                 stage_name = stage.get('stage', '')
                 day_range = stage.get('day_range', [1, 7])
-                trigger_condition = stage.get('trigger', '')
                 player_can_notice = stage.get('player_can_notice', False)
 
                 # 检查是否在日期范围内
                 if day < day_range[0] or day > day_range[1]:
                     continue
 
-                # 检查触发条件
-                if trigger_condition:
-                    # 替换角色变量
-                    trigger_condition = trigger_condition.replace('{char}', character)
-                    if not self.evaluate_condition(trigger_condition, context):
-                        continue
+                # 检查触发条件（{char} 绑定为弧线角色）
+                if not self._all_met(stage_keys, state, cached):
+                    continue
 
                 # 检查是否已触发过
                 arc_flag = f"{character}_arc_{stage_name}"
@@ -329,76 +330,19 @@ class EventTreeEngine:
         """检查是否满足某个结局条件"""
         endings_data = self.endings.get('endings', {})
         ending_priority = self.endings.get('ending_priority', {}).get('order', [])
-        current_day = context.get('current_day', {})
-        character_states = context.get('character_states', {})
+        state, cached = self._condition_state(context)
 
         # 按优先级检查
         for ending_id in ending_priority:
             if ending_id not in endings_data:
                 continue
 
-            ending = endings_data[ending_id]
-            triggers = ending.get('trigger', [])
-
             # 检查所有触发条件
-            all_met = True
-            for trigger in triggers:
-                if not self._check_ending_trigger(trigger, context):
-                    all_met = False
-                    break
-
-            if all_met:
+            if self._all_met(self._ending_keys[ending_id], state, cached):
                 return ending_id
 
         return None
 
-    def _check_ending_trigger(self, trigger: str, context: Dict) -> bool:
-        """检查单个结局触发条件"""
-        current_day = context.get('current_day', {})
-        character_states = context.get('character_states', {})
-
-        # 处理特殊条件
-        if trigger.startswith('flag.'):
-            flag_name = trigger.replace('flag.', '')
-            return current_day.get('flags', {}).get(flag_name, False)
-
-        if trigger.startswith('NOT '):
-            inner = trigger[4:].strip()
-            return not self._check_ending_trigger(inner, context)
-
-        if trigger == 'day == 7':
-            return current_day.get('day', 1) == 7
-
-        if trigger == 'alive_count == 13':
-            # 检查存活人数
-            alive = sum(1 for char_id, state in character_states.items()
-                        if state.get('alive', True))
-            return alive == 13
-
-        if trigger.startswith('trial_result =='):
-            # 检查审判结果
-            result = trigger.split('==')[1].strip()
-            return current_day.get('flags', {}).get('trial_result', '') == result
-
-        if trigger.startswith('player.madness >='):
-            threshold = int(trigger.split('>=')[1].strip())
-            player_state = character_states.get('player', {})
-            return player_state.get('madness', 0) >= threshold
-
-        if trigger.startswith('avg(all_characters.affection) >='):
-            threshold = int(trigger.split('>=')[1].strip())
-            total = 0
-            count = 0
-            for char_id, state in character_states.items():
-                if char_id != 'player':
-                    total += state.get('affection', 50)
-                    count += 1
-            avg = total / count if count > 0 else 0
-            return avg >= threshold
-
-        # 默认尝试评估
-        return self.evaluate_condition(trigger, context)
-
     def get_anti_repetition_warnings(self, location: str, characters: List[str], context: Dict) -> List[str]:
         """获取防重复警告"""
         warnings = []
@@ -7,11 +7,14 @@
 # 3. 支持多种触发类型：auto, event_count, condition, after_event
 # ============================================================================
 
-import yaml
 import json
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
+from .world_state import WorldState, get_world_state
+from .world_bundle import get_world_bundle
+from .conditions import ConditionState, compile_condition
+
 
 def load_json(filepath) -> dict:
     with open(filepath, 'r', encoding='utf-8') as f:
@@ -22,17 +25,18 @@ def save_json(filepath, data: dict):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 def load_yaml(filepath) -> dict:
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    return get_world_bundle().load_yaml(filepath)
 
 
 class FixedEventManager:
     """固定事件管理器"""
 
-    def __init__(self, project_root: Path = None):
+    def __init__(self, project_root: Path = None, world_state: WorldState = None):
         self.project_root = project_root or Path(__file__).parent.parent
+        self.world_state = world_state or get_world_state(self.project_root)
         self.events = self._load_fixed_events()
         self.config = self.events.get("config", {})
+        self._compile_conditions()
 
     def _load_fixed_events(self) -> Dict:
         """加载固定事件定义"""
@@ -41,14 +45,25 @@ class FixedEventManager:
             return load_yaml(path)
         return {"fixed_events": {}}
 
+    def _compile_conditions(self):
+        """加载时把触发条件和分支条件全部编译一次（结果进入 compile_condition 缓存）"""
+        self.invalid_conditions = []
+        for event_id, event_data in self.events.get("fixed_events", {}).items():
+            conditions = [event_data.get("trigger", {}).get("condition")]
+            conditions += [branch.get("condition") for branch in event_data.get("branch", []) or []]
+            for condition in conditions:
+                if condition and not compile_condition(condition).ok:
+                    self.invalid_conditions.append((event_id, condition))
+        for event_id, condition in self.invalid_conditions:
+            print(f"[FixedEventManager] 无法解析的条件: {event_id}: {condition}")
+
     def _load_current_state(self) -> Dict:
         """加载当前游戏状态"""
-        current_day = load_json(self.project_root / "world_state" / "current_day.json")
-        return current_day
+        return self.world_state.get("current_day")
 
     def _load_character_states(self) -> Dict:
         """加载角色状态"""
-        return load_json(self.project_root / "world_state" / "character_states.json")
+        return self.world_state.get("character_states")
 
     def get_triggered_events(self) -> List[str]:
         """获取已触发事件列表"""
@@ -57,13 +72,12 @@ class FixedEventManager:
 
     def mark_event_triggered(self, event_id: str):
         """标记事件已触发"""
-        path = self.project_root / "world_state" / "current_day.json"
-        state = load_json(path)
+        state = self.world_state.get("current_day")
         if "triggered_events" not in state:
             state["triggered_events"] = []
         if event_id not in state["triggered_events"]:
             state["triggered_events"].append(event_id)
-        save_json(path, state)
+        self.world_state.mark_dirty("current_day")
 
     def get_pending_fixed_event(self) -> Optional[Dict]:
         """
@@ -212,78 +226,22 @@ class FixedEventManager:
 
     def _evaluate_condition(self, condition: str, flags: Dict = None) -> bool:
         """
-        评估条件字符串
+        评估条件字符串（语法见 api/conditions.py）
 
         支持的条件：
         - flag_xxx: 检查 flags["xxx"] == True
-        - highest_madness_above_70: 检查最高 madness > 70
-        - day3_night_no_murder: 第三天夜晚且无杀人
+        - highest_madness_above_70 / day3_night_no_murder 等旧式命名条件
         - 复杂表达式: "event_count >= 3 and period == 'noon'"
-        - 等等
         """
         if not condition:
             return True
 
-        if flags is None:
-            flags = {}
-
-        # flag 检查
-        if condition.startswith("flag_"):
-            flag_name = condition[5:]  # 去掉 "flag_" 前缀
-            return flags.get(flag_name, False)
-
-        # 特殊条件
-        if condition == "highest_madness_above_70":
-            states = self._load_character_states()
-            max_madness = max(
-                (s.get("madness", 0) for s in states.values()
-                if s.get("status") == "alive"),
-                default=0
-            )
-            return max_madness > 70
-
-        if condition == "day3_night_no_murder":
-            state = self._load_current_state()
-            return (
-                state.get("day") == 3 and
-                state.get("period") == "night" and
-                not flags.get("murder_occurred", False)
-            )
-
-        if condition == "player_at_library":
-            # 需要外部传入玩家位置，这里简化处理
-            return False
-
-        # ★ 新增：支持复杂条件表达式（如 "event_count >= 3 and period == 'noon'"）
-        if " and " in condition or " or " in condition or ">=" in condition or "==" in condition:
-            try:
-                # 构建评估上下文
-                current_day_data = self._load_current_state()
-                char_states = self._load_character_states()
-
-                context = {
-                    "day": current_day_data.get("day", 1),
-                    "period": current_day_data.get("period", "dawn"),
-                    "phase": current_day_data.get("phase", "free_time"),
-                    "event_count": current_day_data.get("event_count", 0),
-                    "flags": flags,
-                }
-
-                # 添加角色状态变量
-                for char_id, state in char_states.items():
-                    context[f"{char_id}_stress"] = state.get("stress", 0)
-                    context[f"{char_id}_madness"] = state.get("madness", 0)
-                    context[f"{char_id}_alive"] = state.get("alive", True)
-
-                # 安全评估（禁用内置函数）
-                result = eval(condition, {"__builtins__": {}}, context)
-                return bool(result)
-            except Exception as e:
-                print(f"[FixedEventManager] 条件评估失败: {condition}, 错误: {e}")
-                return False
+        current_day = self._load_current_state()
+        if flags is not None and flags is not current_day.get("flags"):
+            current_day = {**current_day, "flags": flags}
 
-        # 默认返回 False
-        return False
+        state = ConditionState(current_day=current_day, character_states=self._load_character_states())
+        return compile_condition(condition)(state)
 
     def apply_event_outcomes(self, event_data: Dict):
         """应用事件结果"""
@@ -291,8 +249,7 @@ class FixedEventManager:
         if not outcomes:
             return
 
-        states_path = self.project_root / "world_state" / "character_states.json"
-        states = load_json(states_path)
+        states = self.world_state.get("character_states")
 
         for target, effects in outcomes.items():
             if target == "all" or target == "all_characters":
@@ -304,18 +261,17 @@ class FixedEventManager:
                 # 应用到特定角色
                 self._apply_effects(states[target], effects)
 
-        save_json(states_path, states)
+        self.world_state.mark_dirty("character_states")
 
         # 处理 flags_set
         flags_to_set = event_data.get("flags_set", [])
         if flags_to_set:
-            day_path = self.project_root / "world_state" / "current_day.json"
-            current_day = load_json(day_path)
+            current_day = self.world_state.get("current_day")
             if "flags" not in current_day:
                 current_day["flags"] = {}
             for flag in flags_to_set:
                 current_day["flags"][flag] = True
-            save_json(day_path, current_day)
+            self.world_state.mark_dirty("current_day")
 
     def _apply_effects(self, state: Dict, effects: Dict):
         """应用效果到角色状态"""
@@ -340,15 +296,18 @@ class FixedEventManager:
             "trigger_npc_scatter": event_data.get("trigger_npc_scatter", False)
         }
 
-        # 更新 current_day.json
-        day_path = self.project_root / "world_state" / "current_day.json"
-        current_day = load_json(day_path)
+        # 更新 current_day
+        current_day = self.world_state.get("current_day")
 
         # 更新阶段（phase: free_time, investigation, trial, ending）
         if result["next_phase"]:
             current_day["phase"] = result["next_phase"]
             print(f"[FixedEventManager] 阶段变更: {result['next_phase']}")
 
+        # 进入调查阶段时按事件的 investigation_limit 重置调查次数
+        if event_data.get("investigation_limit") is not None:
+            current_day["investigation_count"] = event_data["investigation_limit"]
+
         # 更新时段（period: dawn, morning, noon, afternoon, evening, night）
         if result["next_period"]:
             current_day["period"] = result["next_period"]
@@ -371,6 +330,6 @@ class FixedEventManager:
         if event_data.get("trigger_summary"):
             pass
 
-        save_json(day_path, current_day)
+        self.world_state.mark_dirty("current_day")
 
         return result
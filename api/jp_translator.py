@@ -0,0 +1,224 @@
+# ============================================================================
+# 日文台词按需生成 (JP Translator)
+# ============================================================================
+# 职责：
+# 1. LAZY_JP 模式下演出层只生成中文；日文台词（TTS / 调试显示用）在真正需要时
+#    才由这里生成
+# 2. 按批（通常是一个 Beat 或一整场）在后台线程调用一次 API，结果按台词哈希
+#    （说话者 + 中文）缓存，同一句话只翻译一次
+# 3. system 块（翻译要求 + 全体角色档案：第一人称、口癖）回合间不变，走 prompt 缓存
+# ============================================================================
+
+import contextvars
+import hashlib
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import MODEL
+
+from .utils import parse_json_with_diagnostics
+from .llm_gateway import get_gateway
+from .character_registry import get_character_registry
+from .prompt_cache import build_cached_system, get_prompt_cache_stats
+
+# 每句日文台词的输出 token 上限（按批累加）
+TOKENS_PER_LINE = 160
+
+
+def line_key(speaker: str, text_cn: str) -> str:
+    """台词哈希：同一角色的同一句中文对应同一句日文"""
+    return hashlib.sha1(f"{speaker}\x00{text_cn}".encode("utf-8")).hexdigest()
+
+
+def match_translations(translated: Any, count: int) -> Dict[int, str]:
+    """
+    模型输出 -> {台词下标: 日文}（只收下能确定对应哪一句的译文）
+
+    按编号对应：{"1": "...", "2": "..."}（也接受 {"lines": {...}} 之类的包装）。
+    旧格式的字符串数组只有句数与批次完全一致时才按位置对应——
+    模型跳过或合并了一句时，之后每一句都会错位，整批作废。
+    """
+    if isinstance(translated, dict) and not any(str(k).strip().isdigit() for k in translated):
+        translated = next((v for v in translated.values() if isinstance(v, (dict, list))), None)
+
+    if isinstance(translated, dict):
+        numbered = {}
+        for number, text_jp in translated.items():
+            number = str(number).strip()
+            if number.isdigit():
+                numbered[int(number) - 1] = text_jp
+    elif isinstance(translated, list):
+        if len(translated) != count:
+            print(f"[JPTranslator] 返回 {len(translated)} 句，与批次的 {count} 句对不上，整批作废")
+            return {}
+        numbered = dict(enumerate(translated))
+    else:
+        return {}
+
+    return {
+        index: text_jp.strip()
+        for index, text_jp in numbered.items()
+        if 0 <= index < count and isinstance(text_jp, str) and text_jp.strip()
+    }
+
+
+class JapaneseTranslator:
+    """日文台词按需生成 - 后台批量翻译 + 按台词哈希缓存"""
+
+    def __init__(self, project_root: Path = None, max_workers: int = 2):
+        self.gateway = get_gateway()
+        self.project_root = Path(project_root or Path(__file__).parent.parent)
+        self.characters = get_character_registry(self.project_root)
+
+        self._lock = threading.Lock()
+        self._done: Dict[str, str] = {}         # 台词哈希 -> 日文
+        self._pending: Dict[str, Future] = {}   # 台词哈希 -> 所在批次的 Future
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="JPTranslator")
+        self._static_system = None
+        self.stats = {"batches": 0, "lines": 0, "served": 0, "failed": 0}
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+
+    def prefetch(self, lines: Iterable[Any]):
+        """
+        在后台翻译一批台词（DialogueLine 或有 speaker / text_cn 属性的对象）
+
+        已翻译或正在翻译的台词会被跳过；剩下的合并成一次 API 调用。
+        """
+        batch = []
+        with self._lock:
+            for line in lines:
+                if getattr(line, "text_jp", ""):
+                    continue
+                key = line_key(line.speaker, line.text_cn)
+                if key in self._done or key in self._pending:
+                    continue
+                self._pending[key] = None  # 占位，同一批里的重复台词只翻译一次
+                batch.append((key, line.speaker, line.text_cn))
+            if not batch:
+                return
+            future: Future = Future()
+            for key, _, _ in batch:
+                self._pending[key] = future
+
+        # 复制当前上下文，让 usage 统计等上下文状态跟随到线程池
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._run_batch, batch, future)
+
+    def get(self, line: Any, timeout: Optional[float] = None) -> str:
+        """
+        一句台词的日文（需要时才翻译；等待所在批次完成）
+
+        结果会写回 line.text_jp。翻译失败或超时时返回中文原文（不写回，下次重试）。
+        """
+        if getattr(line, "text_jp", ""):
+            return line.text_jp
+        key = line_key(line.speaker, line.text_cn)
+        if key not in self._done and key not in self._pending:
+            self.prefetch([line])
+
+        with self._lock:
+            text_jp = self._done.get(key)
+            future = self._pending.get(key)
+        if text_jp is None and future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+            text_jp = self._done.get(key)
+
+        if text_jp is None:
+            return line.text_cn
+        self.stats["served"] += 1
+        line.text_jp = text_jp
+        return text_jp
+
+    def translate(self, lines: List[Any], timeout: Optional[float] = None) -> List[str]:
+        """一批台词的日文（同步；内部仍是一次批量调用）"""
+        lines = list(lines)
+        self.prefetch(lines)
+        return [self.get(line, timeout) for line in lines]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    # ------------------------------------------------------------------
+    # 批量翻译
+    # ------------------------------------------------------------------
+
+    def _get_static_system(self) -> Any:
+        """静态 system 块：翻译要求 + 全体角色档案（回合间不变，可缓存）"""
+        if self._static_system is not None:
+            return self._static_system
+
+        instructions = """你是视觉小说的日文台词译者。把中文台词译成角色本人会说的日语台词（用于 TTS）。
+
+要求：
+1. 保留角色原本的第一人称（私/僕/ウチ/あたし等，见角色档案）
+2. 适当使用角色的口癖，语气与情绪一致
+3. 旁白（narrator）译成自然的日文叙述
+4. 不要增删内容，不要加引号或说明
+
+输入为编号的台词列表，格式：编号. [说话者] 中文
+输出严格 JSON 对象，键为台词编号（字符串），值为该句的日文，每个编号一句，不要合并或跳过，例如：
+{"1": "日本語の台詞1", "2": "日本語の台詞2"}
+
+请直接输出JSON，不要使用markdown代码块。"""
+
+        self._static_system = build_cached_system(instructions, self.characters.cards_text())
+        return self._static_system
+
+    def _run_batch(self, batch: List[tuple], future: Future):
+        results: Dict[str, str] = {}
+        try:
+            lines_str = "\n".join(
+                f"{i}. [{speaker}] {text_cn}" for i, (_, speaker, text_cn) in enumerate(batch, 1)
+            )
+            completion = self.gateway.create_text(
+                "character",
+                model=MODEL,
+                max_tokens=min(4096, TOKENS_PER_LINE * len(batch)),
+                system=self._get_static_system(),
+                messages=[{"role": "user", "content": f"请翻译以下 {len(batch)} 句台词：\n{lines_str}"}],
+                cache="jp_lines"
+            )
+            for response in completion.responses:
+                get_prompt_cache_stats().record("JPTranslator", response)
+
+            translated = parse_json_with_diagnostics(completion.text, "日文台词", "JPTranslator")
+            for index, text_jp in match_translations(translated, len(batch)).items():
+                results[batch[index][0]] = text_jp
+            if len(results) < len(batch):
+                print(f"[JPTranslator] {len(batch) - len(results)}/{len(batch)} 句没有返回译文")
+                self.gateway.forget(completion)  # 不完整的译文不留在响应缓存里
+        except Exception as e:
+            print(f"[JPTranslator] 翻译失败: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._done.update(results)
+                for key, _, _ in batch:
+                    self._pending.pop(key, None)
+                self.stats["batches"] += 1
+                self.stats["lines"] += len(results)
+                self.stats["failed"] += len(batch) - len(results)
+            future.set_result(results)
+
+
+# 全局实例
+_translators: Dict[Path, JapaneseTranslator] = {}
+_translators_lock = threading.Lock()
+
+def get_jp_translator(project_root: Path = None) -> JapaneseTranslator:
+    """获取日文台词生成器单例（按项目根目录）"""
+    root = Path(project_root or Path(__file__).parent.parent).resolve()
+    with _translators_lock:
+        if root not in _translators:
+            _translators[root] = JapaneseTranslator(root)
+        return _translators[root]
@@ -0,0 +1,233 @@
+# ============================================================================
+# API Key 池 (Key Pool)
+# ============================================================================
+# 职责：
+# 1. 每个角色一个 Key 池（config.API_KEY_POOLS），网关每次发请求前从池里租一个 Key：
+#    选在途请求最少的健康 Key（相同时选最久没分到请求的，自然轮转）
+# 2. 健康检查：429（限流）/ 529（过载）后该 Key 冷却 —— 有 retry-after 按其秒数，
+#    否则 LLM_KEY_COOLDOWN，连续出错时翻倍（上限 LLM_KEY_COOLDOWN_MAX），成功一次即清零；
+#    401 / 403 说明 Key 无效，停用 LLM_KEY_DISABLE_S 秒
+# 3. 故障转移：出错的 Key 进入冷却且池内还有健康 Key 时，网关立即换 Key 重试（不退避）；
+#    全部在冷却时租冷却最早结束的那个，lease.delay 为需要等待的秒数
+# 4. 每个 Key 的请求数、在途数、错误数（按状态码）、冷却次数、最近一分钟吞吐，report() 导出
+#
+# 池里只有一个 Key 时只计数不冷却（行为与原来相同：网关按指数退避重试）。
+# 同一个 Key 出现在多个角色的池里时共用一份健康状态（限流是按 Key 算的）。
+# 报告里只出现 Key 的序号和末 4 位，不会泄露完整 Key。
+# ============================================================================
+
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import API_KEY_POOLS, LLM_KEY_COOLDOWN, LLM_KEY_COOLDOWN_MAX, LLM_KEY_DISABLE_S
+
+# 需要冷却的状态码（限流 / 过载）与需要停用的状态码（认证失败 / 无权限）
+COOLDOWN_STATUS = {429, 529}
+DISABLE_STATUS = {401, 403}
+
+# 吞吐统计的时间窗（秒）
+THROUGHPUT_WINDOW = 60.0
+
+
+class KeyState:
+    """一个 Key 的健康状态与统计"""
+
+    def __init__(self, key: str, label: str):
+        self.key = key
+        self.label = label
+        self.outstanding = 0
+        self.requests = 0
+        self.successes = 0
+        self.errors: Dict[str, int] = {}
+        self.cooldowns = 0
+        self.consecutive = 0           # 连续的限流 / 过载次数（决定下次冷却时长）
+        self.cooling_until = 0.0       # time.monotonic()
+        self.last_assigned = 0.0
+        self.last_error: Optional[str] = None
+        self.recent: Deque[Tuple[float, int, int]] = deque()  # (完成时间, 输入 token, 输出 token)
+
+    def cooling(self, now: float) -> float:
+        """剩余冷却秒数（0 = 健康）"""
+        return max(self.cooling_until - now, 0.0)
+
+    def report(self, now: float) -> Dict[str, Any]:
+        while self.recent and now - self.recent[0][0] > THROUGHPUT_WINDOW:
+            self.recent.popleft()
+        return {
+            "requests": self.requests,
+            "outstanding": self.outstanding,
+            "successes": self.successes,
+            "errors": dict(self.errors),
+            "cooldowns": self.cooldowns,
+            "cooling_s": round(self.cooling(now), 1),
+            "rpm": len(self.recent),
+            "input_tpm": sum(item[1] for item in self.recent),
+            "output_tpm": sum(item[2] for item in self.recent),
+            "last_error": self.last_error,
+        }
+
+
+class KeyLease:
+    """一次请求租用的 Key；请求结束时调用 success / failure（只生效一次）"""
+
+    def __init__(self, pool: "KeyPool", role: str, state: Optional[KeyState], delay: float = 0.0):
+        self.pool = pool
+        self.role = role
+        self.state = state
+        self.delay = delay          # 池内 Key 都在冷却时，发请求前需要等待的秒数
+        self._released = False
+
+    @property
+    def key(self) -> Optional[str]:
+        return self.state.key if self.state else None
+
+    def success(self, response: Any = None):
+        if self._release():
+            self.pool._on_success(self.state, response)
+
+    def failure(self, error: Exception, retry_after: Optional[float] = None) -> bool:
+        """
+        记录失败；返回是否应立即换 Key 重试
+
+        只有 Key 相关的错误（限流 / 过载 / 认证失败）且池内还有健康 Key 时返回 True。
+        """
+        if not self._release():
+            return False
+        return self.pool._on_failure(self.role, self.state, error, retry_after)
+
+    def release(self):
+        """不计成败地归还（调用被中断等）"""
+        self._release()
+
+    def _release(self) -> bool:
+        if self._released or self.state is None:
+            return False
+        self._released = True
+        with self.pool._lock:
+            self.state.outstanding -= 1
+        return True
+
+
+class KeyPool:
+    """按角色的 Key 池：最少在途请求分流 + 限流冷却 + 故障转移"""
+
+    def __init__(
+        self,
+        pools: Dict[str, List[str]] = None,
+        cooldown: float = LLM_KEY_COOLDOWN,
+        cooldown_max: float = LLM_KEY_COOLDOWN_MAX,
+        disable_s: float = LLM_KEY_DISABLE_S
+    ):
+        self.cooldown = cooldown
+        self.cooldown_max = cooldown_max
+        self.disable_s = disable_s
+
+        self._lock = threading.Lock()
+        self._states: Dict[str, KeyState] = {}     # Key -> 状态（多个角色共用）
+        self.pools: Dict[str, List[KeyState]] = {}
+        for role, keys in (API_KEY_POOLS if pools is None else pools).items():
+            self.pools[role] = [self._state(key) for key in keys]
+
+    def _state(self, key: str) -> KeyState:
+        if key not in self._states:
+            self._states[key] = KeyState(key, f"#{len(self._states) + 1} …{key[-4:]}")
+        return self._states[key]
+
+    def size(self, role: str) -> int:
+        return len(self.pools.get(role) or [])
+
+    # ------------------------------------------------------------------
+    # 租用
+    # ------------------------------------------------------------------
+
+    def lease(self, role: str) -> KeyLease:
+        """
+        为一次请求租一个 Key
+
+        池为空时返回 key 为 None 的租约（网关回退到 get_api_key，由它给出配置提示）。
+        """
+        states = self.pools.get(role)
+        if not states:
+            return KeyLease(self, role, None)
+        with self._lock:
+            now = time.monotonic()
+            healthy = [state for state in states if state.cooling_until <= now]
+            if healthy:
+                state = min(healthy, key=lambda s: (s.outstanding, s.last_assigned))
+                delay = 0.0
+            else:
+                state = min(states, key=lambda s: s.cooling_until)
+                delay = state.cooling(now)
+            state.outstanding += 1
+            state.requests += 1
+            state.last_assigned = now
+        return KeyLease(self, role, state, delay)
+
+    # ------------------------------------------------------------------
+    # 结果记录
+    # ------------------------------------------------------------------
+
+    def _on_success(self, state: KeyState, response: Any):
+        usage = getattr(response, "usage", None)
+        input_tokens = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "cache_read_input_tokens", 0) or 0)
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+        with self._lock:
+            state.successes += 1
+            state.consecutive = 0
+            state.recent.append((time.monotonic(), input_tokens, output_tokens))
+
+    def _on_failure(self, role: str, state: KeyState, error: Exception, retry_after: Optional[float]) -> bool:
+        status = getattr(error, "status_code", None)
+        name = str(status) if status else type(error).__name__
+        cooldown = None
+        with self._lock:
+            now = time.monotonic()
+            state.errors[name] = state.errors.get(name, 0) + 1
+            state.last_error = name
+            if status in COOLDOWN_STATUS:
+                state.consecutive += 1
+                cooldown = retry_after if retry_after is not None \
+                    else min(self.cooldown * (2 ** (state.consecutive - 1)), self.cooldown_max)
+            elif status in DISABLE_STATUS:
+                cooldown = self.disable_s
+            # 池里只有一个 Key 时没有可切换的，交给网关原来的退避重试
+            if cooldown is None or len(self.pools.get(role) or []) < 2:
+                return False
+            state.cooling_until = max(state.cooling_until, now + cooldown)
+            state.cooldowns += 1
+            failover = any(other.cooling_until <= now for other in self.pools.get(role) or [])
+        print(f"[KeyPool] {role} Key {state.label} 返回 {name}，冷却 {cooldown:.1f} 秒"
+              f"{'，切换到池内其他 Key' if failover else ''}")
+        return failover
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "pools": {role: [state.label for state in states] for role, states in self.pools.items()},
+                "keys": {state.label: state.report(now) for state in self._states.values()},
+            }
+
+    def print_report(self):
+        report = self.report()
+        if not any(item["requests"] for item in report["keys"].values()):
+            return
+        print("\n[KeyPool] 各 Key 统计：")
+        for role, labels in report["pools"].items():
+            print(f"  {role:<10} 池 {', '.join(labels) or '（空）'}")
+        for label, item in report["keys"].items():
+            errors = ", ".join(f"{name}×{count}" for name, count in item["errors"].items()) or "无"
+            cooling = f"，冷却中 {item['cooling_s']}s" if item["cooling_s"] else ""
+            print(f"  {label:<10} 请求 {item['requests']:>5}  成功 {item['successes']:>5}  在途 {item['outstanding']}  "
+                  f"错误 {errors}  冷却 {item['cooldowns']} 次{cooling}  "
+                  f"近一分钟 {item['rpm']} 次 / 输出 {item['output_tpm']} token")
@@ -0,0 +1,438 @@
+# ============================================================================
+# LLM 网关 (LLM Gateway)
+# ============================================================================
+# 职责：
+# 1. 每个 API Key 只建一个客户端（共享连接池 + keep-alive），所有层共用；
+#    每个角色可配置一池 Key（api/key_pool.py），每次请求按在途数选 Key，限流 / 过载时换 Key 重试
+# 2. 按角色（character / director / controller）限制并发数：名额由调度器（api/llm_scheduler.py）
+#    按优先级、会话轮转与每个 Key 的令牌桶分配
+# 3. 统一的超时与重试（SDK 自带重试关闭，重试逻辑只在这里）
+# 4. 同步（create / stream）与 asyncio（acreate / astream）两套入口
+# 5. 输出因 max_tokens 截断时，以 assistant 预填续写，从断开处接着生成（create_text）
+# 6. create_text 带调用标签时先查磁盘响应缓存（api/response_cache.py）
+# 7. 客户端由传输层提供（api/llm_transport.py）：live / record / replay / synthetic
+#    live / record 的 API 地址可用 LLM_BASE_URL 指向本地模拟服务器（api/stub_server.py）
+# ============================================================================
+
+import asyncio
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import anthropic
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import (
+    get_api_key, LLM_CONCURRENCY, LLM_TIMEOUT,
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_MAX_CONTINUATIONS, LLM_BASE_URL
+)
+
+from .response_cache import get_response_cache
+from .llm_transport import Transport, create_transport
+from .llm_scheduler import LLMScheduler
+from .key_pool import KeyLease, KeyPool
+
+
+# 可重试的 HTTP 状态码（超时 / 冲突 / 限流 / 服务端错误）
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_retryable(error: Exception) -> bool:
+    """判断 API 错误是否值得重试"""
+    if isinstance(error, anthropic.APIConnectionError):  # 含 APITimeoutError
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """读取服务端的 retry-after 头（秒）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _stream_message(response_stream: Any) -> Any:
+    """流已接收部分的消息快照（用于令牌桶记账；拿不到时返回 None）"""
+    try:
+        return response_stream.current_message_snapshot
+    except Exception:
+        return None
+
+
+# ============================================================================
+# 截断续写
+# ============================================================================
+
+def response_text(response: Any) -> str:
+    """响应中全部文本块的内容"""
+    return "".join(getattr(block, "text", "") for block in getattr(response, "content", None) or [])
+
+
+def continuation_messages(messages: List[Dict], partial: str) -> List[Dict]:
+    """
+    在原对话后追加已生成的部分作为 assistant 预填，模型会从断开处接着输出
+
+    API 不接受以空白结尾的预填，末尾空白会被去掉（JSON 中字符串外的空白无意义）。
+    原对话已以 assistant 预填结尾时，把部分输出接在预填之后。
+    """
+    messages = list(messages)
+    prefill = ""
+    if messages and messages[-1].get("role") == "assistant" and isinstance(messages[-1].get("content"), str):
+        prefill = messages.pop()["content"]
+    partial = (prefill + partial).rstrip()
+    if partial:
+        messages.append({"role": "assistant", "content": partial})
+    return messages
+
+
+@dataclass
+class Completion:
+    """create_text 的结果：各次续写拼接后的完整文本"""
+    text: str = ""
+    responses: List[Any] = field(default_factory=list)  # 每次请求的原始响应（第一个是原请求）
+    stop_reason: Optional[str] = None                    # 最后一次请求的 stop_reason
+    cached: bool = False                                 # 来自响应缓存（responses 为空）
+    cache_key: Optional[str] = None                      # 响应缓存中的键（已缓存或刚写入时）
+
+    @property
+    def continuations(self) -> int:
+        return max(len(self.responses) - 1, 0)
+
+    @property
+    def truncated(self) -> bool:
+        """续写次数用完后仍被 max_tokens 截断"""
+        return self.stop_reason == "max_tokens"
+
+
+# ============================================================================
+# LLM 网关
+# ============================================================================
+
+class LLMGateway:
+    """LLM 网关 - 所有 Anthropic 调用的唯一出口"""
+
+    def __init__(
+        self,
+        concurrency: Dict[str, int] = None,
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base_delay: float = LLM_RETRY_BASE_DELAY,
+        transport: Optional[Transport] = None,
+        base_url: Optional[str] = LLM_BASE_URL,
+        scheduler: Optional[LLMScheduler] = None,
+        keys: Optional[KeyPool] = None
+    ):
+        self.concurrency = dict(concurrency or LLM_CONCURRENCY)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.base_url = base_url
+        self.transport = transport or create_transport()
+        self.scheduler = scheduler or LLMScheduler(self.concurrency)
+        self.keys = keys or KeyPool()
+
+        self._lock = threading.Lock()
+        self._clients: Dict[str, anthropic.Anthropic] = {}            # api_key -> 客户端
+        self._async_clients: Dict[str, anthropic.AsyncAnthropic] = {}  # api_key -> 异步客户端
+
+    # ------------------------------------------------------------------
+    # 客户端与并发控制
+    # ------------------------------------------------------------------
+
+    def client(self, role: str, api_key: Optional[str] = None) -> anthropic.Anthropic:
+        """
+        获取角色对应 Key 的共享客户端（同一 Key 的多个角色共用一个连接池）
+
+        api_key 显式指定时优先使用（原型脚本从 api_key.txt 读取的 Key）。
+        replay / synthetic 传输层不需要 Key，返回离线客户端。
+        """
+        if self.transport.offline:
+            return self.transport.client()
+        key = api_key or get_api_key(role)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self.transport.wrap(anthropic.Anthropic(
+                    api_key=key, base_url=self.base_url, timeout=self.timeout, max_retries=0
+                ))
+            return self._clients[key]
+
+    def async_client(self, role: str, api_key: Optional[str] = None) -> anthropic.AsyncAnthropic:
+        """获取角色对应 Key 的共享异步客户端"""
+        if self.transport.offline:
+            return self.transport.client(is_async=True)
+        key = api_key or get_api_key(role)
+        with self._lock:
+            if key not in self._async_clients:
+                self._async_clients[key] = self.transport.wrap_async(anthropic.AsyncAnthropic(
+                    api_key=key, base_url=self.base_url, timeout=self.timeout, max_retries=0
+                ))
+            return self._async_clients[key]
+
+    def _lease(self, role: str, api_key: Optional[str]) -> KeyLease:
+        """为一次请求从角色的 Key 池租 Key（显式指定 Key 或离线传输层时不经过 Key 池）"""
+        if api_key or self.transport.offline:
+            return KeyLease(self.keys, role, None)
+        return self.keys.lease(role)
+
+    def _retry_delay(self, role: str, attempt: int, error: Exception, lease: KeyLease) -> Optional[float]:
+        """
+        一次请求失败后：记入 Key 池，返回重试前等待的秒数；不再重试时返回 None
+
+        限流 / 过载 / 认证失败的 Key 进入冷却，池内还有健康 Key 时立即换 Key 重试（不退避）。
+        """
+        failover = lease.failure(error, _retry_after(error))
+        if attempt >= self.max_retries:
+            return None
+        if failover:
+            return 0.0
+        if not is_retryable(error):
+            return None
+        delay = self._backoff(attempt, error)
+        self._log_retry(role, attempt, error, delay)
+        return delay
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """指数退避 + 抖动；服务端给了 retry-after 时以其为准"""
+        delay = _retry_after(error)
+        if delay is None:
+            delay = self.retry_base_delay * (2 ** attempt)
+        return delay + random.uniform(0, self.retry_base_delay)
+
+    def _log_retry(self, role: str, attempt: int, error: Exception, delay: float):
+        print(f"[LLMGateway] {role} 调用失败（{type(error).__name__}），"
+              f"{delay:.1f}秒后重试 ({attempt + 1}/{self.max_retries})")
+
+    # ------------------------------------------------------------------
+    # 同步入口
+    # ------------------------------------------------------------------
+
+    def create(self, role: str, api_key: Optional[str] = None, **kwargs) -> Any:
+        """
+        messages.create 的网关版本
+
+        Args:
+            role: "character" | "director" | "controller"，决定 Key 和并发上限
+            api_key: 显式指定的 Key（可选）
+            **kwargs: 原样传给 messages.create（model / max_tokens / system / messages ...）
+
+        优先级 / 所属会话由调用方的 llm_request() 上下文决定；
+        投机请求在名额紧张时抛 RequestCancelled（不发出调用）。
+        """
+        with self.scheduler.slot(role, api_key, kwargs) as ticket:
+            for attempt in range(self.max_retries + 1):
+                lease = self._lease(role, api_key)
+                try:
+                    if lease.delay:
+                        time.sleep(lease.delay)
+                    response = self.client(role, lease.key or api_key).messages.create(**kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(role, attempt, e, lease)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    continue
+                except BaseException:
+                    lease.release()
+                    raise
+                lease.success(response)
+                ticket.record(response)
+                return response
+
+    def create_text(
+        self,
+        role: str,
+        api_key: Optional[str] = None,
+        max_continuations: int = LLM_MAX_CONTINUATIONS,
+        cache: Optional[str] = None,
+        **kwargs
+    ) -> Completion:
+        """
+        create 的文本版本：输出因 max_tokens 截断时自动续写
+
+        续写请求把已生成的文本作为 assistant 预填，模型从断开处接着输出，
+        只需生成剩下的部分（而不是整段重新生成）；各段文本按顺序拼接。
+
+        Args:
+            max_continuations: 最多续写几次，用完后仍截断时 completion.truncated 为 True
+            cache: 调用标签（如 "story_outline"）；RESPONSE_CACHE_POLICY 允许时相同请求直接复用磁盘缓存
+                   （续写用完仍截断的输出不写入缓存）
+            **kwargs: 同 create（messages 必填）
+        """
+        # 只有 live 传输层读写响应缓存：录制要完整记下每次请求，离线输出也不能混进缓存
+        if self.transport.mode != "live":
+            cache = None
+        if cache:
+            response_cache = get_response_cache()
+            cache_request = dict(kwargs, max_continuations=max_continuations)
+            entry = response_cache.lookup(cache, cache_request)
+            if entry is not None:
+                return Completion(
+                    text=entry["completion"]["text"],
+                    stop_reason=entry["completion"].get("stop_reason"),
+                    cached=True,
+                    cache_key=entry["key"]
+                )
+
+        messages = kwargs.pop("messages")
+        completion = Completion()
+        for attempt in range(max_continuations + 1):
+            request = continuation_messages(messages, completion.text) if attempt else messages
+            if attempt:
+                completion.text = completion.text.rstrip()
+                print(f"[LLMGateway] {role} 输出达到 max_tokens，从第 {len(completion.text)} 字符处续写 "
+                      f"({attempt}/{max_continuations})")
+            response = self.create(role, api_key, messages=request, **kwargs)
+            completion.responses.append(response)
+            completion.text += response_text(response)
+            completion.stop_reason = getattr(response, "stop_reason", None)
+            if completion.stop_reason != "max_tokens":
+                break
+
+        # 续写次数用完仍被截断的输出不写缓存，否则之后每次命中都拿到同一段残缺文本
+        if cache and not completion.truncated:
+            completion.cache_key = response_cache.store(cache, role, cache_request, completion)
+        return completion
+
+    def forget(self, completion: Completion):
+        """调用方无法使用这次输出（解析失败等）时调用：从响应缓存删除，下次重新生成"""
+        if completion is not None and completion.cache_key:
+            get_response_cache().discard(completion.cache_key)
+            completion.cache_key = None
+
+    @contextmanager
+    def stream(self, role: str, api_key: Optional[str] = None, **kwargs):
+        """
+        messages.stream 的网关版本（with 语句使用，流结束前一直占用并发名额）
+
+        只重试建立连接阶段；已经开始输出后出错直接抛出，由调用方回退。
+        """
+        with self.scheduler.slot(role, api_key, kwargs) as ticket:
+            for attempt in range(self.max_retries + 1):
+                lease = self._lease(role, api_key)
+                try:
+                    if lease.delay:
+                        time.sleep(lease.delay)
+                    manager = self.client(role, lease.key or api_key).messages.stream(**kwargs)
+                    response_stream = manager.__enter__()
+                    break
+                except Exception as e:
+                    delay = self._retry_delay(role, attempt, e, lease)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                except BaseException:
+                    lease.release()
+                    raise
+
+            try:
+                yield response_stream
+            except anthropic.APIError as e:
+                lease.failure(e, _retry_after(e))
+                if not manager.__exit__(*sys.exc_info()):
+                    raise
+            except BaseException:
+                if not manager.__exit__(*sys.exc_info()):
+                    raise
+            else:
+                manager.__exit__(None, None, None)
+            finally:
+                message = _stream_message(response_stream)
+                lease.success(message)
+                ticket.record(message)
+
+    # ------------------------------------------------------------------
+    # asyncio 入口
+    # ------------------------------------------------------------------
+
+    async def acreate(self, role: str, api_key: Optional[str] = None, **kwargs) -> Any:
+        """messages.create 的异步网关版本"""
+        async with self.scheduler.aslot(role, api_key, kwargs) as ticket:
+            for attempt in range(self.max_retries + 1):
+                lease = self._lease(role, api_key)
+                try:
+                    if lease.delay:
+                        await asyncio.sleep(lease.delay)
+                    response = await self.async_client(role, lease.key or api_key).messages.create(**kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(role, attempt, e, lease)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    continue
+                except BaseException:
+                    lease.release()
+                    raise
+                lease.success(response)
+                ticket.record(response)
+                return response
+
+    @asynccontextmanager
+    async def astream(self, role: str, api_key: Optional[str] = None, **kwargs):
+        """messages.stream 的异步网关版本（async with 使用）"""
+        async with self.scheduler.aslot(role, api_key, kwargs) as ticket:
+            for attempt in range(self.max_retries + 1):
+                lease = self._lease(role, api_key)
+                try:
+                    if lease.delay:
+                        await asyncio.sleep(lease.delay)
+                    manager = self.async_client(role, lease.key or api_key).messages.stream(**kwargs)
+                    response_stream = await manager.__aenter__()
+                    break
+                except Exception as e:
+                    delay = self._retry_delay(role, attempt, e, lease)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                except BaseException:
+                    lease.release()
+                    raise
+
+            try:
+                yield response_stream
+            except anthropic.APIError as e:
+                lease.failure(e, _retry_after(e))
+                if not await manager.__aexit__(*sys.exc_info()):
+                    raise
+            except BaseException:
+                if not await manager.__aexit__(*sys.exc_info()):
+                    raise
+            else:
+                await manager.__aexit__(None, None, None)
+            finally:
+                message = _stream_message(response_stream)
+                lease.success(message)
+                ticket.record(message)
+
+    def close(self):
+        """关闭所有同步客户端的连接池"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+# 全局实例
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_gateway() -> LLMGateway:
+    """获取 LLM 网关单例"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
@@ -0,0 +1,480 @@
+# ============================================================================
+# LLM 请求调度器 (LLM Scheduler)
+# ============================================================================
+# 职责：
+# 1. 网关的每次调用先在这里排队领取并发名额（按角色，LLM_CONCURRENCY），取代原来的信号量
+# 2. 优先级：interactive（玩家正在等）> choice（预选回应）> speculative（场景预取）> offline（预热 / 离线批量）
+#    名额空出时先给高优先级；同一优先级内按会话轮转（公平排队），一个会话排再多请求，每轮也只拿一个
+# 3. 令牌桶限流：config.API_KEY_POOLS 中每个 Key 池一组桶（每分钟请求数 / 输入 token / 输出 token，
+#    上限为 LLM_RATE_LIMITS 乘以池中 Key 数；池内怎么分给各个 Key 由网关的 Key 池决定），
+#    Key 池相同的角色共用一组桶；输入 token 按 prompt 长度预估，返回后按 usage 校正，
+#    输出 token 返回后扣除（余额为负时后面的请求等待）
+# 4. 名额紧张时取消投机请求：有 interactive / choice 请求在排队、或令牌桶余量低于
+#    LLM_SPECULATIVE_HEADROOM 时，排队中与新到的 speculative 请求抛 RequestCancelled
+#    （已经发出的请求不中断，输出照常使用）
+# 5. 每个优先级的排队等待时间（p50 / p95 / 平均）、取消数、限流等待次数，report() 导出
+#
+# 调用方用 llm_request() 声明优先级与会话（ContextVar，随 copy_context 提交到线程池的任务一起走）：
+#     with llm_request(priority="speculative", session=session_id):
+#         planner.plan_scene(...)
+# 未声明时为 interactive、无会话（单机游戏即如此，行为与原来的信号量相同）
+# ============================================================================
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import API_KEY_POOLS, LLM_CONCURRENCY, LLM_RATE_LIMITS, LLM_SPECULATIVE_HEADROOM
+
+from .character_registry import estimate_tokens
+
+# 从高到低
+PRIORITIES = ("interactive", "choice", "speculative", "offline")
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default="interactive")
+_session: ContextVar[Optional[str]] = ContextVar("llm_session", default=None)
+
+
+class RequestCancelled(BaseException):
+    """
+    投机请求因名额紧张被取消（没有发出 API 调用）
+
+    继承 BaseException：规划层 / 演出层的 except Exception 不会把它变成回退内容，
+    取消的预取直接作废（由发起投机请求的一方捕获，见 scene_prefetcher）。
+    """
+
+
+@contextmanager
+def llm_request(priority: Optional[str] = None, session: Optional[str] = None):
+    """
+    声明 with 块内 LLM 调用的优先级 / 所属会话（省略的项沿用外层）
+
+    用法：
+        with llm_request(priority="speculative"):
+            planner.plan_scene(...)
+    """
+    if priority is not None and priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}（可选 {', '.join(PRIORITIES)}）")
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    if session is not None:
+        tokens.append((_session, _session.set(session)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def current_session() -> Optional[str]:
+    return _session.get()
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    """请求的输入 token 预估（system + messages）"""
+    return estimate_tokens(json.dumps(
+        {"system": request.get("system"), "messages": request.get("messages")},
+        ensure_ascii=False, default=str
+    ))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))]
+
+
+# ============================================================================
+# 令牌桶
+# ============================================================================
+
+class TokenBucket:
+    """每分钟上限 per_minute 的令牌桶（满桶 = 一分钟的量，匀速回填）；per_minute 为 None 时不限"""
+
+    def __init__(self, per_minute: Optional[float]):
+        self.capacity = float(per_minute) if per_minute else None
+        self.level = self.capacity or 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """还要等多少秒才够 amount（超过桶容量的按满桶算）"""
+        if self.capacity is None:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float):
+        if self.capacity is not None:
+            self.level -= amount  # 可以透支（输出 token 返回后才知道）
+
+    def give(self, amount: float):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + amount)
+
+    def fraction(self, now: float) -> float:
+        if self.capacity is None:
+            return 1.0
+        self._refill(now)
+        return max(self.level, 0.0) / self.capacity
+
+
+class KeyBuckets:
+    """一个 API Key 的三个令牌桶"""
+
+    def __init__(self, name: str, limits: Dict[str, Optional[float]]):
+        self.name = name
+        self.requests = TokenBucket(limits.get("requests"))
+        self.input_tokens = TokenBucket(limits.get("input_tokens"))
+        self.output_tokens = TokenBucket(limits.get("output_tokens"))
+        self.stats = {"throttled": 0}
+
+    def wait_time(self, input_tokens: int, now: float) -> float:
+        return max(
+            self.requests.wait_time(1, now),
+            self.input_tokens.wait_time(input_tokens, now),
+            self.output_tokens.wait_time(1, now),  # 输出 token 事后扣除，这里只要求余额为正
+        )
+
+    def headroom(self, now: float) -> float:
+        return min(self.requests.fraction(now), self.input_tokens.fraction(now), self.output_tokens.fraction(now))
+
+    def report(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "requests": round(self.requests.fraction(now), 3),
+            "input_tokens": round(self.input_tokens.fraction(now), 3),
+            "output_tokens": round(self.output_tokens.fraction(now), 3),
+            **self.stats,
+        }
+
+
+# ============================================================================
+# 排队
+# ============================================================================
+
+class _Waiter:
+    """一个排队中的请求（线程用 Event 唤醒，协程用 Future 唤醒）"""
+
+    def __init__(self, priority: str, session: Optional[str], loop: asyncio.AbstractEventLoop = None):
+        self.priority = priority
+        self.session = session
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cancelled: Optional[str] = None
+        self.wait_ms = 0.0
+        self._loop = loop
+        self._event = None if loop else threading.Event()
+        self._future = loop.create_future() if loop else None
+
+    def wake(self):
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._set_result)
+
+    def _set_result(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    def wait(self):
+        self._event.wait()
+
+    async def await_(self):
+        await self._future
+
+
+class Ticket:
+    """领到的名额（release 时归还；record 用实际 usage 校正令牌桶）"""
+
+    def __init__(self, role: str, buckets: KeyBuckets, priority: str, session: Optional[str],
+                 input_estimate: int, lock: threading.Lock):
+        self.role = role
+        self.buckets = buckets
+        self.priority = priority
+        self.session = session
+        self.input_estimate = input_estimate
+        self.wait_ms = 0.0
+        self._recorded = False
+        self._lock = lock  # 调度器的锁（令牌桶只在锁内修改）
+
+    def record(self, response: Any):
+        """按响应的 usage 校正输入 token、扣除输出 token（每张票只记一次，续写各自领票）"""
+        usage = getattr(response, "usage", None)
+        if usage is None or self._recorded:
+            return
+        self._recorded = True
+        # 缓存读取不计入输入 token 限额
+        actual = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+        with self._lock:
+            self.buckets.input_tokens.give(self.input_estimate - actual)
+            self.buckets.output_tokens.take(getattr(usage, "output_tokens", 0) or 0)
+
+
+# ============================================================================
+# 调度器
+# ============================================================================
+
+class LLMScheduler:
+    """按角色分配并发名额：优先级 + 会话轮转 + 按 Key 的令牌桶"""
+
+    def __init__(
+        self,
+        concurrency: Dict[str, int] = None,
+        rate_limits: Dict[str, Dict[str, Optional[float]]] = None,
+        speculative_headroom: float = LLM_SPECULATIVE_HEADROOM
+    ):
+        self.concurrency = dict(concurrency or LLM_CONCURRENCY)
+        self.rate_limits = LLM_RATE_LIMITS if rate_limits is None else rate_limits
+        self.speculative_headroom = speculative_headroom
+
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = {}
+        # 角色 -> 优先级 -> 会话 -> 该会话排队的请求（OrderedDict 的顺序即轮转顺序）
+        self._queues: Dict[str, Dict[str, "OrderedDict[Optional[str], deque[_Waiter]]"]] = {}
+        self._waiter_keys: Dict[int, tuple] = {}   # id(waiter) -> (角色, 令牌桶, 预估输入 token)
+        self._buckets: Dict[tuple, KeyBuckets] = {}  # Key 池 -> 令牌桶
+        self._timers: Dict[str, threading.Timer] = {}
+
+        self.stats = {
+            priority: {"requests": 0, "queued": 0, "cancelled": 0, "wait_ms": deque(maxlen=2000)}
+            for priority in PRIORITIES
+        }
+
+    # ------------------------------------------------------------------
+    # 令牌桶
+    # ------------------------------------------------------------------
+
+    def _key_buckets(self, role: str, api_key: Optional[str]) -> KeyBuckets:
+        """（持锁调用）角色的 Key 池 / 显式 Key 对应的令牌桶；Key 池相同的角色共用一组"""
+        pool = (api_key,) if api_key else tuple(API_KEY_POOLS.get(role) or [""])
+        if pool not in self._buckets:
+            roles = sorted(name for name, keys in API_KEY_POOLS.items() if tuple(keys or [""]) == pool) or ["explicit"]
+            limits = {}
+            for name in roles:
+                for kind, value in (self.rate_limits.get(name) or {}).items():
+                    if value and (limits.get(kind) is None or value < limits[kind]):
+                        limits[kind] = value
+            name = "+".join(roles) + (f"×{len(pool)}" if len(pool) > 1 else "")
+            self._buckets[pool] = KeyBuckets(name, {kind: value * len(pool) for kind, value in limits.items()})
+        return self._buckets[pool]
+
+    # ------------------------------------------------------------------
+    # 领取 / 归还
+    # ------------------------------------------------------------------
+
+    def _enqueue(self, role: str, api_key: Optional[str], request: Dict[str, Any],
+                 loop: asyncio.AbstractEventLoop = None) -> _Waiter:
+        priority, session = current_priority(), current_session()
+        estimate = estimate_request_tokens(request or {})
+        with self._lock:
+            buckets = self._key_buckets(role, api_key)
+            stats = self.stats[priority]
+            stats["requests"] += 1
+            queues = self._queues.setdefault(role, {p: OrderedDict() for p in PRIORITIES})
+
+            if priority == "speculative":
+                tight = any(queues[p] for p in ("interactive", "choice")) \
+                    or buckets.headroom(time.monotonic()) < self.speculative_headroom
+                if tight:
+                    stats["cancelled"] += 1
+                    raise RequestCancelled(f"{role} 名额紧张，取消投机请求")
+
+            waiter = _Waiter(priority, session, loop)
+            queues[priority].setdefault(session, deque()).append(waiter)
+            self._waiter_keys[id(waiter)] = (role, buckets, estimate)
+            self._dispatch(role)
+            if not waiter.granted:
+                stats["queued"] += 1
+                if priority in ("interactive", "choice"):
+                    self._cancel_speculative(role)
+        return waiter
+
+    def _finish(self, waiter: _Waiter, role: str, buckets: KeyBuckets, estimate: int) -> Ticket:
+        if waiter.cancelled:
+            raise RequestCancelled(waiter.cancelled)
+        ticket = Ticket(role, buckets, waiter.priority, waiter.session, estimate, self._lock)
+        ticket.wait_ms = waiter.wait_ms
+        return ticket
+
+    def acquire(self, role: str, api_key: Optional[str] = None, request: Dict[str, Any] = None) -> Ticket:
+        """排队领取名额（阻塞）；被取消时抛 RequestCancelled"""
+        waiter = self._enqueue(role, api_key, request)
+        waiter.wait()
+        with self._lock:
+            _, buckets, estimate = self._waiter_keys.pop(id(waiter))
+        return self._finish(waiter, role, buckets, estimate)
+
+    async def aacquire(self, role: str, api_key: Optional[str] = None, request: Dict[str, Any] = None) -> Ticket:
+        """acquire 的 asyncio 版本（排队时不占用线程）"""
+        waiter = self._enqueue(role, api_key, request, loop=asyncio.get_running_loop())
+        try:
+            await waiter.await_()
+        except asyncio.CancelledError:
+            with self._lock:
+                self._remove(waiter)
+                if waiter.granted:
+                    self._active[role] -= 1
+                    self._dispatch(role)
+                self._waiter_keys.pop(id(waiter), None)
+            raise
+        with self._lock:
+            _, buckets, estimate = self._waiter_keys.pop(id(waiter))
+        return self._finish(waiter, role, buckets, estimate)
+
+    def release(self, ticket: Ticket):
+        with self._lock:
+            self._active[ticket.role] -= 1
+            self._dispatch(ticket.role)
+
+    @contextmanager
+    def slot(self, role: str, api_key: Optional[str] = None, request: Dict[str, Any] = None):
+        """with 块内占用一个名额"""
+        ticket = self.acquire(role, api_key, request)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, role: str, api_key: Optional[str] = None, request: Dict[str, Any] = None):
+        ticket = await self.aacquire(role, api_key, request)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    # ------------------------------------------------------------------
+    # 分配（持锁调用）
+    # ------------------------------------------------------------------
+
+    def _dispatch(self, role: str):
+        """按优先级、会话轮转把空出的名额分给排队的请求；令牌桶不够时等回填后再试"""
+        queues = self._queues.get(role)
+        if not queues:
+            return
+        capacity = self.concurrency.get(role, 2)
+        now = time.monotonic()
+        while self._active.get(role, 0) < capacity:
+            waiter = None
+            for priority in PRIORITIES:
+                if queues[priority]:
+                    session, waiting = next(iter(queues[priority].items()))
+                    waiter = waiting[0]
+                    break
+            if waiter is None:
+                return
+
+            _, buckets, estimate = self._waiter_keys[id(waiter)]
+            delay = buckets.wait_time(estimate, now)
+            if delay > 0:
+                # 队首的请求等令牌桶回填（低优先级不插队）
+                if role not in self._timers:
+                    buckets.stats["throttled"] += 1
+                    self._schedule(role, delay)
+                return
+
+            waiting.popleft()
+            if waiting:
+                queues[priority].move_to_end(session)  # 这个会话排到本优先级的队尾，轮到下一个会话
+            else:
+                del queues[priority][session]
+            buckets.requests.take(1)
+            buckets.input_tokens.take(estimate)
+            self._active[role] = self._active.get(role, 0) + 1
+            waiter.granted = True
+            waiter.wait_ms = (now - waiter.enqueued_at) * 1000
+            self.stats[priority]["wait_ms"].append(waiter.wait_ms)
+            waiter.wake()
+
+    def _schedule(self, role: str, delay: float):
+        """令牌桶回填后重新分配"""
+        def fire():
+            with self._lock:
+                self._timers.pop(role, None)
+                self._dispatch(role)
+
+        timer = threading.Timer(delay + 0.001, fire)
+        timer.daemon = True
+        self._timers[role] = timer
+        timer.start()
+
+    def _cancel_speculative(self, role: str):
+        """有玩家在等的请求排队时，取消这个角色排队中的全部投机请求"""
+        queue = self._queues[role]["speculative"]
+        for waiting in queue.values():
+            for waiter in waiting:
+                waiter.cancelled = f"{role} 有更高优先级的请求在排队，取消投机请求"
+                self.stats["speculative"]["cancelled"] += 1
+                waiter.wake()
+        queue.clear()
+
+    def _remove(self, waiter: _Waiter):
+        role = self._waiter_keys.get(id(waiter), (None,))[0]
+        queue = self._queues.get(role, {}).get(waiter.priority, {})
+        waiting = queue.get(waiter.session)
+        if waiting and waiter in waiting:
+            waiting.remove(waiter)
+            if not waiting:
+                del queue[waiter.session]
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            classes = {}
+            for priority, stats in self.stats.items():
+                waits = list(stats["wait_ms"])
+                classes[priority] = {
+                    "requests": stats["requests"],
+                    "queued": stats["queued"],
+                    "cancelled": stats["cancelled"],
+                    "wait_p50_ms": round(_percentile(waits, 0.5), 1),
+                    "wait_p95_ms": round(_percentile(waits, 0.95), 1),
+                    "wait_mean_ms": round(sum(waits) / len(waits), 1) if waits else 0.0,
+                }
+            return {
+                "classes": classes,
+                "active": dict(self._active),
+                "queued": {
+                    role: {p: sum(len(w) for w in q.values()) for p, q in queues.items() if q}
+                    for role, queues in self._queues.items()
+                },
+                "buckets": {buckets.name: buckets.report() for buckets in self._buckets.values()},
+            }
+
+    def print_report(self):
+        report = self.report()
+        print("\n[LLMScheduler] 各优先级排队等待")
+        for priority, row in report["classes"].items():
+            if not row["requests"]:
+                continue
+            print(f"  {priority:<12} 请求 {row['requests']:>5}  排队 {row['queued']:>5}  取消 {row['cancelled']:>4}  "
+                  f"等待 p50 {row['wait_p50_ms']:>8.1f}ms  p95 {row['wait_p95_ms']:>8.1f}ms")
+        for name, buckets in report["buckets"].items():
+            print(f"  令牌桶 {name}: 余量 请求 {buckets['requests']:.0%} / 输入 {buckets['input_tokens']:.0%} / "
+                  f"输出 {buckets['output_tokens']:.0%}，限流等待 {buckets['throttled']} 次")
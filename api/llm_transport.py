@@ -0,0 +1,578 @@
+# ============================================================================
+# LLM 传输层 (LLM Transport)
+# ============================================================================
+# 职责：网关之下、SDK 客户端这一层的可替换实现（LLM_TRANSPORT）
+# 1. live：真实的 anthropic 客户端（默认）
+# 2. record：真实调用 + 把请求/响应与时间线（首字延迟、每个流式片段的时刻）
+#    追加写入 JSONL 录制文件（cassette）
+# 3. replay：从录制文件按请求内容回放，完全离线、结果确定；
+#    可按 LLM_REPLAY_LATENCY 倍数重现原始延迟
+# 4. synthetic：按 prompt 合成结构正确的输出（api/synthetic_llm.py），
+#    延迟按 LLM_SYNTHETIC_LATENCY 的对数正态分布生成
+#
+# replay / synthetic 的客户端只实现本项目用到的 SDK 接口：
+# messages.create / messages.stream（text_stream、get_final_message）/ messages.count_tokens
+# 及其 asyncio 版本
+#
+# 用法：LLM_TRANSPORT=synthetic python test_api.py
+#       LLM_TRANSPORT=record LLM_CASSETTE=test_output/day1.jsonl python game_loop_v3.py
+# ============================================================================
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from anthropic.types import Message, MessageTokensCount
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import (
+    LLM_TRANSPORT, LLM_CASSETTE, LLM_REPLAY_LATENCY, LLM_REPLAY_MISS,
+    LLM_SYNTHETIC_SEED, LLM_SYNTHETIC_LATENCY
+)
+
+from .response_cache import normalize_request, request_key
+from .character_registry import estimate_tokens
+from .synthetic_llm import Corpus, DEFAULT_CORPUS, synthesize
+
+TRANSPORT_MODES = ("live", "record", "replay", "synthetic")
+
+
+class ReplayMissError(LookupError):
+    """回放模式下录制文件里没有这个请求"""
+
+
+def exchange_key(kind: str, request: Dict[str, Any]) -> str:
+    """
+    录制条目的键：调用类型 + 规范化后的请求
+
+    create 与 stream 共用 "message" 类型：录制时用流式、回放时非流式（或反过来）也能命中。
+    """
+    return hashlib.sha256(f"{kind}\x00{request_key(request)}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Exchange:
+    """一次请求/响应（录制文件的一行）"""
+    kind: str                       # "message" | "count_tokens"
+    request: Dict[str, Any]         # 规范化后的请求参数
+    response: Dict[str, Any]        # Message / MessageTokensCount 的 JSON
+    latency_ms: float = 0.0         # 请求开始到响应完整的时间
+    chunks: List[Tuple[float, str]] = field(default_factory=list)  # (距请求开始的毫秒数, 文本片段)
+    key: str = ""
+
+    def message(self) -> Any:
+        if self.kind == "count_tokens":
+            return MessageTokensCount.model_validate(self.response)
+        return Message.model_validate(self.response)
+
+    def timeline(self) -> List[Tuple[float, str]]:
+        """流式回放的时间线；非流式录制的条目在完成时一次性给出全文"""
+        if self.chunks:
+            return [(float(ms), text) for ms, text in self.chunks]
+        text = "".join(block.get("text", "") for block in self.response.get("content", []) if isinstance(block, dict))
+        return [(self.latency_ms, text)]
+
+
+# ============================================================================
+# 离线客户端（replay / synthetic 共用）
+# ============================================================================
+
+class _OfflineStream:
+    """messages.stream 返回的流（按时间线逐段给出文本）"""
+
+    def __init__(self, exchange: Exchange, scale: float):
+        self._exchange = exchange
+        self._scale = scale
+        self._started = time.monotonic()
+        self._consumed = False
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        for ms, text in self._exchange.timeline():
+            delay = self._started + ms * self._scale / 1000 - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield text
+        self._consumed = True
+
+    def until_done(self):
+        if not self._consumed:
+            for _ in self.text_stream:
+                pass
+
+    def get_final_message(self) -> Any:
+        self.until_done()
+        return self._exchange.message()
+
+    def get_final_text(self) -> str:
+        return "".join(getattr(block, "text", "") for block in self.get_final_message().content)
+
+    @property
+    def current_message_snapshot(self) -> Any:
+        return self._exchange.message()
+
+    def close(self):
+        self._consumed = True
+
+
+class _OfflineAsyncStream(_OfflineStream):
+    """messages.stream 的 asyncio 版本"""
+
+    @property
+    async def text_stream(self):
+        for ms, text in self._exchange.timeline():
+            delay = self._started + ms * self._scale / 1000 - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield text
+        self._consumed = True
+
+    async def until_done(self):
+        if not self._consumed:
+            async for _ in self.text_stream:
+                pass
+
+    async def get_final_message(self) -> Any:
+        await self.until_done()
+        return self._exchange.message()
+
+    async def get_final_text(self) -> str:
+        message = await self.get_final_message()
+        return "".join(getattr(block, "text", "") for block in message.content)
+
+
+class _OfflineStreamManager:
+    def __init__(self, transport: "OfflineTransport", request: Dict[str, Any], is_async: bool = False):
+        self._transport = transport
+        self._request = request
+        self._is_async = is_async
+
+    def _open(self):
+        exchange = self._transport.respond("message", self._request)
+        cls = _OfflineAsyncStream if self._is_async else _OfflineStream
+        return cls(exchange, self._transport.latency_scale)
+
+    def __enter__(self):
+        return self._open()
+
+    def __exit__(self, *exc_info):
+        return False
+
+    async def __aenter__(self):
+        return self._open()
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _OfflineMessages:
+    def __init__(self, transport: "OfflineTransport"):
+        self._transport = transport
+
+    def create(self, **kwargs) -> Any:
+        exchange = self._transport.respond("message", kwargs)
+        self._transport.wait(exchange.latency_ms)
+        return exchange.message()
+
+    def stream(self, **kwargs) -> _OfflineStreamManager:
+        return _OfflineStreamManager(self._transport, kwargs)
+
+    def count_tokens(self, **kwargs) -> Any:
+        return self._transport.respond("count_tokens", kwargs).message()
+
+
+class _OfflineAsyncMessages(_OfflineMessages):
+    async def create(self, **kwargs) -> Any:
+        exchange = self._transport.respond("message", kwargs)
+        await asyncio.sleep(exchange.latency_ms * self._transport.latency_scale / 1000)
+        return exchange.message()
+
+    def stream(self, **kwargs) -> _OfflineStreamManager:
+        return _OfflineStreamManager(self._transport, kwargs, is_async=True)
+
+    async def count_tokens(self, **kwargs) -> Any:
+        return self._transport.respond("count_tokens", kwargs).message()
+
+
+class OfflineClient:
+    """anthropic.Anthropic 的离线替身（只有 messages 接口）"""
+
+    def __init__(self, transport: "OfflineTransport", is_async: bool = False):
+        self.messages = _OfflineAsyncMessages(transport) if is_async else _OfflineMessages(transport)
+
+    def close(self):
+        pass
+
+
+# ============================================================================
+# 传输层
+# ============================================================================
+
+class Transport:
+    """live：原样使用 SDK 客户端"""
+
+    mode = "live"
+    offline = False  # True 时不需要 API Key，也不建立连接
+
+    def wrap(self, client: Any) -> Any:
+        """包装新建的同步 SDK 客户端（record 模式在这里挂上录制）"""
+        return client
+
+    def wrap_async(self, client: Any) -> Any:
+        return client
+
+    def client(self, is_async: bool = False) -> Any:
+        raise NotImplementedError("live 模式使用 SDK 客户端")
+
+    def report(self) -> Dict[str, Any]:
+        return {"mode": self.mode}
+
+
+class OfflineTransport(Transport):
+    """replay / synthetic 的公共部分：离线客户端 + 延迟重现"""
+
+    offline = True
+
+    def __init__(self, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "simulated_ms": 0.0}
+
+    def client(self, is_async: bool = False) -> OfflineClient:
+        return OfflineClient(self, is_async)
+
+    def wait(self, ms: float):
+        if ms > 0 and self.latency_scale > 0:
+            time.sleep(ms * self.latency_scale / 1000)
+
+    def respond(self, kind: str, request: Dict[str, Any]) -> Exchange:
+        exchange = self._respond(kind, request)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["simulated_ms"] += exchange.latency_ms
+        return exchange
+
+    def _respond(self, kind: str, request: Dict[str, Any]) -> Exchange:
+        raise NotImplementedError
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, **self.stats}
+
+
+# ----------------------------------------------------------------------------
+# 录制文件
+# ----------------------------------------------------------------------------
+
+class Cassette:
+    """JSONL 录制文件（每行一个 Exchange；多线程追加写入）"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def append(self, exchange: Exchange):
+        line = json.dumps(asdict(exchange), ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+    def load(self) -> List[Exchange]:
+        if not self.path.exists():
+            return []
+        exchanges = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    exchanges.append(Exchange(**json.loads(line)))
+                except (ValueError, TypeError) as e:
+                    print(f"[LLMTransport] 录制文件第 {number} 行损坏，跳过 ({type(e).__name__})")
+        return exchanges
+
+
+class _RecordingStream:
+    """包装 SDK 的流：记录每个文本片段的时刻，结束时写入录制文件"""
+
+    def __init__(self, stream: Any, transport: "RecordTransport", request: Dict[str, Any], started: float):
+        self._stream = stream
+        self._transport = transport
+        self._request = request
+        self._started = started
+        self._chunks: List[Tuple[float, str]] = []
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        for text in self._stream.text_stream:
+            self._chunks.append((round((time.monotonic() - self._started) * 1000, 1), text))
+            yield text
+
+    def get_final_message(self) -> Any:
+        return self._stream.get_final_message()
+
+    def finish(self):
+        message = self._stream.get_final_message()
+        self._transport.record("message", self._request, message, self._started, self._chunks)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+class _RecordingStreamManager:
+    def __init__(self, manager: Any, transport: "RecordTransport", request: Dict[str, Any]):
+        self._manager = manager
+        self._transport = transport
+        self._request = request
+        self._stream: Optional[_RecordingStream] = None
+
+    def __enter__(self):
+        started = time.monotonic()
+        self._stream = _RecordingStream(self._manager.__enter__(), self._transport, self._request, started)
+        return self._stream
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None and self._stream is not None:
+            try:
+                self._stream.finish()
+            except Exception as e:
+                print(f"[LLMTransport] 录制流式响应失败: {type(e).__name__}: {e}")
+        return self._manager.__exit__(*exc_info)
+
+
+class _RecordingMessages:
+    def __init__(self, messages: Any, transport: "RecordTransport"):
+        self._messages = messages
+        self._transport = transport
+
+    def create(self, **kwargs) -> Any:
+        started = time.monotonic()
+        message = self._messages.create(**kwargs)
+        self._transport.record("message", kwargs, message, started)
+        return message
+
+    def stream(self, **kwargs) -> _RecordingStreamManager:
+        return _RecordingStreamManager(self._messages.stream(**kwargs), self._transport, kwargs)
+
+    def count_tokens(self, **kwargs) -> Any:
+        started = time.monotonic()
+        result = self._messages.count_tokens(**kwargs)
+        self._transport.record("count_tokens", kwargs, result, started)
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._messages, name)
+
+
+class _AsyncRecordingMessages(_RecordingMessages):
+    """asyncio 版本：create / count_tokens 录制；流式照常透传（项目中未使用异步流式）"""
+
+    async def create(self, **kwargs) -> Any:
+        started = time.monotonic()
+        message = await self._messages.create(**kwargs)
+        self._transport.record("message", kwargs, message, started)
+        return message
+
+    def stream(self, **kwargs) -> Any:
+        return self._messages.stream(**kwargs)
+
+    async def count_tokens(self, **kwargs) -> Any:
+        started = time.monotonic()
+        result = await self._messages.count_tokens(**kwargs)
+        self._transport.record("count_tokens", kwargs, result, started)
+        return result
+
+
+class _RecordingClient:
+    def __init__(self, client: Any, messages: _RecordingMessages):
+        self._client = client
+        self.messages = messages
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+class RecordTransport(Transport):
+    """record：真实调用，同时把请求/响应与时间线写入录制文件"""
+
+    mode = "record"
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._lock = threading.Lock()
+        self.stats = {"recorded": 0}
+
+    def wrap(self, client: Any) -> Any:
+        return _RecordingClient(client, _RecordingMessages(client.messages, self))
+
+    def wrap_async(self, client: Any) -> Any:
+        return _RecordingClient(client, _AsyncRecordingMessages(client.messages, self))
+
+    def record(self, kind: str, request: Dict[str, Any], response: Any, started: float,
+               chunks: Optional[List[Tuple[float, str]]] = None):
+        normalized = normalize_request(request)
+        self.cassette.append(Exchange(
+            kind=kind,
+            request=normalized,
+            response=response.model_dump(mode="json"),
+            latency_ms=round((time.monotonic() - started) * 1000, 1),
+            chunks=chunks or [],
+            key=exchange_key(kind, normalized),
+        ))
+        with self._lock:
+            self.stats["recorded"] += 1
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "cassette": str(self.cassette.path), **self.stats}
+
+
+class ReplayTransport(OfflineTransport):
+    """
+    replay：按请求内容回放录制文件
+
+    同一请求录了多次时按录制顺序依次给出，用完后一直给最后一次（保证确定性）。
+    录制中没有的请求：miss="error" 时抛出 ReplayMissError，miss="synthetic" 时改用合成响应。
+    """
+
+    mode = "replay"
+
+    def __init__(self, cassette: Cassette, latency_scale: float = LLM_REPLAY_LATENCY, miss: str = LLM_REPLAY_MISS):
+        super().__init__(latency_scale)
+        self.cassette = cassette
+        self.miss = miss
+        self._queues: Dict[str, Deque[Exchange]] = {}
+        for exchange in cassette.load():
+            key = exchange.key or exchange_key(exchange.kind, exchange.request)
+            self._queues.setdefault(key, deque()).append(exchange)
+        self._fallback = SyntheticTransport(latency_scale=0.0) if miss == "synthetic" else None
+        self.stats.update({"hits": 0, "misses": 0, "entries": sum(len(q) for q in self._queues.values())})
+
+    def _respond(self, kind: str, request: Dict[str, Any]) -> Exchange:
+        key = exchange_key(kind, request)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                self.stats["hits"] += 1
+                return queue.popleft() if len(queue) > 1 else queue[0]
+            self.stats["misses"] += 1
+        if self._fallback is not None:
+            return self._fallback.respond(kind, request)
+        raise ReplayMissError(f"录制文件 {self.cassette.path} 中没有这个请求（{kind} {key[:12]}）")
+
+
+class SyntheticTransport(OfflineTransport):
+    """
+    synthetic：按 prompt 合成结构正确的输出
+
+    延迟 = 首字延迟 + 输出 token 数 × 每 token 间隔，两者都按对数正态分布抽样
+    （LLM_SYNTHETIC_LATENCY：中位数毫秒与 sigma；scale 为整体倍数，0 时不等待）。
+    随机数以「种子 + 请求内容」初始化：同一请求每次得到同样的输出和延迟。
+    输出超过 max_tokens 时按 max_tokens 截断（stop_reason = "max_tokens"），续写请求给出剩余部分。
+    corpus 为台词与情节的来源（默认内置语料；TemplateCorpus 取自项目的事件模板与角色台词）。
+    """
+
+    mode = "synthetic"
+
+    def __init__(self, seed: int = LLM_SYNTHETIC_SEED, latency: Dict[str, Any] = None, latency_scale: float = None,
+                 corpus: Corpus = None):
+        latency = dict(LLM_SYNTHETIC_LATENCY if latency is None else latency)
+        super().__init__(latency.get("scale", 1.0) if latency_scale is None else latency_scale)
+        self.seed = seed
+        self.latency = latency
+        self.corpus = corpus or DEFAULT_CORPUS
+
+    def _rng(self, request: Dict[str, Any]) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}\x00{request_key(request)}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _sample(self, rng: random.Random, name: str) -> float:
+        median, sigma = self.latency.get(name, (0.0, 0.0))
+        return median * math.exp(rng.gauss(0.0, sigma)) if median > 0 else 0.0
+
+    def _respond(self, kind: str, request: Dict[str, Any]) -> Exchange:
+        normalized = normalize_request(request)
+        input_tokens = estimate_tokens(json.dumps(
+            {k: normalized.get(k) for k in ("system", "messages")}, ensure_ascii=False
+        ))
+        if kind == "count_tokens":
+            return Exchange(kind=kind, request=normalized, response={"input_tokens": input_tokens})
+
+        # 续写请求（末尾是 assistant 预填）：按原请求合成全文，给出预填之后的部分
+        messages = normalized.get("messages", [])
+        prefill = ""
+        base = normalized
+        if messages and messages[-1].get("role") == "assistant" and isinstance(messages[-1].get("content"), str):
+            prefill = messages[-1]["content"]
+            base = dict(normalized, messages=messages[:-1])
+        rng = self._rng(base)
+        text = synthesize(base, rng, self.corpus)
+        text = text[len(prefill):] if text.startswith(prefill) else text
+
+        stop_reason = "end_turn"
+        max_tokens = normalized.get("max_tokens") or 4096
+        if estimate_tokens(text) > max_tokens:
+            while estimate_tokens(text) > max_tokens:
+                text = text[:max(int(len(text) * max_tokens / estimate_tokens(text)) - 1, 0)]
+            stop_reason = "max_tokens"
+        output_tokens = estimate_tokens(text)
+
+        # 时间线：首字延迟后按每 token 间隔逐段输出（约 8 个字符一段）
+        rng = self._rng(normalized)
+        elapsed = self._sample(rng, "first_token")
+        per_token = self._sample(rng, "per_token")
+        chunks = []
+        for start in range(0, len(text), 8):
+            piece = text[start:start + 8]
+            chunks.append((round(elapsed, 1), piece))
+            elapsed += estimate_tokens(piece) * per_token
+
+        response = {
+            "id": f"msg_synthetic_{request_key(normalized)[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": normalized.get("model", "synthetic"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 0,
+            },
+        }
+        return Exchange(kind=kind, request=normalized, response=response,
+                        latency_ms=round(elapsed, 1), chunks=chunks)
+
+
+# ============================================================================
+# 入口
+# ============================================================================
+
+def create_transport(mode: str = LLM_TRANSPORT, cassette: str = LLM_CASSETTE, project_root: Path = None) -> Transport:
+    """按模式创建传输层（cassette 为相对项目根目录的路径）"""
+    if mode not in TRANSPORT_MODES:
+        raise ValueError(f"未知的 LLM_TRANSPORT: {mode}（可选 {', '.join(TRANSPORT_MODES)}）")
+    root = Path(project_root or Path(__file__).parent.parent)
+    path = Path(cassette) if Path(cassette).is_absolute() else root / cassette
+    if mode == "record":
+        return RecordTransport(Cassette(path))
+    if mode == "replay":
+        transport = ReplayTransport(Cassette(path))
+        print(f"[LLMTransport] 回放 {path}（{transport.stats['entries']} 条）")
+        return transport
+    if mode == "synthetic":
+        return SyntheticTransport()
+    return Transport()
@@ -0,0 +1,323 @@
+# ============================================================================
+# NPC 角色表 (NPC Table)
+# ============================================================================
+# 职责：
+# 1. 角色状态的列式表示：W 个互相独立的世界 × C 个角色，每列一个数组
+#    （地点编号 / 压力 / 疯狂值 / 是否存活）
+# 2. NPCMovement 从 npc_behavior.yaml 预先算好每个角色「从地点 i 移动到地点 j」的概率矩阵
+#    （与原 GameLoopV3._select_npc_destination 的分布完全相同：70% 去偏好地点、30% 随机、排除当前位置和回避地点），
+#    一次移动 = 整张表一步：掷 stay / move / 目的地三组随机数，按累积分布查表
+# 3. 批量：一张表可以装很多个世界（批量模拟 / 多会话），同一步里一起移动
+# 4. 字典视图按需生成：load() 从 character_states 读入，apply_to() 只写回移动过的角色，
+#    states() 重新生成完整的字典
+#
+# numpy 可选：已安装且表足够大（世界数 × 角色数 ≥ NPC_TABLE_NUMPY_MIN）时用向量化实现，
+# 否则用列表实现（同样使用预先算好的概率矩阵）；两种实现的结果分布相同。
+# 列表实现使用全局 random，游戏主循环 / 模拟器用 random.seed() 固定的种子对它同样有效。
+# ============================================================================
+
+import random
+import sys
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import NPC_TABLE_NUMPY_MIN
+
+# 配置缺失时的默认地点（与 GameLoopV3._load_npc_behavior 的默认值相同）
+DEFAULT_LOCATIONS = ["食堂", "牢房区", "图书室", "庭院", "走廊"]
+
+# 偏好地点被选中的概率（原 _select_npc_destination 的 70%）
+PREFERRED_WEIGHT = 0.7
+
+
+def _new_rng(rng: Any = None):
+    """numpy 实现用的随机数生成器（未指定时从全局 random 派生，随 random.seed 可复现）"""
+    if rng is not None:
+        return rng
+    return np.random.default_rng(random.getrandbits(64))
+
+
+class NPCTable:
+    """
+    W 个世界 × C 个角色的列式状态表
+
+    location[w][c] 是 locations 中的下标；numpy 实现时各列为 (W, C) 数组，否则为嵌套列表。
+    """
+
+    def __init__(self, characters: List[str], locations: List[str], location, stress, madness, alive):
+        self.characters = characters   # 与 NPCMovement 共用（角色 / 地点增加时同步）
+        self.locations = locations
+        self.location = location
+        self.stress = stress
+        self.madness = madness
+        self.alive = alive
+
+    @property
+    def vectorized(self) -> bool:
+        return np is not None and isinstance(self.location, np.ndarray)
+
+    @property
+    def worlds(self) -> int:
+        return len(self.location)
+
+    def states(self, world: int = 0, base: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """重新生成一个世界的 character_states 字典（base 给出时在其副本上覆盖表中的字段）"""
+        result = {}
+        for c, char_id in enumerate(self.characters):
+            state = dict((base or {}).get(char_id, {}))
+            state["location"] = self.locations[int(self.location[world][c])]
+            state["stress"] = int(self.stress[world][c])
+            state["madness"] = int(self.madness[world][c])
+            alive = bool(self.alive[world][c])
+            state["alive"] = alive
+            if alive:
+                state["status"] = "alive"
+            elif state.get("status", "alive") == "alive":
+                state["status"] = "dead"  # 已有的非存活状态原样保留
+            result[char_id] = state
+        return result
+
+    def apply_to(self, states_list: Sequence[Dict[str, Dict]], moved) -> List[List[str]]:
+        """
+        把移动结果写回字典（只改移动过的角色的 location）
+
+        Returns:
+            每个世界移动过的角色 ID 列表
+        """
+        result = []
+        for w, states in enumerate(states_list):
+            row = moved[w]
+            moved_ids = []
+            for c, char_id in enumerate(self.characters):
+                if row[c] and char_id in states:
+                    states[char_id]["location"] = self.locations[int(self.location[w][c])]
+                    moved_ids.append(char_id)
+            result.append(moved_ids)
+        return result
+
+
+class NPCMovement:
+    """NPC 移动模型：npc_behavior.yaml → 每个角色的移动概率矩阵"""
+
+    def __init__(self, behavior: Dict = None, player: str = "aima"):
+        behavior = behavior or {}
+        movement = behavior.get("movement", {})
+        self.base_chance = movement.get("base_chance", 0.3)
+        self.period_chance = dict(movement.get("period_modifiers", {}))
+        self.preferences = behavior.get("location_preferences", {})
+        self.player = player  # 玩家不自动移动
+
+        self.all_locations = list(behavior.get("all_locations") or DEFAULT_LOCATIONS)
+        self.locations: List[str] = list(self.all_locations)  # 地点词表（表中出现的其他地点追加在后面）
+        self.characters: List[str] = []
+        self._location_index: Dict[str, int] = {}
+        self._character_index: Dict[str, int] = {}
+        self._cdf: List[List[List[float]]] = []  # [角色][当前地点] -> 目的地累积分布
+        self._cdf_array = None                   # numpy 版本 (C, L, L)
+        self._stay_array = None
+        self._movable_array = None
+        for name in self.locations:
+            self._location_index[name] = len(self._location_index)
+
+    # ------------------------------------------------------------------
+    # 概率矩阵
+    # ------------------------------------------------------------------
+
+    def move_chance(self, period: str) -> float:
+        return self.period_chance.get(period, self.base_chance)
+
+    def stay_chance(self, char_id: str) -> float:
+        return self.preferences.get(char_id, {}).get("stay_chance", 0)
+
+    def destination_distribution(self, char_id: str, current: str) -> List[float]:
+        """角色从 current 出发时各目的地的概率（与原 _select_npc_destination 相同，逐次抽样版见 benchmark_npc_table.select_destination）"""
+        pref = self.preferences.get(char_id, {})
+        preferred = pref.get("preferred", [])
+        avoid = pref.get("avoid", [])
+        weights = [0.0] * len(self.locations)
+        remaining = 1.0
+
+        if preferred:
+            available = [loc for loc in preferred if loc != current and loc not in avoid]
+            if available:
+                for loc in available:
+                    weights[self._location_index[loc]] += PREFERRED_WEIGHT / len(available)
+                remaining -= PREFERRED_WEIGHT
+
+        available = [loc for loc in self.all_locations if loc != current and loc not in avoid]
+        if available:
+            for loc in available:
+                weights[self._location_index[loc]] += remaining / len(available)
+        else:
+            weights[self._location_index[current]] += remaining
+        return weights
+
+    def _index_location(self, name: str) -> int:
+        if name not in self._location_index:
+            self._location_index[name] = len(self.locations)
+            self.locations.append(name)
+            self._cdf = []  # 词表变化，矩阵重算
+        return self._location_index[name]
+
+    def _index_character(self, char_id: str) -> int:
+        if char_id not in self._character_index:
+            self._character_index[char_id] = len(self.characters)
+            self.characters.append(char_id)
+            self._cdf = []
+        return self._character_index[char_id]
+
+    def _build(self):
+        """（词表变化后）重算每个角色、每个出发地点的目的地累积分布"""
+        for char_id in self.preferences:
+            for loc in self.preferences[char_id].get("preferred", []):
+                self._index_location(loc)
+        self._cdf = []
+        for char_id in self.characters:
+            rows = []
+            for current in self.locations:
+                total, row = 0.0, []
+                for weight in self.destination_distribution(char_id, current):
+                    total += weight
+                    row.append(total)
+                rows.append(row)
+            self._cdf.append(rows)
+        if np is not None:
+            self._cdf_array = np.array(self._cdf, dtype=np.float64)
+            self._stay_array = np.array([self.stay_chance(c) for c in self.characters], dtype=np.float64)
+            self._movable_array = np.array([c != self.player for c in self.characters], dtype=bool)
+
+    # ------------------------------------------------------------------
+    # 读入
+    # ------------------------------------------------------------------
+
+    def load(self, states_list: Sequence[Dict[str, Dict]], vectorized: Optional[bool] = None) -> NPCTable:
+        """
+        从一个或多个世界的 character_states 建表
+
+        vectorized=None 时按表的大小自动选择（需要 numpy）。
+        """
+        for states in states_list:
+            for char_id, state in states.items():
+                self._index_character(char_id)
+                self._index_location(state.get("location", "牢房区"))
+        if not self._cdf:
+            self._build()
+
+        rows = []
+        for states in states_list:
+            row = [None] * len(self.characters)
+            for char_id, state in states.items():
+                row[self._character_index[char_id]] = state
+            rows.append(row)
+
+        default_location = self._location_index.get("牢房区", 0)
+        location = [[self._location_index[s.get("location", "牢房区")] if s else default_location for s in row] for row in rows]
+        stress = [[s.get("stress", 0) if s else 0 for s in row] for row in rows]
+        madness = [[s.get("madness", 0) if s else 0 for s in row] for row in rows]
+        alive = [[bool(s) and s.get("status") == "alive" for s in row] for row in rows]
+
+        if vectorized is None:
+            vectorized = np is not None and len(rows) * len(self.characters) >= NPC_TABLE_NUMPY_MIN
+        if vectorized:
+            if np is None:
+                raise RuntimeError("[NPCMovement] 向量化实现需要 numpy（pip install numpy）")
+            location, stress, madness = (np.array(column, dtype=np.int64) for column in (location, stress, madness))
+            alive = np.array(alive, dtype=bool)
+        return NPCTable(self.characters, self.locations, location, stress, madness, alive)
+
+    # ------------------------------------------------------------------
+    # 移动
+    # ------------------------------------------------------------------
+
+    def step(self, table: NPCTable, period: str = "morning", rng: Any = None):
+        """
+        所有世界同时移动一步（时段变化时调用）
+
+        Returns:
+            moved[w][c]：该角色这一步是否换了地点（numpy 实现为布尔数组）
+        """
+        if not self._cdf:
+            self._build()
+        chance = self.move_chance(period)
+        if table.vectorized:
+            return self._step_vectorized(table, chance, _new_rng(rng))
+
+        rng = rng or random
+        stay = [self.stay_chance(c) for c in self.characters]
+        moved = []
+        for w in range(table.worlds):
+            location, alive = table.location[w], table.alive[w]
+            row = [False] * len(self.characters)
+            for c, char_id in enumerate(self.characters):
+                if char_id == self.player or not alive[c]:
+                    continue
+                if rng.random() < stay[c]:
+                    continue
+                if rng.random() < chance:
+                    cdf = self._cdf[c][location[c]]
+                    dest = min(bisect_right(cdf, rng.random() * cdf[-1]), len(cdf) - 1)
+                    if dest != location[c]:
+                        location[c] = dest
+                        row[c] = True
+            moved.append(row)
+        return moved
+
+    def _step_vectorized(self, table: NPCTable, chance: float, rng):
+        worlds, count = table.location.shape
+        u = rng.random((3, worlds, count))
+        active = table.alive & self._movable_array[None, :] \
+            & (u[0] >= self._stay_array[None, :]) & (u[1] < chance)
+        cdf = self._cdf_array[np.arange(count)[None, :], table.location]        # (W, C, L)
+        dest = (u[2][..., None] * cdf[..., -1:] >= cdf).sum(axis=-1)
+        dest = np.minimum(dest, len(self.locations) - 1)
+        moved = active & (dest != table.location)
+        table.location = np.where(moved, dest, table.location)
+        return moved
+
+    def scatter(self, table: NPCTable, locations: Sequence[str], chance: float = 1.0, rng: Any = None):
+        """
+        存活角色以 chance 的概率移到 locations 中随机一处（可能与原地点相同）
+
+        Returns:
+            moved[w][c]：该角色是否被重新分配了地点（不论是否与原地点相同）
+        """
+        indices = [self._index_location(name) for name in locations]
+        if not self._cdf:
+            self._build()
+        if table.vectorized:
+            rng = _new_rng(rng)
+            worlds, count = table.location.shape
+            picked = table.alive & (rng.random((worlds, count)) < chance)
+            dest = np.array(indices, dtype=np.int64)[rng.integers(0, len(indices), (worlds, count))]
+            table.location = np.where(picked, dest, table.location)
+            return picked
+
+        rng = rng or random
+        moved = []
+        for w in range(table.worlds):
+            location, alive = table.location[w], table.alive[w]
+            row = [False] * len(self.characters)
+            for c in range(len(self.characters)):
+                if alive[c] and rng.random() < chance:
+                    location[c] = rng.choice(indices)
+                    row[c] = True
+            moved.append(row)
+        return moved
+
+
+def sample_locations(weights: Dict[str, float], count: int, rng: Any = None) -> List[str]:
+    """按权重独立抽取 count 个地点（numpy 可用且数量较多时一次抽完）"""
+    names = list(weights)
+    if np is not None and count >= NPC_TABLE_NUMPY_MIN:
+        p = np.array([weights[name] for name in names], dtype=np.float64)
+        picks = _new_rng(rng).choice(len(names), size=count, p=p / p.sum())
+        return [names[i] for i in picks]
+    return (rng or random).choices(names, weights=[weights[name] for name in names], k=count)
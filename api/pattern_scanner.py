@@ -0,0 +1,196 @@
+# ============================================================================
+# 多模式关键词扫描器 (Pattern Scanner)
+# ============================================================================
+# 职责：
+# 1. 把各处的关键词表（幻觉角色名、地点冲突词、画面感词汇、tone.yaml 的
+#    禁止内容……）编译成一个 Aho-Corasick 自动机
+# 2. 每行文本只扫描一遍，一次性报告全部命中的类别、关键词和位置
+# 3. 扫描耗时只与文本长度和命中数有关，词表增长到上千条也不变
+#
+# 词表由各自的模块登记（register），内容不变的重复登记不会触发重建。
+# ============================================================================
+
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .world_loader import WorldLoader
+
+
+# ============================================================================
+# 数据类
+# ============================================================================
+
+@dataclass(frozen=True)
+class Hit:
+    """一次命中：text[start:end] == keyword"""
+    category: str
+    keyword: str
+    start: int
+    end: int
+
+
+@dataclass
+class ScanResult:
+    """一段文本的扫描结果（按出现位置排序）"""
+    text: str
+    hits: List[Hit] = field(default_factory=list)
+
+    @property
+    def categories(self) -> Set[str]:
+        return {hit.category for hit in self.hits}
+
+    def has(self, category: str) -> bool:
+        return any(hit.category == category for hit in self.hits)
+
+    def keywords(self, category: str) -> List[str]:
+        """某类别命中的关键词（去重，按首次出现的位置）"""
+        found = []
+        for hit in self.hits:
+            if hit.category == category and hit.keyword not in found:
+                found.append(hit.keyword)
+        return found
+
+    def by_category(self) -> Dict[str, List[Hit]]:
+        grouped: Dict[str, List[Hit]] = {}
+        for hit in self.hits:
+            grouped.setdefault(hit.category, []).append(hit)
+        return grouped
+
+
+# ============================================================================
+# Aho-Corasick 自动机
+# ============================================================================
+
+class _Automaton:
+    """trie + 失败指针；每个状态的输出已合并失败链上的输出"""
+
+    def __init__(self, tables: Dict[str, Tuple[str, ...]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Tuple[Tuple[str, str], ...]] = [()]
+
+        for category, keywords in tables.items():
+            for keyword in keywords:
+                if keyword:
+                    self._insert(category, keyword)
+        self._link()
+
+    def _insert(self, category: str, keyword: str):
+        state = 0
+        for ch in keyword:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+            state = nxt
+        if (category, keyword) not in self.out[state]:
+            self.out[state] += ((category, keyword),)
+
+    def _link(self):
+        # 按层次遍历，父状态的失败指针总是先算好
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+
+    def scan(self, text: str) -> List[Hit]:
+        goto, fail, out = self.goto, self.fail, self.out
+        hits = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for category, keyword in out[state]:
+                    hits.append(Hit(category, keyword, end - len(keyword), end))
+        hits.sort(key=lambda hit: (hit.start, hit.end))
+        return hits
+
+
+# ============================================================================
+# 扫描器
+# ============================================================================
+
+class PatternScanner:
+    """多模式关键词扫描器 - 所有词表共用一个自动机"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Tuple[str, ...]] = {}
+        self._automaton: Optional[_Automaton] = None
+        self.stats = {"builds": 0, "scans": 0, "hits": 0}
+
+    def register(self, category: str, keywords: Iterable[str]):
+        """登记（或替换）一个类别的词表；内容不变时不做任何事"""
+        keywords = tuple(keywords)
+        with self._lock:
+            if self._tables.get(category) == keywords:
+                return
+            self._tables[category] = keywords
+            self._automaton = None
+
+    def register_many(self, prefix: str, tables: Dict[str, Iterable[str]]):
+        """按 `<prefix>:<key>` 登记一组词表（如各地点的冲突词）"""
+        for key, keywords in tables.items():
+            self.register(f"{prefix}:{key}", keywords)
+
+    def has_category(self, category: str) -> bool:
+        return category in self._tables
+
+    def _compiled(self) -> _Automaton:
+        automaton = self._automaton
+        if automaton is None:
+            with self._lock:
+                if self._automaton is None:
+                    self._automaton = _Automaton(dict(self._tables))
+                    self.stats["builds"] += 1
+                automaton = self._automaton
+        return automaton
+
+    def scan(self, text: str) -> ScanResult:
+        """扫描一遍文本，返回全部类别的命中"""
+        hits = self._compiled().scan(text or "")
+        self.stats["scans"] += 1
+        self.stats["hits"] += len(hits)
+        return ScanResult(text=text or "", hits=hits)
+
+
+# ============================================================================
+# 对话/场景校验共用的扫描器
+# ============================================================================
+
+def register_forbidden_content(scanner: PatternScanner, world: WorldLoader):
+    """登记各阶段（起/承/转/合）的禁止内容，类别为 `forbidden:<arc>`"""
+    arcs = dict.fromkeys([
+        *world.load_manifest().get('arc', {}).keys(),
+        *world.load_tone().get('scene_guidance', {}).keys(),
+        "起", "承", "转", "合",
+    ])
+    for arc in arcs:
+        forbidden = world.load_tone_for_arc(arc).get('禁止内容', [])
+        scanner.register(f"forbidden:{arc}", [str(item) for item in forbidden])
+
+
+# 全局实例
+_scanners: Dict[Path, PatternScanner] = {}
+_scanners_lock = threading.Lock()
+
+def get_dialogue_scanner(project_root: Path = None) -> PatternScanner:
+    """获取对话校验扫描器单例（按项目根目录）"""
+    root = Path(project_root or Path(__file__).parent.parent).resolve()
+    with _scanners_lock:
+        if root not in _scanners:
+            _scanners[root] = PatternScanner()
+        return _scanners[root]
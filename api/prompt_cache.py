@@ -0,0 +1,226 @@
+# ============================================================================
+# Prompt 缓存 (Prompt Cache)
+# ============================================================================
+# 职责：
+# 1. 把各层 prompt 拆成「静态 system 块 + 每回合动态 user 块」
+#    静态块（模板说明 + 世界观规则 + 角色档案卡）打上 cache_control，回合间复用
+# 2. 记录每次调用的缓存命中/未命中（cache_read / cache_creation tokens）
+# 3. 心跳保活：定期用同一静态块发一个极小请求，防止缓存过期
+# ============================================================================
+
+import threading
+import yaml
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Optional, Any
+import sys
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import MODEL, CACHE_TTL, HEARTBEAT_INTERVAL, ENABLE_CACHE, ENABLE_HEARTBEAT
+
+from .llm_gateway import get_gateway
+
+
+# ============================================================================
+# 静态块构建
+# ============================================================================
+
+def build_cached_system(*sections: str) -> Any:
+    """
+    把若干静态段落合并为 system 参数
+
+    ENABLE_CACHE 时返回带 cache_control 的 content block 列表，否则返回纯文本。
+    同一组 sections 必须逐字相同才能命中缓存，所以这里只能放回合间不变的内容。
+    """
+    text = "\n\n".join(section.strip() for section in sections if section and section.strip())
+    if not ENABLE_CACHE:
+        return text
+
+    cache_control = {"type": "ephemeral"}
+    if CACHE_TTL >= 3600:
+        cache_control["ttl"] = "1h"
+    return [{"type": "text", "text": text, "cache_control": cache_control}]
+
+
+def format_world_rules(world_loader) -> str:
+    """世界观规则（rules.yaml）的静态文本"""
+    rules = world_loader.load_core_rules()
+    if not rules:
+        return ""
+    return "【世界观规则】\n" + yaml.safe_dump(rules, allow_unicode=True, sort_keys=False, width=200).strip()
+
+
+def format_tone_guidance(world_loader) -> str:
+    """氛围指导（tone.yaml 的各阶段基调）的静态文本"""
+    tone = world_loader.load_tone()
+    scene_guidance = tone.get("scene_guidance", {})
+    if not scene_guidance:
+        return ""
+    return "【各阶段氛围指导】\n" + yaml.safe_dump(
+        scene_guidance, allow_unicode=True, sort_keys=False, width=200
+    ).strip()
+
+
+# ============================================================================
+# 命中统计
+# ============================================================================
+
+_USAGE_KEYS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+# 当前上下文的 usage 计量器（track_usage 期间生效；用 copy_context 提交到线程池的任务也会计入）
+_current_meter: ContextVar[Optional[Dict[str, int]]] = ContextVar("prompt_cache_meter", default=None)
+
+
+@contextmanager
+def track_usage():
+    """
+    统计当前上下文在 with 块内所有已 record 的调用的 token 用量
+
+    用法：
+        with track_usage() as usage:
+            planner.plan_scene(...)
+        print(usage["input_tokens"])
+    """
+    meter = {key: 0 for key in _USAGE_KEYS}
+    meter["calls"] = 0
+    token = _current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+
+
+class PromptCacheStats:
+    """Prompt 缓存命中统计（线程安全，按调用方分别计数）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_caller: Dict[str, Dict[str, int]] = {}
+
+    def record(self, caller: str, response: Any) -> Dict[str, int]:
+        """
+        记录一次 API 调用的 usage，返回本次调用的统计
+
+        命中 = cache_read_input_tokens > 0；否则计为未命中（含首次写入缓存）
+        """
+        usage = getattr(response, "usage", None)
+        call = {
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+            "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        }
+        call["hit"] = 1 if call["cache_read_input_tokens"] > 0 else 0
+
+        with self._lock:
+            totals = self._by_caller.setdefault(caller, {
+                "calls": 0, "hits": 0, "misses": 0,
+                "input_tokens": 0, "output_tokens": 0,
+                "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0,
+            })
+            totals["calls"] += 1
+            totals["hits"] += call["hit"]
+            totals["misses"] += 1 - call["hit"]
+            for key in _USAGE_KEYS:
+                totals[key] += call[key]
+
+            meter = _current_meter.get()
+            if meter is not None:
+                meter["calls"] += 1
+                for key in _USAGE_KEYS:
+                    meter[key] += call[key]
+
+        status = "命中" if call["hit"] else "未命中"
+        print(f"[{caller}] Prompt缓存{status}: 读取 {call['cache_read_input_tokens']} / "
+              f"写入 {call['cache_creation_input_tokens']} / 未缓存输入 {call['input_tokens']} tokens")
+        return call
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """各调用方的累计统计（含命中率）"""
+        with self._lock:
+            result = {}
+            for caller, totals in self._by_caller.items():
+                entry = dict(totals)
+                entry["hit_rate"] = totals["hits"] / totals["calls"] if totals["calls"] else 0.0
+                result[caller] = entry
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._by_caller.clear()
+
+
+# ============================================================================
+# 心跳保活
+# ============================================================================
+
+class PromptCacheHeartbeat:
+    """
+    缓存心跳 - 定期用已注册的静态块发送 max_tokens=1 的请求，刷新缓存 TTL
+
+    各层在构建好静态块后调用 register()，同名注册会覆盖为最新的静态块。
+    """
+
+    def __init__(self, interval: int = HEARTBEAT_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}  # name -> (role, system)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, name: str, role: str, system: Any):
+        """注册/更新一个需要保活的静态块（role 决定经由网关使用哪个 Key）"""
+        if not (ENABLE_CACHE and ENABLE_HEARTBEAT):
+            return
+        with self._lock:
+            self._entries[name] = (role, system)
+        self.start()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        print(f"[PromptCache] 心跳线程已启动（间隔: {self.interval}秒）")
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                entries = list(self._entries.items())
+            for name, (role, system) in entries:
+                try:
+                    response = get_gateway().create(
+                        role,
+                        model=MODEL,
+                        max_tokens=1,
+                        system=system,
+                        messages=[{"role": "user", "content": "ping"}]
+                    )
+                    get_prompt_cache_stats().record(f"heartbeat:{name}", response)
+                except Exception as e:
+                    print(f"[PromptCache] 心跳失败 {name}: {type(e).__name__}: {e}")
+
+
+# 全局实例
+_stats: Optional[PromptCacheStats] = None
+_heartbeat: Optional[PromptCacheHeartbeat] = None
+
+def get_prompt_cache_stats() -> PromptCacheStats:
+    """获取缓存统计单例"""
+    global _stats
+    if _stats is None:
+        _stats = PromptCacheStats()
+    return _stats
+
+def get_prompt_cache_heartbeat() -> PromptCacheHeartbeat:
+    """获取心跳单例"""
+    global _heartbeat
+    if _heartbeat is None:
+        _heartbeat = PromptCacheHeartbeat()
+    return _heartbeat
@@ -0,0 +1,494 @@
+# ============================================================================
+# 响应缓存 (Response Cache)
+# ============================================================================
+# 职责：
+# 1. 把 create_text 的完整输出按「模型 + 规范化后的 prompt + 采样参数」的哈希
+#    存到磁盘（.cache/responses/），相同请求直接复用，不再走网络
+# 2. 按调用标签决定是否缓存（RESPONSE_CACHE_POLICY）：大纲、选项回应、固定事件
+#    规划等可以复用；自由场景每次都要新鲜内容，直接绕过
+# 3. 总大小超过上限时按最近使用时间（文件 mtime）淘汰最旧的条目
+# 4. 命中率 / 占用字节数等统计；命令行查看、预热、清理：
+#    python manage_response_cache.py {stats,list,show,purge,export,warm}
+# ============================================================================
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import (
+    ENABLE_RESPONSE_CACHE, RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB, RESPONSE_CACHE_POLICY
+)
+
+ENTRY_FORMAT = 1
+
+# 参与缓存键的请求参数（影响输出的参数；stream / metadata / timeout 等不影响内容）
+KEY_PARAMS = (
+    "model", "max_tokens", "system", "messages", "temperature", "top_p", "top_k",
+    "stop_sequences", "tools", "tool_choice", "thinking", "max_continuations",
+)
+
+# 超出上限时淘汰到上限的这个比例，避免每次写入都触发扫描
+EVICT_TO = 0.9
+
+
+# ============================================================================
+# 请求规范化
+# ============================================================================
+
+def _normalize_text(text: str) -> str:
+    """统一换行、去掉行尾空白和首尾空行（不影响模型理解的差异不应导致缓存未命中）"""
+    lines = text.replace("\r\n", "\n").strip().split("\n")
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def _normalize_content(content: Any) -> Any:
+    """
+    system / message content 的规范形式
+
+    只含文本块时合并成一个字符串：带 cache_control 的块列表与纯文本
+    （ENABLE_CACHE 开关两种形态）得到同一个键。
+    """
+    if isinstance(content, str):
+        return _normalize_text(content)
+    if isinstance(content, list):
+        if all(isinstance(block, dict) and block.get("type") == "text" for block in content):
+            return _normalize_text("\n\n".join(block.get("text", "") for block in content))
+        return [
+            {k: v for k, v in block.items() if k != "cache_control"} if isinstance(block, dict) else block
+            for block in content
+        ]
+    return content
+
+
+def normalize_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留影响输出的参数，并规范化 prompt 文本（结果可直接再次作为请求参数）"""
+    normalized = {key: request[key] for key in KEY_PARAMS if request.get(key) is not None}
+    if "system" in normalized:
+        normalized["system"] = _normalize_content(normalized["system"])
+    if "messages" in normalized:
+        normalized["messages"] = [
+            {"role": message.get("role"), "content": _normalize_content(message.get("content"))}
+            for message in normalized["messages"]
+        ]
+    return normalized
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """请求的内容地址（规范化后的 JSON 的 sha256）"""
+    payload = json.dumps(normalize_request(request), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _usage_totals(responses: List[Any]) -> Dict[str, int]:
+    totals = {"input_tokens": 0, "output_tokens": 0}
+    for response in responses:
+        usage = getattr(response, "usage", None)
+        for key in totals:
+            totals[key] += getattr(usage, key, 0) or 0
+    return totals
+
+
+# ============================================================================
+# 响应缓存
+# ============================================================================
+
+class ResponseCache:
+    """磁盘响应缓存 - 内容寻址 + 按大小的 LRU 淘汰"""
+
+    def __init__(
+        self,
+        project_root: Path = None,
+        cache_dir: Path = None,
+        max_bytes: int = RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+        policy: Dict[str, bool] = None,
+        enabled: bool = ENABLE_RESPONSE_CACHE
+    ):
+        self.project_root = Path(project_root or Path(__file__).parent.parent)
+        self.cache_dir = Path(cache_dir or self.project_root / RESPONSE_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.policy = dict(RESPONSE_CACHE_POLICY if policy is None else policy)
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None  # 首次写入时扫描目录得到
+        self.stats = {
+            "hits": 0, "misses": 0, "bypassed": 0, "writes": 0, "evictions": 0,
+            "errors": 0, "saved_input_tokens": 0, "saved_output_tokens": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # 查询与写入
+    # ------------------------------------------------------------------
+
+    def cacheable(self, tag: Optional[str]) -> bool:
+        """该调用标签是否走缓存（未列入策略的标签一律绕过）"""
+        return self.enabled and bool(tag) and self.policy.get(tag, False)
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def lookup(self, tag: Optional[str], request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的输出
+
+        Returns:
+            条目字典（含 key 与 completion: text / stop_reason / usage），未命中或被策略绕过时为 None
+        """
+        if not self.cacheable(tag):
+            with self._lock:
+                self.stats["bypassed"] += 1
+            return None
+
+        key = request_key(request)
+        entry = self._read(self.path_for(key))
+        with self._lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            usage = entry["completion"].get("usage", {})
+            self.stats["saved_input_tokens"] += usage.get("input_tokens", 0)
+            self.stats["saved_output_tokens"] += usage.get("output_tokens", 0)
+
+        # 命中即「最近使用」：淘汰按 mtime 从旧到新
+        try:
+            os.utime(self.path_for(key))
+        except OSError:
+            pass
+        print(f"[ResponseCache] 命中 {tag} ({key[:12]})")
+        return entry
+
+    def store(self, tag: Optional[str], role: str, request: Dict[str, Any], completion: Any) -> Optional[str]:
+        """
+        写入一次完整输出（create_text 的 Completion），返回缓存键
+
+        续写用完后仍被截断的输出不缓存。
+        """
+        if not self.cacheable(tag) or getattr(completion, "truncated", False):
+            return None
+
+        normalized = normalize_request(request)
+        key = request_key(normalized)
+        entry = {
+            "format": ENTRY_FORMAT,
+            "key": key,
+            "tag": tag,
+            "role": role,
+            "created": time.time(),
+            "request": normalized,
+            "completion": {
+                "text": completion.text,
+                "stop_reason": completion.stop_reason,
+                "usage": _usage_totals(completion.responses),
+            },
+        }
+        path = self.path_for(key)
+        try:
+            size = self._write(path, entry)
+        except OSError as e:
+            print(f"[ResponseCache] 写入失败: {type(e).__name__}: {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+            return None
+
+        with self._lock:
+            self.stats["writes"] += 1
+            if self._bytes is not None:
+                self._bytes += size
+            over = self.bytes_used() > self.max_bytes
+        if over:
+            self.evict()
+        return key
+
+    def discard(self, key: Optional[str]) -> bool:
+        """删除一个条目（调用方发现缓存的输出无法使用时调用，下次重新生成）"""
+        if not key:
+            return False
+        path = self.path_for(key)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return False
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes -= size
+        print(f"[ResponseCache] 丢弃 {key[:12]}")
+        return True
+
+    # ------------------------------------------------------------------
+    # 文件读写
+    # ------------------------------------------------------------------
+
+    def _read(self, path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[ResponseCache] 条目损坏，忽略: {path.name} ({type(e).__name__})")
+            with self._lock:
+                self.stats["errors"] += 1
+            return None
+        if entry.get("format") != ENTRY_FORMAT or "completion" not in entry:
+            return None
+        return entry
+
+    def _write(self, path: Path, entry: Dict[str, Any]) -> int:
+        """原子写入（临时文件 + os.replace），返回新增的字节数"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(entry, ensure_ascii=False, indent=1).encode("utf-8")
+        try:
+            previous = path.stat().st_size
+        except OSError:
+            previous = 0
+        fd, tmp_path = tempfile.mkstemp(prefix=".entry.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return len(data) - previous
+
+    def _scan(self) -> List[Tuple[float, int, Path]]:
+        """[(最近使用时间, 字节数, 路径)]"""
+        entries = []
+        if not self.cache_dir.exists():
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for item in os.scandir(shard.path):
+                if item.name.endswith(".json"):
+                    try:
+                        st = item.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, Path(item.path)))
+        return entries
+
+    # ------------------------------------------------------------------
+    # 淘汰与维护
+    # ------------------------------------------------------------------
+
+    def bytes_used(self) -> int:
+        if self._bytes is None:
+            self._bytes = sum(size for _, size, _ in self._scan())
+        return self._bytes
+
+    def evict(self, target: Optional[int] = None) -> int:
+        """按最近使用时间从旧到新删除条目，直到总大小不超过 target（默认上限的 90%）"""
+        target = int(self.max_bytes * EVICT_TO) if target is None else target
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._bytes = total
+            self.stats["evictions"] += removed
+        if removed:
+            print(f"[ResponseCache] 淘汰 {removed} 个条目，当前 {total / 1024 / 1024:.1f} MB")
+        return removed
+
+    def entries(self, tag: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """遍历全部条目（附带 path / size / last_used），按最近使用时间从新到旧"""
+        for mtime, size, path in sorted(self._scan(), reverse=True):
+            entry = self._read(path)
+            if entry is None or (tag and entry.get("tag") != tag):
+                continue
+            entry["path"] = path
+            entry["size"] = size
+            entry["last_used"] = mtime
+            yield entry
+
+    def find(self, prefix: str) -> Optional[Dict[str, Any]]:
+        """按键的前缀查找一个条目"""
+        shard = self.cache_dir / prefix[:2]
+        if len(prefix) < 2 or not shard.exists():
+            return None
+        matches = sorted(shard.glob(f"{prefix}*.json"))
+        return self._read(matches[0]) if len(matches) == 1 else None
+
+    def purge(self, tag: Optional[str] = None, older_than: Optional[float] = None) -> int:
+        """删除条目：按标签和/或最近使用时间早于 older_than 秒前；都不指定时清空"""
+        cutoff = time.time() - older_than if older_than is not None else None
+        removed = 0
+        for entry in list(self.entries(tag)):
+            if cutoff is not None and entry["last_used"] > cutoff:
+                continue
+            try:
+                entry["path"].unlink()
+                removed += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._bytes = None
+        return removed
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            report = dict(self.stats)
+        lookups = report["hits"] + report["misses"]
+        report["hit_ratio"] = report["hits"] / lookups if lookups else 0.0
+        report["bytes_used"] = self.bytes_used()
+        report["max_bytes"] = self.max_bytes
+        return report
+
+    def print_report(self):
+        report = self.report()
+        print(f"[ResponseCache] 命中 {report['hits']} / 未命中 {report['misses']} "
+              f"(绕过 {report['bypassed']}) | 命中率 {report['hit_ratio']:.0%} | "
+              f"占用 {report['bytes_used'] / 1024 / 1024:.1f}/{report['max_bytes'] / 1024 / 1024:.0f} MB | "
+              f"节省输出 {report['saved_output_tokens']} tokens")
+
+
+# 全局实例
+_caches: Dict[Path, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def get_response_cache(project_root: Path = None) -> ResponseCache:
+    """获取响应缓存单例（按项目根目录）"""
+    root = Path(project_root or Path(__file__).parent.parent).resolve()
+    with _caches_lock:
+        if root not in _caches:
+            _caches[root] = ResponseCache(root)
+        return _caches[root]
+
+
+# ============================================================================
+# 命令行
+# ============================================================================
+
+def _format_time(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+def _preview(text: str, width: int = 48) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="响应缓存：查看 / 清理 / 预热")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("stats", help="条目数、占用空间与各标签分布")
+
+    p_list = sub.add_parser("list", help="列出条目（最近使用的在前）")
+    p_list.add_argument("--tag")
+    p_list.add_argument("--limit", type=int, default=30)
+
+    p_show = sub.add_parser("show", help="显示一个条目的请求与输出")
+    p_show.add_argument("key", help="缓存键或其前缀")
+
+    p_purge = sub.add_parser("purge", help="删除条目（不加条件时清空）")
+    p_purge.add_argument("--tag")
+    p_purge.add_argument("--older-than", type=float, metavar="DAYS", help="最近使用早于 N 天前")
+
+    p_export = sub.add_parser("export", help="把条目的请求导出为 JSONL（供 warm 使用）")
+    p_export.add_argument("file")
+    p_export.add_argument("--tag")
+
+    p_warm = sub.add_parser("warm", help="按 export 导出的请求预先生成缓存（调用 API）")
+    p_warm.add_argument("file")
+
+    args = parser.parse_args(argv)
+    cache = get_response_cache()
+
+    if args.command == "stats":
+        by_tag: Dict[str, List[int]] = {}
+        for entry in cache.entries():
+            counts = by_tag.setdefault(entry.get("tag") or "-", [0, 0])
+            counts[0] += 1
+            counts[1] += entry["size"]
+        print(f"[ResponseCache] {cache.cache_dir}")
+        print(f"占用 {cache.bytes_used() / 1024 / 1024:.2f} / {cache.max_bytes / 1024 / 1024:.0f} MB，"
+              f"{sum(c[0] for c in by_tag.values())} 个条目")
+        for tag, (count, size) in sorted(by_tag.items()):
+            status = "缓存" if cache.cacheable(tag) else "绕过"
+            print(f"  {tag:<20}{count:>6} 条 {size / 1024:>9.1f} KB   ({status})")
+
+    elif args.command == "list":
+        for n, entry in enumerate(cache.entries(args.tag)):
+            if n >= args.limit:
+                break
+            print(f"{entry['key'][:12]}  {entry.get('tag') or '-':<18}{entry['size'] / 1024:>7.1f} KB  "
+                  f"{_format_time(entry['last_used'])}  {_preview(entry['completion'].get('text', ''))}")
+
+    elif args.command == "show":
+        entry = cache.find(args.key)
+        if entry is None:
+            print(f"[ResponseCache] 没有唯一匹配 {args.key} 的条目")
+            return 1
+        print(json.dumps(entry, ensure_ascii=False, indent=2))
+
+    elif args.command == "purge":
+        older_than = args.older_than * 86400 if args.older_than is not None else None
+        removed = cache.purge(args.tag, older_than)
+        print(f"[ResponseCache] 删除 {removed} 个条目，当前 {cache.bytes_used() / 1024 / 1024:.2f} MB")
+
+    elif args.command == "export":
+        count = 0
+        with open(args.file, 'w', encoding='utf-8') as f:
+            for entry in cache.entries(args.tag):
+                record = {"tag": entry.get("tag"), "role": entry.get("role"), "request": entry["request"]}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        print(f"[ResponseCache] 导出 {count} 个请求到 {args.file}")
+
+    elif args.command == "warm":
+        from .llm_gateway import get_gateway
+        from .llm_scheduler import llm_request
+
+        gateway = get_gateway()
+        stats = {"cached": 0, "generated": 0, "skipped": 0, "failed": 0}
+        with open(args.file, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        for record in records:
+            tag, request = record.get("tag"), dict(record["request"])
+            if not cache.cacheable(tag):
+                stats["skipped"] += 1
+                continue
+            if cache.path_for(request_key(request)).exists():
+                stats["cached"] += 1
+                continue
+            try:
+                with llm_request(priority="offline"):  # 预热不和玩家抢名额
+                    gateway.create_text(record.get("role") or "director", cache=tag, **request)
+                stats["generated"] += 1
+            except Exception as e:
+                print(f"[ResponseCache] 预热失败: {type(e).__name__}: {e}")
+                stats["failed"] += 1
+        print(f"[ResponseCache] 预热完成：已有 {stats['cached']} / 新生成 {stats['generated']} / "
+              f"策略绕过 {stats['skipped']} / 失败 {stats['failed']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
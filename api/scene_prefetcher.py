@@ -0,0 +1,302 @@
+# ============================================================================
+# 场景预取器 (Scene Prefetcher)
+# ============================================================================
+# 职责：
+# 1. 玩家阅读上一场景时，在后台为最可能被选择的N个地点预先规划+演出场景
+# 2. 候选地点排序：在场角色数（character_states.json）+ 最近场景历史
+# 3. 玩家选择命中时直接交付 ScenePlan + 对话，省去两次完整的 LLM 往返
+# 4. 世界状态指纹变化时丢弃过期预取；统计命中率和浪费的 token
+# 5. 预取的 LLM 调用以 speculative 优先级排队（api/llm_scheduler.py），名额紧张时被取消
+# 6. 后台线程只在 WorldSnapshot（主线程上拷贝的副本）上规划和演出，
+#    不读写实时世界状态，也不发布变更（主线程此时可能正在修改同一批文档）
+# ============================================================================
+
+import sys
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Any
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import PREFETCH_TOP_N, PREFETCH_HISTORY
+
+from .director_planner import ScenePlan
+from .character_actor import DialogueOutput
+from .prompt_cache import track_usage
+from .llm_scheduler import RequestCancelled, llm_request, current_session
+from .world_state import WorldSnapshot
+
+THREAD_PREFIX = "ScenePrefetch"
+
+# 预取任务所在的上下文（含其提交到线程池的子任务）的输出全部静音
+_quiet: ContextVar[bool] = ContextVar("scene_prefetch_quiet", default=False)
+
+
+# ============================================================================
+# 数据类
+# ============================================================================
+
+@dataclass
+class PrefetchedScene:
+    """一次预取的结果"""
+    location: str
+    fingerprint: int
+    scene_plan: Optional[ScenePlan] = None
+    dialogues: List[DialogueOutput] = field(default_factory=list)
+    choice_responses: Optional[Dict] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+    done: threading.Event = field(default_factory=threading.Event)
+    discarded: bool = False
+
+    @property
+    def usable(self) -> bool:
+        """规划成功且不是回退场景"""
+        return (self.error is None and self.scene_plan is not None
+                and not self.scene_plan.scene_id.startswith("fallback_"))
+
+
+# ============================================================================
+# 后台线程静音
+# ============================================================================
+
+class _ThreadFilteredStdout:
+    """丢弃预取任务的输出，避免打断玩家正在看的菜单；其他线程照常输出"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        if _quiet.get():
+            return len(text)
+        return self._stream.write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _install_quiet_stdout():
+    if not isinstance(sys.stdout, _ThreadFilteredStdout):
+        sys.stdout = _ThreadFilteredStdout(sys.stdout)
+
+
+# ============================================================================
+# 场景预取器
+# ============================================================================
+
+class ScenePrefetcher:
+    """场景预取器 - 投机地提前生成玩家下一步可能进入的场景"""
+
+    def __init__(self, planner, actor, project_root: Path, top_n: int = PREFETCH_TOP_N):
+        self.planner = planner
+        self.actor = actor
+        self.project_root = project_root
+        self.top_n = top_n
+        self.world_state = planner.world_state  # 与规划层同一份（多会话时为会话自己的状态）
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, PrefetchedScene] = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "prefetched": 0,
+            "cancelled": 0,
+            "wasted_tokens": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # 世界状态指纹
+    # ------------------------------------------------------------------
+
+    def fingerprint(self) -> int:
+        """WorldState 的版本号，任何一次修改都会使预取过期"""
+        return self.world_state.version
+
+    # ------------------------------------------------------------------
+    # 候选地点排序
+    # ------------------------------------------------------------------
+
+    def rank_locations(self, locations: List[str], planner=None) -> List[str]:
+        """
+        按「在场角色数 ×2 + 最近场景中出现次数」排序候选地点
+
+        无人的地点直接跳过：plan_scene 对空地点不调用 API，无需预取。
+        planner 为绑定到快照的规划层（默认为实时的规划层）。
+        """
+        planner = planner or self.planner
+        states = planner.world_state.get("character_states")
+
+        present = Counter(
+            state.get("location") for state in states.values()
+            if state.get("status") == "alive" and state.get("can_interact", True)
+        )
+        recent_scenes = planner.scene_history.get("scenes", [])[-PREFETCH_HISTORY:]
+        recent = Counter(scene.get("location") for scene in recent_scenes)
+
+        scored = [
+            (present[loc] * 2 + recent[loc], -order, loc)
+            for order, loc in enumerate(locations)
+            if present[loc] > 0
+        ]
+        scored.sort(reverse=True)
+        return [loc for _, _, loc in scored]
+
+    # ------------------------------------------------------------------
+    # 启动 / 取用 / 丢弃
+    # ------------------------------------------------------------------
+
+    def start(self, locations: List[str], guard: Optional[Callable[[], bool]] = None):
+        """
+        后台开始预取（立即返回）
+
+        Args:
+            locations: 玩家菜单中可选的地点（中文名）
+            guard: 前置检查（在当前线程静音执行），返回 False 则本轮不预取
+                   （例如有待触发的固定事件）
+        """
+        self.discard_all()
+        _install_quiet_stdout()
+        token = _quiet.set(True)
+        try:
+            if guard is not None and not guard():
+                return
+        except Exception:
+            return
+        finally:
+            _quiet.reset(token)
+
+        # 在调用方线程上拷贝：此后后台线程只碰副本
+        snapshot = WorldSnapshot(self.world_state)
+        threading.Thread(
+            target=self._launch, args=(locations, snapshot, current_session()),
+            name=f"{THREAD_PREFIX}-launcher", daemon=True
+        ).start()
+
+    def _launch(self, locations: List[str], snapshot: WorldSnapshot, session: Optional[str]):
+        _quiet.set(True)
+        planner = self.planner.for_world(snapshot)
+        actor = self.actor.for_world(snapshot)
+        try:
+            candidates = self.rank_locations(locations, planner)[:self.top_n]
+        except Exception:
+            return
+
+        for location in candidates:
+            entry = PrefetchedScene(location=location, fingerprint=snapshot.source_version)
+            with self._lock:
+                self._entries[location] = entry
+                self.stats["prefetched"] += 1
+            threading.Thread(
+                target=self._run, args=(entry, planner, actor, session),
+                name=f"{THREAD_PREFIX}-{location}", daemon=True
+            ).start()
+
+    def _run(self, entry: PrefetchedScene, planner, actor, session: Optional[str] = None):
+        _quiet.set(True)
+        with llm_request(priority="speculative", session=session), track_usage() as usage:
+            try:
+                scene_plan = planner.plan_scene(
+                    location=entry.location, scene_type="free", commit=False
+                )
+                entry.scene_plan = scene_plan
+                if entry.usable:
+                    entry.dialogues, choice_responses = actor.generate_scene_dialogue(scene_plan)
+                    # 预选回应在后台并发生成，这里等它完成，usage 才能完整计入
+                    if choice_responses is not None:
+                        choice_responses = dict(choice_responses)
+                    entry.choice_responses = choice_responses
+            except RequestCancelled as e:
+                entry.error = f"已取消: {e}"
+                with self._lock:
+                    self.stats["cancelled"] += 1
+            except Exception as e:
+                entry.error = f"{type(e).__name__}: {e}"
+
+        with self._lock:
+            entry.usage = dict(usage)
+            entry.done.set()
+            if entry.discarded:
+                self.stats["wasted_tokens"] += self._tokens(entry)
+
+    def take(self, location: str) -> Optional[PrefetchedScene]:
+        """
+        玩家已选择地点：命中则返回可直接播放的预取结果（并写入场景历史），否则返回 None
+
+        其余候选地点的预取全部丢弃，计入浪费的 token。
+        """
+        with self._lock:
+            entry = self._entries.pop(location, None)
+        self.discard_all()
+
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        if entry.fingerprint != self.fingerprint():
+            print(f"[ScenePrefetcher] 预取已过期（世界状态已变化）: {location}")
+            self.stats["stale"] += 1
+            self.stats["misses"] += 1
+            self._discard(entry)
+            return None
+
+        if not entry.done.is_set():
+            print(f"[ScenePrefetcher] 等待预取完成: {location}")
+        entry.done.wait()
+
+        if not entry.usable or entry.fingerprint != self.fingerprint():
+            self.stats["misses"] += 1
+            self._discard(entry)
+            return None
+
+        self.planner.commit_scene(entry.scene_plan)
+        self.stats["hits"] += 1
+        print(f"[ScenePrefetcher] 命中预取: {location}")
+        return entry
+
+    def discard_all(self):
+        """丢弃所有未取用的预取（玩家跳过、固定事件等）"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._discard(entry)
+
+    def _discard(self, entry: PrefetchedScene):
+        with self._lock:
+            if entry.discarded:
+                return
+            entry.discarded = True
+            # 仍在进行中的预取在完成时（_run 末尾）再计入浪费
+            if entry.done.is_set():
+                self.stats["wasted_tokens"] += self._tokens(entry)
+
+    @staticmethod
+    def _tokens(entry: PrefetchedScene) -> int:
+        usage = entry.usage
+        return (usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+                + usage.get("cache_read_input_tokens", 0) + usage.get("cache_creation_input_tokens", 0))
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def report(self) -> Dict[str, Any]:
+        """命中率与浪费统计"""
+        with self._lock:
+            result = dict(self.stats)
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+        return result
+
+    def print_report(self):
+        report = self.report()
+        print(f"[ScenePrefetcher] 命中 {report['hits']} / 未命中 {report['misses']} "
+              f"(过期 {report['stale']}) | 命中率 {report['hit_rate']:.0%} | "
+              f"预取 {report['prefetched']} 次 (名额紧张取消 {report['cancelled']}) | 浪费 {report['wasted_tokens']} tokens")
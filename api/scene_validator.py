@@ -6,6 +6,12 @@ from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from .world_loader import WorldLoader, get_world_loader
+from .pattern_scanner import get_dialogue_scanner, register_forbidden_content
+
+
+# 画面感词汇（check_scene_storytelling）
+SCENE_WORDS = ["阳光", "灰尘", "脚步", "沉默", "窗", "声音", "目光", "肩膀",
+               "光线", "气息", "温度", "风", "影子", "走廊", "桌子", "椅子"]
 
 
 @dataclass
@@ -29,6 +35,11 @@ class SceneValidator:
         else:
             self.world = world_loader
 
+        # 禁止内容与画面感词汇登记到共用扫描器（与演出层的词表同一个自动机）
+        self.scanner = get_dialogue_scanner(project_root)
+        register_forbidden_content(self.scanner, self.world)
+        self.scanner.register("scene_word", SCENE_WORDS)
+
     def validate(self, scene_plan: Any, day: int) -> ValidationResult:
         """验证场景是否符合当天约束"""
         errors = []
@@ -40,7 +51,6 @@ class SceneValidator:
         # 获取约束
         tension_range = tone.get('张力范围', [1, 10])
         min_t, max_t = tension_range[0], tension_range[1]
-        forbidden = tone.get('禁止内容', [])
         dialogue_density = tone.get('对话密度', 'normal')
 
         # 1. 张力检查
@@ -54,9 +64,8 @@ class SceneValidator:
 
         # 2. 禁止内容检查
         scene_text = self._extract_all_text(scene_plan)
-        for keyword in forbidden:
-            if keyword in scene_text:
-                errors.append(f"检测到禁止内容：「{keyword}」")
+        for keyword in self.scanner.scan(scene_text).keywords(f"forbidden:{arc}"):
+            errors.append(f"检测到禁止内容：「{keyword}」")
 
         # 3. 角色行为检查（起阶段不能崩溃）
         if arc == "起":
@@ -236,9 +245,7 @@ class SceneValidator:
                     if hasattr(line, 'text_cn'):
                         all_text += line.text_cn + " "
 
-        scene_words = ["阳光", "灰尘", "脚步", "沉默", "窗", "声音", "目光", "肩膀",
-                       "光线", "气息", "温度", "风", "影子", "走廊", "桌子", "椅子"]
-        found = [w for w in scene_words if w in all_text]
+        found = self.scanner.scan(all_text).keywords("scene_word")
         if len(found) < 2:
             warnings.append(f"缺乏画面感词汇，仅找到：{found}")
 
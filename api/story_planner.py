@@ -8,19 +8,27 @@
 # 4. 判断结局类型
 # ============================================================================
 
-import anthropic
 import json
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 import sys
 
 # 添加父目录到路径以导入config
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from config import get_api_key, MODEL
+from config import MODEL
 
 # 导入公共工具函数
 from .utils import parse_json_with_diagnostics
+from .world_loader import get_world_loader
+from .llm_gateway import get_gateway
+from .world_state import WorldState, get_world_state
+from .world_bundle import get_world_bundle
+from .character_registry import get_character_registry
+from .prompt_cache import (
+    build_cached_system, format_world_rules, format_tone_guidance,
+    get_prompt_cache_stats, get_prompt_cache_heartbeat
+)
 
 
 # ============================================================================
@@ -72,6 +80,9 @@ def save_json(filepath: str, data: dict):
     with open(filepath, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
+def load_yaml(filepath: str) -> dict:
+    return get_world_bundle().load_yaml(filepath)
+
 
 # ============================================================================
 # 故事规划层
@@ -80,29 +91,27 @@ def save_json(filepath: str, data: dict):
 class StoryPlanner:
     """故事规划层 - 管理章节大纲和结局判定"""
 
-    def __init__(self, project_root: Path = None):
-        self.client = anthropic.Anthropic(api_key=get_api_key("director"))
+    def __init__(self, project_root: Path = None, world_state: WorldState = None):
+        self.gateway = get_gateway()
         self.project_root = project_root or Path(__file__).parent.parent
+        self.world_state = world_state or get_world_state(self.project_root)
+        self.characters = get_character_registry(self.project_root)
         self._outline_cache: Optional[ChapterOutline] = None
+        self._static_system = None  # 静态 system 块（prompt 缓存前缀）
 
-    def _get_outline_path(self) -> Path:
-        """获取大纲文件路径"""
-        return self.project_root / "world_state" / "chapter_outline.json"
-
-    def _get_murder_prep_path(self) -> Path:
-        """获取杀人准备文件路径"""
-        return self.project_root / "world_state" / "murder_prep.json"
+    def load_character_data(self, char_id: str) -> Dict:
+        """加载角色数据（角色注册表，进程内只读一次）"""
+        return self.characters.get(char_id)
 
     def load_outline(self) -> Optional[Dict]:
         """加载现有大纲"""
-        path = self._get_outline_path()
-        if path.exists():
-            return load_json(path)
+        if self.world_state.exists("chapter_outline"):
+            return self.world_state.get("chapter_outline")
         return None
 
     def save_outline(self, outline: Dict):
         """保存大纲"""
-        save_json(self._get_outline_path(), outline)
+        self.world_state.set("chapter_outline", outline)
 
     def generate_three_day_outline(self) -> Dict:
         """
@@ -112,8 +121,8 @@ class StoryPlanner:
             包含三天事件规划的字典
         """
         # 加载当前状态
-        current_day = load_json(self.project_root / "world_state" / "current_day.json")
-        character_states = load_json(self.project_root / "world_state" / "character_states.json")
+        current_day = self.world_state.get("current_day")
+        character_states = self.world_state.get("character_states")
 
         # 分析角色状态
         high_stress_chars = [
@@ -125,16 +134,23 @@ class StoryPlanner:
             if state.get("madness", 0) >= 50
         ]
 
-        prompt = self._build_outline_prompt(current_day, high_stress_chars, high_madness_chars)
+        system, prompt = self._build_outline_prompt(current_day, high_stress_chars, high_madness_chars)
 
+        completion = None
         try:
-            response = self.client.messages.create(
+            completion = self.gateway.create_text(
+                "director",
                 model=MODEL,
                 max_tokens=4096,
-                messages=[{"role": "user", "content": prompt}]
+                system=system,
+                messages=[{"role": "user", "content": prompt}],
+                cache="story_outline"
             )
+            for response in completion.responses:
+                get_prompt_cache_stats().record("StoryPlanner", response)
+            get_prompt_cache_heartbeat().register("StoryPlanner", "director", system)
 
-            raw_text = response.content[0].text
+            raw_text = completion.text
             result = parse_json_with_diagnostics(raw_text, "三天大纲", "StoryPlanner")
 
             # 保存大纲
@@ -143,23 +159,15 @@ class StoryPlanner:
 
         except Exception as e:
             print(f"[StoryPlanner] 生成大纲失败: {type(e).__name__}: {e}")
+            self.gateway.forget(completion)
             return self._create_fallback_outline(current_day["day"])
 
-    def _build_outline_prompt(self, current_day: Dict, high_stress: List[str], high_madness: List[str]) -> str:
-        """构建大纲生成 prompt"""
-        return f"""你是《魔法少女的魔女审判》的故事规划师。请为接下来的三天规划大纲。
-
-【当前状态】
-当前日期: 第{current_day.get('day', 1)}天
-当前阶段: {current_day.get('phase', 'free_time')}
-已触发事件: {current_day.get('event_count', 0)}次
-已设置标记: {list(current_day.get('flags', {}).keys())}
-
-【危险角色】
-高压力角色（≥70）: {', '.join(high_stress) if high_stress else '无'}
-高疯狂角色（≥50）: {', '.join(high_madness) if high_madness else '无'}
+    def _get_static_system(self) -> Any:
+        """静态 system 块：规划要求 + 世界观规则 + 氛围指导 + 全体角色档案（回合间不变，可缓存）"""
+        if self._static_system is not None:
+            return self._static_system
 
-【规划要求】
+        instructions = """【规划要求】
 1. 每天规划3-5个关键事件
 2. 第一天：建立关系，埋下伏笔
 3. 第二天：矛盾升级，可能发生杀人（如果有高疯狂角色）
@@ -167,45 +175,71 @@ class StoryPlanner:
 5. 张力曲线要逐步升高
 
 【输出格式】严格JSON：
-{{
+{
   "chapter": 1,
   "title": "章节标题",
   "overall_theme": "整体主题描述",
   "days": [
-    {{
+    {
       "day": 1,
       "theme": "当天主题",
       "key_events": ["事件1描述", "事件2描述", "..."],
       "tension_arc": "低→中 (张力变化)",
       "potential_murder": false,
       "notes": "导演备注"
-    }},
-    {{
+    },
+    {
       "day": 2,
       "theme": "...",
       "key_events": [...],
       "tension_arc": "中→高",
       "potential_murder": true/false,
       "notes": "..."
-    }},
-    {{
+    },
+    {
       "day": 3,
       "theme": "...",
       "key_events": [...],
       "tension_arc": "高→结局",
       "potential_murder": false,
       "notes": "..."
-    }}
+    }
   ],
-  "ending_flags": {{
+  "ending_flags": {
     "murder_occurred": false,
     "correct_judgment": null,
     "library_secret_found": false
-  }}
-}}
+  }
+}
 
 请直接输出JSON。"""
 
+        world_loader = get_world_loader(project_root=self.project_root)
+        self._static_system = build_cached_system(
+            "你是《魔法少女的魔女审判》的故事规划师。请为接下来的三天规划大纲。",
+            format_world_rules(world_loader),
+            format_tone_guidance(world_loader),
+            self.characters.cards_text(),
+            instructions
+        )
+        return self._static_system
+
+    def _build_outline_prompt(self, current_day: Dict, high_stress: List[str], high_madness: List[str]) -> Tuple[Any, str]:
+        """构建大纲生成 prompt，返回 (system, user)"""
+        prompt = f"""【当前状态】
+当前日期: 第{current_day.get('day', 1)}天
+当前阶段: {current_day.get('phase', 'free_time')}
+已触发事件: {current_day.get('event_count', 0)}次
+已设置标记: {list(current_day.get('flags', {}).keys())}
+
+【危险角色】
+高压力角色（≥70）: {', '.join(high_stress) if high_stress else '无'}
+高疯狂角色（≥50）: {', '.join(high_madness) if high_madness else '无'}
+
+请按 system 中的要求输出三天大纲JSON。"""
+
+        return self._get_static_system(), prompt
+
     def _create_fallback_outline(self, start_day: int) -> Dict:
         """创建回退大纲"""
         return {
@@ -273,11 +307,10 @@ class StoryPlanner:
         Returns:
             如果有准备杀人的角色，返回准备信息；否则返回 None
         """
-        path = self._get_murder_prep_path()
-        if not path.exists():
+        if not self.world_state.exists("murder_prep"):
             return None
 
-        prep = load_json(path)
+        prep = self.world_state.get("murder_prep")
         if prep.get("active", False):
             return prep
         return None
@@ -300,7 +333,7 @@ class StoryPlanner:
             "progress": progress,
             "can_execute": progress >= 100
         }
-        save_json(self._get_murder_prep_path(), prep)
+        self.world_state.set("murder_prep", prep)
 
     def check_ending(self) -> str:
         """
@@ -309,8 +342,8 @@ class StoryPlanner:
         Returns:
             结局类型字符串
         """
-        current_day = load_json(self.project_root / "world_state" / "current_day.json")
-        character_states = load_json(self.project_root / "world_state" / "character_states.json")
+        current_day = self.world_state.get("current_day")
+        character_states = self.world_state.get("character_states")
         flags = current_day.get("flags", {})
 
         # 检查是否发生过杀人
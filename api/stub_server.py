@@ -0,0 +1,434 @@
+# ============================================================================
+# 本地模拟 LLM 服务器 (Stub LLM Server)
+# ============================================================================
+# 职责：在本机提供一个只实现 Messages API 必要部分的 HTTP 服务，
+#       供压测与无网络的 CI 使用（SDK 客户端原样使用，只换 API 地址）
+# 1. POST /v1/messages：非流式 JSON 与 SSE 流式（message_start → content_block_delta
+#    … → message_delta(stop_reason, usage) → message_stop）
+# 2. POST /v1/messages/count_tokens
+# 3. 429 rate_limit_error（按比例 / 每分钟请求数 / 并发上限，带 retry-after）、
+#    529 overloaded_error（按比例），以及流式中途的 error 事件
+# 4. 延迟：首字延迟 + 每 token 间隔（对数正态），按请求的 model 选用 haiku / sonnet / opus 档位
+# 5. 内容：按 prompt 合成（api/synthetic_llm.py），台词与情节取自
+#    events/free_event_templates*.yaml 与角色注册表（TemplateCorpus）
+#
+# 用法：python stub_llm_server.py --port 8765 [--profile sonnet] [--rate-limit-rate 0.05]
+#       LLM_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=stub python game_loop_v3.py
+# 服务端状态：GET /stub/stats
+# ============================================================================
+
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .llm_transport import Exchange, SyntheticTransport
+from .synthetic_llm import TemplateCorpus
+
+
+# 各档位的延迟分布（对数正态：中位数毫秒, sigma）
+LATENCY_PROFILES = {
+    "instant": {"first_token": (0.0, 0.0), "per_token": (0.0, 0.0)},
+    "haiku": {"first_token": (450.0, 0.3), "per_token": (7.0, 0.2)},
+    "sonnet": {"first_token": (900.0, 0.35), "per_token": (18.0, 0.2)},
+    "opus": {"first_token": (1800.0, 0.4), "per_token": (32.0, 0.25)},
+}
+DEFAULT_PROFILE = "sonnet"
+
+
+def _error_body(error_type: str, message: str) -> Dict[str, Any]:
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+class StubLLMServer:
+    """
+    本地模拟 Messages API 的 HTTP 服务器
+
+    profile="auto" 时按请求的 model 名选择延迟档位（含 haiku / opus 的用对应档，其余用 sonnet）；
+    first_token_ms / per_token_ms 覆盖所有档位的中位数。
+    latency_scale 为整体延迟倍数（0 = 立即返回）。
+    错误注入：rate_limit_rate / overload_rate 为每个请求返回 429 / 529 的概率，
+    stream_error_rate 为流式响应中途发出 overloaded_error 事件的概率；
+    rpm > 0 时按令牌桶限制每个 API Key 每分钟的请求数（容量为 10 秒的配额），max_concurrency > 0 时限制同时处理的请求数。
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        profile: str = "auto",
+        latency_scale: float = 1.0,
+        first_token_ms: Optional[float] = None,
+        per_token_ms: Optional[float] = None,
+        seed: int = 0,
+        rate_limit_rate: float = 0.0,
+        overload_rate: float = 0.0,
+        stream_error_rate: float = 0.0,
+        rpm: int = 0,
+        max_concurrency: int = 0,
+        retry_after: float = 1.0,
+        project_root: Path = None,
+    ):
+        if profile != "auto" and profile not in LATENCY_PROFILES:
+            raise ValueError(f"未知的延迟档位: {profile}（可选 auto, {', '.join(LATENCY_PROFILES)}）")
+        self.profile = profile
+        self.latency_scale = latency_scale
+        self.rate_limit_rate = rate_limit_rate
+        self.overload_rate = overload_rate
+        self.stream_error_rate = stream_error_rate
+        self.rpm = rpm
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+
+        # 每个档位一个合成传输层（共用语料；自身不等待，延迟由服务器按时间线重现）
+        corpus = TemplateCorpus(project_root)
+        self.transports: Dict[str, SyntheticTransport] = {}
+        for name, latency in LATENCY_PROFILES.items():
+            latency = dict(latency)
+            if first_token_ms is not None:
+                latency["first_token"] = (first_token_ms, latency["first_token"][1])
+            if per_token_ms is not None:
+                latency["per_token"] = (per_token_ms, latency["per_token"][1])
+            self.transports[name] = SyntheticTransport(seed=seed, latency=latency, latency_scale=0.0, corpus=corpus)
+
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._active = 0
+        self._buckets: Dict[str, List[float]] = {}  # API Key -> [余额, 上次补充时间]
+        self.stats = {
+            "requests": 0, "streams": 0, "count_tokens": 0,
+            "rate_limited": 0, "overloaded": 0, "stream_errors": 0, "invalid": 0,
+            "input_tokens": 0, "output_tokens": 0, "peak_concurrency": 0,
+        }
+
+        self.httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # ------------------------------------------------------------------
+    # 启停
+    # ------------------------------------------------------------------
+
+    def serve_forever(self):
+        print(f"[StubLLMServer] 监听 {self.url}（延迟档位 {self.profile}，倍数 {self.latency_scale}）")
+        self.httpd.serve_forever()
+
+    def start(self) -> "StubLLMServer":
+        """在后台线程中运行（测试 / 基准脚本内嵌使用）"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # ------------------------------------------------------------------
+    # 限流与错误注入
+    # ------------------------------------------------------------------
+
+    def _bucket_size(self) -> int:
+        return max(1, self.rpm // 6)
+
+    def admit(self, api_key: str = "") -> Optional[Tuple[int, str, str, float]]:
+        """
+        决定是否受理一个请求（rpm 按 api_key 分别计）
+
+        Returns:
+            None = 受理（调用方处理完后必须 release）；
+            否则 (HTTP 状态码, 错误类型, 说明, retry-after 秒)
+        """
+        with self._lock:
+            if self.max_concurrency and self._active >= self.max_concurrency:
+                self.stats["rate_limited"] += 1
+                return 429, "rate_limit_error", "Number of concurrent connections has exceeded your rate limit.", self.retry_after
+            if self.rpm:
+                now = time.monotonic()
+                bucket = self._buckets.setdefault(api_key, [float(self._bucket_size()), now])
+                bucket[0] = min(float(self._bucket_size()), bucket[0] + (now - bucket[1]) * self.rpm / 60)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    self.stats["rate_limited"] += 1
+                    wait = (1 - bucket[0]) * 60 / self.rpm
+                    return 429, "rate_limit_error", f"Number of requests has exceeded your per-minute rate limit ({self.rpm}).", wait
+                bucket[0] -= 1
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429, "rate_limit_error", "This request would exceed your rate limit.", self.retry_after
+            if roll < self.rate_limit_rate + self.overload_rate:
+                self.stats["overloaded"] += 1
+                return 529, "overloaded_error", "Overloaded", self.retry_after
+            self._active += 1
+            self.stats["peak_concurrency"] = max(self.stats["peak_concurrency"], self._active)
+            return None
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def stream_fails(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.stream_error_rate
+
+    # ------------------------------------------------------------------
+    # 响应
+    # ------------------------------------------------------------------
+
+    def transport_for(self, model: str) -> SyntheticTransport:
+        if self.profile != "auto":
+            return self.transports[self.profile]
+        for name in ("haiku", "opus"):
+            if name in (model or ""):
+                return self.transports[name]
+        return self.transports[DEFAULT_PROFILE]
+
+    def respond(self, kind: str, request: Dict[str, Any]) -> Exchange:
+        exchange = self.transport_for(request.get("model")).respond(kind, request)
+        with self._lock:
+            if kind == "count_tokens":
+                self.stats["count_tokens"] += 1
+            else:
+                self.stats["requests"] += 1
+                self.stats["streams"] += bool(request.get("stream"))
+                usage = exchange.response.get("usage") or {}
+                self.stats["input_tokens"] += usage.get("input_tokens", 0)
+                self.stats["output_tokens"] += usage.get("output_tokens", 0)
+        return exchange
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"url": self.url, "profile": self.profile, "active": self._active, **self.stats}
+
+
+# ============================================================================
+# HTTP 处理
+# ============================================================================
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive；流式响应用分块传输
+
+    server_version = "StubLLM/1.0"
+
+    @property
+    def stub(self) -> StubLLMServer:
+        return self.server.stub
+
+    def log_message(self, format: str, *args):
+        pass  # 不逐条打印请求
+
+    # ------------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------------
+
+    def _request_id(self) -> str:
+        return "req_stub_" + hashlib.sha1(f"{time.time_ns()}{threading.get_ident()}".encode()).hexdigest()[:20]
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Dict[str, str] = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.send_header("request-id", self._request_id())
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, error_type: str, message: str, retry_after: Optional[float] = None):
+        headers = {"retry-after": f"{retry_after:.0f}" if retry_after >= 1 else f"{retry_after:.3f}"} \
+            if retry_after is not None else None
+        self._send_json(status, _error_body(error_type, message), headers)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_event(self, event: str, data: Dict[str, Any]):
+        payload = json.dumps(data, ensure_ascii=False)
+        self._write_chunk(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+
+    # ------------------------------------------------------------------
+    # 路由
+    # ------------------------------------------------------------------
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/stub/stats":
+            self._send_json(200, self.stub.report())
+        else:
+            self._send_error(404, "not_found_error", f"Not found: {self.path}")
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        length = int(self.headers.get("content-length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        if not (self.headers.get("x-api-key") or self.headers.get("authorization")):
+            self._send_error(401, "authentication_error", "x-api-key header is required")
+            return
+        try:
+            request = json.loads(raw.decode("utf-8") or "{}")
+        except ValueError as e:
+            self.stub.count("invalid")
+            self._send_error(400, "invalid_request_error", f"Invalid JSON body: {e}")
+            return
+
+        if path == "/v1/messages/count_tokens":
+            exchange = self.stub.respond("count_tokens", request)
+            self._send_json(200, exchange.response)
+        elif path == "/v1/messages":
+            self._messages(request)
+        else:
+            self._send_error(404, "not_found_error", f"Not found: {self.path}")
+
+    def _messages(self, request: Dict[str, Any]):
+        problem = self._validate(request)
+        if problem:
+            self.stub.count("invalid")
+            self._send_error(400, "invalid_request_error", problem)
+            return
+
+        rejected = self.stub.admit(self.headers.get("x-api-key") or self.headers.get("authorization") or "")
+        if rejected:
+            status, error_type, message, retry_after = rejected
+            self._send_error(status, error_type, message, retry_after)
+            return
+        try:
+            exchange = self.stub.respond("message", request)
+            if request.get("stream"):
+                self._stream(exchange)
+            else:
+                self._sleep_until(time.monotonic(), exchange.latency_ms)
+                self._send_json(200, exchange.response)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端已断开（超时 / 取消）
+        finally:
+            self.stub.release()
+
+    @staticmethod
+    def _validate(request: Dict[str, Any]) -> Optional[str]:
+        if not request.get("model"):
+            return "model: Field required"
+        if not isinstance(request.get("max_tokens"), int) or request["max_tokens"] < 1:
+            return "max_tokens: Field required (integer >= 1)"
+        messages = request.get("messages")
+        if not isinstance(messages, list) or not messages:
+            return "messages: at least one message is required"
+        if messages[0].get("role") != "user":
+            return "messages: first message must use the \"user\" role"
+        return None
+
+    def _sleep_until(self, started: float, ms: float):
+        delay = started + ms * self.stub.latency_scale / 1000 - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _stream(self, exchange: Exchange):
+        started = time.monotonic()
+        response = exchange.response
+        usage = response.get("usage") or {}
+
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.send_header("transfer-encoding", "chunked")
+        self.send_header("request-id", self._request_id())
+        self.end_headers()
+
+        self._send_event("message_start", {"type": "message_start", "message": {
+            **{k: v for k, v in response.items() if k not in ("content", "usage")},
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {**usage, "output_tokens": 1},
+        }})
+        self._send_event("content_block_start", {
+            "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""},
+        })
+        self._send_event("ping", {"type": "ping"})
+
+        timeline = exchange.timeline()
+        fail_at = len(timeline) // 2 if timeline and self.stub.stream_fails() else None
+        for n, (ms, text) in enumerate(timeline):
+            if n == fail_at:
+                self.stub.count("stream_errors")
+                self._send_event("error", _error_body("overloaded_error", "Overloaded"))
+                self._write_chunk(b"")
+                return
+            self._sleep_until(started, ms)
+            self._send_event("content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text},
+            })
+
+        self._send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        self._send_event("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": response.get("stop_reason"), "stop_sequence": None},
+            "usage": {"output_tokens": usage.get("output_tokens", 0)},
+        })
+        self._send_event("message_stop", {"type": "message_stop"})
+        self._write_chunk(b"")
+
+
+# ============================================================================
+# 命令行
+# ============================================================================
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 服务器（Messages API）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profile", default="auto", choices=["auto"] + list(LATENCY_PROFILES),
+                        help="延迟档位（auto = 按请求的 model 选择）")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="延迟倍数（0 = 立即返回）")
+    parser.add_argument("--first-token-ms", type=float, default=None, help="首字延迟中位数（覆盖档位）")
+    parser.add_argument("--per-token-ms", type=float, default=None, help="每 token 间隔中位数（覆盖档位）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="返回 529 的概率")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="流式中途出错的概率")
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟请求数上限（0 = 不限）")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="同时处理的请求上限（0 = 不限）")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 / 529 的 retry-after 秒数")
+    args = parser.parse_args(argv)
+
+    server = StubLLMServer(
+        host=args.host, port=args.port, profile=args.profile, latency_scale=args.latency_scale,
+        first_token_ms=args.first_token_ms, per_token_ms=args.per_token_ms, seed=args.seed,
+        rate_limit_rate=args.rate_limit_rate, overload_rate=args.overload_rate,
+        stream_error_rate=args.stream_error_rate, rpm=args.rpm,
+        max_concurrency=args.max_concurrency, retry_after=args.retry_after,
+    )
+    print(f"[StubLLMServer] 使用方法：LLM_BASE_URL={server.url} ANTHROPIC_API_KEY=stub python game_loop_v3.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"[StubLLMServer] {server.report()}")
+        server.httpd.server_close()
+    return 0
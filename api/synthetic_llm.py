@@ -0,0 +1,481 @@
+# ============================================================================
+# 合成响应 (Synthetic LLM)
+# ============================================================================
+# 职责：
+# 1. 离线运行（LLM_TRANSPORT=synthetic）时代替模型输出：按请求的 prompt 判断
+#    是哪一层的调用，生成结构正确的 JSON
+# 2. 识别本项目各层的请求：场景规划 / 整场对话 / 空 Beat 修复 / 单 Beat 对话 /
+#    选项回应 / 三天大纲 / 日文台词（含紧凑格式与仅中文模式）；
+#    其他请求（test_*.py 等）按 prompt 中的 JSON 示例填值
+# 3. 只依赖 prompt 文本、传入的随机数生成器与语料：同一请求 + 同一种子 → 同一输出
+# 4. 语料可替换：Corpus 为内置的少量句子；TemplateCorpus 取自
+#    events/free_event_templates*.yaml 与各角色 speech.yaml（本地模拟服务器使用）
+# ============================================================================
+
+import json
+import random
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .compact_schema import NARRATOR, build_cast, compact_scene_dialogue, compact_scene_plan
+from .character_registry import get_character_registry
+from .world_bundle import get_world_bundle
+from .utils import parse_json_lenient
+
+
+# ============================================================================
+# 语料
+# ============================================================================
+
+EMOTIONS = ["calm", "nervous", "sad", "angry", "scared", "surprised", "conflicted", "neutral", "happy"]
+BEAT_TYPES = ["opening", "development", "tension", "climax", "resolution"]
+
+NARRATION = [
+    ("{location}里很安静，只有远处传来模糊的脚步声。", "{location}は静かで、遠くからかすかな足音が聞こえるだけだった。"),
+    ("光线从高处的窗户斜斜地落下，在{location}的地面上拉出长长的影子。", "高い窓から斜めに差し込む光が、{location}の床に長い影を落としている。"),
+    ("空气像是凝固了一样，谁也没有先开口。", "空気が固まったように、誰も先に口を開かなかった。"),
+    ("沉默持续了很久，久到让人有些不安。", "沈黙は長く続き、不安になるほどだった。"),
+]
+LINES = [
+    ("……你也在这里啊。", "……あなたもここにいたんだ。"),
+    ("我只是想一个人待一会儿。", "ちょっと一人になりたかっただけ。"),
+    ("你到底在隐瞒什么？", "何を隠してるの？"),
+    ("别这样看着我……我什么都不知道。", "そんな目で見ないで……何も知らないから。"),
+    ("如果明天还能见面的话，就好了。", "明日もまた会えたら、いいな。"),
+    ("我们一定要活着离开这里。", "絶対に、生きてここを出よう。"),
+    ("嗯……怎么说呢，我也说不清楚。", "うーん……なんて言えばいいのか、よく分からない。"),
+    ("够了，这种话我不想再听了。", "もういい、そんな話はもう聞きたくない。"),
+]
+ACTIONS = ["低下头", "轻轻握紧拳头", "移开视线", "向前走了一步", "叹了口气", None, None]
+
+
+class Corpus:
+    """内置语料（不读取任何文件）"""
+
+    def line(self, rng: random.Random, speaker: str, location: str, bilingual: bool) -> Tuple[str, str, str]:
+        """一句台词 / 旁白：(中文, 日文, 情绪)"""
+        if speaker == NARRATOR:
+            cn, jp = rng.choice(NARRATION)
+            cn, jp = cn.format(location=location or "房间"), jp.format(location=location or "部屋")
+        else:
+            cn, jp = rng.choice(LINES)
+        return cn, jp, rng.choice(EMOTIONS)
+
+    def beat_description(self, rng: random.Random, location: str, n: int) -> str:
+        return f"{location}中的第{n + 1}段情节，气氛{rng.choice(['平静', '微妙', '紧张', '压抑'])}"
+
+    def scene_name(self, rng: random.Random, location: str) -> str:
+        return f"{location}的午后"
+
+    def options(self, rng: random.Random) -> List[str]:
+        """玩家选项 A/B/C 的文本"""
+        return ["上前搭话", "保持沉默", "追问下去"]
+
+    def event(self, rng: random.Random, day: int, k: int) -> str:
+        """大纲中的关键事件"""
+        return f"第{day}天的事件{k + 1}"
+
+
+class TemplateCorpus(Corpus):
+    """
+    取自项目数据的语料
+
+    - 角色台词：characters/<id>/speech.yaml 的 example_lines（中日对照，按情绪）
+    - 旁白与选项：free_event_templates_v2.yaml 各模板的示例
+    - Beat 描述、场景名、大纲事件：free_event_templates.yaml 的事件模板
+    数据缺失的部分退回内置语料。
+    """
+
+    def __init__(self, project_root: Path = None):
+        self.project_root = Path(project_root or Path(__file__).parent.parent)
+        self.registry = get_character_registry(self.project_root)
+        self._lock = threading.Lock()
+        self._speech: Dict[str, List[Tuple[str, str, str]]] = {}
+
+        bundle = get_world_bundle(self.project_root)
+        events_dir = self.project_root / "events"
+        self.events: List[Dict[str, Any]] = []
+        self.narration: List[str] = []
+        self.quotes: List[str] = []
+        self.option_sets: List[List[str]] = []
+        try:
+            templates = (bundle.load_yaml(events_dir / "free_event_templates.yaml") or {}).get("templates") or {}
+            self.events = [t for t in templates.values() if isinstance(t, dict) and t.get("name_cn")]
+        except Exception as e:
+            print(f"[TemplateCorpus] 读取事件模板失败: {e}")
+        try:
+            data = bundle.load_yaml(events_dir / "free_event_templates_v2.yaml") or {}
+            for group in data.values():
+                for template in (group or {}).values() if isinstance(group, dict) else []:
+                    if isinstance(template, dict):
+                        for example in template.get("examples") or []:
+                            self._add_example(str(example))
+        except Exception as e:
+            print(f"[TemplateCorpus] 读取日常模板失败: {e}")
+
+    def _add_example(self, example: str):
+        options = []
+        for raw in example.splitlines():
+            text = raw.strip()
+            option = re.match(r"^[A-Z]\.\s*(.+)$", text)
+            if option:
+                options.append(option.group(1).strip("「」"))
+            elif text.startswith("「"):
+                self.quotes.extend(q for q in re.findall(r"「([^」]+)」", text) if len(q) > 2)
+            elif text and not text.startswith("（") and "「" not in text:
+                self.narration.append(text)
+        if len(options) >= 3:
+            self.option_sets.append(options[:3])
+
+    def _lines_of(self, char_id: str) -> List[Tuple[str, str, str]]:
+        with self._lock:
+            cached = self._speech.get(char_id)
+        if cached is not None:
+            return cached
+        lines = []
+        if self.registry.exists(char_id):
+            speech = self.registry.get(char_id).get("speech") or {}
+            for emotion, example in (speech.get("example_lines") or {}).items():
+                if isinstance(example, dict) and example.get("zh"):
+                    emotion = emotion if emotion in EMOTIONS else "neutral"
+                    lines.append((str(example["zh"]).strip(), str(example.get("ja") or "").strip(), emotion))
+        with self._lock:
+            self._speech[char_id] = lines
+        return lines
+
+    def line(self, rng: random.Random, speaker: str, location: str, bilingual: bool) -> Tuple[str, str, str]:
+        if speaker == NARRATOR:
+            if self.narration and not bilingual:
+                return rng.choice(self.narration), "", rng.choice(EMOTIONS)
+            return super().line(rng, speaker, location, bilingual)
+        lines = [line for line in self._lines_of(speaker) if line[1] or not bilingual]
+        if lines and (not self.quotes or bilingual or rng.random() < 0.7):
+            return rng.choice(lines)
+        if self.quotes and not bilingual:
+            return rng.choice(self.quotes), "", rng.choice(EMOTIONS)
+        return super().line(rng, speaker, location, bilingual)
+
+    def beat_description(self, rng: random.Random, location: str, n: int) -> str:
+        if not self.events:
+            return super().beat_description(rng, location, n)
+        event = rng.choice(self.events)
+        reasons = ((event.get("slots") or {}).get("reason") or {}).get("examples") or []
+        reason = f"（{rng.choice(reasons)}）" if reasons else ""
+        return f"在{location}，{event.get('description', event['name_cn'])}{reason}"
+
+    def scene_name(self, rng: random.Random, location: str) -> str:
+        if not self.events:
+            return super().scene_name(rng, location)
+        return f"{location}·{rng.choice(self.events)['name_cn']}"
+
+    def options(self, rng: random.Random) -> List[str]:
+        return list(rng.choice(self.option_sets)) if self.option_sets else super().options(rng)
+
+    def event(self, rng: random.Random, day: int, k: int) -> str:
+        if not self.events:
+            return super().event(rng, day, k)
+        event = rng.choice(self.events)
+        return f"{event['name_cn']}：{event.get('description', '')}"
+
+
+DEFAULT_CORPUS = Corpus()
+
+
+# ============================================================================
+# prompt 解析
+# ============================================================================
+
+def _prompt_parts(request: Dict[str, Any]) -> Tuple[str, str]:
+    """(system 文本, 最后一条 user 消息文本)"""
+    def text_of(content: Any) -> str:
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return "\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+        return ""
+
+    system = text_of(request.get("system"))
+    user = ""
+    for message in request.get("messages", []):
+        if message.get("role") == "user":
+            user = text_of(message.get("content"))
+    return system, user
+
+
+def _characters(text: str) -> List[str]:
+    """prompt 中「【名字】(char_id)」形式列出的角色"""
+    found = []
+    for char_id in re.findall(r"【[^】\n]+】\s*\((\w+)\)", text):
+        if char_id not in found and char_id != NARRATOR:
+            found.append(char_id)
+    return found
+
+
+def _cast(text: str) -> Optional[List[str]]:
+    """紧凑格式的【角色序号】表（0=旁白 1=艾玛(aima) ...）"""
+    match = re.search(r"【角色序号】(.*)", text)
+    if not match:
+        return None
+    cast = {}
+    for index, char_id in re.findall(r"(\d+)=[^\s(]*\((\w+)\)", match.group(1)):
+        cast[int(index)] = char_id
+    cast[0] = NARRATOR
+    return [cast.get(i, NARRATOR) for i in range(max(cast) + 1)]
+
+
+def _field(text: str, label: str, default: str = "") -> str:
+    match = re.search(rf"{label}[:：]\s*([^\n（(]+)", text)
+    return match.group(1).strip() if match else default
+
+
+def _beats(text: str) -> List[Dict[str, Any]]:
+    """Beat 大纲（character_actor._format_beat 的格式）"""
+    beats = []
+    for block in re.split(r"\n(?=Beat \d+ \()", text):
+        head = re.match(r"Beat \d+ \(([^)]+)\)", block)
+        if not head:
+            continue
+        order = [c.strip() for c in _field(block, "说话顺序").split("→") if c.strip()]
+        count = re.search(r"对话数[:：]\s*(\d+)", block)
+        beats.append({
+            "beat_id": head.group(1),
+            "characters": [c.strip() for c in _field(block, "角色").split(",") if c.strip()],
+            "speaker_order": order,
+            "dialogue_count": int(count.group(1)) if count else max(len(order), 3),
+        })
+    return beats
+
+
+# ============================================================================
+# 各层的输出
+# ============================================================================
+
+def _line(rng: random.Random, speaker: str, location: str, bilingual: bool, corpus: Corpus) -> Dict[str, Any]:
+    cn, jp, emotion = corpus.line(rng, speaker, location, bilingual)
+    line = {"speaker": speaker, "text_cn": cn}
+    if bilingual:
+        line["text_jp"] = jp
+    line["emotion"] = emotion
+    action = rng.choice(ACTIONS)
+    if action and speaker != NARRATOR:
+        line["action"] = action
+    return line
+
+
+def _beat_dialogue(rng: random.Random, beat: Dict, characters: List[str], location: str, bilingual: bool,
+                   corpus: Corpus) -> Dict:
+    order = beat.get("speaker_order") or characters or [NARRATOR]
+    count = max(int(beat.get("dialogue_count") or len(order)), 1)
+    speakers = [NARRATOR] + [order[i % len(order)] for i in range(count)]
+    dialogue = [_line(rng, speaker, location, bilingual, corpus) for speaker in speakers]
+    cast = [c for c in (beat.get("characters") or characters) if c != NARRATOR]
+    effects = {c: {"stress": rng.randint(-3, 5), "emotion": rng.choice(EMOTIONS)} for c in cast[:2]}
+    return {"beat_id": beat.get("beat_id"), "dialogue": dialogue, "effects": effects}
+
+
+def scene_dialogue(system: str, user: str, rng: random.Random, corpus: Corpus = DEFAULT_CORPUS) -> str:
+    """整场对话 / 空 Beat 修复（character_actor._build_scene_prompt / _build_beat_repair_prompt）"""
+    location = _field(user, "地点")
+    characters = _characters(user)
+    beats = _beats(user)
+    only = re.search(r"beats 中只包含[:：]\s*([^\n（(]+)", user)
+    if only:
+        wanted = {b.strip() for b in only.group(1).split(",")}
+        beats = [b for b in beats if b["beat_id"] in wanted]
+
+    bilingual = "日本語の台詞" in system
+    data = {"beats": [_beat_dialogue(rng, beat, characters, location, bilingual, corpus) for beat in beats]}
+    cast = _cast(user)
+    if cast is not None and '"b":[' in system:
+        return json.dumps(compact_scene_dialogue(data, cast, bilingual), ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def beat_dialogue(system: str, user: str, rng: random.Random, corpus: Corpus = DEFAULT_CORPUS) -> str:
+    """单个 Beat 的对话（character_actor._build_actor_prompt）"""
+    order = [c.strip() for c in _field(user, "说话顺序").split("→") if c.strip()]
+    count = re.search(r"目标对话数[:：]\s*(\d+)", user)
+    beat = {"speaker_order": order, "dialogue_count": int(count.group(1)) if count else 3}
+    data = _beat_dialogue(rng, beat, _characters(user) or order, "", False, corpus)
+    return json.dumps({"dialogue": data["dialogue"], "effects": data["effects"]}, ensure_ascii=False, indent=2)
+
+
+def scene_plan(system: str, user: str, rng: random.Random, corpus: Corpus = DEFAULT_CORPUS) -> str:
+    """场景规划（director_planner._build_planner_prompt）"""
+    location = _field(user, "当前位置", "走廊")
+    characters = _characters(user) or ["aima", "hiro"]
+    beats = []
+    for n in range(rng.randint(4, 6)):
+        cast = rng.sample(characters, min(len(characters), rng.randint(1, 3)))
+        beats.append({
+            "beat_id": f"beat_{n + 1}",
+            "beat_type": BEAT_TYPES[min(n, len(BEAT_TYPES) - 1)],
+            "description": corpus.beat_description(rng, location, n),
+            "characters": cast,
+            "speaker_order": [NARRATOR] + [rng.choice(cast) for _ in range(rng.randint(2, 4))],
+            "emotion_targets": {c: rng.choice(EMOTIONS) for c in cast},
+            "tension_level": min(10, 2 + n + rng.randint(0, 2)),
+            "dialogue_count": rng.randint(3, 6),
+            "direction_notes": "对话之间穿插动作与环境描写",
+        })
+    options = corpus.options(rng)
+    data = {
+        "scene_id": f"synthetic_{rng.randint(1000, 9999)}",
+        "scene_name": corpus.scene_name(rng, location),
+        "location": location,
+        "time_estimate_minutes": rng.randint(5, 10),
+        "overall_arc": "平静 → 试探 → 冲突 → 余韵",
+        "beats": beats,
+        "key_moments": ["欲言又止的瞬间", "视线交汇"],
+        "player_choice_point": {
+            "after_beat": beats[-2]["beat_id"],
+            "prompt": "你要怎么做？",
+            "options": [
+                {"id": "A", "text": options[0], "leads_to": "正面"},
+                {"id": "B", "text": options[1], "leads_to": "中性"},
+                {"id": "C", "text": options[2], "leads_to": "危险"},
+            ],
+        },
+        "outcomes": {
+            "stress_changes": {c: rng.randint(-5, 5) for c in characters[:2]},
+            "relationship_changes": {},
+            "flags_to_set": [],
+        },
+        "recommended_bgm": rng.choice(["ambient_calm", "ambient_tension", "daily_life"]),
+    }
+    if '"loc":' in system:
+        cast = _cast(user) or build_cast(characters)
+        return json.dumps(compact_scene_plan(data, cast), ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def choice_responses(system: str, user: str, rng: random.Random, corpus: Corpus = DEFAULT_CORPUS) -> str:
+    """选项回应（character_actor._build_choice_response_prompt）"""
+    match = re.search(r"【角色】[^(\n]*\((\w+)\)", user)
+    char_id = match.group(1) if match else "aima"
+    option_ids = re.findall(r"^\s+([A-Z])\. ", user, flags=re.M) or ["A", "B", "C"]
+    result = {}
+    for n, option_id in enumerate(option_ids):
+        cn, _, _ = corpus.line(rng, char_id, "", False)
+        result[option_id] = {
+            "dialogue": [{"speaker": char_id, "text_cn": cn, "emotion": rng.choice(EMOTIONS)}],
+            "effects": {"stress": [-3, 0, 6][min(n, 2)], "affection": [3, 0, -4][min(n, 2)]},
+        }
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+
+def story_outline(system: str, user: str, rng: random.Random, corpus: Corpus = DEFAULT_CORPUS) -> str:
+    """三天大纲（story_planner._get_static_system）"""
+    day = int(_field(user, "当前日期", "第1天").strip("第天") or 1)
+    arcs = ["低→中", "中→高", "高→结局"]
+    days = [{
+        "day": day + n,
+        "theme": ["相识与试探", "裂痕与猜疑", "真相与抉择"][n],
+        "key_events": [corpus.event(rng, day + n, k) for k in range(rng.randint(3, 4))],
+        "tension_arc": arcs[n],
+        "potential_murder": n == 1 and rng.random() < 0.5,
+        "notes": "张力逐步升高",
+    } for n in range(3)]
+    return json.dumps({
+        "chapter": 1,
+        "title": "孤岛的三日",
+        "overall_theme": "在猜疑中寻找信任",
+        "days": days,
+        "ending_flags": {"murder_occurred": False, "correct_judgment": None, "library_secret_found": False},
+    }, ensure_ascii=False, indent=2)
+
+
+def japanese_lines(system: str, user: str, rng: random.Random, corpus: Corpus = DEFAULT_CORPUS) -> str:
+    """日文台词（jp_translator）：按编号一一对应的字符串数组"""
+    lines = re.findall(r"^\d+\. \[[^\]]*\] (.*)$", user, flags=re.M)
+    return json.dumps([f"「{text}」" for text in lines], ensure_ascii=False)
+
+
+# ============================================================================
+# 按示例填值（其他请求）
+# ============================================================================
+
+def _example_json(text: str) -> Optional[str]:
+    """prompt 中【输出格式】/【输出要求】之后的第一个 JSON 示例"""
+    marker = re.search(r"【输出(格式|要求)】", text)
+    start = text.find("{", marker.end() if marker else 0)
+    if start < 0:
+        return None
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            escaped = ch == "\\" and not escaped
+            if ch == '"' and not escaped:
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _fill(value: Any, characters: List[str], rng: random.Random) -> Any:
+    if isinstance(value, dict):
+        filled = {}
+        for key, item in value.items():
+            if key in ("角色ID", "char_id") and characters:
+                key = rng.choice(characters)
+            filled[key] = _fill(item, characters, rng)
+        return filled
+    if isinstance(value, list):
+        return [_fill(item, characters, rng) for item in value]
+    if isinstance(value, str) and characters and (value in ("角色ID", "char_id") or value.startswith("char_id")):
+        return rng.choice(characters)
+    return value
+
+
+def from_example(system: str, user: str, rng: random.Random, corpus: Corpus = DEFAULT_CORPUS) -> Optional[str]:
+    """按 prompt 中的 JSON 示例生成同结构的输出（占位说明原样保留，角色ID换成真实ID）"""
+    example = _example_json(user) or _example_json(system)
+    if example is None:
+        return None
+    # 示例中的非 JSON 写法：// 注释 / { ... } / 变化值 / 5-10 / true/false / [...] / "..."
+    example = re.sub(r"//[^\n]*", "", example)
+    example = re.sub(r'"[^"\n]*":\s*\{\s*\.\.\.\s*\},?', "", example)
+    example = re.sub(r":\s*(变化值整数|变化值)", ": 0", example)
+    example = re.sub(r":\s*(\d+)-\d+", r": \1", example)
+    example = example.replace("true/false", "false").replace("[...]", "[]")
+    example = re.sub(r',\s*"\.\.\."', "", example)
+    data = parse_json_lenient(example).value
+    if data is None:
+        return None
+    characters = _characters(user) or re.findall(r"\((\w+)\)", user)[:4]
+    return json.dumps(_fill(data, characters, rng), ensure_ascii=False, indent=2)
+
+
+# ============================================================================
+# 入口
+# ============================================================================
+
+def synthesize(request: Dict[str, Any], rng: random.Random, corpus: Corpus = DEFAULT_CORPUS) -> str:
+    """
+    为一次 messages 请求合成输出文本（corpus 为台词与情节的来源，默认内置语料）
+
+    识别顺序：日文台词 → 三天大纲 → 场景规划 → 整场对话 / 修复 → 单 Beat → 选项回应 → 按示例填值
+    """
+    system, user = _prompt_parts(request)
+    if "请翻译以下" in user:
+        return japanese_lines(system, user, rng, corpus)
+    if '"overall_theme"' in system:
+        return story_outline(system, user, rng, corpus)
+    if "场景名称" in system:
+        return scene_plan(system, user, rng, corpus)
+    if "【Beat大纲】" in user or "【需要重写的 Beat】" in user:
+        return scene_dialogue(system, user, rng, corpus)
+    if "【Beat信息】" in user:
+        return beat_dialogue(system, user, rng, corpus)
+    if "为玩家的每个选项预生成" in user:
+        return choice_responses(system, user, rng, corpus)
+    return from_example(system, user, rng, corpus) or "好的。"
@@ -2,95 +2,515 @@
 # API 公共工具模块 (Utils)
 # ============================================================================
 # 职责：
-# 1. 提供 JSON 解析和清理的公共函数
-# 2. 处理 API 返回的各种 JSON 格式问题
+# 1. 提供 JSON 解析的公共函数（严格解析 + 单遍宽容解析）
+# 2. 处理 API 返回的各种 JSON 格式问题（代码块、中文标点、+号、尾部逗号、截断）
 # 3. 供 director_planner.py 和 character_actor.py 共同使用
 # ============================================================================
 
 import json
 import re
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
 
 
-def clean_json_response(text: str) -> str:
-    """
-    清理 API 返回的 JSON，处理各种常见问题
-
-    处理内容：
-    1. 移除 markdown 代码块 (```json ... ```)
-    2. 用正则提取 JSON 对象（处理前后可能有的额外文字）
-    3. 处理中文引号和标点
-    4. 移除正数前的 + 号（JSON 不允许 +5，只允许 5 或 -5）
-    5. 处理尾部逗号（JSON 不允许）
-    """
-    text = text.strip()
-
-    # 1. 移除 markdown 代码块
-    if text.startswith('```json'):
-        text = text[7:]
-    elif text.startswith('```'):
-        text = text[3:]
-    if text.endswith('```'):
-        text = text[:-3]
-    text = text.strip()
-
-    # 2. 用正则提取 JSON 对象（处理前后可能有的额外文字）
-    json_match = re.search(r'\{[\s\S]*\}', text)
-    if json_match:
-        text = json_match.group()
+# ============================================================================
+# 宽容 JSON 解析
+# ============================================================================
+# 三级，由快到慢，每一级都只在上一级失败时才运行：
+# 1. 格式正确：C 解析器一次完成（前后的代码块标记、说明文字直接忽略）
+# 2. 骨架修复：按引号切分一次（转义引号先替换成占位符），字符串内容原样保留，
+#    只在很短的「字符串外」骨架上修正标点、+号、尾部逗号、截断，
+#    拼回后交给 C 解析器解析一次
+# 3. 逐记号扫描：骨架修复也失败时（括号错配、非 JSON 字面量等），
+#    单遍扫描整段文本，能解析多少就返回多少
+# ============================================================================
 
-    # 3. 处理中文引号和标点
-    text = text.replace('"', '"').replace('"', '"')  # 中文双引号
-    text = text.replace(''', "'").replace(''', "'")  # 中文单引号
-    text = text.replace('：', ':')  # 中文冒号
+@dataclass
+class LenientJSON:
+    """宽容解析的结果"""
+    value: Any = None                # 解析出的对象（截断时为已收到的部分）
+    truncated: bool = False          # 文本在顶层值闭合之前就结束了
+    repairs: List[str] = field(default_factory=list)  # 做过的修正（去重，按首次出现）
+
+
+_JSON_START = re.compile(r"[{\[]")
+_raw_decode = json.JSONDecoder(strict=False).raw_decode
+_scanstring = json.decoder.scanstring
+
+# ---- 骨架修复 ----
+# 骨架：字符串外的文本，每个字符串用 \x00 代替；\x01 \x02 是转义的 \\ 和 \"
+# 骨架上的检查尽量用 str/bytes 的 C 方法完成，正则只在确实需要修正时运行。
+_SKELETON_CHARS = b" \t\n\r\x00{}[]:,+-.0123456789eEaflnrstu"  # 末尾的字母拼出 true/false/null
+_WHITESPACE = b" \t\n\r"
+_BRACKETS_ONLY = bytes(c for c in range(256) if c not in b"{}[]")
+# 骨架逐字符分类：\x00 保留（段分隔），JSON 字符 -> "."，其余（正文）-> "X"
+_SKELETON_MASK = bytes(c if c == 0 else (46 if c in _SKELETON_CHARS else 88) for c in range(256))
+_CURLY_STRING = re.compile(r"“[^”\x00]*”")
+_MAX_BODY_EDITS = 8  # 直接在原文上修正的处数上限（见 _remove_plus_signs）
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_PARTIAL_ESCAPE = re.compile(r"\\(?:u[0-9a-fA-F]{0,3})?$")
+
+
+def _note(repairs: List[str], repair: str):
+    if repair not in repairs:
+        repairs.append(repair)
+
+
+def _skeleton_clean(skeleton: str) -> bool:
+    """骨架里只有 JSON 的标点、数字和字面量（与 _skeleton_mask 中没有 X 等价，但更快）"""
+    if not skeleton.isascii():
+        if "“" in skeleton:
+            skeleton = _CURLY_STRING.sub("", skeleton)
+        skeleton = skeleton.replace("：", ":").replace("，", ",")
+        if not skeleton.isascii():
+            return False
+    return not skeleton.encode("ascii").translate(None, _SKELETON_CHARS)
+
+
+def _skeleton_mask(skeleton: str) -> bytes:
+    """
+    骨架的逐字符分类（与骨架等长的 bytes）：段分隔 \x00，JSON 的标点、数字和字面量 "."，正文 "X"
 
-    # 4. 移除正数前的 + 号（JSON 不允许 "stress": +5）
-    text = re.sub(r':\s*\+(\d)', r': \1', text)
+    字符串外的中文引号字符串、全角冒号逗号算作标点（之后再修正）。
+    分类在 C 层完成（encode + translate），正文的位置用 bytes.find 查找；
+    只在 _skeleton_clean 为 False 时才需要。
+    """
+    if skeleton.isascii():
+        return skeleton.encode("ascii").translate(_SKELETON_MASK)
+    if "“" in skeleton:
+        skeleton = _CURLY_STRING.sub(lambda m: " " * len(m.group()), skeleton)
+    skeleton = skeleton.replace("：", ":").replace("，", ",")
+    return skeleton.encode("latin-1", "replace").translate(_SKELETON_MASK)  # 其余非 latin-1 字符 -> ? -> X
 
-    # 5. 处理尾部逗号（JSON 不允许）
-    # 处理 ,] 和 ,} 的情况
-    text = re.sub(r',(\s*[\]\}])', r'\1', text)
 
-    return text
+def _merge_segments(outside: List[str], inside: List[str], segments: List[Tuple[int, int, int]], quote: str):
+    """把 segments 中各段（段号从大到小）连同两侧的字符串合成一个字符串"""
+    for k, _, _ in segments:
+        inside[k - 1:k + 1] = [inside[k - 1] + quote + outside[k] + quote + inside[k]]
+        del outside[k]
 
 
-def fix_truncated_json(text: str) -> str:
+def _escape_segments(body: str, inside: List[str], segments: List[Tuple[int, int, int]], quote: str) -> str:
     """
-    修复被截断的 JSON，尝试补全缺失的括号
+    直接在原文上转义 segments 中各段两侧的引号（与 _merge_segments 后整体拼回的结果相同）
 
-    当 API 响应因 max_tokens 限制被截断时，JSON 可能不完整。
-    此函数尝试检测并补全缺失的括号。
+    第 k 段内骨架上的位置 p 在原文中是 p + 前 k 个字符串的长度 + k
+    （每个字符串在骨架中只占一个 \x00，在原文中还有两个引号）。
     """
-    # 计算括号平衡
-    open_braces = text.count('{')
-    close_braces = text.count('}')
-    open_brackets = text.count('[')
-    close_brackets = text.count(']')
-
-    # 如果不平衡，尝试修复
-    if open_braces != close_braces or open_brackets != close_brackets:
-        print(f"[utils] 检测到 JSON 截断: {{ 有 {open_braces} 个, }} 有 {close_braces} 个, [ 有 {open_brackets} 个, ] 有 {close_brackets} 个")
+    pieces = []
+    last = shift = done = 0
+    for k, begin, end in reversed(segments):
+        shift += sum(map(len, inside[done:k])) + k - done
+        done = k
+        pieces += (body[last:begin + shift - 1], quote, body[begin + shift:end + shift], quote)
+        last = end + shift + 1
+    pieces.append(body[last:])
+    return "".join(pieces)
+
+
+def _remove_plus_signs(body: str, inside: List[str], skeleton: str) -> Optional[str]:
+    """
+    直接在原文上去掉骨架中的 + 号（与修正骨架后整体拼回的结果相同）
 
-        # 检查是否在字符串中间被截断（寻找未闭合的引号）
-        text = text.rstrip()
+    skeleton 是修正之前的骨架；位置换算同 _escape_segments。每处都有 Python 层的开销，
+    超过 _MAX_BODY_EDITS 处时不如整体拼回，返回 None。
+    """
+    pieces = []
+    last = shift = done = k = prev = 0
+    p = skeleton.find("+")
+    while p != -1:
+        if len(pieces) == 2 * _MAX_BODY_EDITS:
+            return None
+        k += skeleton.count("\x00", prev, p)
+        prev = p
+        shift += sum(map(len, inside[done:k])) + k - done
+        done = k
+        pieces.append(body[last:p + shift])
+        last = p + shift + 1
+        p = skeleton.find("+", p + 1)
+    pieces.append(body[last:])
+    return "".join(pieces)
+
+
+def _parse_skeleton(text: str, start: int, result: LenientJSON) -> bool:
+    """骨架修复；成功时填好 result 并返回 True"""
+    body = text[start:]
+    repairs = list(result.repairs)
+
+    escaped = "\\" in body
+    if escaped:
+        # 占位符本身出现在原文中时不走这一级（没有转义时不用占位符；
+        # \x00 只需查骨架：在 UCS-2 字符串里查找它很慢）
+        if "\x01" in body or "\x02" in body:
+            return False
+        body = body.replace("\\\\", "\x01").replace('\\"', "\x02")
+    parts = body.split('"')
+    outside = parts[0::2]
+    inside = parts[1::2]
+    in_string = len(parts) % 2 == 0  # 截断在字符串中间
+    # 截断在字符串外的中文引号字符串中间（"emotion"：“peace）：同样按截断在字符串中间处理
+    curly_tail = False
+    if not in_string and "“" in outside[-1]:
+        tail = outside[-1]
+        opened = tail.rfind("“")
+        if tail.find("”", opened) == -1:
+            outside[-1] = tail[:opened]
+            inside.append(tail[opened + 1:])
+            in_string = curly_tail = True
+
+    # 字符串外出现正文：最后一段是 JSON 之后的说明文字，其余是台词里没转义的引号
+    skeleton = "\x00".join(outside)
+    if skeleton.count("\x00") != len(outside) - 1:
+        return False
+    segments = []          # 要合并的段：(段号, 骨架中的起止)，段号从大到小
+    trailing_text = False
+    if not _skeleton_clean(skeleton):
+        # 每段记下第一处正文（段内偏移）与该段在骨架中的起止，找到后直接跳到下一段；
+        # 从后往前处理，前面各段的下标、位置都不受影响
+        mask = _skeleton_mask(skeleton)
+        first_bad = []
+        k, prev, pos = 0, 0, 0
+        while pos != -1:
+            i = mask.find(b"X", pos)
+            if i == -1:
+                break
+            k += mask.count(b"\x00", prev, i)
+            prev = i
+            begin = mask.rfind(b"\x00", 0, i) + 1
+            pos = mask.find(b"\x00", i)
+            first_bad.append((k, i - begin, begin, len(mask) if pos == -1 else pos))
+        # 台词里没转义的引号：该段连同两侧的字符串合成一个字符串，骨架上去掉该段和它前面的 \x00；
+        # 这里只改骨架，字符串列表到确实需要时才合并（见 _escape_segments）
+        pieces = []
+        last = len(skeleton)
+        for k, offset, begin, end in reversed(first_bad):
+            if k == len(outside) - 1 and not in_string:
+                tail = outside[k]
+                cut = max(tail.rfind("}"), tail.rfind("]"))
+                if cut == -1 or cut > offset:
+                    return False
+                outside[k] = tail[:cut + 1]
+                last = begin + cut + 1
+                trailing_text = True
+                _note(repairs, "trailing_text")
+            elif 0 < k < len(inside):
+                segments.append((k, begin, end))
+                pieces.append(skeleton[end:last])
+                last = begin - 1
+                _note(repairs, "unescaped_quote")
+            else:
+                return False
+        pieces.append(skeleton[:last])
+        skeleton = "".join(reversed(pieces))
+    joined = skeleton  # 骨架之后没有改动时，直接在原文上拼接（比 % 格式化快）
+    quote = "\x02" if escaped else '\\"'  # 拼接处用 \" 转义；原文本身含转义时先用占位符，最后统一替换
+    if in_string:
+        skeleton += "\x00"
+
+    # 字符串外的中文标点、+号（JSON 里 + 只会出现在指数中，且可以省略）
+    if not skeleton.isascii():
+        if "：" in skeleton or "，" in skeleton:
+            skeleton = skeleton.replace("：", ":").replace("，", ",")
+            _note(repairs, "fullwidth_punctuation")
+        if "“" in skeleton:
+            skeleton = skeleton.replace("“", '"').replace("”", '"')
+            _note(repairs, "fullwidth_quote")
+    if curly_tail:
+        _note(repairs, "fullwidth_quote")
+    if "+" in skeleton:
+        skeleton = skeleton.replace("+", "")
+        _note(repairs, "plus_sign")
+    replaced = skeleton  # 之后没有改动、又只去掉了 + 号时，直接在原文上去掉
+
+    # 括号：数量平衡时交给 C 解析器判断；不平衡时反复消去相邻的 {} []，剩下的开括号就是截断
+    # （顶层闭合之后不应再有括号）。纯 ASCII 的骨架去掉空白后计数，下面查尾部逗号时复用
+    stack = b""  # 未闭合的开括号
+    ascii_only = skeleton.isascii()
+    compact = (skeleton.encode("ascii").translate(None, _WHITESPACE) if ascii_only
+               else skeleton.encode("latin-1", "replace"))
+    if in_string or compact.count(b"{") != compact.count(b"}") or compact.count(b"[") != compact.count(b"]"):
+        brackets = compact.translate(None, _BRACKETS_ONLY)
+        # 顶层括号单独拿出来，不参与消去：这样顶层提前闭合时，它的闭括号会留下来
+        rest = brackets[1:]
+        while b"{}" in rest or b"[]" in rest:
+            rest = rest.replace(b"{}", b"").replace(b"[]", b"")
+        if rest != (b"}" if brackets[:1] == b"{" else b"]"):  # 不是顶层恰好在末尾闭合
+            if rest.translate(None, b"{["):
+                return False
+            stack = brackets[:1] + rest
+
+    # 尾部逗号：空白对 JSON 无意义，去掉空白后直接替换（在补全截断之前：
+    # 截断处悬空的逗号由下面去掉，补上的闭括号前不会再有逗号）
+    if ascii_only:
+        if b",}" in compact or b",]" in compact:
+            while b",}" in compact or b",]" in compact:
+                compact = compact.replace(b",}", b"}").replace(b",]", b"]")
+            skeleton = compact.decode("ascii")
+            _note(repairs, "trailing_comma")
+    elif "," in skeleton:
+        fixed = _TRAILING_COMMA.sub(r"\1", skeleton)
+        if fixed != skeleton:
+            skeleton = fixed
+            _note(repairs, "trailing_comma")
+
+    truncated = bool(stack) or in_string
+    if truncated:
+        _merge_segments(outside, inside, segments, quote)
+        segments = []
+        if in_string:
+            inside[-1] = _PARTIAL_ESCAPE.sub("", inside[-1])
+        # 去掉悬空的逗号、冒号和没有值的键
+        while True:
+            tail = skeleton.rstrip()
+            if tail.endswith(","):
+                skeleton = tail[:-1]
+            elif tail.endswith(":") and tail[:-1].rstrip().endswith("\x00"):
+                skeleton = tail[:-1].rstrip()[:-1]
+                inside.pop()
+            elif (tail.endswith("\x00") and stack and stack[-1] == 123
+                  and tail[:-1].rstrip()[-1:] in ("{", ",")):
+                skeleton = tail[:-1]
+                inside.pop()
+            else:
+                break
+        skeleton += stack[::-1].decode("ascii").replace("{", "}").replace("[", "]")
+
+    # 拼回后由 C 解析器解析一次。只合并过字符串或只去掉过 + 号（纯 ASCII 的骨架上没有中文标点）
+    # 时直接在原文上改，不必拼回；其余情况用 % 格式化把骨架中的 \x00 依次换成字符串，
+    # 不必再把骨架切分成段
+    fixed = None
+    if skeleton is joined and not trailing_text:
+        fixed = _escape_segments(body, inside, segments, quote)
+    elif skeleton is replaced and joined.isascii() and not (segments or trailing_text or in_string):
+        fixed = _remove_plus_signs(body, inside, joined)
+    if fixed is None:
+        _merge_segments(outside, inside, segments, quote)
+        if skeleton is joined:
+            merged = [""] * (len(outside) + len(inside))
+            merged[0::2] = outside
+            merged[1::2] = inside
+            fixed = '"'.join(merged)
+        else:
+            if skeleton.count("\x00") != len(inside):
+                return False
+            if "%" in skeleton:
+                skeleton = skeleton.replace("%", "%%")
+            fixed = skeleton.replace("\x00", '"%s"') % tuple(inside)
+    if escaped:
+        fixed = fixed.replace("\x02", '\\"').replace("\x01", "\\\\")
+    try:
+        value, end = _raw_decode(fixed)
+    except json.JSONDecodeError:
+        return False
+    if fixed[end:].strip():
+        return False
+
+    result.value = value
+    result.truncated = truncated
+    result.repairs = repairs
+    return True
+
+
+# ---- 逐记号扫描 ----
+# 词法单元（跳过空白和逗号后的一个记号）
+# 逗号只是分隔符：尾部逗号、缺失的逗号都不影响结构，所以直接当空白跳过。
+# 不含转义的键/字符串值由正则一次取出，其余字符串交给 C 实现的 scanstring。
+_TOKEN = re.compile(r"""[\s\ufeff,，]*(?:
+    "([^"\\]*)"\s*([:：])                         # 1,2 简单键 + 冒号
+  | "([^"\\]*)"(?=\s*(?:[,}\]，]|$))               # 3 简单字符串值
+  | (")                                          # 4 其他字符串
+  | ([{\[])                                     # 5 容器开始
+  | ([}\]])                                     # 6 容器结束
+  | ([:：])                                      # 7 多余的冒号
+  | (“)                                          # 8 中文引号字符串
+  | ([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)  # 9 数字
+  | (true|false|null|True|False|None)\b          # 10 字面量
+  | (.)                                          # 11 其他字符（跳过）
+)""", re.S | re.X)
+
+_STRUCTURAL_AFTER_STRING = re.compile(r"[\s\ufeff]*(?:[,:}\]，：]|$)")
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+
+
+def _scan_string(text: str, pos: int, repairs: List[str]) -> Tuple[str, int]:
+    """
+    从开引号之后读取字符串，返回 (内容, 结束位置)
 
-        # 如果在字符串中截断，先尝试闭合字符串
-        if text.count('"') % 2 != 0:
-            text += '"'
+    - 允许字符串内的原始换行/控制字符
+    - 闭引号后面不是 , : } ] 时，视为字符串内未转义的引号（如 "她说"好"。"）
+    - 字符串在文本末尾被截断时返回已读到的部分，结束位置为 -1
+    - 非法转义（如 \\q）按字面保留反斜杠
+    """
+    parts = []
+    n = len(text)
+    while True:
+        try:
+            chunk, end = _scanstring(text, pos, False)
+        except json.JSONDecodeError as e:
+            bad = e.pos if e.pos < n and text[e.pos] == "\\" else e.pos - 1
+            if e.msg.startswith("Unterminated") or (e.msg.startswith("Invalid \\u") and bad + 6 > n):
+                # 截断在字符串中间：丢掉末尾不完整的转义序列
+                tail = text[pos:bad] if e.msg.startswith("Invalid") else text[pos:]
+                try:
+                    chunk = _scanstring(tail + '"', 0, False)[0]
+                except json.JSONDecodeError:
+                    tail = tail[:tail.rfind("\\")]
+                    chunk = _scanstring(tail + '"', 0, False)[0]
+                parts.append(chunk)
+                return "".join(parts), -1
+            _note(repairs, "invalid_escape")
+            parts.append(_scanstring(text[pos:bad] + '"', 0, False)[0])
+            parts.append("\\")
+            pos = bad + 1
+            continue
+        parts.append(chunk)
+        if _STRUCTURAL_AFTER_STRING.match(text, end):
+            return "".join(parts), end
+        _note(repairs, "unescaped_quote")
+        parts.append('"')
+        pos = end
+
+
+def _to_number(token: str) -> Any:
+    try:
+        return int(token)
+    except ValueError:
+        try:
+            return float(token)
+        except ValueError:
+            return None
+
+
+def _parse_tokens(text: str, pos: int, result: LenientJSON) -> LenientJSON:
+    """逐记号扫描（最后一级）；格式正确的子容器仍整体交给 C 解析器"""
+    # 栈帧: [容器, 待赋值的键]；列表的键恒为 None
+    stack: List[list] = []
+    match = _TOKEN.match
+    n = len(text)
+
+    while pos < n:
+        m = match(text, pos)
+        if m is None:
+            break
+        kind = m.lastindex
+        pos = m.end()
+
+        if kind == 2:  # 键
+            if m.group(2) != ":":
+                _note(result.repairs, "fullwidth_punctuation")
+            if stack and type(stack[-1][0]) is dict:
+                stack[-1][1] = m.group(1)
+                continue
+            value = m.group(1)
+        elif kind == 3:
+            value = m.group(3)
+        elif kind == 4:
+            value, pos = _scan_string(text, pos, result.repairs)
+            if pos == -1:
+                pos = n
+                result.truncated = True
+        elif kind == 5:
+            # 先让 C 实现的解析器整体解析这个容器；只有含错误的容器才逐记号扫描，
+            # 所以 Python 层的开销只落在出错的那些容器上
+            try:
+                value, pos = _raw_decode(text, m.start(5))
+            except json.JSONDecodeError:
+                value = {} if m.group(5) == "{" else []
+                kind = 0
+        elif kind == 6:  # } ]
+            want = dict if m.group(6) == "}" else list
+            if not any(type(frame[0]) is want for frame in stack):
+                _note(result.repairs, "stray_bracket")
+                continue
+            while type(stack[-1][0]) is not want:
+                stack.pop()
+                _note(result.repairs, "mismatched_bracket")
+            stack.pop()
+            if not stack:
+                return result
+            continue
+        elif kind == 7:
+            if m.group(7) != ":":
+                _note(result.repairs, "fullwidth_punctuation")
+            continue
+        elif kind == 8:
+            _note(result.repairs, "fullwidth_quote")
+            close = min((i for i in (text.find("”", pos), text.find('"', pos)) if i != -1), default=-1)
+            if close == -1:
+                value, pos = text[pos:], n
+                result.truncated = True
+            else:
+                value, pos = text[pos:close], close + 1
+        elif kind == 9:
+            token = m.group(9)
+            if token[0] == "+":
+                _note(result.repairs, "plus_sign")
+            value = _to_number(token)
+        elif kind == 10:
+            value = _LITERALS[m.group(10)]
+        else:
+            _note(result.repairs, "skipped_text")
+            continue
+
+        # ---- 把值放进当前容器（kind == 0 表示需要继续扫描内部的新容器）----
+        if stack:
+            frame = stack[-1]
+            container = frame[0]
+            if type(container) is list:
+                container.append(value)
+            elif frame[1] is not None:
+                container[frame[1]] = value
+                frame[1] = None
+            elif kind in (3, 4, 8):
+                frame[1] = value
+            else:
+                # 非字符串的键：丢弃（是容器时照常解析，但不挂到结果上）
+                _note(result.repairs, "bad_key")
+        else:
+            result.value = value
+            if kind:
+                return result
+
+        if kind == 0:
+            stack.append([value, None])
+
+    if stack:
+        result.truncated = True
+    return result
+
+
+
+def parse_json_lenient(text: str) -> LenientJSON:
+    """
+    字符串感知的宽容 JSON 解析
 
-        # 补全缺失的括号
-        missing_brackets = open_brackets - close_brackets
-        missing_braces = open_braces - close_braces
+    处理：
+    1. markdown 代码块、JSON 前后的说明文字（从第一个 { 或 [ 开始，顶层值闭合即停止）
+    2. 字符串外的中文标点（：，“”）；字符串内的内容原样保留
+    3. 正数前的 + 号（"stress": +5）
+    4. 尾部逗号；台词中没有转义的引号（"她说"好"。"）
+    5. 截断（max_tokens）：已读到的部分照常返回，未闭合的字符串和容器自动闭合，
+       没有值的键被丢弃，并设置 truncated=True
 
-        # 按照 JSON 结构，通常是先闭合 ]，再闭合 }
-        if missing_brackets > 0:
-            text += ']' * missing_brackets
-        if missing_braces > 0:
-            text += '}' * missing_braces
+    找不到任何 JSON 容器时 value 为 None。
+    """
+    result = LenientJSON()
+    start = _JSON_START.search(text)
+    if start is None:
+        return result
+    start = start.start()
+    if start > 0:
+        _note(result.repairs, "leading_text")
 
-        print(f"[utils] 已尝试补全 JSON 括号")
+    try:
+        result.value, _ = _raw_decode(text, start)
+        return result
+    except json.JSONDecodeError:
+        pass
 
-    return text
+    if _parse_skeleton(text, start, result):
+        return result
+    return _parse_tokens(text, start, LenientJSON(repairs=result.repairs))
 
 
 def parse_json_with_diagnostics(
@@ -99,12 +519,10 @@ def parse_json_with_diagnostics(
     caller_name: str = "API"
 ) -> dict:
     """
-    带诊断信息的 JSON 解析，三次尝试
+    带诊断信息的 JSON 解析
 
-    尝试顺序：
-    1. 直接解析原始文本
-    2. 清理后解析（clean_json_response）
-    3. 修复截断后解析（fix_truncated_json）
+    交给 parse_json_lenient 单遍解析：格式正确的响应整体由 C 解析器一次完成，
+    有问题的部分就地修正，截断的响应返回已收到的部分。
 
     Args:
         raw_text: API 返回的原始文本
@@ -115,47 +533,164 @@ def parse_json_with_diagnostics(
         解析后的字典
 
     Raises:
-        json.JSONDecodeError: 如果所有尝试都失败
+        json.JSONDecodeError: 如果文本中找不到 JSON 对象
     """
-    # 第一次尝试：直接解析
-    try:
-        return json.loads(raw_text)
-    except json.JSONDecodeError:
-        pass  # 继续尝试
+    result = parse_json_lenient(raw_text)
+    if result.value is not None:
+        if result.truncated:
+            print(f"[{caller_name}] ⚠️ {context_name} JSON 被截断，已补全未闭合的部分")
+        return result.value
 
-    # 第二次尝试：清理后解析
-    cleaned_text = clean_json_response(raw_text)
-    try:
-        return json.loads(cleaned_text)
-    except json.JSONDecodeError:
-        pass  # 继续尝试
+    # 找不到任何 JSON，打印诊断信息
+    print(f"\n[{caller_name}] ❌ {context_name} 解析失败：响应中没有 JSON 对象")
 
-    # 第三次尝试：修复截断后解析
-    fixed_text = fix_truncated_json(cleaned_text)
-    try:
-        return json.loads(fixed_text)
-    except json.JSONDecodeError as e:
-        # 所有尝试都失败，打印详细诊断信息
-        print(f"\n[{caller_name}] ❌ {context_name} 解析失败")
-        print(f"[{caller_name}] 错误类型: {e.msg}")
-        print(f"[{caller_name}] 错误位置: 第 {e.lineno} 行, 第 {e.colno} 列 (字符位置 {e.pos})")
-
-        # 显示错误位置附近的文本
-        text = fixed_text
-        start = max(0, e.pos - 50)
-        end = min(len(text), e.pos + 50)
-        context_text = text[start:end]
-
-        # 标记错误位置
-        error_marker_pos = e.pos - start
-        print(f"[{caller_name}] 错误附近内容:")
-        print(f"  ...{context_text}...")
-        print(f"  {' ' * (error_marker_pos + 3)}^ 错误在这里")
-
-        # 打印原始响应的前500个字符
-        print(f"\n[{caller_name}] 原始响应前500字符:")
-        print(raw_text[:500])
-        if len(raw_text) > 500:
-            print(f"... (共 {len(raw_text)} 字符)")
-
-        raise
+    # 打印原始响应的前500个字符
+    print(f"\n[{caller_name}] 原始响应前500字符:")
+    print(raw_text[:500])
+    if len(raw_text) > 500:
+        print(f"... (共 {len(raw_text)} 字符)")
+
+    raise json.JSONDecodeError("No JSON object found", raw_text, 0)
+
+
+# ============================================================================
+# 增量 JSON 扫描（流式输出用）
+# ============================================================================
+
+class StreamingJSONScanner:
+    """
+    增量 JSON 扫描器
+
+    流式响应逐块到达时，不必等整段 JSON 结束再解析：
+    扫描器字符串感知地跟踪容器嵌套路径，每当 watch_paths 中某条路径下的
+    对象/数组闭合，就立即解析该子串并交付。
+
+    路径用元组表示，如 ("beats", 0, "dialogue", 2)；"*" 匹配任意键或下标。
+    第一个 '{' 之前的内容（如 ```json 代码块标记、说明文字）会被忽略。
+
+    用法：
+        scanner = StreamingJSONScanner([("beats", "*", "dialogue", "*")])
+        for chunk in stream:
+            for path, value in scanner.feed(chunk):
+                ...
+    """
+
+    def __init__(self, watch_paths: List[Tuple]):
+        self.watch_paths = [tuple(p) for p in watch_paths]
+        self._buf = ""
+        self._pos = 0
+        # 每个容器帧: [类型 '{'/'[', 当前槽位(键或下标), 起始位置, 容器自身路径, 是否等待键]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._started = False
+        self.finished = False
+
+    def _matches(self, path: Tuple) -> bool:
+        for pattern in self.watch_paths:
+            if len(pattern) != len(path):
+                continue
+            if all(p == "*" or p == k for p, k in zip(pattern, path)):
+                return True
+        return False
+
+    def _current_path(self) -> Tuple:
+        return tuple(frame[1] for frame in self._stack)
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple, Any]]:
+        """喂入一段文本，返回本次新闭合的 (路径, 值) 列表"""
+        completed = []
+        if self.finished:
+            return completed
+
+        self._buf += chunk
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+
+        while i < n:
+            ch = buf[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1] if self._stack else None
+                    if frame is not None and frame[0] == '{' and frame[4]:
+                        try:
+                            frame[1] = json.loads(buf[self._string_start:i + 1])
+                        except json.JSONDecodeError:
+                            frame[1] = buf[self._string_start + 1:i]
+                i += 1
+                continue
+
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                else:
+                    i += 1
+                    continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in '{[':
+                path = self._current_path()
+                self._stack.append([ch, 0 if ch == '[' else None, i, path, ch == '{'])
+            elif ch in '}]':
+                if not self._stack:
+                    i += 1
+                    continue
+                frame = self._stack.pop()
+                if self._matches(frame[3]):
+                    raw = buf[frame[2]:i + 1]
+                    try:
+                        completed.append((frame[3], json.loads(raw)))
+                    except json.JSONDecodeError:
+                        lenient = parse_json_lenient(raw)
+                        if lenient.value is not None and not lenient.truncated:
+                            completed.append((frame[3], lenient.value))
+                if not self._stack:
+                    self.finished = True
+                    i += 1
+                    break
+            elif ch == ':':
+                if self._stack and self._stack[-1][0] == '{':
+                    self._stack[-1][4] = False
+            elif ch == ',':
+                if self._stack:
+                    frame = self._stack[-1]
+                    if frame[0] == '[':
+                        frame[1] += 1
+                    else:
+                        frame[4] = True
+            i += 1
+
+        self._pos = i
+        return completed
+
+    def rstrip(self):
+        """
+        去掉缓冲区末尾的空白（续写前调用）
+
+        续写的预填不能以空白结尾（见 llm_gateway.continuation_messages），模型会从去掉
+        空白的地方接着输出；缓冲区也要一起去掉，否则字符串里断开处的空格会重复。
+        """
+        trimmed = self._buf.rstrip()
+        if self.finished or len(trimmed) == len(self._buf):
+            return
+        self._buf = trimmed
+        self._pos = min(self._pos, len(trimmed))
+        if self._in_string:
+            # 去掉的空白可能消耗了一个转义的反斜杠
+            body = trimmed[self._string_start + 1:]
+            self._escape = (len(body) - len(body.rstrip("\\"))) % 2 == 1
+
+    @property
+    def text(self) -> str:
+        """目前为止收到的全部文本"""
+        return self._buf
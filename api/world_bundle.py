@@ -0,0 +1,199 @@
+# ============================================================================
+# 世界数据包 (World Bundle)
+# ============================================================================
+# 职责：
+# 1. 把 worlds/ characters/ events/ prompts/ 与 locations.yaml 预编译成一个
+#    pickle 数据包（.cache/world_bundle.pickle）
+# 2. 冷启动只读一个文件、反序列化一次，替代几十次纯 Python YAML 解析
+# 3. 按源文件的 mtime + 大小校验；有文件增删改时自动重建
+# 4. 各模块的 load_yaml 都经由这里；数据包外的路径照常直接读文件
+#
+# 手动构建：python build_world_bundle.py [--force]
+# ============================================================================
+
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+# 添加父目录到路径以导入config
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import ENABLE_WORLD_BUNDLE, WORLD_BUNDLE_PATH
+
+BUNDLE_FORMAT = 1
+
+# 打包的内容（相对项目根目录）
+SOURCE_DIRS = ("worlds", "characters", "events", "prompts")
+SOURCE_FILES = ("world_state/locations.yaml",)
+SOURCE_SUFFIXES = {".yaml", ".yml", ".txt"}
+
+# 构建时优先使用 libyaml
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _parse_file(path: Path) -> Any:
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix in (".yaml", ".yml"):
+            return yaml.load(f, Loader=_YamlLoader)
+        return f.read()
+
+
+class WorldBundle:
+    """世界数据包 - 静态内容的预解析缓存"""
+
+    def __init__(self, project_root: Path = None, bundle_path: Path = None, enabled: bool = ENABLE_WORLD_BUNDLE):
+        self.project_root = Path(project_root or Path(__file__).parent.parent)
+        self.bundle_path = Path(bundle_path or self.project_root / WORLD_BUNDLE_PATH)
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._files: Optional[Dict[str, Any]] = None  # 相对路径 -> 解析结果
+        self.stats = {"hits": 0, "misses": 0, "rebuilt": False, "load_ms": 0.0}
+
+    # ------------------------------------------------------------------
+    # 源文件与校验
+    # ------------------------------------------------------------------
+
+    def source_paths(self) -> List[Path]:
+        paths = []
+        for dirname in SOURCE_DIRS:
+            root = self.project_root / dirname
+            if root.is_dir():
+                paths.extend(p for p in root.rglob("*") if p.suffix in SOURCE_SUFFIXES and p.is_file())
+        paths.extend(self.project_root / name for name in SOURCE_FILES if (self.project_root / name).is_file())
+        return sorted(paths)
+
+    def _relative(self, path: Path) -> Optional[str]:
+        try:
+            return Path(os.path.abspath(path)).relative_to(os.path.abspath(self.project_root)).as_posix()
+        except ValueError:
+            return None
+
+    def signature(self, paths: List[Path] = None) -> Dict[str, Tuple[int, int]]:
+        """源文件指纹：相对路径 -> (mtime_ns, 大小)，只 stat 不读内容"""
+        signature = {}
+        for path in paths if paths is not None else self.source_paths():
+            st = path.stat()
+            signature[self._relative(path)] = (st.st_mtime_ns, st.st_size)
+        return signature
+
+    # ------------------------------------------------------------------
+    # 构建 / 加载
+    # ------------------------------------------------------------------
+
+    def build(self) -> Dict[str, Any]:
+        """解析全部源文件并写出数据包（解析失败的文件不入包，运行时按原路径报错）"""
+        paths = self.source_paths()
+        signature = self.signature(paths)
+        files = {}
+        for path in paths:
+            try:
+                files[self._relative(path)] = _parse_file(path)
+            except Exception as e:
+                print(f"[WorldBundle] 跳过无法解析的文件 {path}: {e}")
+
+        payload = {"format": BUNDLE_FORMAT, "signature": signature, "files": files}
+        self.bundle_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".world_bundle.", suffix=".tmp", dir=self.bundle_path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.bundle_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return files
+
+    def _read(self) -> Optional[Dict]:
+        try:
+            with open(self.bundle_path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return None
+
+    def load(self, force_rebuild: bool = False) -> Dict[str, Any]:
+        """加载数据包；不存在、格式不符或源文件有变化时重建"""
+        with self._lock:
+            if self._files is not None and not force_rebuild:
+                return self._files
+
+            start = time.perf_counter()
+            payload = None if force_rebuild else self._read()
+            if (payload is None or payload.get("format") != BUNDLE_FORMAT
+                    or payload.get("signature") != self.signature()):
+                self._files = self.build()
+                self.stats["rebuilt"] = True
+                action = "已重建"
+            else:
+                self._files = payload["files"]
+                action = "已加载"
+            self.stats["load_ms"] = (time.perf_counter() - start) * 1000
+            print(f"[WorldBundle] {action} {len(self._files)} 个文件 ({self.stats['load_ms']:.1f}ms)")
+            return self._files
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def load_yaml(self, filepath) -> Any:
+        """
+        读取 YAML（数据包内的文件直接返回预解析结果）
+
+        返回的对象在调用方之间共享，不要原地修改。
+        """
+        path = Path(filepath)
+        if self.enabled:
+            relative = self._relative(path)
+            files = self.load()
+            if relative in files:
+                self.stats["hits"] += 1
+                return files[relative]
+        self.stats["misses"] += 1
+        with open(path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f)
+
+    def read_text(self, filepath) -> str:
+        """读取文本文件（prompts/ 下的模板）"""
+        path = Path(filepath)
+        if self.enabled:
+            relative = self._relative(path)
+            files = self.load()
+            if relative in files and isinstance(files[relative], str):
+                self.stats["hits"] += 1
+                return files[relative]
+        self.stats["misses"] += 1
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+# 全局实例
+_bundles: Dict[Path, WorldBundle] = {}
+_bundles_lock = threading.Lock()
+
+def get_world_bundle(project_root: Path = None) -> WorldBundle:
+    """获取项目对应的世界数据包单例"""
+    root = Path(os.path.abspath(project_root or Path(__file__).parent.parent))
+    with _bundles_lock:
+        if root not in _bundles:
+            _bundles[root] = WorldBundle(root)
+        return _bundles[root]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="构建世界数据包")
+    parser.add_argument("--force", action="store_true", help="忽略校验，强制重建")
+    args = parser.parse_args()
+
+    bundle = get_world_bundle()
+    bundle.load(force_rebuild=args.force)
+    size_kb = bundle.bundle_path.stat().st_size / 1024
+    print(f"[WorldBundle] {bundle.bundle_path} ({size_kb:.0f} KB)")
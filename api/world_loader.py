@@ -2,11 +2,12 @@
 世界观加载器 - 按需加载世界观数据
 """
 
-import yaml
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 from functools import lru_cache
 
+from .world_bundle import get_world_bundle
+
 
 class WorldLoader:
     """世界观数据加载器"""
@@ -25,8 +26,7 @@ class WorldLoader:
             print(f"[WorldLoader] 警告: 文件不存在 {filepath}")
             return {}
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f) or {}
+            return get_world_bundle(self.project_root).load_yaml(filepath) or {}
         except Exception as e:
             print(f"[WorldLoader] 加载YAML失败 {filepath}: {e}")
             return {}
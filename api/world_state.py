@@ -0,0 +1,316 @@
+# ============================================================================
+# 世界状态存储 (World State)
+# ============================================================================
+# 职责：
+# 1. world_state/*.json 的唯一权威内存副本，api/ 各层与游戏主循环共用
+# 2. 读取零开销：首次访问时从磁盘加载一次，之后直接返回内存对象
+# 3. 脏标记 + 回合边界批量落盘（write-behind），每个文档每回合最多写一次
+# 4. 原子写入：先写临时文件再 os.replace，崩溃时不会留下半个 JSON
+# 5. 变更通知：publish_changes() 对比上次发布的快照，把修改过的状态键推给订阅者
+# 6. 多会话：每个会话一个实例（state_dir 为会话目录），没写过的文档从
+#    seed_dir（项目的 world_state/）读取初始内容，不修改共享的初始状态
+# 7. WorldSnapshot：某一时刻的独立副本，后台任务（场景预取）在上面规划，
+#    不读写实时状态的文档，也不发布变更
+# ============================================================================
+
+import copy
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+# 文件不存在时使用的默认内容
+DEFAULT_DOCUMENTS = {
+    "current_day": {"day": 1, "period": "dawn", "event_count": 0, "flags": {}},
+    "character_states": {},
+    "scene_history": {
+        "scenes": [],
+        "location_last_used": {},
+        "character_last_focus": {},
+        "activity_last_used": {}
+    },
+}
+
+
+def _diff_document(name: str, old: Any, new: Any) -> Set[str]:
+    """
+    两个版本的文档之间被修改的状态键
+
+    current_day      -> day.<字段> / flag.<名称>
+    character_states -> char.<角色>.<属性>
+    其他文档         -> <文档名>.*
+    """
+    if old == new:
+        return set()
+    if name == "current_day" and isinstance(old, dict) and isinstance(new, dict):
+        changes = set()
+        for key in old.keys() | new.keys():
+            if old.get(key) == new.get(key):
+                continue
+            changes.add(f"day.{key}")
+            if key == "flags":
+                old_flags, new_flags = old.get(key) or {}, new.get(key) or {}
+                changes.update(
+                    f"flag.{flag}" for flag in old_flags.keys() | new_flags.keys()
+                    if old_flags.get(flag) != new_flags.get(flag)
+                )
+        return changes
+    if name == "character_states" and isinstance(old, dict) and isinstance(new, dict):
+        changes = set()
+        for char_id in old.keys() | new.keys():
+            old_state, new_state = old.get(char_id) or {}, new.get(char_id) or {}
+            if old_state == new_state:
+                continue
+            changes.update(
+                f"char.{char_id}.{attr}" for attr in old_state.keys() | new_state.keys()
+                if old_state.get(attr) != new_state.get(attr)
+            )
+        return changes
+    return {f"{name}.*"}
+
+
+class WorldState:
+    """
+    世界状态存储 - 内存权威副本 + 回合边界落盘
+
+    用法：
+        world = get_world_state()
+        day = world.get("current_day")       # 直接返回内存对象，不读磁盘
+        day["period"] = "noon"
+        world.mark_dirty("current_day")      # 原地修改后必须标脏
+        world.set("murder_prep", prep)       # 或整体替换（自动标脏）
+        world.flush()                        # 回合结束时统一写盘
+
+    会话专用实例：WorldState(root, state_dir=会话目录, seed_dir=root / "world_state")
+    """
+
+    detached = False  # WorldSnapshot 为 True：条件求值不使用依赖索引的缓存
+
+    def __init__(self, project_root: Path = None, state_dir: Path = None, seed_dir: Path = None):
+        self.project_root = project_root or Path(__file__).parent.parent
+        self.state_dir = Path(state_dir) if state_dir else self.project_root / "world_state"
+        self.seed_dir = Path(seed_dir) if seed_dir else None  # state_dir 中没有的文档从这里读初始内容
+
+        self._lock = threading.RLock()
+        self._documents: Dict[str, Any] = {}
+        self._dirty: set = set()
+        self.version = 0  # 每次修改 +1，可作为「世界状态是否变化」的廉价指纹
+        self.stats = {"loads": 0, "flushes": 0, "files_written": 0, "changes_published": 0}
+
+        # 变更通知
+        self._published: Dict[str, Any] = {}   # 上次发布时的文档快照
+        self._unpublished: set = set()         # 上次发布后被修改过的文档
+        self._reset_pending = False            # reload 之后下一次发布通知「全部失效」
+        self._subscribers: List[Callable[[Set[str]], None]] = []
+
+    def _path(self, name: str) -> Path:
+        return self.state_dir / f"{name}.json"
+
+    def _source(self, name: str) -> Path:
+        """读取文档的位置：state_dir 中已有则用它，否则用 seed_dir 中的初始内容"""
+        path = self._path(name)
+        if self.seed_dir is not None and not path.exists():
+            return self.seed_dir / f"{name}.json"
+        return path
+
+    # ------------------------------------------------------------------
+    # 读
+    # ------------------------------------------------------------------
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """
+        获取文档（内存对象，修改后需 mark_dirty）
+
+        文件不存在时返回 default；未指定 default 则使用 DEFAULT_DOCUMENTS 中的默认值。
+        """
+        with self._lock:
+            if name not in self._documents:
+                path = self._source(name)
+                if path.exists():
+                    with open(path, 'r', encoding='utf-8') as f:
+                        self._documents[name] = json.load(f)
+                    self._published[name] = copy.deepcopy(self._documents[name])
+                    self.stats["loads"] += 1
+                else:
+                    if default is None:
+                        default = DEFAULT_DOCUMENTS.get(name)
+                    return copy.deepcopy(default)
+            return self._documents[name]
+
+    def exists(self, name: str) -> bool:
+        """文档是否存在（内存中或磁盘上）"""
+        with self._lock:
+            return name in self._documents or self._source(name).exists()
+
+    def snapshot(self, name: str) -> Any:
+        """文档的深拷贝（给需要在后台线程中长时间使用的调用方）"""
+        with self._lock:
+            return copy.deepcopy(self.get(name))
+
+    # ------------------------------------------------------------------
+    # 写
+    # ------------------------------------------------------------------
+
+    def set(self, name: str, data: Any):
+        """整体替换文档并标脏"""
+        with self._lock:
+            self._documents[name] = data
+            self._mark(name)
+
+    def mark_dirty(self, name: str):
+        """标记文档已被原地修改，下次 flush 时写盘"""
+        with self._lock:
+            if name not in self._documents:
+                raise KeyError(f"[WorldState] 文档未加载，无法标脏: {name}")
+            self._mark(name)
+
+    def _mark(self, name: str):
+        self._dirty.add(name)
+        self._unpublished.add(name)
+        self.version += 1
+
+    @property
+    def dirty(self) -> List[str]:
+        with self._lock:
+            return sorted(self._dirty)
+
+    def flush(self) -> List[str]:
+        """
+        把所有脏文档原子地写回磁盘（回合边界调用）
+
+        Returns:
+            本次写入的文档名列表
+        """
+        with self._lock:
+            if not self._dirty:
+                return []
+            # 在锁内序列化，保证写出的是一致的快照
+            payloads = {
+                name: json.dumps(self._documents[name], ensure_ascii=False, indent=2)
+                for name in sorted(self._dirty)
+            }
+            self._dirty.clear()
+            self.stats["flushes"] += 1
+
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        for name, text in payloads.items():
+            self._atomic_write(self._path(name), text)
+        self.stats["files_written"] += len(payloads)
+        return list(payloads)
+
+    @staticmethod
+    def _atomic_write(path: Path, text: str):
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{path.stem}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    # ------------------------------------------------------------------
+    # 变更通知
+    # ------------------------------------------------------------------
+
+    def subscribe(self, callback: Callable[[Set[str]], None]):
+        """订阅变更键（publish_changes 时回调）"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def publish_changes(self) -> Set[str]:
+        """
+        计算自上次发布以来被修改的状态键并通知订阅者
+
+        只对比上次发布后 set / mark_dirty 过的文档；从未发布过快照的文档
+        （未加载就被 set 整体替换）和 reload 之后报告 "*"（全部失效）。
+        """
+        with self._lock:
+            changes = set()
+            if self._reset_pending:
+                changes.add("*")
+                self._reset_pending = False
+            for name in self._unpublished:
+                document = self._documents.get(name)
+                if name in self._published:
+                    changes |= _diff_document(name, self._published[name], document)
+                else:
+                    changes.add("*")
+                self._published[name] = copy.deepcopy(document)
+            self._unpublished.clear()
+            subscribers = list(self._subscribers)
+            self.stats["changes_published"] += len(changes)
+
+        if changes:
+            for callback in subscribers:
+                callback(changes)
+        return changes
+
+    # ------------------------------------------------------------------
+    # 其他
+    # ------------------------------------------------------------------
+
+    def reload(self, name: Optional[str] = None):
+        """丢弃内存副本（未落盘的修改会丢失），下次访问时重新从磁盘读取"""
+        with self._lock:
+            if name is None:
+                self._documents.clear()
+                self._dirty.clear()
+                self._published.clear()
+                self._unpublished.clear()
+            else:
+                self._documents.pop(name, None)
+                self._dirty.discard(name)
+                self._published.pop(name, None)
+                self._unpublished.discard(name)
+            self._reset_pending = True
+            self.version += 1
+
+
+class WorldSnapshot(WorldState):
+    """
+    世界状态的独立副本（在主线程上创建：主线程原地修改文档时不持有锁）
+
+    可以照常读写，但修改只留在副本里：flush 不写盘，publish_changes 不通知订阅者。
+    尚未加载的文档按需从磁盘读取（与实时状态读到的相同）。
+    """
+
+    detached = True
+
+    def __init__(self, source: WorldState):
+        super().__init__(source.project_root, source.state_dir, source.seed_dir)
+        with source._lock:
+            self._documents = copy.deepcopy(source._documents)
+            self.version = source.version
+        self.source_version = source.version  # 创建时实时状态的版本号
+
+    def flush(self) -> List[str]:
+        with self._lock:
+            self._dirty.clear()
+        return []
+
+    def subscribe(self, callback: Callable[[Set[str]], None]):
+        pass
+
+    def publish_changes(self) -> Set[str]:
+        with self._lock:
+            self._unpublished.clear()
+            self._reset_pending = False
+        return set()
+
+
+# 全局实例
+_world_state: Optional[WorldState] = None
+_world_state_lock = threading.Lock()
+
+def get_world_state(project_root: Path = None) -> WorldState:
+    """获取世界状态单例"""
+    global _world_state
+    with _world_state_lock:
+        if _world_state is None:
+            _world_state = WorldState(project_root)
+        return _world_state
@@ -0,0 +1,156 @@
+# ============================================================================
+# 紧凑输出格式基准（api/compact_schema.py）
+# ============================================================================
+# 用法：python benchmark_compact_schema.py [--scenes N] [--seed S] [--api]
+#
+# 对每个场景分别按详细格式（system 中示例的缩进 JSON）和紧凑格式编码
+# 整场对话与场景规划，比较输出 token 数，并检查紧凑格式解码后与原数据一致。
+#
+# token 数默认用 character_registry.estimate_tokens 估算（不调用 API）；
+# 加 --api 时用 messages.count_tokens 按模型的真实分词计数（需要 API Key）。
+# ============================================================================
+
+import argparse
+import json
+import random
+from typing import Callable, Dict, List
+
+from api.character_registry import estimate_tokens
+from api.compact_schema import (
+    build_cast, compact_scene_dialogue, compact_scene_plan,
+    expand_scene_dialogue, expand_scene_plan
+)
+from benchmark_json_parser import CHARACTERS, make_response
+
+
+# ============================================================================
+# 语料
+# ============================================================================
+
+BEAT_TYPES = ["opening", "development", "tension", "climax", "resolution"]
+DESCRIPTIONS = [
+    "午后的图书室，阳光斜照，安静得能听见书页翻动的声音",
+    "两人在书架间偶然相遇，气氛有些微妙",
+    "一句无心的话触及了对方的伤口，空气骤然凝固",
+    "压抑的情绪终于爆发，争吵声在空旷的房间里回响",
+    "沉默之后，两人各自离开，留下未说完的话",
+]
+NOTES = ["多用环境描写，对话简短", "注意停顿和沉默", "动作要克制，情绪藏在细节里"]
+
+
+def make_plan(rng: random.Random, cast: List[str]) -> Dict:
+    """一份格式正确的场景规划"""
+    beats = []
+    for b in range(rng.randint(4, 6)):
+        characters = rng.sample(cast, min(len(cast), rng.randint(2, 3)))
+        beats.append({
+            "beat_id": f"beat_{b + 1}",
+            "beat_type": BEAT_TYPES[min(b, len(BEAT_TYPES) - 1)],
+            "description": rng.choice(DESCRIPTIONS),
+            "characters": characters,
+            "speaker_order": [rng.choice(characters) for _ in range(rng.randint(3, 5))],
+            "emotion_targets": {c: rng.choice(["calm", "nervous", "angry", "sad"]) for c in characters},
+            "tension_level": rng.randint(2, 9),
+            "dialogue_count": rng.randint(3, 6),
+            "direction_notes": rng.choice(NOTES),
+        })
+    return {
+        "scene_id": f"scene_{rng.randint(100, 999)}",
+        "scene_name": "午后的图书室",
+        "location": "图书室",
+        "time_estimate_minutes": rng.randint(5, 10),
+        "overall_arc": "平静 → 试探 → 冲突 → 余韵",
+        "beats": beats,
+        "key_moments": ["书页间夹着的旧照片", "没说出口的道歉"],
+        "player_choice_point": {
+            "after_beat": beats[-2]["beat_id"],
+            "prompt": "要上前打圆场吗？",
+            "options": [
+                {"id": "A", "text": "上前安慰", "leads_to": "正面"},
+                {"id": "B", "text": "保持沉默", "leads_to": "中性"},
+                {"id": "C", "text": "追问照片的事", "leads_to": "危险"},
+            ],
+        },
+        "outcomes": {
+            "stress_changes": {c: rng.randint(-5, 5) for c in cast[:2]},
+            "relationship_changes": {},
+            "flags_to_set": [],
+        },
+        "recommended_bgm": "ambient_tension",
+    }
+
+
+def verbose(data: Dict) -> str:
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def compact(data: Dict) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+# ============================================================================
+# token 计数
+# ============================================================================
+
+def api_counter() -> Callable[[str], int]:
+    """按模型真实分词计数：同一条消息有无正文的 input_tokens 之差"""
+    from config import MODEL
+    from api.llm_gateway import get_gateway
+
+    client = get_gateway().client("character")
+
+    def count(text: str) -> int:
+        return client.messages.count_tokens(
+            model=MODEL, messages=[{"role": "user", "content": text}]
+        ).input_tokens
+
+    baseline = count(".")
+    return lambda text: count(text) - baseline
+
+
+# ============================================================================
+# 评估
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="紧凑输出格式：每场景输出 token 对比")
+    parser.add_argument("--scenes", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--api", action="store_true", help="用 messages.count_tokens 计数（需要 API Key）")
+    args = parser.parse_args()
+
+    count = api_counter() if args.api else estimate_tokens
+    rng = random.Random(args.seed)
+
+    print(f"token 计数：{'messages.count_tokens' if args.api else 'estimate_tokens 估算'}\n")
+    print(f"{'场景':<6}{'台词':>5}{'对话:详细':>10}{'对话:紧凑':>10}{'减少':>7}   "
+          f"{'规划:详细':>10}{'规划:紧凑':>10}{'减少':>7}")
+    totals = [0, 0, 0, 0]
+    for n in range(args.scenes):
+        dialogue = make_response(rng)
+        plan = make_plan(rng, rng.sample(CHARACTERS, 4))
+
+        dialogue_cast = build_cast(
+            [line["speaker"] for beat in dialogue["beats"] for line in beat["dialogue"]]
+            + [char_id for beat in dialogue["beats"] for char_id in beat["effects"]]
+        )
+        plan_cast = build_cast(c for beat in plan["beats"] for c in beat["characters"])
+
+        # 解码后必须与原数据一致
+        dialogue_wire = compact(compact_scene_dialogue(dialogue, dialogue_cast))
+        plan_wire = compact(compact_scene_plan(plan, plan_cast))
+        assert expand_scene_dialogue(json.loads(dialogue_wire), dialogue_cast) == dialogue, "对话解码不一致"
+        assert expand_scene_plan(json.loads(plan_wire), plan_cast) == plan, "规划解码不一致"
+
+        row = [count(verbose(dialogue)), count(dialogue_wire), count(verbose(plan)), count(plan_wire)]
+        totals = [t + r for t, r in zip(totals, row)]
+        lines = sum(len(beat["dialogue"]) for beat in dialogue["beats"])
+        print(f"{n + 1:<6}{lines:>5}{row[0]:>10}{row[1]:>10}{1 - row[1] / row[0]:>7.0%}   "
+              f"{row[2]:>10}{row[3]:>10}{1 - row[3] / row[2]:>7.0%}")
+
+    print(f"{'合计':<6}{'':>5}{totals[0]:>10}{totals[1]:>10}{1 - totals[1] / totals[0]:>7.0%}   "
+          f"{totals[2]:>10}{totals[3]:>10}{1 - totals[3] / totals[2]:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+# ============================================================================
+# JSON 解析基准（api/utils.py）
+# ============================================================================
+# 用法：python benchmark_json_parser.py [--cassette PATH] [--synthetic] [--rounds N] [--seed S]
+#
+# 语料（默认）：录制文件中真实的模型响应（LLM_TRANSPORT=record 运行游戏即可录下，
+# 见 api/llm_transport.py）。续写请求的响应与 assistant 预填拼成完整文本。
+# 按新解析器报告的修正（repairs / truncated）归类，json.loads 直接成功的归为「格式正确」；
+# 台词 = 解析出的台词数 / 两种流程中较多的那个。
+#
+# 合成语料（--synthetic，或录制文件不存在时）：以 prompts/character_actor_prompt.txt
+# 中的示例台词拼出整场对话响应，再按线上遇到过的问题（见 STATUS.md「JSON 解析错误修复」）
+# 注入畸形：代码块与说明文字、+号数字、尾部逗号、中文标点、台词内未转义引号、
+# max_tokens 截断，以及它们的组合；台词 = 与原文逐行一致的台词数 / 原文台词总数。
+# 注入的畸形只代表已知问题的形态，不代表真实响应中各类问题的比例。
+#
+# 对比：旧的三次尝试流程（json.loads → clean_json_response → fix_truncated_json）
+# 与现在的 parse_json_with_diagnostics（parse_json_lenient 单遍解析）。
+# 最后列出新流程比旧流程慢的类别。
+# ============================================================================
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from api.llm_transport import Cassette
+from api.utils import parse_json_lenient, parse_json_with_diagnostics
+from config import LLM_CASSETTE
+
+
+# ============================================================================
+# 旧流程（原 api/utils.py 实现，原样保留用于对比）
+# ============================================================================
+
+def legacy_clean_json_response(text: str) -> str:
+    text = text.strip()
+    if text.startswith('```json'):
+        text = text[7:]
+    elif text.startswith('```'):
+        text = text[3:]
+    if text.endswith('```'):
+        text = text[:-3]
+    text = text.strip()
+    json_match = re.search(r'\{[\s\S]*\}', text)
+    if json_match:
+        text = json_match.group()
+    text = text.replace('"', '"').replace('"', '"')
+    text = text.replace("'", "'").replace("'", "'")
+    text = text.replace('：', ':')
+    text = re.sub(r':\s*\+(\d)', r': \1', text)
+    text = re.sub(r',(\s*[\]\}])', r'\1', text)
+    return text
+
+
+def legacy_fix_truncated_json(text: str) -> str:
+    open_braces = text.count('{')
+    close_braces = text.count('}')
+    open_brackets = text.count('[')
+    close_brackets = text.count(']')
+    if open_braces != close_braces or open_brackets != close_brackets:
+        text = text.rstrip()
+        if text.count('"') % 2 != 0:
+            text += '"'
+        missing_brackets = open_brackets - close_brackets
+        missing_braces = open_braces - close_braces
+        if missing_brackets > 0:
+            text += ']' * missing_brackets
+        if missing_braces > 0:
+            text += '}' * missing_braces
+    return text
+
+
+def legacy_parse(raw_text: str) -> Any:
+    try:
+        return json.loads(raw_text)
+    except json.JSONDecodeError:
+        pass
+    cleaned_text = legacy_clean_json_response(raw_text)
+    try:
+        return json.loads(cleaned_text)
+    except json.JSONDecodeError:
+        pass
+    return json.loads(legacy_fix_truncated_json(cleaned_text))
+
+
+def current_parse(raw_text: str) -> Any:
+    return parse_json_with_diagnostics(raw_text, "基准", "Benchmark")
+
+
+# ============================================================================
+# 语料
+# ============================================================================
+
+LINES = [
+    ("narrator", "午后的阳光透过高窗洒落，在图书室的地板上画出金色的光斑。",
+     "午後の日差しが高窓から差し込み、図書室の床に金色の光の斑点を描いている。", "peaceful", None),
+    ("narrator", "安安独自坐在角落的沙发上，手中的绘本已经翻到了最后几页。她的表情很平静，仿佛外面的世界与她无关。",
+     "アンアンは隅のソファに一人座り、手にした絵本はもう最後の数ページに差し掛かっている。", "peaceful", None),
+    ("aima", "啊，希罗...早上好。今天起得好早呢。", "あ、ヒロ...おはよう。今日は早いね。", "nervous", "轻轻挥手"),
+    ("hiro", "...你到底在隐瞒什么？别以为我看不出来。", "...何を隠してるの？私には分かるんだから。", "suspicious", "眯起眼睛"),
+    ("arisa", "够了！我受够了！为什么...为什么要这样对我们！",
+     "もういい！ウチはもう我慢できん！なんで...なんでウチらをこんな目に！", "angry", "猛地站起来"),
+]
+
+CHARACTERS = ["aima", "hiro", "anan", "noah", "reia", "arisa"]
+
+
+def make_response(rng: random.Random) -> Dict:
+    """一段格式正确的整场对话响应"""
+    beats = []
+    for b in range(rng.randint(3, 5)):
+        dialogue = []
+        for _ in range(rng.randint(3, 7)):
+            speaker, cn, jp, emotion, action = rng.choice(LINES)
+            line = {"speaker": speaker, "text_cn": cn, "text_jp": jp, "emotion": emotion}
+            if action:
+                line["action"] = action
+            dialogue.append(line)
+        effects = {rng.choice(CHARACTERS): {"stress": rng.randint(-5, 5), "emotion": "calm"}}
+        beats.append({"beat_id": f"beat_{b + 1}", "dialogue": dialogue, "effects": effects})
+    return {"beats": beats}
+
+
+def _sometimes(pattern: str, repl: str, text: str, rng: random.Random, rate: float = 0.2) -> str:
+    """按一定比例在匹配处制造错误（模型出错通常是零星的，至少出错一处）"""
+    sites = list(re.finditer(pattern, text))
+    chosen = {m.start() for m in sites if rng.random() < rate}
+    if sites and not chosen:
+        chosen = {rng.choice(sites).start()}
+    return re.sub(pattern, lambda m: m.expand(repl) if m.start() in chosen else m.group(0), text)
+
+
+def _fence(text: str, rng: random.Random) -> str:
+    return rng.choice(["```json\n", "好的，以下是场景对话：\n```json\n", "以下是生成的对话：\n"]) + text + rng.choice(["\n```", "\n```\n希望符合要求。", ""])
+
+
+def _plus(text: str, rng: random.Random) -> str:
+    return _sometimes(r'("stress": )(\d)', r'\1+\2', text, rng, rate=0.5)
+
+
+def _trailing_commas(text: str, rng: random.Random) -> str:
+    return _sometimes(r'(["\d\]}])(\s*[\]}])', r'\1,\2', text, rng)
+
+
+def _fullwidth(text: str, rng: random.Random) -> str:
+    # 字符串外的冒号/逗号换成全角，emotion 值用中文引号
+    text = _sometimes(r'"emotion": "(\w+)"', r'"emotion"：“\1”', text, rng)
+    return _sometimes(r'\}, \{', '}，{', text, rng)
+
+
+def _inner_quotes(text: str, rng: random.Random) -> str:
+    # 台词里的引号没有转义（原始对象中是 \"她说\"）
+    return text.replace('\\"她说\\"', '"她说"')
+
+
+def _truncate(text: str, rng: random.Random) -> str:
+    return text[:rng.randint(len(text) // 3, len(text) - 2)]
+
+
+def _dump(obj: Dict, rng: random.Random) -> str:
+    return json.dumps(obj, ensure_ascii=False, indent=rng.choice([None, 2]))
+
+
+MALFORMATIONS: Dict[str, List[Callable]] = {
+    "代码块/说明文字": [_fence],
+    "+号数字": [_plus],
+    "尾部逗号": [_trailing_commas],
+    "中文标点": [_fullwidth],
+    "未转义引号": [_inner_quotes],
+    "截断": [_truncate],
+    "代码块+截断": [_fence, _truncate],
+    "+号+尾部逗号+截断": [_plus, _trailing_commas, _truncate],
+    "全部": [_plus, _trailing_commas, _fullwidth, _fence, _truncate],
+}
+
+
+def build_corpus(seed: int, per_kind: int) -> List[Tuple[str, Dict, str]]:
+    """[(类别, 原始对象, 畸形文本)]"""
+    rng = random.Random(seed)
+    corpus = []
+    for kind, steps in MALFORMATIONS.items():
+        for _ in range(per_kind):
+            truth = make_response(rng)
+            if _inner_quotes in steps:
+                for beat in truth["beats"]:
+                    for line in beat["dialogue"]:
+                        if rng.random() < 0.3:
+                            line["text_cn"] = line["text_cn"].replace("。", '。"她说"。', 1)
+            text = _dump(truth, rng)
+            for step in steps:
+                text = step(text, rng)
+            corpus.append((kind, truth, text))
+    return corpus
+
+
+# ============================================================================
+# 录制语料
+# ============================================================================
+
+# parse_json_lenient 的修正 -> 类别
+REPAIR_LABELS = {
+    "leading_text": "代码块/说明文字",
+    "trailing_text": "代码块/说明文字",
+    "plus_sign": "+号数字",
+    "trailing_comma": "尾部逗号",
+    "fullwidth_punctuation": "中文标点",
+    "fullwidth_quote": "中文标点",
+    "unescaped_quote": "未转义引号",
+    "invalid_escape": "非法转义",
+    "stray_bracket": "括号不匹配",
+    "mismatched_bracket": "括号不匹配",
+    "skipped_text": "多余文本",
+    "bad_key": "非法键",
+}
+
+
+def classify(text: str) -> str:
+    try:
+        json.loads(text)
+        return "格式正确"
+    except json.JSONDecodeError:
+        pass
+    result = parse_json_lenient(text)
+    labels = []
+    for repair in result.repairs:
+        label = REPAIR_LABELS.get(repair, repair)
+        if label not in labels:
+            labels.append(label)
+    if result.truncated:
+        labels.append("截断")
+    return "+".join(labels) or "其他"
+
+
+def load_recorded(path: Path) -> List[Tuple[str, Optional[Dict], str]]:
+    """[(类别, None, 响应全文)]：录制文件中看起来是 JSON 的消息响应"""
+    corpus = []
+    for exchange in Cassette(path).load():
+        if exchange.kind != "message":
+            continue
+        text = "".join(block.get("text", "") for block in exchange.response.get("content", [])
+                       if isinstance(block, dict))
+        messages = exchange.request.get("messages") or []
+        if messages and messages[-1].get("role") == "assistant":
+            prefill = messages[-1].get("content")
+            if isinstance(prefill, list):
+                prefill = "".join(block.get("text", "") for block in prefill if isinstance(block, dict))
+            text = (prefill or "") + text
+        if "{" not in text:
+            continue
+        corpus.append((classify(text), None, text))
+    return corpus
+
+
+# ============================================================================
+# 评估
+# ============================================================================
+
+def count_lines(result: Any) -> int:
+    """结果中的台词数（带 speaker 的对象）"""
+    if isinstance(result, dict):
+        return ("speaker" in result) + sum(count_lines(value) for value in result.values())
+    if isinstance(result, list):
+        return sum(count_lines(item) for item in result)
+    return 0
+
+
+def recovered_lines(result: Any, truth: Optional[Dict]) -> int:
+    if truth is None:
+        return count_lines(result)
+    if not isinstance(result, dict):
+        return 0
+    count = 0
+    beats = result.get("beats") if isinstance(result.get("beats"), list) else []
+    for beat, true_beat in zip(beats, truth["beats"]):
+        dialogue = beat.get("dialogue") if isinstance(beat, dict) else None
+        if not isinstance(dialogue, list):
+            continue
+        count += sum(1 for line, true_line in zip(dialogue, true_beat["dialogue"]) if line == true_line)
+    return count
+
+
+def reference_lines(corpus: List[Tuple[str, Optional[Dict], str]]) -> List[int]:
+    """每条语料的台词总数：合成语料取原文，录制语料取两种流程中解析出较多的那个"""
+    totals = []
+    sink = io.StringIO()
+    for _, truth, text in corpus:
+        if truth is not None:
+            totals.append(sum(len(beat["dialogue"]) for beat in truth["beats"]))
+            continue
+        best = 0
+        for parse in (legacy_parse, current_parse):
+            with contextlib.redirect_stdout(sink):
+                try:
+                    best = max(best, count_lines(parse(text)))
+                except (json.JSONDecodeError, ValueError):
+                    pass
+        totals.append(best)
+    return totals
+
+
+def run(parsers: Dict[str, Callable], corpus: List[Tuple[str, Optional[Dict], str]], rounds: int,
+        totals: List[int]) -> Dict[str, Dict[str, Dict]]:
+    """{流程: {类别: 统计}}；同一条语料上各流程交替计时，机器负载的波动对两者的影响相同"""
+    results: Dict[str, Dict[str, Dict]] = {name: {} for name in parsers}
+    sink = io.StringIO()
+    for (kind, truth, text), total in zip(corpus, totals):
+        best = {}
+        with contextlib.redirect_stdout(sink):
+            for name, parse in parsers.items():
+                entry = results[name].setdefault(kind, {"n": 0, "ok": 0, "lines": 0, "total": 0, "seconds": 0.0})
+                entry["n"] += 1
+                entry["total"] += total
+                try:
+                    result = parse(text)
+                    entry["ok"] += 1
+                    entry["lines"] += min(recovered_lines(result, truth), total)
+                except (json.JSONDecodeError, ValueError):
+                    pass
+                best[name] = float("inf")
+            # 取最快的一次，排除调度和 GC 的干扰
+            for _ in range(rounds):
+                for name, parse in parsers.items():
+                    start = time.perf_counter()
+                    try:
+                        parse(text)
+                    except (json.JSONDecodeError, ValueError):
+                        pass
+                    best[name] = min(best[name], time.perf_counter() - start)
+        for name in parsers:
+            results[name][kind]["seconds"] += best[name]
+        sink.seek(0)
+        sink.truncate()
+    return results
+
+
+def _ratio(part: int, whole: int) -> str:
+    return f"{part / whole:>8.0%}" if whole else f"{'-':>8}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 解析基准：旧三次尝试 vs 单遍宽容解析")
+    parser.add_argument("--cassette", default=LLM_CASSETTE, help="录制文件（LLM_TRANSPORT=record 生成）")
+    parser.add_argument("--synthetic", action="store_true", help="使用注入畸形的合成语料")
+    parser.add_argument("--rounds", type=int, default=20, help="每条语料计时的次数（取最快一次）")
+    parser.add_argument("--seed", type=int, default=7, help="合成语料的随机种子")
+    parser.add_argument("--per-kind", type=int, default=30, help="合成语料每类畸形的条数")
+    args = parser.parse_args()
+
+    corpus = [] if args.synthetic else load_recorded(Path(args.cassette))
+    if corpus:
+        source = f"录制文件 {args.cassette}"
+    else:
+        if not args.synthetic:
+            print(f"[提示] 录制文件 {args.cassette} 中没有 JSON 响应，改用合成语料。录制方法：\n"
+                  f"       LLM_TRANSPORT=record LLM_CASSETTE={args.cassette} python game_loop_v3.py\n")
+        corpus = build_corpus(args.seed, args.per_kind)
+        source = "合成语料（注入畸形）"
+    totals = reference_lines(corpus)
+    results = run({"旧流程": legacy_parse, "新流程": current_parse}, corpus, args.rounds, totals)
+
+    print(f"{source}：{len(corpus)} 条，平均 {sum(len(t) for _, _, t in corpus) // len(corpus)} 字符，"
+          f"每条两种流程交替计时 {args.rounds} 次取最快\n")
+    print(f"{'类别':<18}{'条数':>6}{'旧:成功':>8}{'旧:台词':>8}{'旧:µs':>9}   {'新:成功':>8}{'新:台词':>8}{'新:µs':>9}")
+    kinds = sorted(results["新流程"], key=lambda k: -results["新流程"][k]["n"])
+    if corpus[0][1] is not None:
+        kinds = list(MALFORMATIONS)
+    summary = {name: {"n": 0, "ok": 0, "lines": 0, "total": 0, "seconds": 0.0} for name in results}
+    slower = []
+    for kind in kinds:
+        row = f"{kind:<18}{results['新流程'][kind]['n']:>6}"
+        for name, stats in results.items():
+            entry = stats[kind]
+            for key in summary[name]:
+                summary[name][key] += entry[key]
+            row += (f"{entry['ok'] / entry['n']:>8.0%}{_ratio(entry['lines'], entry['total'])}"
+                    f"{entry['seconds'] / entry['n'] * 1e6:>9.0f}   ")
+        old, new = results["旧流程"][kind]["seconds"], results["新流程"][kind]["seconds"]
+        if new > old:
+            slower.append((kind, old, new, results["新流程"][kind]["n"]))
+        print(row)
+
+    row = f"{'合计':<18}{len(corpus):>6}"
+    for name, entry in summary.items():
+        row += (f"{entry['ok'] / entry['n']:>8.0%}{_ratio(entry['lines'], entry['total'])}"
+                f"{entry['seconds'] / entry['n'] * 1e6:>9.0f}   ")
+    print(row)
+
+    if slower:
+        print("\n新流程较慢的类别（旧流程在这些类别上多数直接解析失败，耗时是失败前的耗时）：")
+        for kind, old, new, n in slower:
+            print(f"  {kind:<18} 旧 {old / n * 1e6:>6.0f} µs → 新 {new / n * 1e6:>6.0f} µs  (+{(new / old - 1):.0%})")
+    else:
+        print("\n新流程在所有类别上都不慢于旧流程")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# ============================================================================
+# NPC 移动基准：逐角色遍历字典 vs 角色表（api/npc_table.py）批量移动多个世界
+# ============================================================================
+# 用法：python benchmark_npc_table.py [--worlds N] [--steps K] [--seed S]
+#
+# 从 world_state/character_states.json 复制 N 个世界，按 PERIODS 轮流移动 K 步：
+#   dict  —— 原 _maybe_move_npcs 的写法（每个角色掷骰、select_destination 现算候选地点）
+#   list  —— 角色表的列表实现（预先算好的概率矩阵）
+#   numpy —— 角色表的向量化实现（已安装 numpy 时）
+# 比较耗时，并用各地点的人数分布（总变差距离）检查三种写法的结果分布是否一致。
+# 只读 world_state/，不写回。
+# ============================================================================
+
+import argparse
+import copy
+import json
+import random
+import time
+from collections import Counter
+from pathlib import Path
+
+from api.npc_table import NPCMovement, np
+from game_loop_v3 import PERIODS, load_yaml
+
+
+def select_destination(current_location, pref, all_locations):
+    """原 GameLoopV3._select_npc_destination：根据角色偏好选择移动目的地"""
+    preferred = pref.get("preferred", [])
+    avoid = pref.get("avoid", [])
+
+    # 70% 去偏好地点，30% 随机
+    if preferred and random.random() < 0.7:
+        available = [loc for loc in preferred if loc != current_location and loc not in avoid]
+        if available:
+            return random.choice(available)
+
+    # 随机选择（排除当前位置和回避地点）
+    available = [loc for loc in all_locations if loc != current_location and loc not in avoid]
+    if available:
+        return random.choice(available)
+
+    return current_location
+
+
+def move_dict(states_list, behavior, period):
+    """原写法：逐世界、逐角色遍历字典"""
+    movement = behavior.get("movement", {})
+    move_chance = movement.get("period_modifiers", {}).get(period, movement.get("base_chance", 0.3))
+    prefs = behavior.get("location_preferences", {})
+    all_locations = behavior.get("all_locations")
+    for states in states_list:
+        for char_id, state in states.items():
+            if char_id == "aima" or state.get("status") != "alive":
+                continue
+            pref = prefs.get(char_id, {})
+            if random.random() < pref.get("stay_chance", 0):
+                continue
+            if random.random() < move_chance:
+                old = state.get("location", "牢房区")
+                state["location"] = select_destination(old, pref, all_locations)
+
+
+def histogram(locations):
+    counts = Counter(locations)
+    total = sum(counts.values())
+    return {loc: count / total for loc, count in counts.items()}
+
+
+def distance(a, b):
+    return 0.5 * sum(abs(a.get(loc, 0) - b.get(loc, 0)) for loc in set(a) | set(b))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NPC 移动基准（字典遍历 vs 角色表）")
+    parser.add_argument("--worlds", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = Path(__file__).parent
+    behavior = load_yaml(root / "worlds" / "witch_trial" / "npc_behavior.yaml")
+    with open(root / "world_state" / "character_states.json", encoding="utf-8") as f:
+        initial = json.load(f)
+    periods = [PERIODS[i % len(PERIODS)] for i in range(args.steps)]
+
+    results = {}
+
+    random.seed(args.seed)
+    worlds = [copy.deepcopy(initial) for _ in range(args.worlds)]
+    start = time.perf_counter()
+    for period in periods:
+        move_dict(worlds, behavior, period)
+    results["dict"] = (time.perf_counter() - start,
+                       histogram(s["location"] for states in worlds for s in states.values()))
+
+    modes = [("list", False)] + ([("numpy", True)] if np is not None else [])
+    for name, vectorized in modes:
+        random.seed(args.seed)
+        model = NPCMovement(behavior)
+        worlds = [copy.deepcopy(initial) for _ in range(args.worlds)]
+        start = time.perf_counter()
+        table = model.load(worlds, vectorized=vectorized)
+        for period in periods:
+            model.step(table, period)
+        views = [table.states(w) for w in range(table.worlds)]  # 结束时才生成字典视图
+        results[name] = (time.perf_counter() - start,
+                         histogram(s["location"] for states in views for s in states.values()))
+
+    cells = args.worlds * len(initial)
+    print(f"\n{args.worlds} 个世界 × {len(initial)} 名角色 × {args.steps} 步"
+          f"{'' if np is not None else '（未安装 numpy，跳过向量化实现）'}\n")
+    base_seconds, base_hist = results["dict"]
+    for name, (seconds, hist) in results.items():
+        print(f"{name:<6} {seconds * 1000:>9.1f} ms   {cells * args.steps / seconds / 1e6:>6.2f} M 角色步/秒   "
+              f"加速 {base_seconds / seconds:>5.1f}x   分布差 {distance(hist, base_hist):.4f}")
+    print("\n地点分布（dict）：" + "，".join(f"{loc} {p:.3f}" for loc, p in sorted(base_hist.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# ============================================================================
+# 场景流水线基准（规划 → 整场对话 → 选项回应），可完全离线运行
+# ============================================================================
+# 用法：python benchmark_pipeline.py [--scenes N] [--seed S] [--stream]
+#           [--transport synthetic|replay|record|live] [--cassette FILE] [--latency-scale X]
+#
+# 默认使用 synthetic 传输层（api/llm_transport.py）：不需要 API Key 和网络，
+# 输出与延迟由种子决定，同样的参数每次得到同样的结果（末尾打印输出摘要，可直接比对）。
+# 先用 --transport record 跑一遍真实 API，之后 --transport replay 即可离线重放同一批请求；
+# --latency-scale 1 时按录制/合成的原始延迟等待，0 时立即返回（只测本地开销）。
+#
+# 场景规划以 commit=False 调用，不写入场景历史；世界状态只读。
+# ============================================================================
+
+import argparse
+import hashlib
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from api.llm_gateway import get_gateway
+from api.llm_transport import TRANSPORT_MODES, create_transport
+from api.prompt_cache import track_usage
+from api.director_planner import DirectorPlanner
+from api.character_actor import CharacterActor
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def scene_locations(planner: DirectorPlanner) -> List[str]:
+    """当前有角色在的地点（plan_scene 对空地点不调用 API）"""
+    states = planner.world_state.get("character_states")
+    locations = []
+    for state in states.values():
+        location = state.get("location")
+        if location and location not in locations and planner.get_characters_at_location(location):
+            locations.append(location)
+    return locations
+
+
+def run_scene(planner: DirectorPlanner, actor: CharacterActor, location: str, stream: bool) -> Dict:
+    row = {"location": location}
+    with track_usage() as usage:
+        start = time.perf_counter()
+        scene_plan = planner.plan_scene(location=location, scene_type="free", commit=False)
+        row["plan_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if stream:
+            dialogue_stream = actor.stream_scene_dialogue(scene_plan)
+            dialogues, choice_responses = dialogue_stream.wait()
+            row["first_line_s"] = dialogue_stream.stats["time_to_first_line"] or 0.0
+        else:
+            dialogues, choice_responses = actor.generate_scene_dialogue(scene_plan)
+        row["dialogue_s"] = time.perf_counter() - start
+        # 预选回应在后台生成，等它完成
+        row["choices"] = len(dict(choice_responses)) if choice_responses is not None else 0
+
+    row["total_s"] = row["plan_s"] + row["dialogue_s"]
+    row["beats"] = len(scene_plan.beats)
+    row["lines"] = sum(len(output.dialogue) for output in dialogues)
+    row["empty_beats"] = sum(1 for output in dialogues if not output.dialogue)
+    row["input_tokens"] = usage["input_tokens"]
+    row["output_tokens"] = usage["output_tokens"]
+    row["calls"] = usage["calls"]
+    row["digest"] = "\n".join(
+        f"{line.speaker}|{line.text_cn}|{line.text_jp}" for output in dialogues for line in output.dialogue
+    )
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="场景流水线基准（默认离线合成）")
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0, help="合成模式的种子（第 n 个场景用 seed + n）")
+    parser.add_argument("--transport", choices=TRANSPORT_MODES, default="synthetic")
+    parser.add_argument("--cassette", default=".cache/llm_cassette.jsonl", help="record / replay 的录制文件")
+    parser.add_argument("--latency-scale", type=float, default=None,
+                        help="synthetic / replay 的延迟倍数（默认：合成 1，回放 0）")
+    parser.add_argument("--stream", action="store_true", help="演出层使用流式生成（统计首行延迟）")
+    args = parser.parse_args()
+
+    gateway = get_gateway()
+    gateway.transport = create_transport(args.transport, args.cassette)
+    if args.latency_scale is not None and hasattr(gateway.transport, "latency_scale"):
+        gateway.transport.latency_scale = args.latency_scale
+
+    project_root = Path(__file__).parent
+    planner = DirectorPlanner(project_root)
+    actor = CharacterActor(project_root)
+    locations = scene_locations(planner)
+    if not locations:
+        print("没有角色所在的地点，无法规划场景")
+        return
+
+    rows = []
+    for n in range(args.scenes):
+        if hasattr(gateway.transport, "seed"):
+            gateway.transport.seed = args.seed + n
+        rows.append(run_scene(planner, actor, locations[n % len(locations)], args.stream))
+
+    print(f"\n传输层 {args.transport}，{args.scenes} 个场景{'（流式）' if args.stream else ''}\n")
+    header = f"{'#':<4}{'地点':<8}{'Beat':>5}{'台词':>6}{'空Beat':>7}{'规划s':>8}{'对话s':>8}"
+    header += f"{'首行s':>8}" if args.stream else ""
+    print(header + f"{'合计s':>8}{'调用':>6}{'输入tok':>9}{'输出tok':>9}")
+    for n, row in enumerate(rows, 1):
+        line = (f"{n:<4}{row['location']:<8}{row['beats']:>5}{row['lines']:>6}{row['empty_beats']:>7}"
+                f"{row['plan_s']:>8.2f}{row['dialogue_s']:>8.2f}")
+        line += f"{row['first_line_s']:>8.2f}" if args.stream else ""
+        print(line + f"{row['total_s']:>8.2f}{row['calls']:>6}{row['input_tokens']:>9}{row['output_tokens']:>9}")
+
+    print()
+    metrics = ["plan_s", "dialogue_s", "total_s"] + (["first_line_s"] if args.stream else [])
+    for key in metrics:
+        values = [row[key] for row in rows]
+        print(f"{key:<14} p50 {percentile(values, 0.5):>7.2f}s   p95 {percentile(values, 0.95):>7.2f}s   "
+              f"平均 {statistics.mean(values):>7.2f}s")
+    print(f"台词 {sum(r['lines'] for r in rows)} 行，空 Beat {sum(r['empty_beats'] for r in rows)} 个，"
+          f"输出 {sum(r['output_tokens'] for r in rows)} tokens")
+
+    digest = hashlib.sha1("\n\n".join(row["digest"] for row in rows).encode("utf-8")).hexdigest()
+    print(f"输出摘要 {digest[:16]}（同一传输层与参数下应保持不变）")
+    print(f"传输层统计 {gateway.transport.report()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# ============================================================================
+# 多会话基准：一个进程内同时运行 N 个游戏会话（game_engine.py），可完全离线运行
+# ============================================================================
+# 用法：python benchmark_sessions.py [--sessions N] [--steps K] [--seed S]
+#           [--transport synthetic|replay|live] [--latency-scale X] [--prefetch] [--hibernate]
+#
+# 每个会话用 auto_input 随机选择（地点序号 / 选项字母 / 继续），所有会话的输入同时提交，
+# 统计每一步从提交输入到再次等待输入的耗时、线程数与内存峰值。
+# --hibernate：走完步数后每个会话继续到回合之间，全部休眠，再各提交一条输入恢复，
+# 统计休眠 / 恢复耗时、快照大小与前后常驻会话数、内存。
+# 会话的世界状态写在 .cache/sessions/bench-*（结束后删除），项目的 world_state/ 不受影响。
+# ============================================================================
+
+import argparse
+import random
+import resource
+import shutil
+import statistics
+import threading
+import time
+from pathlib import Path
+
+from api.llm_gateway import get_gateway
+from api.llm_transport import TRANSPORT_MODES, create_transport
+from benchmark_pipeline import percentile
+from game_engine import GameEngine, SessionClosed, auto_input
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话基准（默认离线合成）")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=10, help="每个会话提交的输入数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--transport", choices=TRANSPORT_MODES, default="synthetic")
+    parser.add_argument("--cassette", default=".cache/llm_cassette.jsonl")
+    parser.add_argument("--latency-scale", type=float, default=None, help="synthetic / replay 的延迟倍数")
+    parser.add_argument("--prefetch", action="store_true", help="会话开启场景预取")
+    parser.add_argument("--hibernate", action="store_true", help="最后休眠全部会话再恢复")
+    args = parser.parse_args()
+
+    gateway = get_gateway()
+    gateway.transport = create_transport(args.transport, args.cassette)
+    if args.latency_scale is not None and hasattr(gateway.transport, "latency_scale"):
+        gateway.transport.latency_scale = args.latency_scale
+
+    project_root = Path(__file__).parent
+    # 不开后台休眠检查：休眠只在 --hibernate 阶段显式触发
+    engine = GameEngine(project_root, max_sessions=args.sessions, prefetch=args.prefetch,
+                        idle_hibernate_s=0, memory_budget_mb=0)
+    step_ms, ready_ms = [], []
+    outputs = {}
+    lock = threading.Lock()
+
+    def play(n: int):
+        rng = random.Random(args.seed + n)
+        start = time.perf_counter()
+        session = engine.create_session(f"bench-{n}")
+        output = session.wait_ready()
+        with lock:
+            ready_ms.append((time.perf_counter() - start) * 1000)
+        for _ in range(args.steps):
+            if output.finished:
+                break
+            try:
+                output = session.send(auto_input(output, rng))
+            except SessionClosed:
+                break
+            with lock:
+                step_ms.append(output.elapsed_ms)
+        if args.hibernate:
+            # 继续到回合之间的「继续?」提示（只有那里可以休眠）
+            for _ in range(args.steps * 5):
+                if output.finished or session.hibernatable:
+                    break
+                output = session.send(auto_input(output, rng))
+        outputs[n] = output
+
+    start = time.perf_counter()
+    players = [threading.Thread(target=play, args=(n,), daemon=True) for n in range(args.sessions)]
+    for player in players:
+        player.start()
+    for player in players:
+        player.join()
+    wall = time.perf_counter() - start
+    report = engine.report()
+
+    hibernation = None
+    if args.hibernate:
+        sessions = [engine.get(f"bench-{n}") for n in range(args.sessions)]
+        hibernated = [s for s in sessions if s.hibernate("benchmark")]
+        after_hibernate = engine.report()
+        resumed = []
+
+        def resume(session):
+            output = session.send("y")
+            with lock:
+                resumed.append(output.elapsed_ms)
+
+        workers = [threading.Thread(target=resume, args=(s,), daemon=True) for s in hibernated]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        hibernation = (len(hibernated), after_hibernate, engine.report(), resumed)
+
+    engine.close_all(hibernate=False)
+    for n in range(args.sessions):
+        shutil.rmtree(engine.session_dir / f"bench-{n}", ignore_errors=True)
+
+    print(f"\n传输层 {args.transport}，{args.sessions} 个会话 × {args.steps} 步"
+          f"{'（预取）' if args.prefetch else ''}，总耗时 {wall:.1f}s\n")
+    for name, values in (("首屏ms", ready_ms), ("每步ms", step_ms)):
+        if values:
+            print(f"{name:<8} p50 {percentile(values, 0.5):>9.1f}   p95 {percentile(values, 0.95):>9.1f}   "
+                  f"平均 {statistics.mean(values):>9.1f}   共 {len(values)}")
+    print(f"吞吐 {len(step_ms) / wall:.1f} 步/秒，线程数 {report['threads']}，"
+          f"内存峰值 {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    print(f"引擎统计 {report}")
+    if hibernation:
+        count, after_hibernate, after_restore, resumed = hibernation
+        print(f"\n休眠 {count}/{args.sessions} 个会话：常驻 {report['resident']} → {after_hibernate['resident']}，"
+              f"线程 {report['threads']} → {after_hibernate['threads']}，RSS {report['rss_mb']} → {after_hibernate['rss_mb']} MB，"
+              f"快照平均 {after_hibernate['snapshot_bytes'] / max(count, 1) / 1024:.1f} KB")
+        print(f"休眠ms   p50 {after_restore['hibernate_ms']['p50']:>9.1f}   p95 {after_restore['hibernate_ms']['p95']:>9.1f}")
+        print(f"恢复ms   p50 {after_restore['restore_ms']['p50']:>9.1f}   p95 {after_restore['restore_ms']['p95']:>9.1f}"
+              f"   （恢复后第一步 p50 {percentile(resumed, 0.5):.1f} ms）")
+        print(f"恢复后常驻 {after_restore['resident']}，线程 {after_restore['threads']}")
+    print(f"传输层统计 {gateway.transport.report()}")
+    gateway.scheduler.print_report()
+    gateway.keys.print_report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+# ============================================================================
+# 构建世界数据包（api/world_bundle.py）
+# ============================================================================
+# 用法：python build_world_bundle.py [--force]
+# 游戏启动时数据包过期会自动重建，这里用于发布前预先生成
+# ============================================================================
+
+from api.world_bundle import main
+
+
+if __name__ == "__main__":
+    main()
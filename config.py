@@ -37,20 +37,82 @@ except ImportError:
     pass
 
 # 从环境变量读取，或使用本地配置
-_DEFAULT_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "") or _LOCAL_API_KEY
-
-API_KEYS = {
-    "character": os.environ.get("ANTHROPIC_API_KEY_CHARACTER") or _LOCAL_KEYS.get("character") or _DEFAULT_API_KEY,
-    "director": os.environ.get("ANTHROPIC_API_KEY_DIRECTOR") or _LOCAL_KEYS.get("director") or _DEFAULT_API_KEY,
-    "controller": os.environ.get("ANTHROPIC_API_KEY_CONTROLLER") or _LOCAL_KEYS.get("controller") or _DEFAULT_API_KEY,
+# 每个角色可以配置多个 Key（Key 池）：环境变量用逗号分隔，config_local.py 里可写成列表，
+# 网关按在途请求数在池内分流，某个 Key 被限流 / 过载时自动冷却并切换到其他 Key（api/key_pool.py）
+def _key_list(value) -> list:
+    """把 'sk-a,sk-b' / ['sk-a', 'sk-b'] / 'sk-a' 统一成 Key 列表（去空白、去重、保持顺序）"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    keys = []
+    for key in value:
+        key = (key or "").strip()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+_DEFAULT_API_KEYS = _key_list(os.environ.get("ANTHROPIC_API_KEY")) or _key_list(_LOCAL_API_KEY)
+_DEFAULT_API_KEY = _DEFAULT_API_KEYS[0] if _DEFAULT_API_KEYS else ""
+
+API_KEY_POOLS = {
+    role: (_key_list(os.environ.get(f"ANTHROPIC_API_KEY_{role.upper()}"))
+           or _key_list(_LOCAL_KEYS.get(role))
+           or list(_DEFAULT_API_KEYS))
+    for role in ("character", "director", "controller")
 }
 
+# 兼容旧用法：每个角色池中的第一个 Key
+API_KEYS = {role: (keys[0] if keys else "") for role, keys in API_KEY_POOLS.items()}
+
 # 模型配置
 # 注意: Claude 3.5 Sonnet 已升级为 Claude Sonnet 4
 # 可用模型: claude-sonnet-4-20250514, claude-3-haiku-20240307
 MODEL = "claude-sonnet-4-20250514"  # Claude Sonnet 4
 MAX_TOKENS = 4096  # 增加token限制
 
+# ============================================
+# LLM 网关设置（api/llm_gateway.py）
+# ============================================
+LLM_CONCURRENCY = {        # 每个角色同时进行的请求上限
+    "character": 4,
+    "director": 2,
+    "controller": 2,
+}
+LLM_TIMEOUT = 120.0        # 单次请求超时（秒）
+LLM_MAX_RETRIES = 3        # 限流/超时/5xx 的重试次数
+LLM_RETRY_BASE_DELAY = 1.0 # 指数退避的基础间隔（秒）
+LLM_MAX_CONTINUATIONS = 2  # 输出因 max_tokens 截断时，以 assistant 预填续写的最多次数
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL") or None  # API 地址（None = SDK 默认）；本地模拟服务器见 stub_llm_server.py
+
+# 请求调度（api/llm_scheduler.py）：名额按优先级 interactive > choice > speculative > offline 分配，同级按会话轮转
+_RATE_LIMIT = {"requests": 1000, "input_tokens": 450000, "output_tokens": 90000}  # 每分钟；None = 不限
+LLM_RATE_LIMITS = {        # 每个 Key 的令牌桶；几个角色的 Key 池相同时共用一组桶（取较小的上限，乘以池中 Key 数）
+    "character": dict(_RATE_LIMIT),
+    "director": dict(_RATE_LIMIT),
+    "controller": dict(_RATE_LIMIT),
+}
+LLM_SPECULATIVE_HEADROOM = 0.2  # 令牌桶余量低于该比例时，投机请求（场景预取）直接取消
+
+# Key 池健康检查（api/key_pool.py）：429 / 529 后该 Key 冷却，期间请求分给池内其他 Key
+LLM_KEY_COOLDOWN = 10.0        # 没有 retry-after 时的冷却秒数（同一 Key 连续出错时翻倍）
+LLM_KEY_COOLDOWN_MAX = 120.0   # 冷却上限（秒）
+LLM_KEY_DISABLE_S = 3600.0     # 401 / 403（Key 无效或无权限）后停用的秒数
+
+# 传输层（api/llm_transport.py）：live | record | replay | synthetic，可用环境变量切换
+# 例：LLM_TRANSPORT=synthetic python test_api.py
+LLM_TRANSPORT = os.environ.get("LLM_TRANSPORT", "live")
+LLM_CASSETTE = os.environ.get("LLM_CASSETTE", ".cache/llm_cassette.jsonl")  # record / replay 的录制文件（相对项目根目录）
+LLM_REPLAY_LATENCY = float(os.environ.get("LLM_REPLAY_LATENCY", "0"))   # 回放时按录制延迟的倍数等待（0 = 立即返回）
+LLM_REPLAY_MISS = os.environ.get("LLM_REPLAY_MISS", "error")            # 录制中没有的请求：error | synthetic
+LLM_SYNTHETIC_SEED = int(os.environ.get("LLM_SYNTHETIC_SEED", "0"))
+LLM_SYNTHETIC_LATENCY = {  # 合成响应的延迟分布（对数正态：中位数毫秒, sigma）
+    "first_token": (900.0, 0.35),
+    "per_token": (18.0, 0.2),
+    "scale": float(os.environ.get("LLM_SYNTHETIC_LATENCY_SCALE", "1")),  # 整体倍数，0 = 不等待
+}
+
 # ============================================
 # 缓存设置
 # ============================================
@@ -59,6 +121,65 @@ HEARTBEAT_INTERVAL = 3000  # 50分钟心跳（秒）
 ENABLE_CACHE = True
 ENABLE_HEARTBEAT = False   # 测试时关闭
 
+# ============================================
+# 流式输出设置
+# ============================================
+ENABLE_STREAMING = True    # 角色演出层逐行流式显示（指标：首行延迟）
+COMPACT_OUTPUT = False     # 演出层/规划层使用紧凑输出格式（短键 + 数组 + 角色序号，减少输出 token）
+LAZY_JP = False            # 演出层只生成中文；日文台词在显示/TTS 需要时后台批量生成（api/jp_translator.py）
+
+# ============================================
+# 响应缓存设置（api/response_cache.py）
+# ============================================
+ENABLE_RESPONSE_CACHE = True                  # 相同请求（模型 + prompt + 采样参数）复用磁盘上的输出
+RESPONSE_CACHE_DIR = ".cache/responses"       # 相对项目根目录
+RESPONSE_CACHE_MAX_MB = 64                    # 超出后按最近使用时间淘汰
+RESPONSE_CACHE_POLICY = {                     # 调用标签 -> 是否缓存（未列出的标签不缓存）
+    "story_outline": True,      # 三天大纲：同一初始状态反复出现
+    "choice_responses": True,   # 选项回应
+    "fixed_scene_plan": True,   # 固定事件的场景规划
+    "jp_lines": True,           # 日文台词（同一句中文的译文）
+    "free_scene_plan": False,   # 自由场景每次都要新鲜内容
+    "scene_dialogue": False,
+    "beat_repair": False,
+}
+
+# ============================================
+# 场景预取设置
+# ============================================
+ENABLE_PREFETCH = True     # 玩家阅读上一场景时，后台预先规划+演出候选地点的场景
+PREFETCH_TOP_N = 2         # 预取的候选地点数
+PREFETCH_HISTORY = 6       # 排序时参考的最近场景数
+
+# ============================================
+# 世界数据包设置（api/world_bundle.py）
+# ============================================
+ENABLE_WORLD_BUNDLE = True                        # 静态 YAML 从预编译数据包读取
+WORLD_BUNDLE_PATH = ".cache/world_bundle.pickle"  # 相对项目根目录；源文件变化时自动重建
+
+# ============================================
+# 多会话游戏服务器（game_engine.py / game_server.py）
+# ============================================
+GAME_SESSION_DIR = ".cache/sessions"  # 每个会话的世界状态目录（相对项目根目录）
+GAME_MAX_SESSIONS = 500               # 单进程同时常驻内存的会话上限（满时先休眠最久未用的会话）
+GAME_SESSION_PREFETCH = False         # 会话是否预取场景（多人时投机调用会成倍增加 API 负载）
+GAME_IDLE_HIBERNATE_S = 300           # 在回合之间空闲超过该秒数的会话写入快照并释放内存（0 = 不按空闲休眠）
+GAME_MEMORY_BUDGET_MB = 0             # 进程常驻内存（RSS）超出时按最近使用时间休眠会话（0 = 不限）
+GAME_SWEEP_INTERVAL_S = 5.0           # 检查空闲 / 内存预算的间隔（秒）
+GAME_SERVER_HOST = "127.0.0.1"
+GAME_SERVER_PORT = 8080
+
+# ============================================
+# 无界面蒙特卡洛模拟（simulate_playthroughs.py）
+# ============================================
+SIM_WORKERS = 0        # 模拟进程数（0 = 全部 CPU 核心）
+SIM_MAX_TURNS = 300    # 每局最多回合数，超过记为 timeout（流程卡住时不会无限循环）
+
+# ============================================
+# NPC 角色表（api/npc_table.py）
+# ============================================
+NPC_TABLE_NUMPY_MIN = 256  # 世界数 × 角色数达到该值且已安装 numpy 时用向量化实现（单个世界用列表实现更快）
+
 # ============================================
 # 路径配置
 # ============================================
@@ -71,20 +192,20 @@ OUTPUT_DIR.mkdir(exist_ok=True)
 # ============================================
 ANTHROPIC_API_KEY = API_KEYS.get("character", "")
 
-def get_api_key(service_type="director"):
+def get_api_keys(service_type="director"):
     """
-    获取指定服务的API Key
+    获取指定服务的 Key 池（至少一个 Key）
 
     优先级:
-    1. 环境变量 ANTHROPIC_API_KEY_<SERVICE>
-    2. config_local.py 中的 ANTHROPIC_API_KEY_<SERVICE>
+    1. 环境变量 ANTHROPIC_API_KEY_<SERVICE>（逗号分隔可写多个）
+    2. config_local.py 中的 ANTHROPIC_API_KEY_<SERVICE>（字符串或列表）
     3. 环境变量 ANTHROPIC_API_KEY
     4. config_local.py 中的 ANTHROPIC_API_KEY
     5. 抛出错误
     """
-    key = API_KEYS.get(service_type) or API_KEYS.get("director") or _DEFAULT_API_KEY
+    keys = API_KEY_POOLS.get(service_type) or API_KEY_POOLS.get("director") or _DEFAULT_API_KEYS
 
-    if not key:
+    if not keys:
         raise ValueError(
             f"\n{'='*60}\n"
             f"[错误] 未找到 API Key\n"
@@ -99,8 +220,16 @@ def get_api_key(service_type="director"):
             f"方式3: 多个 API Key（可选）\n"
             f"  ANTHROPIC_API_KEY_CHARACTER = 'sk-ant-api03-key1'\n"
             f"  ANTHROPIC_API_KEY_DIRECTOR = 'sk-ant-api03-key2'\n"
-            f"  ANTHROPIC_API_KEY_CONTROLLER = 'sk-ant-api03-key3'\n"
+            f"  ANTHROPIC_API_KEY_CONTROLLER = 'sk-ant-api03-key3'\n\n"
+            f"方式4: Key 池（可选，请求在池内分流，限流时自动切换）\n"
+            f"  ANTHROPIC_API_KEY_CHARACTER = ['sk-ant-api03-key1', 'sk-ant-api03-key4']\n"
+            f"  或环境变量 ANTHROPIC_API_KEY_CHARACTER=sk-ant-api03-key1,sk-ant-api03-key4\n"
             f"{'='*60}"
         )
 
-    return key
+    return list(keys)
+
+
+def get_api_key(service_type="director"):
+    """获取指定服务的API Key（Key 池中的第一个；优先级同 get_api_keys）"""
+    return get_api_keys(service_type)[0]
@@ -11,7 +11,6 @@
 # - 就寝，结束第1天
 # ============================================================================
 
-import anthropic
 import json
 import yaml
 import random
@@ -20,6 +19,8 @@ from pathlib import Path
 from dataclasses import dataclass
 from typing import Dict, List, Optional
 
+from api.llm_gateway import get_gateway
+
 # ============================================================================
 # 配置
 # ============================================================================
@@ -231,14 +232,17 @@ class FreeEventGenerator:
     
     def __init__(self):
         self.client = None  # 延迟初始化
+        self.api_key = None
         self.templates = load_yaml("events/free_event_templates.yaml").get("templates", {})
         self.char_states = load_json("world_state/character_states.json")
     
     def _get_client(self):
+        """获取 LLM 网关（没有 Key 时返回 None，走离线回退）"""
         if self.client is None:
             api_key = get_api_key()
             if api_key:
-                self.client = anthropic.Anthropic(api_key=api_key)
+                self.api_key = api_key
+                self.client = get_gateway()
         return self.client
     
     def reload_states(self):
@@ -340,7 +344,9 @@ class FreeEventGenerator:
 直接输出JSON，不要markdown。"""
 
         try:
-            response = self.client.messages.create(
+            response = self.client.create(
+                "character",
+                api_key=self.api_key,
                 model=MODEL,
                 max_tokens=512,
                 messages=[{"role": "user", "content": prompt}]
@@ -8,7 +8,6 @@
 # 4. 重要选择很少，但有重量
 # ============================================================================
 
-import anthropic
 import json
 import yaml
 import random
@@ -17,6 +16,10 @@ from pathlib import Path
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 
+from api.llm_gateway import get_gateway
+from api.character_registry import get_character_registry
+from api.npc_table import sample_locations
+
 # ============================================================================
 # 配置
 # ============================================================================
@@ -74,15 +77,8 @@ def get_name(char_id: str) -> str:
     return CHAR_NAMES.get(char_id, char_id)
 
 def load_char_data(char_id: str) -> Optional[dict]:
-    try:
-        path = Path(f"characters/{char_id}")
-        return {
-            "core": load_yaml(path / "core.yaml"),
-            "personality": load_yaml(path / "personality.yaml"),
-            "speech": load_yaml(path / "speech.yaml")
-        }
-    except:
-        return None
+    registry = get_character_registry()
+    return registry.get(char_id) if registry.exists(char_id) else None
 
 # ============================================================================
 # 显示函数
@@ -164,6 +160,7 @@ class DailyEventGenerator:
     
     def __init__(self):
         self.client = None
+        self.api_key = None
         self.char_states = load_json("world_state/character_states.json")
         self.templates = load_yaml("events/free_event_templates_v2.yaml")
         
@@ -175,10 +172,12 @@ class DailyEventGenerator:
         }
     
     def _get_client(self):
+        """获取 LLM 网关（没有 Key 时返回 None，走离线回退）"""
         if self.client is None:
             key = get_api_key()
             if key:
-                self.client = anthropic.Anthropic(api_key=key)
+                self.api_key = key
+                self.client = get_gateway()
         return self.client
     
     def reload(self):
@@ -244,7 +243,9 @@ class DailyEventGenerator:
             prompt = self._build_meaningful_prompt(location, char1)
         
         try:
-            response = self.client.messages.create(
+            response = self.client.create(
+                "director",
+                api_key=self.api_key,
                 model=MODEL,
                 max_tokens=MAX_TOKENS,
                 messages=[{"role": "user", "content": prompt}]
@@ -496,15 +497,9 @@ class NPCManager:
         """更新NPC位置"""
         weights = {"食堂": 0.25, "庭院": 0.25, "图书室": 0.15, "走廊": 0.15, "牢房区": 0.2}
         
-        for char_id in self.char_states:
-            total = sum(weights.values())
-            r = random.random() * total
-            cumulative = 0
-            for loc, w in weights.items():
-                cumulative += w
-                if r <= cumulative:
-                    self.char_states[char_id]["location"] = loc
-                    break
+        char_ids = list(self.char_states)
+        for char_id, loc in zip(char_ids, sample_locations(weights, len(char_ids))):
+            self.char_states[char_id]["location"] = loc
         
         save_json("world_state/character_states.json", self.char_states)
     
@@ -9,14 +9,17 @@
 # 5. 预生成选项回应（零延迟）
 # ============================================================================
 
-import anthropic
 import json
+import re
 import yaml
 import random
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, field
-from config import get_api_key, MODEL, MAX_TOKENS, ENABLE_CACHE
+from config import MODEL, MAX_TOKENS, ENABLE_CACHE
+from api.llm_gateway import get_gateway
+from api.conditions import ConditionState, compile_condition, is_named_condition
+from api.character_registry import get_character_registry
 
 
 # ============================================================================
@@ -79,6 +82,17 @@ def clean_json_response(text: str) -> str:
 # 条件评估器
 # ============================================================================
 
+# 本模块的 current_day 用 phase 表示时段（set_phase / next_day），
+# 与 FixedEventManager 含义不同的命名条件在这里覆盖（定义见 events/fixed_events.yaml 开头的说明）
+DIRECTOR_NAMED_CONDITIONS = {
+    "highest_madness_above_70": "max(all_characters.madness) > 70",   # 含已死亡角色
+    "day3_night_no_murder":
+        "day == 3 and phase == night and not flag.murder_occurred and max(all_characters.madness) <= 70",
+}
+
+_BARE_NAME_RE = re.compile(r"\w+")
+
+
 class ConditionEvaluator:
     """条件评估器 - 解析并评估事件触发条件"""
     
@@ -88,61 +102,15 @@ class ConditionEvaluator:
         self.locations = locations
     
     def evaluate(self, condition: str) -> bool:
-        """评估条件字符串"""
-        # 解析条件
-        if condition == "default":
-            return True
-        
-        # highest_madness_above_70
-        if condition == "highest_madness_above_70":
-            max_madness = max(c.get("madness", 0) for c in self.chars.values())
-            return max_madness > 70
-        
-        # player_madness_above_80
-        if condition == "player_madness_above_80":
-            # 假设player不在character_states中，或者用特殊处理
-            return False  # 需要具体实现
-        
-        # flag检查
-        if condition.startswith("flag_"):
-            flag_name = condition[5:]  # 去掉"flag_"前缀
-            return self.day.get("flags", {}).get(flag_name, False)
-        
-        # day3_night_no_murder
-        if condition == "day3_night_no_murder":
-            is_day3 = self.day.get("day") == 3
-            is_night = self.day.get("phase") == "night"
-            no_murder = not self.day.get("flags", {}).get("murder_occurred", False)
-            max_madness = max(c.get("madness", 0) for c in self.chars.values())
-            return is_day3 and is_night and no_murder and max_madness <= 70
-        
-        # all_stress_70_to_85_and_library_clue_and_all_alive
-        if condition == "all_stress_70_to_85_and_library_clue_and_all_alive":
-            all_alive = all(c.get("status") == "alive" for c in self.chars.values())
-            library_clue = self.day.get("flags", {}).get("library_clue_found", False)
-            all_stress_ok = all(70 <= c.get("stress", 0) <= 85 for c in self.chars.values())
-            return all_alive and library_clue and all_stress_ok
-        
-        # 投票相关条件
-        if condition in ["vote_result_correct", "vote_result_player", "vote_result_wrong"]:
-            # 这些需要在审判阶段由代码设置
-            return self.day.get("flags", {}).get(condition, False)
-        
-        # debate_finished
-        if condition == "debate_finished":
-            return self.day.get("flags", {}).get("debate_finished", False)
-        
-        # investigation_count_zero_or_time_expired
-        if condition == "investigation_count_zero_or_time_expired":
-            return self.day.get("investigation_count", 5) <= 0
-        
-        # player_at_library
-        if condition == "player_at_library":
-            return self.day.get("player_location") == "图书室"
-        
-        # 默认返回False
-        print(f"⚠️ 未知条件: {condition}")
-        return False
+        """评估条件字符串（与 api/conditions.py 共用同一套条件语言）"""
+        if _BARE_NAME_RE.fullmatch(condition) and not is_named_condition(condition):
+            print(f"⚠️ 未知条件: {condition}")
+            return False
+        compiled = compile_condition(DIRECTOR_NAMED_CONDITIONS.get(condition, condition))
+        if not compiled.ok:
+            print(f"⚠️ 未知条件: {condition}")
+            return False
+        return compiled(ConditionState(current_day=self.day, character_states=self.chars))
     
     def check_trigger(self, trigger: Dict) -> bool:
         """检查事件触发条件"""
@@ -369,7 +337,7 @@ class DirectorAPIv2:
     """导演API v2 - 整合事件系统"""
     
     def __init__(self):
-        self.client = anthropic.Anthropic(api_key=get_api_key("director"))
+        self.gateway = get_gateway()
         self.event_manager = EventManager()
     
     def process_turn(self, player_location: str) -> EventResult:
@@ -571,7 +539,8 @@ class DirectorAPIv2:
         
         # 调用API
         try:
-            response = self.client.messages.create(
+            response = self.gateway.create(
+                "director",
                 model=MODEL,
                 max_tokens=MAX_TOKENS,
                 messages=[{"role": "user", "content": prompt}]
@@ -593,20 +562,8 @@ class DirectorAPIv2:
             ], [], {}
     
     def _load_character_data(self, char_id: str) -> Dict:
-        """加载角色数据"""
-        char_path = Path(f"characters/{char_id}")
-        
-        try:
-            core = load_yaml(char_path / "core.yaml")
-            personality = load_yaml(char_path / "personality.yaml")
-            speech = load_yaml(char_path / "speech.yaml")
-            return {"core": core, "personality": personality, "speech": speech}
-        except:
-            return {
-                "core": {"name": {"zh": char_id}},
-                "personality": {"versions": {"simple": "性格不明"}},
-                "speech": {"first_person": "我", "verbal_tics": []}
-            }
+        """加载角色数据（共享角色注册表）"""
+        return get_character_registry().get(char_id)
     
     def _build_director_prompt(
         self, 
@@ -0,0 +1,789 @@
+# ============================================================================
+# 无界面游戏引擎（多会话）
+# ============================================================================
+# 职责：
+# 1. 一个进程同时运行多个玩家的 GameLoopV3；每个会话有自己的 WorldState
+#    （GAME_SESSION_DIR/<会话ID>/，没写过的文档从 world_state/ 读初始内容），互不覆盖
+# 2. 只读的世界数据（数据包、角色注册表、世界观库、prompt 模板）与 LLM 网关进程内共享
+# 3. 逐回合驱动：send(输入) 让游戏运行到下一次等待输入，返回这期间的渲染输出（TurnOutput）
+#    输入与终端版相同：地点编号 / 选项字母 / Enter 继续（空字符串）/ y/n ...
+# 4. 每个会话在自己的线程中运行游戏循环；print 输出按 ContextVar 路由到所属会话
+#    （与 scene_prefetcher 的后台静音同一做法），其他线程照常输出到终端
+# 5. 休眠：停在回合之间（「继续?」提示）的会话，空闲超过 GAME_IDLE_HIBERNATE_S、
+#    常驻会话数达到上限或进程内存超出 GAME_MEMORY_BUDGET_MB 时（按最近使用时间），
+#    把世界状态与游戏进度打包成一个 gzip 快照（GAME_SESSION_DIR/<会话ID>.snapshot.json.gz），
+#    结束游戏线程并释放内存；下一条输入到达时自动恢复（GameLoopV3.resume，不重置、不重新生成大纲）
+#
+# 前端见 game_server.py（asyncio HTTP / WebSocket）
+# 用法：engine = get_game_engine()
+#       session = engine.create_session()
+#       output = session.wait_ready()           # 第一屏（地点菜单）
+#       output = session.send("1")              # 选择地点 1
+# ============================================================================
+
+import asyncio
+import gzip
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (
+    GAME_SESSION_DIR, GAME_MAX_SESSIONS, GAME_SESSION_PREFETCH,
+    GAME_IDLE_HIBERNATE_S, GAME_MEMORY_BUDGET_MB, GAME_SWEEP_INTERVAL_S,
+)
+from api.world_state import WorldState
+from api.world_bundle import get_world_bundle
+from api.world_loader import get_world_loader
+from api.character_registry import get_character_registry
+from api.llm_scheduler import llm_request
+from game_loop_v3 import GameLoopV3
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+SNAPSHOT_FORMAT = 1
+
+# 当前线程（及其复制了上下文的子任务）所属的会话
+_current_session: ContextVar[Optional["GameSession"]] = ContextVar("game_session", default=None)
+
+
+class SessionClosed(BaseException):
+    """
+    会话被关闭（或休眠）时从等待输入处抛出
+
+    继承 BaseException：游戏循环里的 except Exception 不会拦住它，线程直接结束。
+    """
+
+
+class SessionBusy(RuntimeError):
+    """会话还在处理上一条输入"""
+
+
+class SessionLimitError(RuntimeError):
+    """会话数达到 GAME_MAX_SESSIONS"""
+
+
+# ============================================================================
+# 数据类
+# ============================================================================
+
+@dataclass
+class TurnOutput:
+    """一次输入之后到下一次等待输入之间的渲染输出"""
+    session_id: str
+    text: str                         # 这期间打印的全部内容（含末尾的输入提示）
+    expects: Optional[str] = None     # 等待的输入类型（INPUT_KINDS 的键）；结束时为 None
+    prompt: str = ""                  # 输入提示文字
+    finished: bool = False            # 游戏已结束 / 会话已关闭
+    step: int = 0                     # 第几次输出（从 1 开始）
+    elapsed_ms: float = 0.0           # 从收到输入到再次等待输入的时间
+    state: Dict[str, Any] = field(default_factory=dict)  # 日期 / 时段 / 阶段 / 玩家位置
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+# ============================================================================
+# 输出路由
+# ============================================================================
+
+class _SessionStdout:
+    """会话线程的输出写入会话缓冲区；其他线程照常输出"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        session = _current_session.get()
+        if session is not None:
+            session.write(text)
+            return len(text)
+        return self._stream.write(text)
+
+    def flush(self):
+        if _current_session.get() is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _install_session_stdout():
+    if not isinstance(sys.stdout, _SessionStdout):
+        sys.stdout = _SessionStdout(sys.stdout)
+
+
+# ============================================================================
+# 会话
+# ============================================================================
+
+class GameSession:
+    """一个玩家的游戏：独立的 WorldState + GameLoopV3，在自己的线程中运行（休眠时只留快照）"""
+
+    def __init__(self, engine: "GameEngine", session_id: str):
+        self.engine = engine
+        self.session_id = session_id
+        self.state_dir = engine.session_dir / session_id
+        self.snapshot_path = engine.session_dir / f"{session_id}.snapshot.json.gz"
+        self.world_state: Optional[WorldState] = None
+        self.game: Optional[GameLoopV3] = None
+
+        self._cond = threading.Condition()
+        self._buffer: List[str] = []
+        self._command: Optional[str] = None
+        self._callback: Optional[Callable[[TurnOutput], None]] = None
+        self._waiting: Optional[tuple] = None   # (提示文字, 输入类型)
+        self._closed = False
+        self._parking = False                   # 正在休眠：游戏线程退出、写快照
+        self._resuming = False                  # 从快照恢复：第一次等待输入时直接取走已提交的输入
+        self._restore_started = 0.0
+        self._received_at = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+
+        self.resident = False                   # 游戏线程与世界状态是否在内存中
+        self.finished = False
+        self.last_output: Optional[TurnOutput] = None
+        self.created_at = time.time()
+        self.last_active = time.monotonic()
+        self.stats = {"inputs": 0, "outputs": 0, "busy_ms": 0.0, "hibernations": 0, "restores": 0}
+
+    @classmethod
+    def load(cls, engine: "GameEngine", session_id: str) -> "GameSession":
+        """从磁盘上的快照建立休眠中的会话（进程重启后接回玩家）"""
+        session = cls(engine, session_id)
+        data = session._read_snapshot()
+        session._waiting = tuple(data["waiting"])
+        session.last_output = TurnOutput(**data["last_output"])
+        session.created_at = data.get("created_at", session.created_at)
+        session.stats.update(data.get("stats", {}))
+        return session
+
+    def _new_world_state(self) -> WorldState:
+        return WorldState(
+            self.engine.project_root, state_dir=self.state_dir, seed_dir=self.engine.project_root / "world_state"
+        )
+
+    # ------------------------------------------------------------------
+    # 游戏线程
+    # ------------------------------------------------------------------
+
+    def start(self, callback: Callable[[TurnOutput], None] = None):
+        """开始新游戏；callback 在第一屏输出就绪时（游戏线程中）调用"""
+        with self._cond:
+            self._callback = callback
+            self.world_state = self._new_world_state()
+            self.resident = True
+            self._start_thread()
+
+    def _start_thread(self, resume: Dict[str, Any] = None):
+        self._thread = threading.Thread(
+            target=self._run, args=(resume,), name=f"GameSession-{self.session_id}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, resume: Dict[str, Any] = None):
+        _current_session.set(self)
+        try:
+            with llm_request(session=self.session_id):  # LLM 名额按会话轮转分配
+                self.game = GameLoopV3(world_state=self.world_state, ask=self._ask, prefetch=self.engine.prefetch)
+                if resume is None:
+                    self.game.run()
+                else:
+                    self.game.resume(resume)
+        except SessionClosed:
+            pass
+        except Exception:
+            self.write(f"\n[错误] 会话异常结束\n{traceback.format_exc()}")
+        finally:
+            try:
+                self.world_state.flush()
+                if self.game is not None:
+                    self.game.close()
+            except Exception as e:
+                print(f"[GameSession] {self.session_id} 状态落盘失败: {e}", file=sys.__stdout__)
+            with self._cond:
+                if self._parking:  # 休眠：不算结束，由 hibernate() 接着写快照
+                    return
+                self.finished = True
+                self._waiting = None
+                output, callback = self._emit()
+            if callback is not None:
+                callback(output)
+
+    def _ask(self, prompt: str, kind: str) -> str:
+        """GameLoopV3 读取输入的位置：交出这一屏输出，阻塞到下一条输入"""
+        callback = None
+        with self._cond:
+            if self._resuming:
+                # 恢复出来的游戏回到了休眠时的提示：这一屏玩家已经看过，直接取走已提交的输入
+                self._resuming = False
+                self._buffer.clear()
+                self._waiting = (prompt, kind)
+                self.engine._record("restore", (time.perf_counter() - self._restore_started) * 1000)
+                self._cond.notify_all()
+            else:
+                self._buffer.append(prompt)
+                self._waiting = (prompt, kind)
+                output, callback = self._emit()
+        if callback is not None:
+            callback(output)
+
+        with self._cond:
+            while self._command is None and not self._closed and not self._parking:
+                self._cond.wait()
+            if self._closed or self._parking:
+                raise SessionClosed()
+            command, self._command = self._command, None
+            self._waiting = None
+            return command
+
+    def _emit(self):
+        """（持锁调用）把缓冲区打包成 TurnOutput，取出待通知的回调"""
+        prompt, kind = self._waiting or ("", None)
+        elapsed = (time.monotonic() - self._received_at) * 1000
+        self.stats["outputs"] += 1
+        self.stats["busy_ms"] += elapsed
+        output = TurnOutput(
+            session_id=self.session_id,
+            text="".join(self._buffer),
+            expects=kind,
+            prompt=prompt.strip(),
+            finished=self.finished,
+            step=self.stats["outputs"],
+            elapsed_ms=round(elapsed, 1),
+            state=self._state(),
+        )
+        self._buffer.clear()
+        self.last_output = output
+        self.last_active = time.monotonic()
+        callback, self._callback = self._callback, None
+        self._cond.notify_all()
+        return output, callback
+
+    def _state(self) -> Dict[str, Any]:
+        try:
+            current_day = self.world_state.get("current_day")
+            return {
+                "day": current_day.get("day"),
+                "period": current_day.get("period"),
+                "phase": current_day.get("phase", "free_time"),
+                "location": self.game.player_location if self.game else None,
+            }
+        except Exception:
+            return {}
+
+    def write(self, text: str):
+        """会话线程的 print 输出（_SessionStdout 调用）"""
+        with self._cond:
+            self._buffer.append(text)
+
+    # ------------------------------------------------------------------
+    # 输入
+    # ------------------------------------------------------------------
+
+    @property
+    def waiting(self) -> Optional[str]:
+        """正在等待的输入类型（游戏正在运行时为 None；休眠中为休眠时等待的类型）"""
+        with self._cond:
+            return self._waiting[1] if self._waiting and self._command is None else None
+
+    def submit(self, command: str, callback: Callable[[TurnOutput], None]):
+        """
+        提交一条输入（立即返回）；游戏再次等待输入或结束时以 TurnOutput 调用 callback
+
+        休眠中的会话先从快照恢复（常驻会话已满时会先休眠别的会话）。
+
+        Raises:
+            SessionBusy: 游戏还在处理上一条输入
+            SessionClosed: 会话已结束
+            SessionLimitError: 需要恢复，但常驻会话已满且没有可休眠的会话
+        """
+        if not self.resident:
+            self.engine._make_room(exclude=self)
+        with self._cond:
+            self._cond.wait_for(lambda: not self._parking)
+            if self.finished or self._closed:
+                raise SessionClosed(f"会话已结束: {self.session_id}")
+            if self._waiting is None or self._command is not None:
+                raise SessionBusy(f"会话正在处理上一条输入: {self.session_id}")
+            self._command = str(command)
+            self._callback = callback
+            self._received_at = time.monotonic()
+            self.stats["inputs"] += 1
+            self.last_active = time.monotonic()
+            if not self.resident:
+                try:
+                    self._restore()
+                except Exception:
+                    self._command, self._callback = None, None
+                    self.stats["inputs"] -= 1
+                    raise
+            self._cond.notify_all()
+
+    def send(self, command: str, timeout: Optional[float] = None) -> TurnOutput:
+        """提交输入并等待下一屏输出（同步版本）"""
+        done = threading.Event()
+        result: List[TurnOutput] = []
+
+        def callback(output: TurnOutput):
+            result.append(output)
+            done.set()
+
+        self.submit(command, callback)
+        if not done.wait(timeout):
+            raise TimeoutError(f"会话 {self.session_id} 在 {timeout} 秒内没有再次等待输入")
+        return result[0]
+
+    def _ready(self) -> bool:
+        return self.finished or bool(self._waiting and self._command is None and not self._resuming)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> TurnOutput:
+        """等到游戏在等待输入（或已结束 / 休眠中），返回最近一屏输出"""
+        with self._cond:
+            if not self._cond.wait_for(self._ready, timeout):
+                raise TimeoutError(f"会话 {self.session_id} 在 {timeout} 秒内没有就绪")
+            return self.last_output
+
+    async def asend(self, command: str) -> TurnOutput:
+        """提交输入并等待下一屏输出（asyncio 版本，不占用事件循环线程）"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        callback = lambda output: loop.call_soon_threadsafe(_resolve, future, output)
+        if self.resident:
+            self.submit(command, callback)
+        else:
+            # 恢复会读快照、可能先休眠别的会话（磁盘 IO），放到线程池里做
+            await loop.run_in_executor(None, self.submit, command, callback)
+        return await future
+
+    async def aready(self) -> TurnOutput:
+        """等到第一屏输出（asyncio 版本）"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if self._ready():
+                return self.last_output
+            self._callback = lambda output: loop.call_soon_threadsafe(_resolve, future, output)
+        return await future
+
+    # ------------------------------------------------------------------
+    # 休眠 / 恢复
+    # ------------------------------------------------------------------
+
+    @property
+    def hibernatable(self) -> bool:
+        """停在回合之间等待「继续?」（世界状态已落盘，没有进行中的场景）"""
+        with self._cond:
+            return (
+                self.resident and not self.finished and not self._closed and not self._parking
+                and self._waiting is not None and self._command is None
+                and self.game is not None and self.game.at_turn_boundary
+            )
+
+    def hibernate(self, reason: str = "idle") -> bool:
+        """
+        写快照并释放内存（游戏线程结束，世界状态与组件随之回收）
+
+        Returns:
+            是否已休眠（不在回合之间、正在处理输入时返回 False）
+        """
+        start = time.perf_counter()
+        with self._cond:
+            if not self.hibernatable:
+                return False
+            self._parking = True
+            self._cond.notify_all()
+            thread = self._thread
+        thread.join()
+
+        self.stats["hibernations"] += 1
+        try:
+            size = self._write_snapshot()
+        except Exception as e:
+            self.stats["hibernations"] -= 1
+            # 快照写不出来就保持常驻：重新开一个游戏线程回到同一个提示
+            print(f"[GameSession] {self.session_id} 快照写入失败，保持常驻: {e}", file=sys.__stdout__)
+            with self._cond:
+                self._parking = False
+                self._resuming = True
+                self._restore_started = time.perf_counter()
+                self._start_thread(self.game.snapshot())
+                self._cond.notify_all()
+            return False
+
+        with self._cond:
+            self.game = None
+            self.world_state = None
+            self._thread = None
+            self.resident = False
+            self._parking = False
+            self._cond.notify_all()
+        self.engine._record("hibernate", (time.perf_counter() - start) * 1000, reason=reason, size=size)
+        return True
+
+    def _write_snapshot(self) -> int:
+        """把会话目录中的世界状态与游戏进度打包成一个 gzip 文件，删除会话目录；返回快照字节数"""
+        documents = {}
+        if self.state_dir.exists():
+            for path in sorted(self.state_dir.glob("*.json")):
+                with open(path, 'r', encoding='utf-8') as f:
+                    documents[path.stem] = json.load(f)
+        data = {
+            "format": SNAPSHOT_FORMAT,
+            "session_id": self.session_id,
+            "created_at": self.created_at,
+            "game": self.game.snapshot(),
+            "waiting": list(self._waiting),
+            "last_output": self.last_output.to_dict(),
+            "stats": self.stats,
+            "documents": documents,
+        }
+        payload = gzip.compress(
+            json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), compresslevel=6
+        )
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, self.snapshot_path)
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+        return len(payload)
+
+    def _read_snapshot(self) -> Dict[str, Any]:
+        with open(self.snapshot_path, 'rb') as f:
+            data = json.loads(gzip.decompress(f.read()).decode("utf-8"))
+        if data.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"不支持的会话快照格式: {data.get('format')}")
+        return data
+
+    def _restore(self):
+        """（持锁调用）把快照展开回会话目录，在新线程中恢复游戏；休眠时的提示会直接取走已提交的输入"""
+        self._restore_started = time.perf_counter()
+        data = self._read_snapshot()
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        for name, document in data["documents"].items():
+            with open(self.state_dir / f"{name}.json", 'w', encoding='utf-8') as f:
+                json.dump(document, f, ensure_ascii=False, indent=2)
+        self.snapshot_path.unlink()
+
+        self.world_state = self._new_world_state()
+        self.resident = True
+        self._resuming = True
+        self.stats["restores"] += 1
+        self._start_thread(data["game"])
+
+    # ------------------------------------------------------------------
+    # 关闭
+    # ------------------------------------------------------------------
+
+    def close(self, timeout: float = 5.0):
+        """关闭会话：等待输入中的游戏线程立即结束；正在调用 LLM 的会在本次调用返回后结束"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "resident": self.resident,
+            "finished": self.finished,
+            "waiting": self.waiting,
+            "idle_s": round(time.monotonic() - self.last_active, 1),
+            **self.stats,
+        }
+
+
+def _resolve(future: asyncio.Future, output: TurnOutput):
+    if not future.done():
+        future.set_result(output)
+
+
+def _rss_bytes() -> Optional[int]:
+    """进程当前常驻内存（Linux 读 /proc；其他平台返回 None，内存预算不生效）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))]
+
+
+# ============================================================================
+# 引擎
+# ============================================================================
+
+class GameEngine:
+    """多会话游戏引擎 - 会话的创建 / 查找 / 休眠 / 关闭，共享只读世界数据"""
+
+    def __init__(self, project_root: Path = None, session_dir: str = GAME_SESSION_DIR,
+                 max_sessions: int = GAME_MAX_SESSIONS, prefetch: bool = GAME_SESSION_PREFETCH,
+                 idle_hibernate_s: float = GAME_IDLE_HIBERNATE_S, memory_budget_mb: float = GAME_MEMORY_BUDGET_MB,
+                 sweep_interval_s: float = GAME_SWEEP_INTERVAL_S):
+        """
+        Args:
+            max_sessions: 常驻内存的会话上限（休眠中的会话不计入）
+            idle_hibernate_s: 回合之间空闲多久后休眠（0 = 不按空闲休眠）
+            memory_budget_mb: 进程 RSS 超出时按最近使用时间休眠会话（0 = 不限）
+            sweep_interval_s: 后台检查空闲 / 内存预算的间隔
+        """
+        self.project_root = Path(project_root or Path(__file__).parent)
+        self.session_dir = Path(session_dir) if Path(session_dir).is_absolute() else self.project_root / session_dir
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+        self.max_sessions = max_sessions
+        self.prefetch = prefetch
+        self.idle_hibernate_s = idle_hibernate_s
+        self.memory_budget_mb = memory_budget_mb
+
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, GameSession] = {}
+        self.stats = {
+            "created": 0, "closed": 0, "rejected": 0, "loaded": 0,
+            "hibernations": {}, "restores": 0, "snapshot_bytes": 0,
+        }
+        self._latency = {"hibernate": deque(maxlen=1000), "restore": deque(maxlen=1000)}
+
+        # 只读世界数据在第一个会话之前加载好，之后所有会话共用
+        start = time.perf_counter()
+        get_world_bundle(self.project_root)
+        get_world_loader(project_root=self.project_root)
+        registry = get_character_registry(self.project_root)
+        registry.cards_text()
+        self.warmup_ms = (time.perf_counter() - start) * 1000
+        self._baseline_rss = _rss_bytes()  # 没有会话时的内存，用来估算每个会话的占用
+
+        _install_session_stdout()
+
+        self._stop = threading.Event()
+        if (idle_hibernate_s > 0 or memory_budget_mb > 0) and sweep_interval_s > 0:
+            threading.Thread(
+                target=self._sweep_loop, args=(sweep_interval_s,), name="GameEngine-sweep", daemon=True
+            ).start()
+
+    def create_session(self, session_id: str = None, callback: Callable[[TurnOutput], None] = None) -> GameSession:
+        """
+        新建会话并开始新游戏（立即返回；第一屏输出用 callback / wait_ready / aready 获取）
+
+        同一 ID 的旧状态目录会被新游戏的重置覆盖；仍有快照（休眠中）的 ID 视为已存在。
+        """
+        if session_id is None:
+            session_id = uuid.uuid4().hex[:12]
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"无效的会话ID: {session_id!r}")
+        self._make_room()
+        with self._lock:
+            if session_id in self._sessions or (self.session_dir / f"{session_id}.snapshot.json.gz").exists():
+                raise ValueError(f"会话已存在: {session_id}")
+            if self._resident_count() >= self.max_sessions:
+                self.stats["rejected"] += 1
+                raise SessionLimitError(f"常驻会话数已达上限 {self.max_sessions}")
+            session = GameSession(self, session_id)
+            self._sessions[session_id] = session
+            self.stats["created"] += 1
+        session.start(callback)
+        return session
+
+    def get(self, session_id: str) -> GameSession:
+        """查找会话；内存里没有但磁盘上有快照时（进程重启后）以休眠状态接回"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is not None:
+            return session
+        if not SESSION_ID_PATTERN.match(session_id) or \
+                not (self.session_dir / f"{session_id}.snapshot.json.gz").exists():
+            raise KeyError(session_id)
+        try:
+            loaded = GameSession.load(self, session_id)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[GameEngine] 会话快照无法读取 {session_id}: {e}")
+            raise KeyError(session_id)
+        with self._lock:
+            session = self._sessions.setdefault(session_id, loaded)
+            if session is loaded:
+                self.stats["loaded"] += 1
+        return session
+
+    def close(self, session_id: str):
+        """结束会话（休眠中的会话删除其快照）"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self.stats["closed"] += 1
+        if session is not None:
+            session.close()
+            session.snapshot_path.unlink(missing_ok=True)
+
+    def close_all(self, hibernate: bool = True):
+        """
+        关闭所有会话（进程退出时调用）
+
+        hibernate=True 时停在回合之间的会话先写快照，重启后可用同一 ID 接着玩。
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self.stats["closed"] += len(sessions)
+        self._stop.set()
+        for session in sessions:
+            if not (hibernate and session.hibernate("shutdown")):
+                session.close(timeout=1.0)
+                if not hibernate:
+                    session.snapshot_path.unlink(missing_ok=True)
+
+    def sessions(self) -> List[GameSession]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    # ------------------------------------------------------------------
+    # 休眠策略
+    # ------------------------------------------------------------------
+
+    def _resident_count(self) -> int:
+        """（持锁调用）"""
+        return sum(1 for session in self._sessions.values() if session.resident)
+
+    def _lru_candidates(self, exclude: GameSession = None) -> List[GameSession]:
+        """可休眠的常驻会话，最久未用的在前"""
+        return sorted(
+            (s for s in self.sessions() if s is not exclude and s.hibernatable),
+            key=lambda s: s.last_active
+        )
+
+    def _make_room(self, exclude: GameSession = None):
+        """常驻会话已满时休眠最久未用的会话；没有可休眠的会话时抛 SessionLimitError"""
+        while True:
+            with self._lock:
+                if self._resident_count() < self.max_sessions:
+                    return
+            candidates = self._lru_candidates(exclude)
+            if not candidates:
+                with self._lock:
+                    self.stats["rejected"] += 1
+                raise SessionLimitError(f"常驻会话数已达上限 {self.max_sessions}，且没有可休眠的会话")
+            candidates[0].hibernate("lru")
+
+    def _memory_excess(self) -> int:
+        """内存超出预算时需要休眠的会话数（按平均每个常驻会话的占用估算）"""
+        rss = _rss_bytes()
+        if not self.memory_budget_mb or rss is None:
+            return 0
+        budget = self.memory_budget_mb * 1024 * 1024
+        if rss <= budget:
+            return 0
+        with self._lock:
+            resident = self._resident_count()
+        per_session = max((rss - (self._baseline_rss or 0)) / max(resident, 1), 256 * 1024)
+        return math.ceil((rss - budget) / per_session)
+
+    def sweep(self) -> int:
+        """休眠空闲超时的会话，再按内存预算休眠最久未用的会话；返回本次休眠数"""
+        count = 0
+        if self.idle_hibernate_s > 0:
+            now = time.monotonic()
+            for session in self._lru_candidates():
+                if now - session.last_active < self.idle_hibernate_s:
+                    break
+                count += session.hibernate("idle")
+        excess = self._memory_excess()
+        if excess:
+            for session in self._lru_candidates()[:excess]:
+                count += session.hibernate("memory")
+        return count
+
+    def _sweep_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[GameEngine] 休眠检查失败: {e}")
+
+    def _record(self, kind: str, ms: float, reason: str = None, size: int = 0):
+        with self._lock:
+            self._latency[kind].append(ms)
+            if kind == "hibernate":
+                self.stats["hibernations"][reason] = self.stats["hibernations"].get(reason, 0) + 1
+                self.stats["snapshot_bytes"] += size
+            else:
+                self.stats["restores"] += 1
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def report(self) -> Dict[str, Any]:
+        sessions = self.sessions()
+        resident = [s for s in sessions if s.resident]
+        with self._lock:
+            latency = {kind: list(values) for kind, values in self._latency.items()}
+            stats = {**self.stats, "hibernations": dict(self.stats["hibernations"])}
+        rss = _rss_bytes()
+        report = {
+            "sessions": len(sessions),
+            "resident": len(resident),
+            "hibernated": len(sessions) - len(resident),
+            "waiting": sum(1 for s in resident if s.waiting),
+            "running": sum(1 for s in resident if not s.waiting and not s.finished),
+            "finished": sum(1 for s in sessions if s.finished),
+            "threads": threading.active_count(),
+            "rss_mb": round(rss / 1024 / 1024, 1) if rss else None,
+            "warmup_ms": round(self.warmup_ms, 1),
+            **stats,
+        }
+        for kind, values in latency.items():
+            report[f"{kind}_ms"] = {
+                "p50": round(_percentile(values, 0.5), 1),
+                "p95": round(_percentile(values, 0.95), 1),
+                "n": len(values),
+            }
+        return report
+
+
+# 全局实例
+_engines: Dict[Path, GameEngine] = {}
+_engines_lock = threading.Lock()
+
+def get_game_engine(project_root: Path = None) -> GameEngine:
+    """获取游戏引擎单例（按项目根目录）"""
+    root = Path(project_root or Path(__file__).parent).resolve()
+    with _engines_lock:
+        if root not in _engines:
+            _engines[root] = GameEngine(root)
+        return _engines[root]
+
+
+# ============================================================================
+# 自动输入（压测 / 冒烟测试）
+# ============================================================================
+
+def auto_input(output: TurnOutput, rng: random.Random) -> str:
+    """按这一屏等待的输入类型随机给出一个合法输入（确认继续时总是 y）"""
+    kind = output.expects
+    if kind in ("location", "action", "vote"):
+        numbers = re.findall(r"^\s*(\d+)\. ", output.text, flags=re.M)
+        numbers = [n for n in numbers if n != "0"] or ["0"]
+        return rng.choice(numbers)
+    if kind == "choice":
+        return rng.choice(["A", "B", "C"])
+    if kind == "confirm":
+        return "y"
+    if kind == "text":
+        return "……我在听。"
+    return ""
@@ -2,12 +2,12 @@
 游戏主循环 - 整合中控API、导演API、角色API
 """
 
-import anthropic
 import json
 import yaml
 import time
 from pathlib import Path
-from config import get_api_key, MODEL, MAX_TOKENS, ENABLE_CACHE, OUTPUT_DIR
+from config import MODEL, MAX_TOKENS, ENABLE_CACHE, OUTPUT_DIR
+from api.llm_gateway import get_gateway
 
 
 # ============================================
@@ -203,8 +203,8 @@ def call_controller_api():
 必须包含：aima, hiro, melulu, hanna, noah, leya, koyuki, seira, maki, rena, yuki, tsubasa, mira"""
 
     # 调用API
-    client = anthropic.Anthropic(api_key=get_api_key("controller"))
-    response = client.messages.create(
+    response = get_gateway().create(
+        "controller",
         model=MODEL,
         max_tokens=2048,
         messages=[{"role": "user", "content": prompt}]
@@ -309,8 +309,8 @@ def call_director_api(character_id):
   "recommended_bgm": "音乐名"
 }}"""
 
-    client = anthropic.Anthropic(api_key=get_api_key("director"))
-    response = client.messages.create(
+    response = get_gateway().create(
+        "director",
         model=MODEL,
         max_tokens=2048,
         messages=[{"role": "user", "content": prompt}]
@@ -421,8 +421,8 @@ def call_character_api(character_id, player_input):
   "new_memory": "新记忆"
 }}"""
 
-    client = anthropic.Anthropic(api_key=get_api_key("character"))
-    response = client.messages.create(
+    response = get_gateway().create(
+        "character",
         model=MODEL,
         max_tokens=1024,
         messages=[{"role": "user", "content": prompt}]
@@ -2,11 +2,11 @@
 # 游戏主循环 v2 - 整合导演API v2、事件系统、地点系统
 # ============================================================================
 
-import anthropic
 import json
 import yaml
 from pathlib import Path
-from config import get_api_key, MODEL, MAX_TOKENS, OUTPUT_DIR
+from config import MODEL, MAX_TOKENS, OUTPUT_DIR
+from api.llm_gateway import get_gateway
 from director_api_v2 import DirectorAPIv2, EventResult, EventManager
 
 
@@ -300,8 +300,8 @@ def call_character_api(char_id: str, player_input: str) -> dict:
 }}"""
 
     try:
-        client = anthropic.Anthropic(api_key=get_api_key("character"))
-        response = client.messages.create(
+        response = get_gateway().create(
+            "character",
             model=MODEL,
             max_tokens=512,
             messages=[{"role": "user", "content": prompt}]
@@ -5,22 +5,29 @@
 # 流程：大纲生成 → 时段循环 → 导演规划 → 角色演出 → 结局判定
 # 【v9新增】世界观约束、事件树引擎、场景验证
 # 【v10新增】NPC自动移动系统
+# 输入经 GameLoopV3.ask 读取：终端用 input()，多会话服务器由 game_engine.py 注入（世界状态按会话隔离）
 # ============================================================================
 
 import json
-import yaml
 import random
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Mapping, Optional, Any
 
 # 导入API模块
 from api import DirectorPlanner, CharacterActor, ScenePlan, Beat, DialogueOutput
 from api import StoryPlanner, EndingType
 from api.fixed_event_manager import FixedEventManager
-from config import get_api_key, MODEL, OUTPUT_DIR
+from api.npc_table import NPCMovement
+from config import get_api_key, MODEL, OUTPUT_DIR, ENABLE_STREAMING, ENABLE_PREFETCH
 
 # 【v9新增】世界观库模块
 from api import WorldLoader, get_world_loader, EventTreeEngine
+from api.scene_prefetcher import ScenePrefetcher
+from api.response_cache import get_response_cache
+from api.llm_gateway import get_gateway
+from api.world_state import WorldState, get_world_state
+from api.world_bundle import get_world_bundle
+from api.jp_translator import get_jp_translator
 
 
 # ============================================================================
@@ -48,6 +55,17 @@ PHASE_NAMES = {
     "ending": "结局"
 }
 
+# 等待玩家输入的类型（无界面运行时告诉前端该显示什么控件，见 game_engine.py）
+INPUT_KINDS = {
+    "location": "地点编号（0 = 待在原地）",
+    "continue": "按 Enter 继续",
+    "choice": "选项 A/B/C/D/Q",
+    "text": "自由输入的台词",
+    "confirm": "是否继续 y/n",
+    "action": "调查行动编号",
+    "vote": "投票的角色编号",
+}
+
 
 # ============================================================================
 # 工具函数
@@ -62,8 +80,7 @@ def save_json(filepath: str, data: dict):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 def load_yaml(filepath: str) -> dict:
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    return get_world_bundle().load_yaml(filepath)
 
 
 # ============================================================================
@@ -77,9 +94,9 @@ def display_header():
     print("   三层导演架构: StoryPlanner + DirectorPlanner + Actor")
     print("=" * 60)
 
-def display_time(project_root: Path):
+def display_time(world_state: WorldState):
     """显示当前时间"""
-    current_day = load_json(project_root / "world_state" / "current_day.json")
+    current_day = world_state.get("current_day")
     period = current_day.get("period", "dawn")
     phase = current_day.get("phase", "free_time")
 
@@ -89,9 +106,9 @@ def display_time(project_root: Path):
     print(f"\n[第{current_day['day']}天 - {period_cn}] ({phase_cn})")
     print(f"   事件计数: {current_day.get('event_count', 0)}")
 
-def display_world_state(project_root: Path):
+def display_world_state(world_state: WorldState):
     """显示世界状态"""
-    character_states = load_json(project_root / "world_state" / "character_states.json")
+    character_states = world_state.get("character_states")
 
     # 按地点分组
     loc_chars = {}
@@ -162,23 +179,30 @@ def display_dialogue(dialogue_output: DialogueOutput, show_jp: bool = False):
     print("\n" + "-" * 50)
 
     for line in dialogue_output.dialogue:
-        speaker = line.speaker
-        text_cn = line.text_cn
-        text_jp = line.text_jp
-        emotion = line.emotion
-        action = line.action
-
-        if speaker == "narrator":
-            print(f"\n  {text_cn}")
-            if show_jp and text_jp != text_cn:
-                print(f"  [JP] {text_jp}")
-        else:
-            emotion_mark = f" [{emotion}]" if emotion else ""
-            action_mark = f" *{action}*" if action else ""
-            print(f"\n[{speaker}{emotion_mark}]{action_mark}")
-            print(f"  {text_cn}")
-            if show_jp and text_jp:
-                print(f"  [TTS] {text_jp}")
+        display_dialogue_line(line, show_jp)
+
+def display_dialogue_line(line, show_jp: bool = False):
+    """显示单行对话（流式模式下逐行调用）"""
+    speaker = line.speaker
+    text_cn = line.text_cn
+    text_jp = line.text_jp
+    if show_jp and not text_jp:
+        # LAZY_JP：日文只在需要显示时生成（已预取的台词取缓存，或只等待所在批次）
+        text_jp = get_jp_translator().get(line)
+    emotion = line.emotion
+    action = line.action
+
+    if speaker == "narrator":
+        print(f"\n  {text_cn}")
+        if show_jp and text_jp != text_cn:
+            print(f"  [JP] {text_jp}")
+    else:
+        emotion_mark = f" [{emotion}]" if emotion else ""
+        action_mark = f" *{action}*" if action else ""
+        print(f"\n[{speaker}{emotion_mark}]{action_mark}")
+        print(f"  {text_cn}")
+        if show_jp and text_jp:
+            print(f"  [TTS] {text_jp}")
 
 def display_choices(choice_point: Dict):
     """显示选项"""
@@ -239,26 +263,50 @@ def display_ending(ending_type: str, ending_info: Dict):
 class GameLoopV3:
     """游戏主循环 v3 - 三层架构（故事规划 + 导演规划 + 角色演出 + 世界观库）"""
 
-    def __init__(self):
+    # 三层的实现（无界面模拟器 simulate_playthroughs.py 换成不调用 LLM 的版本）
+    story_planner_class = StoryPlanner
+    director_planner_class = DirectorPlanner
+    character_actor_class = CharacterActor
+
+    def __init__(self, world_state: WorldState = None, ask: Callable[[str, str], str] = None,
+                 prefetch: bool = ENABLE_PREFETCH):
+        """
+        Args:
+            world_state: 世界状态（默认为全局实例；多会话时每个会话传入自己的实例）
+            ask: 读取玩家输入的函数 (提示文字, 输入类型) -> 输入，默认从终端读取
+            prefetch: 是否在玩家阅读时后台预取场景
+        """
         self.project_root = Path(__file__).parent
-        self.story_planner = StoryPlanner(self.project_root)  # 故事规划层
-        self.planner = DirectorPlanner(self.project_root)      # 导演规划层
-        self.actor = CharacterActor(self.project_root)         # 角色演出层
-        self.fixed_event_manager = FixedEventManager(self.project_root)  # 固定事件管理器
+        self.world_state = world_state or get_world_state(self.project_root)  # 世界状态（内存权威副本，回合边界落盘）
+        self._ask = ask or (lambda prompt, kind: input(prompt))
+        self.story_planner = self.story_planner_class(self.project_root, self.world_state)  # 故事规划层
+        self.planner = self.director_planner_class(self.project_root, self.world_state)      # 导演规划层
+        self.actor = self.character_actor_class(self.project_root, self.world_state)         # 角色演出层
+        self.fixed_event_manager = FixedEventManager(self.project_root, self.world_state)  # 固定事件管理器
         self.locations = load_yaml(self.project_root / "world_state" / "locations.yaml")
 
         # 【v9新增】世界观库
         self.world_loader = get_world_loader(project_root=self.project_root)
-        self.event_engine = EventTreeEngine(self.world_loader, self.project_root)
+        self.event_engine = self.planner.event_engine  # 与导演规划层共用（条件依赖索引只维护一份）
 
         # 【v10新增】NPC行为配置
         self.npc_behavior = self._load_npc_behavior()
+        self.npc_movement = NPCMovement(self.npc_behavior)
 
         self.player_location = "牢房区"
         self.running = True
+        self.at_turn_boundary = False  # 正在回合之间等待「继续?」（此时可保存会话）
         self.current_scene_plan: Optional[ScenePlan] = None
         self.pregenerated_responses: Dict = {}
         self.show_jp_text = False  # 是否显示日文（调试用）
+        self.stream_dialogue = ENABLE_STREAMING  # 流式逐行显示对话
+
+        # 场景预取：玩家阅读时后台生成候选地点的场景
+        self.prefetcher = ScenePrefetcher(self.planner, self.actor, self.project_root) if prefetch else None
+
+    def ask(self, prompt: str, kind: str) -> str:
+        """等待玩家输入（kind 见 INPUT_KINDS）"""
+        return self._ask(prompt, kind)
 
     def _load_npc_behavior(self) -> Dict:
         """【v10新增】加载NPC行为配置"""
@@ -272,68 +320,17 @@ class GameLoopV3:
         }
 
     def _maybe_move_npcs(self, period: str = "morning"):
-        """【v10新增】随机移动部分 NPC"""
-        states_path = self.project_root / "world_state" / "character_states.json"
-        states = load_json(states_path)
-
-        # 获取移动配置
-        movement_config = self.npc_behavior.get("movement", {})
-        base_chance = movement_config.get("base_chance", 0.3)
-        period_modifiers = movement_config.get("period_modifiers", {})
-        move_chance = period_modifiers.get(period, base_chance)
-
-        location_prefs = self.npc_behavior.get("location_preferences", {})
-        all_locations = self.npc_behavior.get("all_locations", ["食堂", "牢房区", "图书室", "庭院", "走廊"])
+        """【v10新增】随机移动部分 NPC（概率矩阵见 api/npc_table.py）"""
+        states = self.world_state.get("character_states")
 
-        moved_chars = []
-
-        for char_id, state in states.items():
-            if char_id == "aima":  # 玩家不自动移动
-                continue
-            if state.get("status") != "alive":
-                continue
-
-            # 获取角色偏好
-            char_pref = location_prefs.get(char_id, {})
-            stay_chance = char_pref.get("stay_chance", 0)
-
-            # 如果角色倾向待在原地
-            if random.random() < stay_chance:
-                continue
-
-            # 概率移动
-            if random.random() < move_chance:
-                old_location = state.get("location", "牢房区")
-
-                # 根据偏好选择新位置
-                new_location = self._select_npc_destination(char_id, old_location, char_pref, all_locations)
-
-                if new_location != old_location:
-                    state["location"] = new_location
-                    moved_chars.append(char_id)
+        table = self.npc_movement.load([states])
+        moved = self.npc_movement.step(table, period)
+        moved_chars = table.apply_to([states], moved)[0]
 
         if moved_chars:
-            save_json(states_path, states)
+            self.world_state.mark_dirty("character_states")
             print(f"[系统] {len(moved_chars)} 名角色移动了位置")
 
-    def _select_npc_destination(self, char_id: str, current_location: str, pref: Dict, all_locations: List[str]) -> str:
-        """【v10新增】根据角色偏好选择移动目的地"""
-        preferred = pref.get("preferred", [])
-        avoid = pref.get("avoid", [])
-
-        # 70% 去偏好地点，30% 随机
-        if preferred and random.random() < 0.7:
-            available = [loc for loc in preferred if loc != current_location and loc not in avoid]
-            if available:
-                return random.choice(available)
-
-        # 随机选择（排除当前位置和回避地点）
-        available = [loc for loc in all_locations if loc != current_location and loc not in avoid]
-        if available:
-            return random.choice(available)
-
-        return current_location
-
     def _display_arc_info(self, day: int):
         """【v9新增】显示当前arc阶段信息"""
         arc = self.world_loader.get_arc_for_day(day)
@@ -387,11 +384,10 @@ class GameLoopV3:
             "triggered_events": [],
             "next_event": None
         }
-        save_json(self.project_root / "world_state" / "current_day.json", initial_day_state)
+        self.world_state.set("current_day", initial_day_state)
 
         # 重置 character_states.json
-        character_states_path = self.project_root / "world_state" / "character_states.json"
-        character_states = load_json(character_states_path)
+        character_states = self.world_state.get("character_states")
 
         # 初始角色状态（基础stress/madness值）
         initial_stats = {
@@ -424,17 +420,16 @@ class GameLoopV3:
             state["is_victim"] = False
             state["magic_revealed"] = False
 
-        save_json(character_states_path, character_states)
+        self.world_state.mark_dirty("character_states")
 
         # 【v9新增】重置 scene_history.json
-        scene_history_path = self.project_root / "world_state" / "scene_history.json"
         initial_scene_history = {
             "scenes": [],
             "location_last_used": {},
             "character_last_focus": {},
             "activity_last_used": {}
         }
-        save_json(scene_history_path, initial_scene_history)
+        self.world_state.set("scene_history", initial_scene_history)
 
         print("[系统] 游戏状态已重置完成（含世界观库v9）")
 
@@ -449,38 +444,112 @@ class GameLoopV3:
         print("\n[系统] 正在生成三天大纲...")
         self.story_planner.generate_three_day_outline()
         print("[系统] 大纲生成完成!")
+        self.world_state.flush()
 
         # 【v9新增】显示第一天arc信息
-        current_day_data = load_json(self.project_root / "world_state" / "current_day.json")
+        current_day_data = self.world_state.get("current_day")
         self._display_arc_info(current_day_data.get("day", 1))
 
         self._last_displayed_day = current_day_data.get("day", 1)  # 记录上次显示的日期
 
-        while self.running:
-            try:
-                self.game_turn()
-            except KeyboardInterrupt:
-                print("\n\n游戏中断，感谢游玩!")
-                break
-            except Exception as e:
-                print(f"\n[错误] {e}")
-                import traceback
-                traceback.print_exc()
+        self._main_loop()
 
-            if not self.running:
-                break
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        世界状态之外的游戏进度（回合之间调用；世界状态本身已在回合边界落盘）
 
-            # 询问继续
-            cont = input("\n继续? (y/n): ").strip().lower()
+        与 resume() 配对：多会话服务器休眠空闲会话时保存，恢复时传回。
+        """
+        return {
+            "player_location": self.player_location,
+            "last_displayed_day": getattr(self, "_last_displayed_day", None),
+            "show_jp_text": self.show_jp_text,
+            "stream_dialogue": self.stream_dialogue,
+        }
+
+    def resume(self, snapshot: Dict[str, Any]):
+        """从 snapshot() 恢复并继续游戏（不重置状态、不生成大纲），从回合之间的「继续?」提示开始"""
+        self.player_location = snapshot.get("player_location", self.player_location)
+        if snapshot.get("last_displayed_day") is not None:
+            self._last_displayed_day = snapshot["last_displayed_day"]
+        self.show_jp_text = snapshot.get("show_jp_text", self.show_jp_text)
+        self.stream_dialogue = snapshot.get("stream_dialogue", self.stream_dialogue)
+        self._main_loop(resumed=True)
+
+    def _main_loop(self, resumed: bool = False):
+        """回合循环；resumed=True 时跳过第一个回合，直接询问是否继续"""
+        while self.running:
+            if not resumed:
+                try:
+                    self.game_turn()
+                except KeyboardInterrupt:
+                    print("\n\n游戏中断，感谢游玩!")
+                    break
+                except Exception as e:
+                    print(f"\n[错误] {e}")
+                    import traceback
+                    traceback.print_exc()
+                finally:
+                    # 回合边界：本回合所有修改统一落盘
+                    self.world_state.flush()
+
+                if not self.running:
+                    break
+
+                # 玩家阅读/确认期间，后台预取下一回合的候选场景
+                self._start_prefetch()
+            resumed = False
+
+            # 询问继续（回合之间：世界状态已落盘，可以安全地保存 / 恢复会话）
+            self.at_turn_boundary = True
+            try:
+                cont = self.ask("\n继续? (y/n): ", "confirm").strip().lower()
+            finally:
+                self.at_turn_boundary = False
             if cont != 'y':
                 print("\n游戏暂停，感谢游玩!")
                 break
 
+        if self.prefetcher:
+            self.prefetcher.discard_all()
+            self.prefetcher.print_report()
+        self.event_engine.print_trigger_stats()
+        get_response_cache(self.project_root).print_report()
+        get_gateway().scheduler.print_report()
+        get_gateway().keys.print_report()
+        self.world_state.flush()
+
+    def close(self):
+        """释放后台资源（预取任务、演出层线程池）；会话休眠或关闭时调用"""
+        if self.prefetcher:
+            self.prefetcher.discard_all()
+        self.actor.close()
+
+    def _start_prefetch(self):
+        """下一回合是自由行动时，开始预取候选地点的场景"""
+        if not self.prefetcher:
+            return
+
+        current_day_data = self.world_state.get("current_day")
+        if current_day_data.get("phase", "free_time") != "free_time":
+            return
+
+        locations = [
+            loc_data.get("name_cn", loc_id)
+            for loc_id, loc_data in self.locations.get("locations", {}).items()
+            if not loc_data.get("locked", False)
+        ]
+        # 有待触发的固定事件时不预取（检查的调试输出会被静音）
+        self.prefetcher.start(
+            locations,
+            guard=lambda: self.fixed_event_manager.get_pending_fixed_event() is None
+        )
+
     def game_turn(self):
         """一个游戏回合"""
 
         # 0. 加载当前状态
-        current_day_data = load_json(self.project_root / "world_state" / "current_day.json")
+        current_day_data = self.world_state.get("current_day")
         current_day = current_day_data.get('day', 1)
         print(f"[DEBUG] game_turn() 开始: day={current_day}, period={current_day_data.get('period')}, event_count={current_day_data.get('event_count')}")
 
@@ -504,13 +573,15 @@ class GameLoopV3:
             return
 
         # 1. 显示时间
-        display_time(self.project_root)
+        display_time(self.world_state)
 
         # 2. 显示世界状态
-        display_world_state(self.project_root)
+        display_world_state(self.world_state)
 
         # 3. 检查是否处于特殊阶段
         phase = current_day_data.get("phase", "free_time")
+        if phase != "free_time" and self.prefetcher:
+            self.prefetcher.discard_all()
         if phase == "investigation":
             self.run_investigation()
             return
@@ -521,15 +592,19 @@ class GameLoopV3:
         # === 新增：检查固定事件 ===
         fixed_event = self.fixed_event_manager.get_pending_fixed_event()
         if fixed_event:
+            if self.prefetcher:
+                self.prefetcher.discard_all()
             self._run_fixed_event(fixed_event)
             return
 
         # 4. 玩家选择地点
         menu = display_location_menu(self.locations, phase)
 
-        choice = input("\n输入数字: ").strip()
+        choice = self.ask("\n输入数字: ", "location").strip()
 
         if choice == "0":
+            if self.prefetcher:
+                self.prefetcher.discard_all()
             print("\n你决定待在原地...")
             self._increment_event_count()
             self._check_and_advance()
@@ -545,34 +620,61 @@ class GameLoopV3:
                 print(f"\n你来到了 {loc_name}...")
             else:
                 print("\n无效选择，待在原地...")
+                if self.prefetcher:
+                    self.prefetcher.discard_all()
                 self._increment_event_count()
                 self._check_and_advance()
                 return
         except:
+            if self.prefetcher:
+                self.prefetcher.discard_all()
             print("\n无效选择，待在原地...")
             self._increment_event_count()
             self._check_and_advance()
             return
 
-        # 5. 调用导演规划层
-        print("\n[导演] 正在规划场景...")
-        scene_plan = self.planner.plan_scene(
-            location=self.player_location,
-            scene_type="free"
-        )
+        # 5. 调用导演规划层（预取命中时直接使用后台已生成的场景）
+        prefetched = self.prefetcher.take(self.player_location) if self.prefetcher else None
+        if prefetched:
+            scene_plan = prefetched.scene_plan
+        else:
+            print("\n[导演] 正在规划场景...")
+            scene_plan = self.planner.plan_scene(
+                location=self.player_location,
+                scene_type="free"
+            )
         self.current_scene_plan = scene_plan
 
         # 6. 显示场景规划
         display_scene_plan(scene_plan)
 
         # 7. 一次性生成所有 Beat 的对话和预选回应（v6优化：零延迟）
+        if prefetched:
+            self._play_scene(scene_plan, prefetched.dialogues, prefetched.choice_responses)
+            self._finish_scene(scene_plan)
+            return
+
         print("\n[角色] 正在演出...")
-        all_dialogues, pregenerated_responses = self.actor.generate_scene_dialogue(scene_plan)
+        if self.stream_dialogue:
+            self._play_scene_streaming(scene_plan)
+            self._finish_scene(scene_plan)
+            return
 
-        # ★ 保存预生成的回应（提前生成，无需在选择点等待）
-        if pregenerated_responses:
+        all_dialogues, pregenerated_responses = self.actor.generate_scene_dialogue(scene_plan)
+        self._play_scene(scene_plan, all_dialogues, pregenerated_responses)
+        self._finish_scene(scene_plan)
+
+    def _play_scene(self, scene_plan: ScenePlan, all_dialogues: List[DialogueOutput],
+                    pregenerated_responses: Optional[Mapping]):
+        """播放已完整生成的场景对话"""
+        # ★ 保存预生成的回应（与对话并发生成，到选择点才读取；不要用真值判断，否则会提前等待）
+        if pregenerated_responses is not None:
             self.pregenerated_responses = pregenerated_responses
 
+        # 需要显示日文时，整场缺日文的台词一次性在后台生成
+        if self.show_jp_text:
+            get_jp_translator().prefetch(line for output in all_dialogues for line in output.dialogue)
+
         # 8. 逐个显示 Beat
         for i, beat in enumerate(scene_plan.beats):
             display_beat_info(beat, i)
@@ -593,8 +695,46 @@ class GameLoopV3:
 
             # 暂停让玩家阅读
             if i < len(scene_plan.beats) - 1:
-                input("\n[按Enter继续...]")
+                self.ask("\n[按Enter继续...]", "continue")
+
+    def _play_scene_streaming(self, scene_plan: ScenePlan):
+        """流式演出：每行对话一生成就显示，不等整场结束"""
+        # 需要显示日文时，每个 Beat 结束就把该 Beat 的台词作为一批在后台生成日文
+        jp_translator = get_jp_translator() if self.show_jp_text else None
+        stream = self.actor.stream_scene_dialogue(scene_plan, jp_translator)
+
+        for i, beat in enumerate(scene_plan.beats):
+            display_beat_info(beat, i)
+            print("\n" + "-" * 50)
+
+            if jp_translator is not None:
+                # 等该 Beat 结束（此时它的日文批次已经提交），逐行显示只等待这一批
+                lines = stream.beat_output(i).dialogue
+            else:
+                lines = stream.iter_beat(i)
+            for line in lines:
+                display_dialogue_line(line, self.show_jp_text)
+
+            # Beat 结束后再应用效果（effects 在该 Beat 的对话之后才生成）
+            self._apply_dialogue_effects(stream.beat_output(i))
+
+            if scene_plan.player_choice_point:
+                if scene_plan.player_choice_point.get("after_beat") == beat.beat_id:
+                    pregenerated_responses = stream.choice_responses()
+                    if pregenerated_responses is not None:
+                        self.pregenerated_responses = pregenerated_responses
+                    self._handle_player_choice(scene_plan.player_choice_point, beat.characters)
+
+            if i < len(scene_plan.beats) - 1:
+                self.ask("\n[按Enter继续...]", "continue")
+
+        stream.wait()
+        ttfl = stream.stats.get("time_to_first_line")
+        if ttfl is not None:
+            print(f"\n[角色] 首行延迟 {ttfl:.2f}s（整场 {stream.stats['total_time']:.2f}s）")
 
+    def _finish_scene(self, scene_plan: ScenePlan):
+        """场景结束：显示结尾提示、应用结果并推进时间"""
         # 9. 场景结束 - 【连续性新增】显示结尾提示
         print("\n" + "=" * 50)
         print("[场景结束]")
@@ -629,7 +769,7 @@ class GameLoopV3:
 
     def _check_and_advance(self):
         """检查结局条件并推进时间"""
-        current_day_data = load_json(self.project_root / "world_state" / "current_day.json")
+        current_day_data = self.world_state.get("current_day")
 
         # 检测结局（仅在第3天晚上检测）
         day = current_day_data.get("day", 1)
@@ -656,8 +796,7 @@ class GameLoopV3:
 
     def advance_time(self):
         """推进时间：时段->时段，night后进入下一天"""
-        day_path = self.project_root / "world_state" / "current_day.json"
-        current_day = load_json(day_path)
+        current_day = self.world_state.get("current_day")
 
         old_period = current_day.get("period", "dawn")
         print(f"[DEBUG] advance_time() 调用前: period={old_period}")
@@ -687,19 +826,19 @@ class GameLoopV3:
 
             # 检查是否超过3天
             if current_day["day"] > 3:
+                self.world_state.mark_dirty("current_day")
                 # 游戏应该在第3天结束前触发结局
                 ending = self.story_planner.check_ending()
                 self.handle_ending(ending)
                 return
 
         # ★ 关键：确保保存到文件
-        save_json(day_path, current_day)
+        self.world_state.mark_dirty("current_day")
         print(f"[DEBUG] advance_time() 调用后: period={current_day.get('period')}")
 
     def _check_madness_murder(self):
         """检查是否有角色madness过高触发杀人"""
-        states_path = self.project_root / "world_state" / "character_states.json"
-        states = load_json(states_path)
+        states = self.world_state.get("character_states")
 
         # 找madness最高的角色
         highest_madness = 0
@@ -743,11 +882,10 @@ class GameLoopV3:
         display_ending(ending_type, ending_info)
 
         # 更新状态
-        day_path = self.project_root / "world_state" / "current_day.json"
-        current_day = load_json(day_path)
+        current_day = self.world_state.get("current_day")
         current_day["phase"] = "ending"
         current_day["ending_type"] = ending_type
-        save_json(day_path, current_day)
+        self.world_state.mark_dirty("current_day")
 
         self.running = False
 
@@ -763,34 +901,31 @@ class GameLoopV3:
         print(f"\n  这一夜，有什么不对劲...")
         print(f"  走廊里传来异样的脚步声，然后是...尖叫。")
         print(f"  接着，一切归于寂静。")
-        input("\n[按Enter继续...]")
+        self.ask("\n[按Enter继续...]", "continue")
 
         # 更新状态
-        states_path = self.project_root / "world_state" / "character_states.json"
-        states = load_json(states_path)
+        states = self.world_state.get("character_states")
         if target_id and target_id in states:
             states[target_id]["status"] = "dead"
-            save_json(states_path, states)
+            self.world_state.mark_dirty("character_states")
 
         # 更新current_day
-        day_path = self.project_root / "world_state" / "current_day.json"
-        current_day = load_json(day_path)
+        current_day = self.world_state.get("current_day")
         current_day["murderer_id"] = killer_id
         current_day["victim_id"] = target_id
         current_day["flags"]["murder_occurred"] = True
         current_day["phase"] = "investigation"
         current_day["investigation_count"] = 5  # 5次调查机会
-        save_json(day_path, current_day)
+        self.world_state.mark_dirty("current_day")
 
         print(f"\n  [早晨] 发现了尸体...")
         print(f"  {target_id} 已经死亡。")
         print(f"\n  典狱长: 发现了尸体! 现在开始进入调查时间。")
-        input("\n[按Enter进入调查阶段...]")
+        self.ask("\n[按Enter进入调查阶段...]", "continue")
 
     def run_investigation(self):
         """调查阶段（框架）"""
-        day_path = self.project_root / "world_state" / "current_day.json"
-        current_day = load_json(day_path)
+        current_day = self.world_state.get("current_day")
 
         inv_count = current_day.get("investigation_count", 0)
 
@@ -801,8 +936,8 @@ class GameLoopV3:
         if inv_count <= 0:
             print("\n调查时间结束，准备进入审判...")
             current_day["phase"] = "trial"
-            save_json(day_path, current_day)
-            input("\n[按Enter进入审判阶段...]")
+            self.world_state.mark_dirty("current_day")
+            self.ask("\n[按Enter进入审判阶段...]", "continue")
             return
 
         print("\n可执行的调查行动:")
@@ -811,16 +946,16 @@ class GameLoopV3:
         print("  3. 查看证据")
         print("  0. 结束调查，进入审判")
 
-        choice = input("\n选择行动: ").strip()
+        choice = self.ask("\n选择行动: ", "action").strip()
 
         if choice == "0":
             current_day["phase"] = "trial"
-            save_json(day_path, current_day)
+            self.world_state.mark_dirty("current_day")
             print("\n准备进入审判...")
             return
         elif choice in ["1", "2", "3"]:
             current_day["investigation_count"] = inv_count - 1
-            save_json(day_path, current_day)
+            self.world_state.mark_dirty("current_day")
 
             # 简化的调查反馈
             if choice == "1":
@@ -834,8 +969,7 @@ class GameLoopV3:
 
     def run_trial(self):
         """审判阶段（框架）"""
-        day_path = self.project_root / "world_state" / "current_day.json"
-        current_day = load_json(day_path)
+        current_day = self.world_state.get("current_day")
 
         print("\n" + "=" * 60)
         print("[魔女审判]")
@@ -846,8 +980,7 @@ class GameLoopV3:
         print("  讨论结束后，将进行投票。得票最多者将被处刑。")
 
         # 获取存活角色列表
-        states_path = self.project_root / "world_state" / "character_states.json"
-        states = load_json(states_path)
+        states = self.world_state.get("character_states")
         alive_chars = [cid for cid, state in states.items() if state.get("status") == "alive"]
 
         print("\n存活角色:")
@@ -855,7 +988,7 @@ class GameLoopV3:
             print(f"  {i}. {char_id}")
 
         print("\n请投票选择你认为的凶手:")
-        vote = input("输入编号: ").strip()
+        vote = self.ask("输入编号: ", "vote").strip()
 
         try:
             vote_idx = int(vote) - 1
@@ -879,7 +1012,7 @@ class GameLoopV3:
                     current_day["flags"]["correct_judgment"] = False
                     self.handle_ending(EndingType.BAD_END)
 
-                save_json(day_path, current_day)
+                self.world_state.mark_dirty("current_day")
             else:
                 print("\n无效选择")
         except:
@@ -890,16 +1023,16 @@ class GameLoopV3:
         display_choices(choice_point)
 
         while True:
-            choice = input("\n输入选项 (A/B/C/D/Q): ").strip().upper()
+            choice = self.ask("\n输入选项 (A/B/C/D/Q): ", "choice").strip().upper()
 
             if choice == "Q":
-                display_world_state(self.project_root)
+                display_world_state(self.world_state)
                 display_choices(choice_point)
                 continue
 
             if choice == "D":
                 # 自由输入
-                player_input = input("\n你说: ").strip()
+                player_input = self.ask("\n你说: ", "text").strip()
                 if not player_input:
                     continue
 
@@ -941,8 +1074,7 @@ class GameLoopV3:
             return
 
         try:
-            states_path = self.project_root / "world_state" / "character_states.json"
-            states = load_json(states_path)
+            states = self.world_state.get("character_states")
 
             for char_id, effects in dialogue_output.effects.items():
                 if char_id in states:
@@ -955,7 +1087,7 @@ class GameLoopV3:
                         current = states[char_id].get("madness", 0)
                         states[char_id]["madness"] = max(0, min(100, current + effects["madness"]))
 
-            save_json(states_path, states)
+            self.world_state.mark_dirty("character_states")
         except Exception as e:
             print(f"[警告] 应用对话效果失败: {e}")
 
@@ -965,8 +1097,7 @@ class GameLoopV3:
             return
 
         try:
-            states_path = self.project_root / "world_state" / "character_states.json"
-            states = load_json(states_path)
+            states = self.world_state.get("character_states")
 
             for key, value in effects.items():
                 if isinstance(value, dict):
@@ -978,7 +1109,7 @@ class GameLoopV3:
                 else:
                     pass
 
-            save_json(states_path, states)
+            self.world_state.mark_dirty("character_states")
         except Exception as e:
             print(f"[警告] 应用选项效果失败: {e}")
 
@@ -989,8 +1120,7 @@ class GameLoopV3:
             return
 
         try:
-            states_path = self.project_root / "world_state" / "character_states.json"
-            states = load_json(states_path)
+            states = self.world_state.get("character_states")
 
             stress_changes = outcomes.get("stress_changes", {})
             for char_id, change in stress_changes.items():
@@ -998,17 +1128,16 @@ class GameLoopV3:
                     current = states[char_id].get("stress", 50)
                     states[char_id]["stress"] = max(0, min(100, current + change))
 
-            save_json(states_path, states)
+            self.world_state.mark_dirty("character_states")
 
             flags_to_set = outcomes.get("flags_to_set", [])
             if flags_to_set:
-                day_path = self.project_root / "world_state" / "current_day.json"
-                current_day = load_json(day_path)
+                current_day = self.world_state.get("current_day")
                 flags = current_day.get("flags", {})
                 for flag in flags_to_set:
                     flags[flag] = True
                 current_day["flags"] = flags
-                save_json(day_path, current_day)
+                self.world_state.mark_dirty("current_day")
 
         except Exception as e:
             print(f"[警告] 应用场景结果失败: {e}")
@@ -1016,53 +1145,52 @@ class GameLoopV3:
     def _increment_event_count(self):
         """增加事件计数"""
         try:
-            day_path = self.project_root / "world_state" / "current_day.json"
-            current_day = load_json(day_path)
+            current_day = self.world_state.get("current_day")
             current_day["event_count"] = current_day.get("event_count", 0) + 1
             current_day["daily_event_count"] = current_day.get("daily_event_count", 0) + 1
-            save_json(day_path, current_day)
+            self.world_state.mark_dirty("current_day")
         except Exception as e:
             print(f"[警告] 更新事件计数失败: {e}")
 
     def _update_npc_locations(self):
         """更新NPC位置（简化版）"""
         try:
-            states_path = self.project_root / "world_state" / "character_states.json"
-            states = load_json(states_path)
+            states = self.world_state.get("character_states")
 
             locations_list = ["食堂", "庭院", "走廊", "图书室", "牢房区"]
             actions = ["站着发呆", "四处张望", "低头沉思", "靠墙休息", "来回踱步"]
 
+            table = self.npc_movement.load([states])
+            moved = self.npc_movement.scatter(table, locations_list, chance=0.3)
+            table.apply_to([states], moved)
             for char_id, state in states.items():
                 if state.get("status") != "alive":
                     continue
-                if random.random() < 0.3:
-                    state["location"] = random.choice(locations_list)
                 state["action"] = random.choice(actions)
                 state["can_interact"] = True
 
-            save_json(states_path, states)
+            self.world_state.mark_dirty("character_states")
         except Exception as e:
             print(f"[警告] 更新NPC位置失败: {e}")
 
     def scatter_npcs(self):
         """将NPC分散到各个地点"""
         try:
-            states_path = self.project_root / "world_state" / "character_states.json"
-            states = load_json(states_path)
+            states = self.world_state.get("character_states")
 
             # 可用地点
             locations = ["食堂", "牢房区", "图书室", "庭院", "走廊"]
             actions = ["四处张望", "静静站着", "来回踱步", "若有所思", "环顾四周"]
 
             # 为每个角色随机分配地点
+            table = self.npc_movement.load([states])
+            table.apply_to([states], self.npc_movement.scatter(table, locations))
             for char_id, state in states.items():
                 if state.get("status") == "alive":
-                    state["location"] = random.choice(locations)
                     state["action"] = random.choice(actions)
                     state["can_interact"] = True
 
-            save_json(states_path, states)
+            self.world_state.mark_dirty("character_states")
             print("\n[系统] NPC已分散到各个地点")
         except Exception as e:
             print(f"[警告] 分散NPC失败: {e}")
@@ -1098,7 +1226,7 @@ class GameLoopV3:
                 print(f"\n[{speaker}]")
                 print(f"  {text}")
 
-        input("\n[按Enter继续...]")
+        self.ask("\n[按Enter继续...]", "continue")
 
     def _run_fixed_event(self, event_data: Dict):
         """执行固定事件"""
@@ -1163,7 +1291,7 @@ class GameLoopV3:
 
     def _handle_event_branch(self, branches: List[Dict]):
         """处理事件分支"""
-        state = load_json(self.project_root / "world_state" / "current_day.json")
+        state = self.world_state.get("current_day")
         flags = state.get("flags", {})
 
         for branch in branches:
@@ -1174,14 +1302,14 @@ class GameLoopV3:
                 # 默认分支
                 if next_event:
                     state["next_event"] = next_event
-                    save_json(self.project_root / "world_state" / "current_day.json", state)
+                    self.world_state.mark_dirty("current_day")
                 break
 
             # 评估条件
             if self.fixed_event_manager._evaluate_condition(condition, flags):
                 if next_event:
                     state["next_event"] = next_event
-                    save_json(self.project_root / "world_state" / "current_day.json", state)
+                    self.world_state.mark_dirty("current_day")
                 break
 
 
@@ -0,0 +1,341 @@
+# ============================================================================
+# 多会话游戏服务器（asyncio HTTP + WebSocket，只用标准库）
+# ============================================================================
+# 游戏逻辑由 game_engine.py 的会话线程运行；事件循环只负责收发，
+# 等待游戏输出时不占用线程（会话就绪时 call_soon_threadsafe 唤醒）
+#
+# 用法：python game_server.py [--host 127.0.0.1] [--port 8080] [--max-sessions N] [--prefetch]
+#                             [--idle-hibernate 秒] [--memory-budget MB]
+#
+# HTTP（JSON）：
+#   POST   /sessions               新建会话，body 可带 {"session_id": "..."}；返回第一屏输出
+#   GET    /sessions               会话列表
+#   GET    /sessions/<id>          最近一屏输出
+#   POST   /sessions/<id>/input    {"input": "1"}；运行到游戏再次等待输入，返回这期间的输出
+#   DELETE /sessions/<id>          关闭会话（删除休眠快照）
+#   GET    /stats                  引擎统计 + LLM 调度（各优先级排队等待时间、令牌桶余量）
+# WebSocket：GET /ws（新建会话）或 /ws/<id>（接回已有会话），收发 JSON 文本帧
+#   客户端 {"input": "..."}；服务端推送每一屏输出（TurnOutput）
+#   连接断开不关闭会话，可用同一 ID 重连
+# 空闲会话会被引擎休眠（写快照、释放内存），下一条输入自动恢复；服务器停止时
+# 停在回合之间的会话都会写快照，重启后用同一 ID 继续
+#
+# 输出格式（TurnOutput）：{"session_id", "text", "expects", "prompt", "finished", "step", "elapsed_ms", "state"}
+# ============================================================================
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from config import (
+    GAME_SERVER_HOST, GAME_SERVER_PORT, GAME_MAX_SESSIONS, GAME_SESSION_PREFETCH,
+    GAME_IDLE_HIBERNATE_S, GAME_MEMORY_BUDGET_MB,
+)
+from api.llm_gateway import get_gateway
+from game_engine import GameEngine, GameSession, SessionBusy, SessionClosed, SessionLimitError
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_BODY_BYTES = 64 * 1024
+MAX_FRAME_BYTES = 64 * 1024
+
+STATUS_TEXT = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 410: "Gone", 413: "Payload Too Large", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ============================================================================
+# WebSocket 帧
+# ============================================================================
+
+def _ws_frame(opcode: int, payload: bytes) -> bytes:
+    """服务端发出的帧（不加掩码）"""
+    head = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        head += bytes([length])
+    elif length < 65536:
+        head += bytes([126]) + struct.pack("!H", length)
+    else:
+        head += bytes([127]) + struct.pack("!Q", length)
+    return head + payload
+
+
+async def _ws_read(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """读取一条完整消息（合并分片），返回 (opcode, payload)"""
+    message_opcode, chunks = None, []
+    while True:
+        b1, b2 = await reader.readexactly(2)
+        fin, opcode = b1 & 0x80, b1 & 0x0F
+        length = b2 & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if length > MAX_FRAME_BYTES:
+            raise HTTPError(413, "WebSocket 帧过大")
+        mask = await reader.readexactly(4) if b2 & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        if opcode >= 0x8:  # 控制帧不分片，可插在分片之间
+            return opcode, payload
+        if opcode != 0x0:
+            message_opcode = opcode
+        chunks.append(payload)
+        if fin:
+            return message_opcode or 0x1, b"".join(chunks)
+
+
+# ============================================================================
+# 服务器
+# ============================================================================
+
+class GameServer:
+    """asyncio HTTP / WebSocket 前端"""
+
+    def __init__(self, engine: GameEngine, host: str = GAME_SERVER_HOST, port: int = GAME_SERVER_PORT):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.stats = {"http_requests": 0, "ws_connections": 0, "ws_messages": 0, "errors": 0}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"[GameServer] 监听 http://{self.host}:{self.port}（会话上限 {self.engine.max_sessions}）")
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(None, self.engine.close_all)
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                path = urlsplit(target).path.rstrip("/") or "/"
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, path, headers)
+                    break
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "请求体过大"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                self.stats["http_requests"] += 1
+                try:
+                    status, payload = await self._route(method.upper(), path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": e.message}
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    status, payload = 400, {"error": f"{type(e).__name__}: {e}"}
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool = True):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        parts = [p for p in path.split("/") if p]
+        data = json.loads(body.decode("utf-8")) if body.strip() else {}
+
+        if parts == ["stats"] and method == "GET":
+            gateway = get_gateway()
+            return 200, {"engine": self.engine.report(), "server": self.stats,
+                         "llm": gateway.scheduler.report(), "keys": gateway.keys.report()}
+        if parts == ["sessions"]:
+            if method == "GET":
+                return 200, [session.report() for session in self.engine.sessions()]
+            if method == "POST":
+                session = self._create(data.get("session_id"))
+                return 201, (await session.aready()).to_dict()
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session = self._session(parts[1])
+            if len(parts) == 2 and method == "GET":
+                return 200, session.last_output.to_dict() if session.last_output else session.report()
+            if len(parts) == 2 and method == "DELETE":
+                await asyncio.get_running_loop().run_in_executor(None, self.engine.close, session.session_id)
+                return 200, {"closed": session.session_id}
+            if parts[2:] == ["input"] and method == "POST":
+                return 200, (await self._send(session, data.get("input", ""))).to_dict()
+        raise HTTPError(404 if method in ("GET", "POST", "DELETE") else 405, f"{method} {path}")
+
+    def _create(self, session_id: Optional[str]) -> GameSession:
+        try:
+            return self.engine.create_session(session_id)
+        except SessionLimitError as e:
+            raise HTTPError(503, str(e))
+        except ValueError as e:
+            raise HTTPError(409 if "已存在" in str(e) else 400, str(e))
+
+    def _session(self, session_id: str) -> GameSession:
+        try:
+            return self.engine.get(session_id)
+        except KeyError:
+            raise HTTPError(404, f"会话不存在: {session_id}")
+
+    async def _send(self, session: GameSession, command: Any):
+        try:
+            return await session.asend(str(command))
+        except SessionBusy as e:
+            raise HTTPError(409, str(e))
+        except SessionClosed as e:
+            raise HTTPError(410, str(e) or "会话已结束")
+        except SessionLimitError as e:
+            raise HTTPError(503, str(e))
+
+    # ------------------------------------------------------------------
+    # WebSocket
+    # ------------------------------------------------------------------
+
+    async def _websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         path: str, headers: Dict[str, str]):
+        parts = [p for p in path.split("/") if p]
+        key = headers.get("sec-websocket-key")
+        if not parts or parts[0] != "ws" or len(parts) > 2 or not key:
+            await self._respond(writer, 400, {"error": "WebSocket 地址为 /ws 或 /ws/<会话ID>"}, keep_alive=False)
+            return
+        try:
+            session = self._session(parts[1]) if len(parts) == 2 else self._create(None)
+        except HTTPError as e:
+            await self._respond(writer, e.status, {"error": e.message}, keep_alive=False)
+            return
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("latin-1"))
+        self.stats["ws_connections"] += 1
+
+        async def send(payload: Dict[str, Any]):
+            writer.write(_ws_frame(0x1, json.dumps(payload, ensure_ascii=False).encode("utf-8")))
+            await writer.drain()
+
+        await send((await session.aready()).to_dict())
+        while True:
+            try:
+                opcode, payload = await _ws_read(reader)
+            except HTTPError:
+                writer.write(_ws_frame(0x8, struct.pack("!H", 1009)))
+                break
+            if opcode == 0x8:  # close
+                writer.write(_ws_frame(0x8, payload[:2]))
+                break
+            if opcode == 0x9:  # ping
+                writer.write(_ws_frame(0xA, payload))
+                continue
+            if opcode != 0x1:
+                continue
+
+            self.stats["ws_messages"] += 1
+            try:
+                message = json.loads(payload.decode("utf-8"))
+                output = await self._send(session, message.get("input", "") if isinstance(message, dict) else message)
+            except HTTPError as e:
+                await send({"error": e.message, "status": e.status})
+                continue
+            except ValueError as e:
+                await send({"error": f"无效的 JSON: {e}", "status": 400})
+                continue
+            await send(output.to_dict())
+            if output.finished:
+                writer.write(_ws_frame(0x8, struct.pack("!H", 1000)))
+                break
+        await writer.drain()
+
+
+# ============================================================================
+# 入口
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话游戏服务器（HTTP / WebSocket）")
+    parser.add_argument("--host", default=GAME_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=GAME_SERVER_PORT)
+    parser.add_argument("--max-sessions", type=int, default=GAME_MAX_SESSIONS)
+    parser.add_argument("--prefetch", action="store_true", default=GAME_SESSION_PREFETCH,
+                        help="会话在玩家阅读时预取场景（API 负载成倍增加）")
+    parser.add_argument("--idle-hibernate", type=float, default=GAME_IDLE_HIBERNATE_S,
+                        help="回合之间空闲多少秒后休眠会话（0 = 不按空闲休眠）")
+    parser.add_argument("--memory-budget", type=float, default=GAME_MEMORY_BUDGET_MB,
+                        help="进程内存预算 MB，超出时休眠最久未用的会话（0 = 不限）")
+    args = parser.parse_args()
+
+    engine = GameEngine(max_sessions=args.max_sessions, prefetch=args.prefetch,
+                        idle_hibernate_s=args.idle_hibernate, memory_budget_mb=args.memory_budget)
+    server = GameServer(engine, args.host, args.port)
+
+    async def run():
+        try:
+            await server.serve_forever()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print(f"\n[GameServer] 已停止 {engine.report()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# ============================================================================
+# 响应缓存管理（api/response_cache.py）
+# ============================================================================
+# 用法：python manage_response_cache.py stats
+#       python manage_response_cache.py list [--tag TAG] [--limit N]
+#       python manage_response_cache.py show KEY
+#       python manage_response_cache.py purge [--tag TAG] [--older-than DAYS]
+#       python manage_response_cache.py export FILE [--tag TAG]
+#       python manage_response_cache.py warm FILE
+# ============================================================================
+
+import sys
+
+from api.response_cache import main
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,552 @@
+# ============================================================================
+# 无界面蒙特卡洛模拟：多进程自动跑成千上万局 GameLoopV3，统计结局分布、首次杀人的日期、固定事件覆盖率
+# ============================================================================
+# 用法：python simulate_playthroughs.py [--runs N] [--workers W] [--seed S]
+#           [--policy random|calm|provoke|idle|oracle|script] [--script FILE]
+#           [--max-turns T] [--madness-gain G] [--json OUT]
+#
+# 保持真实：GameLoopV3 的回合流程、FixedEventManager、EventTreeEngine、_maybe_move_npcs、
+# _check_madness_murder、StoryPlanner.check_ending / check_murder_prep
+# 替换为不调用 LLM 的假实现（按 EffectModel 直接生成结构，不拼 prompt、不解析 JSON）：
+#   StoryPlanner.generate_three_day_outline → 回退大纲
+#   DirectorPlanner.plan_scene             → 按在场角色生成场景（事件树触发检查照常执行，场景照常写入历史）
+#   CharacterActor                          → 每个 Beat 的对话效果 + A/B/C 选项回应
+# 假实现产生的效果与 prompt 要求模型输出的格式一致（对话效果按角色，选项回应的效果不按角色），
+# 游戏如何处理这些效果完全由原代码决定。
+#
+# 世界状态只在内存中（MemoryWorldState：种子文档每个进程读一次，每局深拷贝，flush 不写盘），
+# 项目的 world_state/ 不受影响。每局的种子为 --seed + 局号，同样的参数结果可复现。
+#
+# 玩家策略：
+#   random   随机地点 / 随机选项 / 调查若干次 / 随机投票
+#   calm     总是选 A（安抚）；provoke 总是选 C（挑衅）；idle 总是待在原地
+#   oracle   同 random，但投票总是投给真凶
+#   script   从 JSON 文件读取每种输入的序列，如 {"location": ["3", "1"], "choice": ["C"]}，
+#            按输入类型循环使用，没写的类型用 random
+# ============================================================================
+
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from itertools import cycle
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import SIM_MAX_TURNS, SIM_WORKERS
+from api import DirectorPlanner, ScenePlan, Beat, StoryPlanner
+from api.character_actor import ChoiceResponse, DialogueLine, DialogueOutput
+from api.llm_gateway import get_gateway
+from api.llm_transport import create_transport
+from api.world_state import WorldState
+from game_loop_v3 import GameLoopV3
+
+
+PROJECT_ROOT = Path(__file__).parent
+POLICIES = ("random", "calm", "provoke", "idle", "oracle", "script")
+EMOTIONS = ["calm", "nervous", "sad", "angry", "scared", "surprised", "conflicted", "neutral"]
+BEAT_TYPES = ["opening", "development", "tension", "climax", "resolution"]
+
+
+# ============================================================================
+# 效果模型
+# ============================================================================
+
+@dataclass
+class EffectModel:
+    """假实现产生的数值效果（幅度参照 api/synthetic_llm.py 与各层 prompt 中的示例）"""
+    beats: Tuple[int, int] = (2, 4)              # 每个场景的 Beat 数
+    base_tension: Tuple[int, int, int] = (3, 5, 7)  # 第 1 / 2 / 3 天的基础张力（之后沿用第 3 天）
+    scene_stress: int = 5                        # 场景结果 stress_changes 的随机幅度（±）
+    beat_stress: Tuple[int, int] = (-3, 5)       # 每个 Beat 对话效果的 stress 变化范围（张力高于 5 时额外增加）
+    madness_gain: int = 3                        # 压力 ≥ madness_stress 的角色每个 Beat 的疯狂值增长上限
+    madness_stress: int = 70
+    choice_rate: float = 0.6                     # 场景带玩家选择点的概率
+    # 选项回应的效果（与 character_actor 选项回应 prompt 的示例相同，不按角色区分）
+    choice_effects: Dict[str, Dict[str, int]] = field(default_factory=lambda: {
+        "A": {"stress": -5, "affection": 3},
+        "B": {"stress": 0, "affection": 0},
+        "C": {"stress": 10, "madness": 3, "affection": -5},
+    })
+
+    def tension(self, day: int, rng: random.Random) -> int:
+        base = self.base_tension[min(max(day, 1), len(self.base_tension)) - 1]
+        return max(1, min(10, base + rng.randint(-1, 2)))
+
+
+# ============================================================================
+# 内存世界状态
+# ============================================================================
+
+_SEEDS: Dict[str, Any] = {}
+
+
+def load_seeds(project_root: Path = PROJECT_ROOT) -> Dict[str, Any]:
+    """读取 world_state/*.json 作为每局的初始文档（每个进程一次）"""
+    if not _SEEDS:
+        for path in sorted((project_root / "world_state").glob("*.json")):
+            with open(path, 'r', encoding='utf-8') as f:
+                _SEEDS[path.stem] = json.load(f)
+    return _SEEDS
+
+
+class MemoryWorldState(WorldState):
+    """只在内存中的世界状态：文档从种子深拷贝，flush 只清脏标记"""
+
+    def __init__(self, project_root: Path, seeds: Dict[str, Any]):
+        super().__init__(project_root, state_dir=project_root / ".cache" / "simulation")
+        self._seeds = seeds
+
+    def get(self, name: str, default: Any = None) -> Any:
+        with self._lock:
+            if name not in self._documents and name in self._seeds:
+                self._documents[name] = copy.deepcopy(self._seeds[name])
+                self._published[name] = copy.deepcopy(self._seeds[name])
+                self.stats["loads"] += 1
+            return super().get(name, default)
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return name in self._documents or name in self._seeds
+
+    def flush(self) -> List[str]:
+        with self._lock:
+            flushed = sorted(self._dirty)
+            self._dirty.clear()
+            return flushed
+
+
+# ============================================================================
+# 不调用 LLM 的三层
+# ============================================================================
+
+class SimStoryPlanner(StoryPlanner):
+    """故事规划层：大纲用回退大纲，结局 / 杀人判定保持原实现"""
+
+    def generate_three_day_outline(self) -> Dict:
+        outline = self._create_fallback_outline(self.world_state.get("current_day").get("day", 1))
+        self.save_outline(outline)
+        return outline
+
+
+class SimDirectorPlanner(DirectorPlanner):
+    """导演规划层：按在场角色与当天张力生成场景；事件树触发检查与场景历史照常"""
+
+    rng: random.Random = random.Random(0)
+    effects: EffectModel = EffectModel()
+
+    def __init__(self, project_root: Path = None, world_state: WorldState = None):
+        super().__init__(project_root, world_state)
+        self.trigger_counts: Counter = Counter()
+
+    def plan_scene(self, location: str, scene_type: str = "free", fixed_event_data: Optional[Dict] = None,
+                   player_location: str = None, commit: bool = True) -> ScenePlan:
+        characters = self.get_characters_at_location(location)
+        if not characters:
+            return self._create_empty_scene(location)
+
+        for trigger in self.event_engine.check_triggers(self.event_engine.load_game_context()):
+            self.trigger_counts[trigger.trigger_id] += 1
+
+        rng, effects = self.rng, self.effects
+        day = self._get_current_day()
+        beats = []
+        for n in range(rng.randint(*effects.beats)):
+            cast = rng.sample(characters, min(len(characters), rng.randint(1, 3)))
+            beats.append(Beat(
+                beat_id=f"beat_{n + 1}",
+                beat_type=BEAT_TYPES[min(n, len(BEAT_TYPES) - 1)],
+                description="",
+                characters=cast,
+                speaker_order=list(cast),
+                emotion_targets={c: rng.choice(EMOTIONS) for c in cast},
+                tension_level=effects.tension(day, rng),
+                dialogue_count=len(cast),
+                direction_notes=""
+            ))
+
+        choice_point = None
+        if len(beats) > 1 and rng.random() < effects.choice_rate:
+            choice_point = {
+                "after_beat": beats[-2].beat_id,
+                "prompt": "你要怎么做？",
+                "options": [
+                    {"id": "A", "text": "安抚", "leads_to": "正面"},
+                    {"id": "B", "text": "沉默", "leads_to": "中性"},
+                    {"id": "C", "text": "追问", "leads_to": "危险"},
+                ],
+            }
+
+        scene_plan = ScenePlan(
+            scene_id=f"sim_{rng.randint(100000, 999999)}",
+            scene_name="模拟场景",
+            location=location,
+            time_estimate_minutes=5,
+            total_beats=len(beats),
+            beats=beats,
+            overall_arc="",
+            key_moments=[],
+            player_choice_point=choice_point,
+            outcomes={
+                "stress_changes": {c: rng.randint(-effects.scene_stress, effects.scene_stress) for c in characters[:2]},
+                "flags_to_set": [],
+            },
+            recommended_bgm="ambient_calm"
+        )
+        if commit:
+            self.commit_scene(scene_plan, characters)
+        return scene_plan
+
+
+class SimCharacterActor:
+    """角色演出层：每个 Beat 的对话效果 + 预选回应（接口同 CharacterActor 的非流式部分）"""
+
+    rng: random.Random = random.Random(0)
+    effects: EffectModel = EffectModel()
+
+    def __init__(self, project_root: Path = None, world_state: WorldState = None):
+        self.world_state = world_state
+
+    def generate_scene_dialogue(self, scene_plan: ScenePlan) -> Tuple[List[DialogueOutput], Dict[str, ChoiceResponse]]:
+        rng, effects = self.rng, self.effects
+        states = self.world_state.get("character_states")
+        outputs = []
+        for beat in scene_plan.beats:
+            low, high = effects.beat_stress
+            bonus = max(beat.tension_level - 5, 0)
+            beat_effects = {}
+            for char_id in beat.characters[:2]:
+                change = {"stress": rng.randint(low, high) + bonus, "emotion": rng.choice(EMOTIONS)}
+                if states.get(char_id, {}).get("stress", 0) >= effects.madness_stress and effects.madness_gain:
+                    change["madness"] = rng.randint(0, effects.madness_gain)
+                beat_effects[char_id] = change
+            dialogue = [DialogueLine(c, "……", "……", beat_effects[c]["emotion"]) for c in beat.characters[:2]]
+            outputs.append(DialogueOutput(beat.beat_id, dialogue, beat_effects))
+
+        responses = {}
+        if scene_plan.player_choice_point:
+            speaker = next((b.characters[0] for b in scene_plan.beats if b.characters), "narrator")
+            for option in scene_plan.player_choice_point.get("options", []):
+                option_id = option.get("id")
+                responses[option_id] = ChoiceResponse(
+                    option_id,
+                    [DialogueLine(speaker, "……", "……", "neutral")],
+                    dict(effects.choice_effects.get(option_id, {}))
+                )
+        return outputs, responses
+
+    def close(self):
+        pass
+
+
+# ============================================================================
+# 玩家策略
+# ============================================================================
+
+def _location_numbers(game: GameLoopV3) -> List[str]:
+    """地点菜单中可选的编号（与 display_location_menu 的编号一致）"""
+    return [
+        str(i) for i, loc_data in enumerate(game.locations.get("locations", {}).values(), 1)
+        if not loc_data.get("locked", False)
+    ]
+
+
+def _alive(game: GameLoopV3) -> List[str]:
+    states = game.world_state.get("character_states")
+    return [cid for cid, state in states.items() if state.get("status") == "alive"]
+
+
+def _random_answer(game: GameLoopV3, kind: str, rng: random.Random) -> str:
+    if kind == "location":
+        return rng.choice(_location_numbers(game) + ["0"])
+    if kind == "choice":
+        return rng.choice(["A", "B", "C"])
+    if kind == "action":
+        return rng.choice(["1", "2", "3", "0"])
+    if kind == "vote":
+        return str(rng.randint(1, max(len(_alive(game)), 1)))
+    if kind == "text":
+        return "……我在听。"
+    return ""
+
+
+def make_policy(name: str, script: Optional[Dict[str, List[str]]] = None) -> Callable[[GameLoopV3, str, random.Random], str]:
+    """返回 (游戏, 输入类型, 随机数生成器) -> 输入；确认继续由模拟器处理"""
+    if name == "calm":
+        return lambda game, kind, rng: "A" if kind == "choice" else _random_answer(game, kind, rng)
+    if name == "provoke":
+        return lambda game, kind, rng: "C" if kind == "choice" else _random_answer(game, kind, rng)
+    if name == "idle":
+        return lambda game, kind, rng: "0" if kind == "location" else _random_answer(game, kind, rng)
+    if name == "oracle":
+        def oracle(game, kind, rng):
+            if kind == "vote":
+                murderer = game.world_state.get("current_day").get("murderer_id")
+                alive = _alive(game)
+                if murderer in alive:
+                    return str(alive.index(murderer) + 1)
+            return _random_answer(game, kind, rng)
+        return oracle
+    if name == "script":
+        sequences = {kind: cycle([str(v) for v in values]) for kind, values in (script or {}).items() if values}
+        return lambda game, kind, rng: next(sequences[kind]) if kind in sequences else _random_answer(game, kind, rng)
+    return _random_answer
+
+
+# ============================================================================
+# 单局
+# ============================================================================
+
+@dataclass
+class PlaythroughResult:
+    """一局的结果"""
+    seed: int
+    ending: str = "stopped"                 # 结局类型 / timeout（回合数用完）/ stopped（提前退出）
+    end_day: int = 0
+    end_period: str = ""
+    turns: int = 0
+    murder_day: Optional[int] = None        # 首次出现杀人（murder_occurred 标记或有角色死亡）的日期
+    murder_source: Optional[str] = None     # murder_prep（GameLoopV3 的杀人流程）/ fixed_event（murder_trigger 等固定事件）
+    fixed_events: List[str] = field(default_factory=list)
+    triggers: Dict[str, int] = field(default_factory=dict)  # 事件树触发模板命中次数
+    max_madness: int = 0
+    max_stress: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)    # 回合中抛出的异常（GameLoopV3 会吞掉并继续）
+    elapsed_ms: float = 0.0
+
+
+class SimulatedGame(GameLoopV3):
+    """自动对局：三层换成假实现，输入由策略给出，每个回合后记录观测"""
+
+    story_planner_class = SimStoryPlanner
+    director_planner_class = SimDirectorPlanner
+    character_actor_class = SimCharacterActor
+
+    def __init__(self, world_state: WorldState, policy: Callable, seed: int, effects: EffectModel, max_turns: int):
+        self.rng = random.Random(seed)
+        self.policy = policy
+        self.max_turns = max_turns
+        self.result = PlaythroughResult(seed=seed)
+        super().__init__(world_state, ask=self._answer, prefetch=False)
+        self.stream_dialogue = False
+        self.show_jp_text = False
+        for layer in (self.planner, self.actor):
+            layer.rng = random.Random(self.rng.random())
+            layer.effects = effects
+
+    def _answer(self, prompt: str, kind: str) -> str:
+        if kind == "confirm":
+            return "y" if self.result.turns < self.max_turns else "n"
+        return self.policy(self, kind, self.rng)
+
+    def game_turn(self):
+        self.result.turns += 1
+        try:
+            super().game_turn()
+        except Exception as e:
+            name = type(e).__name__
+            self.result.errors[name] = self.result.errors.get(name, 0) + 1
+            raise
+        finally:
+            self._observe()
+
+    def _observe(self):
+        if self.result.murder_day is not None:
+            return
+        current_day = self.world_state.get("current_day")
+        states = self.world_state.get("character_states")
+        dead = any(state.get("status") == "dead" for state in states.values())
+        if dead or current_day.get("flags", {}).get("murder_occurred"):
+            self.result.murder_day = current_day.get("day", 1)
+            self.result.murder_source = "murder_prep" if current_day.get("victim_id") else "fixed_event"
+
+    def finish(self) -> PlaythroughResult:
+        current_day = self.world_state.get("current_day")
+        states = self.world_state.get("character_states")
+        result = self.result
+        if current_day.get("phase") == "ending":
+            result.ending = current_day.get("ending_type") or "unknown"
+        elif result.turns >= self.max_turns:
+            result.ending = "timeout"
+        result.end_day = current_day.get("day", 1)
+        result.end_period = current_day.get("period", "")
+        result.fixed_events = list(current_day.get("triggered_events", []))
+        result.triggers = dict(self.planner.trigger_counts)
+        result.max_madness = max((s.get("madness", 0) for s in states.values()), default=0)
+        result.max_stress = max((s.get("stress", 0) for s in states.values()), default=0)
+        return result
+
+
+def play(seed: int, policy: Callable, effects: EffectModel, max_turns: int) -> PlaythroughResult:
+    """跑一局（当前进程内）"""
+    start = time.perf_counter()
+    random.seed(seed)  # GameLoopV3 的 NPC 移动 / 受害者选择使用全局 random
+    game = SimulatedGame(MemoryWorldState(PROJECT_ROOT, load_seeds()), policy, seed, effects, max_turns)
+    try:
+        game.run()
+    finally:
+        game.close()
+    result = game.finish()
+    result.elapsed_ms = (time.perf_counter() - start) * 1000
+    return result
+
+
+# ============================================================================
+# 多进程
+# ============================================================================
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(policy_name: str, script: Optional[Dict], effects: EffectModel, max_turns: int, quiet: bool):
+    """子进程初始化：静音输出、切到合成传输层（漏网的 LLM 调用不会发到网上）、读取种子"""
+    if quiet:
+        sink = open(os.devnull, "w", encoding="utf-8")
+        sys.stdout = sink
+        sys.stderr = sink
+    gateway = get_gateway()
+    gateway.transport = create_transport("synthetic")
+    gateway.transport.latency_scale = 0
+    load_seeds()
+    _worker.update(policy=make_policy(policy_name, script), effects=effects, max_turns=max_turns)
+
+
+def _play_seed(seed: int) -> Dict[str, Any]:
+    result = asdict(play(seed, _worker["policy"], _worker["effects"], _worker["max_turns"]))
+    result["llm_calls"] = get_gateway().transport.report().get("requests", 0)
+    return result
+
+
+def simulate(runs: int, seed: int = 0, workers: int = SIM_WORKERS, policy: str = "random",
+             script: Optional[Dict] = None, effects: EffectModel = None, max_turns: int = SIM_MAX_TURNS,
+             quiet: bool = True) -> Dict[str, Any]:
+    """跑 runs 局并返回汇总统计"""
+    effects = effects or EffectModel()
+    workers = workers or os.cpu_count() or 1
+    seeds = range(seed, seed + runs)
+    start = time.perf_counter()
+    init_args = (policy, script, effects, max_turns, quiet)
+    if workers == 1:
+        stdout, stderr = sys.stdout, sys.stderr
+        try:
+            _init_worker(*init_args)
+            results = [_play_seed(s) for s in seeds]
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+    else:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+            results = list(pool.imap_unordered(_play_seed, seeds, chunksize=max(1, min(64, runs // (workers * 8)))))
+    wall = time.perf_counter() - start
+    return aggregate(results, wall, workers, policy)
+
+
+def aggregate(results: List[Dict[str, Any]], wall: float, workers: int, policy: str) -> Dict[str, Any]:
+    """各局结果 → 结局分布、首次杀人日期、固定事件覆盖率等"""
+    runs = len(results)
+    endings = Counter(r["ending"] for r in results)
+    murder_days = Counter(r["murder_day"] for r in results if r["murder_day"] is not None)
+    murder_sources = Counter(r["murder_source"] for r in results if r["murder_source"])
+    fixed = Counter(event for r in results for event in set(r["fixed_events"]))
+    triggers = Counter()
+    errors = Counter()
+    for r in results:
+        triggers.update(r["triggers"])
+        errors.update(r["errors"])
+    turns = [r["turns"] for r in results]
+    elapsed = [r["elapsed_ms"] for r in results]
+    murdered = sum(murder_days.values())
+    return {
+        "runs": runs,
+        "policy": policy,
+        "workers": workers,
+        "wall_s": round(wall, 2),
+        "runs_per_min": round(runs / wall * 60, 1) if wall else 0,
+        "ms_per_run": {"p50": round(statistics.median(elapsed), 1) if elapsed else 0,
+                       "mean": round(statistics.mean(elapsed), 1) if elapsed else 0},
+        "turns": {"mean": round(statistics.mean(turns), 1) if turns else 0, "max": max(turns, default=0)},
+        "endings": dict(endings.most_common()),
+        "murder_rate": round(murdered / runs, 4) if runs else 0,
+        "first_murder_day": dict(sorted(murder_days.items())),
+        "murder_sources": dict(murder_sources),
+        "fixed_event_coverage": {event: round(count / runs, 4) for event, count in sorted(fixed.items(), key=lambda x: -x[1])},
+        "event_tree_triggers": dict(triggers.most_common()),
+        "max_madness_mean": round(statistics.mean(r["max_madness"] for r in results), 1) if runs else 0,
+        "errors": dict(errors),
+        "llm_calls": sum(r.get("llm_calls", 0) for r in results),
+    }
+
+
+def print_report(report: Dict[str, Any], all_events: List[str]):
+    runs = report["runs"] or 1
+    print(f"\n{report['runs']} 局（策略 {report['policy']}，{report['workers']} 个进程），"
+          f"耗时 {report['wall_s']}s，{report['runs_per_min']} 局/分钟，"
+          f"每局 p50 {report['ms_per_run']['p50']}ms，平均 {report['turns']['mean']} 回合")
+
+    print("\n结局分布")
+    for ending, count in report["endings"].items():
+        print(f"  {ending:<16} {count:>7}  {count / runs:6.1%}  {'█' * round(count / runs * 40)}")
+
+    print(f"\n杀人发生率 {report['murder_rate']:.1%}（来源 {report['murder_sources'] or '无'}）")
+    for day, count in report["first_murder_day"].items():
+        print(f"  第 {day} 天  {count:>7}  {count / runs:6.1%}")
+    print(f"  终局最高疯狂值平均 {report['max_madness_mean']}")
+
+    coverage = report["fixed_event_coverage"]
+    print(f"\n固定事件覆盖率（触发过的 {len(coverage)}/{len(all_events)}）")
+    for event in all_events:
+        rate = coverage.get(event, 0)
+        print(f"  {event:<28} {rate:6.1%}{'' if rate else '  （从未触发）'}")
+
+    if report["event_tree_triggers"]:
+        print("\n事件树触发模板（命中次数 / 局）")
+        for trigger, count in report["event_tree_triggers"].items():
+            print(f"  {trigger:<28} {count / runs:8.2f}")
+    if report["errors"]:
+        print(f"\n回合异常 {report['errors']}")
+    if report["llm_calls"]:
+        print(f"\n[警告] 有 {report['llm_calls']} 次调用漏到了 LLM 网关（已由合成传输层应答）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面蒙特卡洛模拟（不调用 LLM）")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=SIM_WORKERS, help="进程数（0 = 全部核心）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policy", choices=POLICIES, default="random")
+    parser.add_argument("--script", help="script 策略的输入序列（JSON 文件）")
+    parser.add_argument("--max-turns", type=int, default=SIM_MAX_TURNS)
+    parser.add_argument("--madness-gain", type=int, default=EffectModel.madness_gain,
+                        help="高压力角色每个 Beat 疯狂值增长上限（0 = 对话不改变疯狂值）")
+    parser.add_argument("--json", help="把汇总统计写入 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="不静音游戏输出（调试单局用，配合 --workers 1）")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, 'r', encoding='utf-8') as f:
+            script = json.load(f)
+
+    report = simulate(args.runs, seed=args.seed, workers=args.workers, policy=args.policy, script=script,
+                      effects=EffectModel(madness_gain=args.madness_gain), max_turns=args.max_turns,
+                      quiet=not args.verbose)
+
+    from api.fixed_event_manager import FixedEventManager
+    all_events = list(FixedEventManager(PROJECT_ROOT, MemoryWorldState(PROJECT_ROOT, load_seeds()))
+                      .events.get("fixed_events", {}))
+    print_report(report, all_events)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n汇总统计已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
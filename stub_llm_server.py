@@ -0,0 +1,20 @@
+# ============================================================================
+# 本地模拟 LLM 服务器（api/stub_server.py）
+# ============================================================================
+# 用法：python stub_llm_server.py [--port 8765] [--profile auto|instant|haiku|sonnet|opus]
+#           [--latency-scale X] [--first-token-ms MS] [--per-token-ms MS]
+#           [--rate-limit-rate P] [--overload-rate P] [--stream-error-rate P]
+#           [--rpm N] [--max-concurrency N] [--retry-after S]
+#
+# 另开终端，把网关指向它（Key 任意，不会发往真实 API）：
+#   LLM_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=stub python game_loop_v3.py
+#   LLM_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=stub python benchmark_pipeline.py --transport live
+# ============================================================================
+
+import sys
+
+from api.stub_server import main
+
+
+if __name__ == "__main__":
+    sys.exit(main())
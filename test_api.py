@@ -1,10 +1,9 @@
 # test_api.py - 角色API测试脚本
-import anthropic
 import json
 import yaml
 from pathlib import Path
-from config import get_api_key, MODEL, MAX_TOKENS
-ANTHROPIC_API_KEY = get_api_key("character")
+from config import MODEL, MAX_TOKENS
+from api.llm_gateway import get_gateway
 
 def load_yaml(filepath):
     """加载YAML文件"""
@@ -100,8 +99,8 @@ def call_character_api(character_id, player_input):
     print(prompt)
     print("=" * 50)
     
-    # 调用API
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    # 调用API（LLM_TRANSPORT=replay/synthetic 时离线运行）
+    client = get_gateway().client("character")
     
     response = client.messages.create(
         model=MODEL,
@@ -7,6 +7,7 @@ API Key 测试脚本
 
 import anthropic
 from config import API_KEYS, MODEL
+from api.llm_gateway import get_gateway
 
 def test_api_key(key, service_name):
     """测试单个 API Key"""
@@ -14,7 +15,7 @@ def test_api_key(key, service_name):
     print(f"测试 {service_name} API Key")
     print(f"{'='*60}")
 
-    if not key:
+    if not key and not get_gateway().transport.offline:
         print("❌ 未配置 API Key")
         return False
 
@@ -24,7 +25,7 @@ def test_api_key(key, service_name):
     print(f"模型: {MODEL}")
 
     try:
-        client = anthropic.Anthropic(api_key=key)
+        client = get_gateway().client(service_name.lower(), key)  # LLM_TRANSPORT=replay/synthetic 时离线运行
 
         # 发送测试请求
         print("发送测试请求...")
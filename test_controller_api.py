@@ -2,10 +2,10 @@
 中控API测试 - 管理13人位置和行为，生成动态事件
 """
 
-import anthropic
 import json
 from pathlib import Path
-from config import get_api_key, MODEL, MAX_TOKENS, ENABLE_CACHE, OUTPUT_DIR
+from config import MODEL, MAX_TOKENS, ENABLE_CACHE, OUTPUT_DIR
+from api.llm_gateway import get_gateway
 
 
 def load_json(file_path):
@@ -40,7 +40,7 @@ def build_controller_prompt(current_day, character_states):
     prompt = f"""你是中控AI，负责调度13名魔法少女的位置和行为。
 
 【当前时间】
-第{current_day['day']}天 {current_day['time']}
+第{current_day['day']}天 {current_day.get('time', current_day.get('period'))}
 阶段: {current_day['phase']}
 
 【可用位置】
@@ -94,7 +94,7 @@ def main():
     current_day = load_json("world_state/current_day.json")
     character_states = load_json("world_state/character_states.json")
     
-    print(f"   时间: 第{current_day['day']}天 {current_day['time']}")
+    print(f"   时间: 第{current_day['day']}天 {current_day.get('time', current_day.get('period'))}")
     print(f"   角色数: {len(character_states)}")
     
     # 构建prompt
@@ -103,8 +103,7 @@ def main():
     
     # 调用API
     print("\n🚀 调用中控API...")
-    api_key = get_api_key("controller")
-    client = anthropic.Anthropic(api_key=api_key)
+    client = get_gateway().client("controller")  # LLM_TRANSPORT=replay/synthetic 时离线运行
     
     if ENABLE_CACHE:
         response = client.messages.create(
@@ -1,7 +1,6 @@
 # test_director_api.py - 导演API测试脚本
 # 支持Prompt Caching和心跳机制
 
-import anthropic
 import json
 import yaml
 import time
@@ -9,11 +8,12 @@ import threading
 from pathlib import Path
 from datetime import datetime
 from config import (
-    get_api_key, MODEL, MAX_TOKENS,
+    MODEL, MAX_TOKENS,
     CACHE_TTL, HEARTBEAT_INTERVAL,
     ENABLE_CACHE, ENABLE_HEARTBEAT,
     OUTPUT_DIR
 )
+from api.llm_gateway import get_gateway
 
 def load_yaml(filepath):
     """加载YAML文件"""
@@ -119,8 +119,7 @@ class DirectorAPITester:
     """导演API测试器"""
     
     def __init__(self):
-        self.api_key = get_api_key("director")
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        self.client = get_gateway().client("director")  # LLM_TRANSPORT=replay/synthetic 时离线运行
         self.heartbeat_active = False
         self.heartbeat_thread = None
         self.cache_stats = {
@@ -275,7 +274,7 @@ def main():
     scene_info = {
         "location": "庭院",
         "day": current_day["day"],
-        "time": current_day["time"],
+        "time": current_day.get("time", current_day.get("period")),
         "atmosphere": current_day.get("atmosphere", "平静")
     }
     
@@ -0,0 +1,11 @@
+# ============================================================================
+# 单元测试公共设置：让 tests/ 下的测试可以 import 项目根目录的 api / config
+# ============================================================================
+# 用法：python -m pytest -q（项目根目录；pytest.ini 只收集 tests/，
+#       根目录的 test_*.py 是需要 API Key 的手动脚本）
+# ============================================================================
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
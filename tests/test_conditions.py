@@ -0,0 +1,267 @@
+# ============================================================================
+# api/conditions.py：条件语言 / 旧式命名条件 / 依赖键 / ConditionIndex
+# ============================================================================
+
+import pytest
+
+from api.conditions import (
+    ConditionIndex,
+    ConditionState,
+    NAMED_CONDITIONS,
+    compile_condition,
+    evaluate,
+    is_named_condition,
+)
+
+
+def make_state(**day):
+    current_day = {
+        "day": 2,
+        "period": "evening",
+        "phase": "free_time",
+        "player_location": "食堂",
+        "triggered_events": ["opening"],
+        "flags": {"library_clue_found": True, "murder_occurred": False},
+    }
+    current_day.update(day)
+    return ConditionState(
+        current_day=current_day,
+        character_states={
+            "hiro": {"stress": 80, "madness": 40, "affection": 30, "location": "图书室",
+                     "status": "alive", "interactions": 3,
+                     "relationships": {"aima": {"trust": 60}}},
+            "aima": {"stress": 72, "madness": 75, "location": "食堂", "status": "alive"},
+            "hannah": {"stress": 90, "madness": 10, "location": "牢房区", "status": "dead", "alive": False},
+            "player": {"madness": 20},
+        },
+    )
+
+
+# ============================================================================
+# 表达式求值
+# ============================================================================
+# (表达式, 期望结果)
+
+EXPRESSION_CASES = [
+    # current_day 字段 / 默认值 / flags
+    ("day == 2", True),
+    ("day >= 2 and period == evening", True),
+    ("period in [evening, night]", True),
+    ("period not in [evening, night]", False),
+    ("event_count == 0", True),                     # DAY_FIELD_DEFAULTS
+    ("library_clue_found", True),                   # 裸标识符最后查 flags
+    ("flag.library_clue_found and not flag.murder_occurred", True),
+    ("flag.never_set", False),
+    ("seen.opening and not seen.trial", True),
+
+    # 角色属性
+    ("hiro.stress > 75", True),
+    ("hiro.affection == 30 and aima.affection == 50", True),   # affection 缺省 50
+    ("aima.trust == 0", True),                                  # 其余属性缺省 0
+    ("interactions.hiro == 3", True),
+    ("rel.hiro.aima.trust >= 60 and rel.aima.hiro.trust == 0", True),
+
+    # 玩家（player_location 兜底 location）
+    ("player.location == 食堂 and player.madness == 20", True),
+
+    # 计算字段与聚合
+    ("alive_count == 2", True),
+    ("all_alive", False),
+    ("max(all_characters.madness) == 75", True),
+    ("max(alive.stress) == 80", True),
+    ("min(all_characters.stress) == 72", True),
+    ("avg(alive.madness) == 57.5", True),
+    ("count(alive.stress) == 2 and len(all_characters.stress) == 3", True),
+    ("sum(alive.stress) == 152", True),
+
+    # 运算符
+    ("70 <= hiro.stress <= 85", True),              # 比较链
+    ("70 <= hannah.stress <= 85", False),
+    ("hiro.stress - aima.stress == 8", True),
+    ("hiro.stress * 2 / 4 == 40", True),
+    ("-hiro.madness < 0", True),
+    ("not (day == 2 or day == 3)", False),
+    ("day == 1 OR day == 2 AND period == evening", True),
+    ("phase == 'free_time'", True),
+    ("true and not false", True),
+
+    # 求值出错按不满足处理
+    ("unknown_field > 3", False),                   # None 与数字比较
+]
+
+
+@pytest.mark.parametrize("text, expected", EXPRESSION_CASES, ids=[c[0] for c in EXPRESSION_CASES])
+def test_expression(text, expected):
+    condition = compile_condition(text)
+    assert condition.ok, condition.error
+    assert condition(make_state()) is expected
+
+
+def test_empty_condition_is_true():
+    assert evaluate("", make_state()) is True
+    assert evaluate("   ", make_state()) is True
+
+
+@pytest.mark.parametrize("text", ["day ==", "(day == 1", "a.b.c.d.e == 1", "day === 1", "max(day"])
+def test_parse_error_is_false(text):
+    condition = compile_condition(text)
+    assert not condition.ok and condition.error
+    assert condition(make_state()) is False
+
+
+def test_compile_is_cached():
+    assert compile_condition("day == 2") is compile_condition("day == 2")
+
+
+# ============================================================================
+# 占位符
+# ============================================================================
+
+def test_placeholders_use_bindings():
+    condition = compile_condition("{char}.stress > 75 and player.location == {location}")
+    assert condition.placeholders == {"char", "location"}
+    state = make_state()
+    assert condition(state, {"char": "hiro", "location": "食堂"}) is True
+    assert condition(state, {"char": "aima", "location": "食堂"}) is False
+    # 未绑定的占位符 -> 不满足
+    assert condition(state, {}) is False
+    # 未显式传入时使用 state.bindings
+    state.bindings = {"char": "hiro", "location": "食堂"}
+    assert condition(state) is True
+
+
+# ============================================================================
+# 旧式命名条件
+# ============================================================================
+
+NAMED_CASES = [
+    # (命名条件, current_day 覆盖, 期望结果)
+    ("default", {}, True),
+    ("highest_madness_above_70", {}, True),         # aima 75（只看存活角色）
+    ("player_madness_above_80", {}, False),
+    ("player_at_library", {}, False),
+    ("player_at_library", {"player_location": "图书室"}, True),
+    ("day3_night_no_murder", {}, False),
+    ("day3_night_no_murder", {"day": 3, "period": "night"}, True),
+    ("day3_night_no_murder", {"day": 3, "period": "night",
+                              "flags": {"murder_occurred": True}}, False),
+    ("all_stress_70_to_85_and_library_clue_and_all_alive", {}, False),   # hannah 已死
+    # 调查尚未开始（没有 investigation_count）时不算用完
+    ("investigation_count_zero_or_time_expired", {}, False),
+    ("investigation_count_zero_or_time_expired", {"investigation_count": 2}, False),
+    ("investigation_count_zero_or_time_expired", {"investigation_count": 0}, True),
+    ("debate_finished", {"flags": {"debate_finished": True}}, True),
+    ("vote_result_wrong", {}, False),
+    ("flag_library_clue_found", {}, True),
+    ("flag_murder_occurred", {}, False),
+]
+
+
+@pytest.mark.parametrize("name, day, expected", NAMED_CASES,
+                         ids=[f"{c[0]}-{i}" for i, c in enumerate(NAMED_CASES)])
+def test_named_condition(name, day, expected):
+    condition = compile_condition(name)
+    assert condition.ok, condition.error
+    assert condition(make_state(**day)) is expected
+
+
+def test_is_named_condition():
+    assert all(is_named_condition(name) for name in NAMED_CONDITIONS)
+    assert is_named_condition("flag_anything")
+    assert not is_named_condition("day == 1")
+    assert not is_named_condition("unknown_name")
+
+
+# ============================================================================
+# 依赖键
+# ============================================================================
+
+DEPS_CASES = [
+    ("day == 2 and period in [evening, night]",
+     {"day.day", "flag.day", "day.period", "flag.period"}),
+    ("flag.a or seen.opening", {"flag.a", "day.triggered_events"}),
+    ("hiro.stress > 70 and interactions.aima > 1", {"char.hiro.stress", "char.aima.interactions"}),
+    ("rel.hiro.aima.trust > 50", {"char.hiro.relationships"}),
+    ("max(all_characters.madness) > 70", {"char.*.madness"}),
+    ("avg(alive.stress) > 70", {"char.*.stress", "char.*.status"}),
+    ("alive_count == 2 and all_alive", {"char.*.alive", "char.*.status"}),
+    ("player.location == 图书室", {"char.player.location", "day.player_location"}),
+    ("trial_result == wrong_person", {"day.trial_result", "flag.trial_result"}),   # 右侧是字面量
+]
+
+
+@pytest.mark.parametrize("text, deps", DEPS_CASES, ids=[c[0] for c in DEPS_CASES])
+def test_dependencies(text, deps):
+    assert compile_condition(text).dependencies() == deps
+
+
+def test_dependencies_with_placeholders():
+    condition = compile_condition("{char}.stress > 70")
+    assert condition.dependencies({"char": "hiro"}) == {"char.hiro.stress"}
+    assert condition.dependencies() == {"char.*.stress"}
+
+
+# ============================================================================
+# ConditionIndex
+# ============================================================================
+
+def make_index():
+    index = ConditionIndex()
+    index.add("stress", compile_condition("hiro.stress > 75"))
+    index.add("madness", compile_condition("max(all_characters.madness) > 70"))
+    index.add("flag", compile_condition("flag.library_clue_found"))
+    index.add("bound", compile_condition("{char}.stress > 75"), {"char": "aima"})
+    return index
+
+
+def evaluate_all(index, state):
+    return {key: index.evaluate(key, state) for key in ("stress", "madness", "flag", "bound")}
+
+
+def test_index_caches_until_invalidated():
+    index, state = make_index(), make_state()
+    assert evaluate_all(index, state) == {"stress": True, "madness": True, "flag": True, "bound": False}
+    assert index.stats == {"evaluated": 4, "skipped": 0}
+
+    # 未失效时直接返回缓存（即使文档已变）
+    state.character_states["hiro"]["stress"] = 10
+    assert evaluate_all(index, state)["stress"] is True
+    assert index.stats == {"evaluated": 4, "skipped": 4}
+
+
+@pytest.mark.parametrize("changes, recomputed", [
+    (["char.hiro.stress"], {"stress"}),
+    (["char.aima.stress"], {"bound"}),
+    (["char.hannah.madness"], {"madness"}),          # 命中通配依赖 char.*.madness
+    (["flag.library_clue_found"], {"flag"}),
+    (["flag.other", "day.day"], set()),
+    (["char.hiro.location"], set()),
+    (["*"], {"stress", "madness", "flag", "bound"}),
+])
+def test_index_invalidates_only_affected(changes, recomputed):
+    index, state = make_index(), make_state()
+    evaluate_all(index, state)
+    before = index.stats["evaluated"]
+    index.invalidate(changes)
+    evaluate_all(index, state)
+    assert index.stats["evaluated"] - before == len(recomputed)
+
+
+def test_index_sees_new_state_after_invalidate():
+    index, state = make_index(), make_state()
+    evaluate_all(index, state)
+    state.character_states["hiro"]["stress"] = 10
+    index.invalidate(["char.hiro.stress"])
+    assert index.evaluate("stress", state) is False
+
+
+def test_index_uncached_evaluation_does_not_store():
+    index, state = make_index(), make_state()
+    assert index.evaluate("stress", state) is True
+
+    snapshot = make_state()
+    snapshot.character_states["hiro"]["stress"] = 10
+    assert index.evaluate("stress", snapshot, cached=False) is False
+    # 缓存仍是原状态的结果
+    assert index.evaluate("stress", state) is True
+    assert index.stats == {"evaluated": 2, "skipped": 1}
@@ -0,0 +1,71 @@
+# ============================================================================
+# api/jp_translator.py：批量译文与台词的对应
+# ============================================================================
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from api.jp_translator import JapaneseTranslator, match_translations
+from api.llm_gateway import Completion
+
+
+# (说明, 模型输出, 批次句数, 期望的 {下标: 日文})
+MATCH_CASES = [
+    ("按编号", {"1": "あ", "2": "い", "3": "う"}, 3, {0: "あ", 1: "い", 2: "う"}),
+    ("编号乱序", {"3": "う", "1": "あ", "2": "い"}, 3, {0: "あ", 1: "い", 2: "う"}),
+    ("跳过一句只丢那一句", {"1": "あ", "3": "う"}, 3, {0: "あ", 2: "う"}),
+    ("包装", {"lines": {"1": "あ", "2": "い"}}, 2, {0: "あ", 1: "い"}),
+    ("越界编号与空译文忽略", {"0": "x", "1": " ", "2": "い", "4": "x"}, 3, {1: "い"}),
+    ("数组句数一致按位置", ["あ", "い"], 2, {0: "あ", 1: "い"}),
+    ("数组少一句整批作废", ["あ", "う"], 3, {}),
+    ("数组多一句整批作废", ["あ", "い", "う"], 2, {}),
+    ("包装的数组", {"lines": ["あ", "い"]}, 2, {0: "あ", 1: "い"}),
+    ("无法识别", "あ", 1, {}),
+]
+
+
+@pytest.mark.parametrize("translated, count, expected", [c[1:] for c in MATCH_CASES],
+                         ids=[c[0] for c in MATCH_CASES])
+def test_match_translations(translated, count, expected):
+    assert match_translations(translated, count) == expected
+
+
+class FakeGateway:
+    """只应答第一次请求（get() 对没有译文的台词单独重试时失败，回退中文）"""
+
+    def __init__(self, output):
+        self.outputs = [output]
+        self.forgotten = []
+
+    def create_text(self, role, **request):
+        if not self.outputs:
+            raise RuntimeError("没有更多应答")
+        return Completion(text=json.dumps(self.outputs.pop(), ensure_ascii=False), stop_reason="end_turn")
+
+    def forget(self, completion):
+        self.forgotten.append(completion)
+
+
+def translate(output):
+    translator = JapaneseTranslator()
+    translator.gateway = FakeGateway(output)
+    lines = [SimpleNamespace(speaker="hiro", text_cn=text, text_jp="") for text in ("甲", "乙", "丙")]
+    try:
+        return translator, translator.translate(lines, timeout=5)
+    finally:
+        translator.close()
+
+
+def test_skipped_line_does_not_shift_later_lines():
+    translator, texts = translate({"1": "A", "3": "C"})
+    assert texts == ["A", "乙", "C"]              # 乙没有译文，回退中文（下次重试）
+    assert len(translator._done) == 2
+    assert translator.gateway.forgotten           # 不完整的批次不留在响应缓存里
+
+
+def test_short_array_is_rejected_whole():
+    translator, texts = translate(["A", "C"])
+    assert texts == ["甲", "乙", "丙"]
+    assert translator._done == {}
@@ -0,0 +1,189 @@
+# ============================================================================
+# api/utils.py：parse_json_lenient / parse_json_with_diagnostics / StreamingJSONScanner
+# ============================================================================
+
+import json
+
+import pytest
+
+from api.utils import StreamingJSONScanner, parse_json_lenient, parse_json_with_diagnostics
+
+
+# ============================================================================
+# parse_json_lenient
+# ============================================================================
+# (说明, 输入, 期望的 value, 期望的 truncated, 期望的 repairs)
+
+LENIENT_CASES = [
+    # 格式正确
+    ("格式正确", '{"a": 1, "b": [true, null]}', {"a": 1, "b": [True, None]}, False, []),
+    ("数组顶层", '[1, "x", {"k": []}]', [1, "x", {"k": []}], False, []),
+    ("转义引号", '{"a": "x\\"y"}', {"a": 'x"y'}, False, []),
+    ("字符串内的中文标点原样保留", '{"t": "冒号：逗号，原样"}', {"t": "冒号：逗号，原样"}, False, []),
+    ("顶层值之后的内容忽略", '{"a": 1} {"b": 2}', {"a": 1}, False, []),
+
+    # 代码块 / 说明文字
+    ("代码块", '```json\n{"a": 1}\n```', {"a": 1}, False, ["leading_text"]),
+    ("前后说明文字", '好的：{"a": 1} 希望符合要求', {"a": 1}, False, ["leading_text"]),
+    ("说明文字+尾部逗号", '好的：\n```json\n{"a": [1, 2,]}\n```',
+     {"a": [1, 2]}, False, ["leading_text", "trailing_text", "trailing_comma"]),
+
+    # 字符串外的修正
+    ("+号数字", '{"stress": +5, "madness": -3}', {"stress": 5, "madness": -3}, False, ["plus_sign"]),
+    ("+号数字（字符串内的+号保留）", '{"t": "a+b", "stress": +5, "x": [+1, "+"]}',
+     {"t": "a+b", "stress": 5, "x": [1, "+"]}, False, ["plus_sign"]),
+    ("尾部逗号", '{"a": [1, 2,], "b": {"c": 1,},}', {"a": [1, 2], "b": {"c": 1}}, False, ["trailing_comma"]),
+    ("全角冒号逗号与中文引号", '{"emotion"：“calm”，"x": 1}',
+     {"emotion": "calm", "x": 1}, False, ["fullwidth_punctuation", "fullwidth_quote"]),
+
+    # 字符串内的问题
+    ("未转义引号", '{"text_cn": "她说"好"。", "e": 1}', {"text_cn": '她说"好"。', "e": 1}, False, ["unescaped_quote"]),
+    ("多处未转义引号与转义", '{"a": "他"说"了", "b": "x\\"y", "c": "又"一"处"}',
+     {"a": '他"说"了', "b": 'x"y', "c": '又"一"处'}, False, ["unescaped_quote"]),
+    ("非法转义", '{"a": "bad \\q escape"}', {"a": "bad \\q escape"}, False, ["invalid_escape"]),
+
+    # 截断
+    ("截断在对象中", '{"beats": [{"id": 1}, {"id": 2', {"beats": [{"id": 1}, {"id": 2}]}, True, []),
+    ("截断在字符串中", '{"a": "未闭合的字', {"a": "未闭合的字"}, True, []),
+    ("截断在冒号后（键被丢弃）", '{"a": 1, "b":', {"a": 1}, True, []),
+    ("截断在键后（键被丢弃）", '{"a": 1, "b"', {"a": 1}, True, []),
+    ("截断的数组", '[1, 2, 3', [1, 2, 3], True, []),
+    ("截断+尾部逗号", '{"a": [1, 2,', {"a": [1, 2]}, True, []),
+    ("截断在未转义引号之后", '{"a": 1, "t": "她说"好"。', {"a": 1, "t": '她说"好"。'}, True, ["unescaped_quote"]),
+    ("截断在中文引号字符串中", '{"a": 1, "emotion"：“pea', {"a": 1, "emotion": "pea"}, True,
+     ["fullwidth_punctuation", "fullwidth_quote"]),
+
+    # 括号错配
+    ("括号错配", '{"a": [1, 2}', {"a": [1, 2]}, False, ["mismatched_bracket"]),
+]
+
+
+@pytest.mark.parametrize(
+    "text, value, truncated, repairs",
+    [case[1:] for case in LENIENT_CASES],
+    ids=[case[0] for case in LENIENT_CASES],
+)
+def test_parse_json_lenient(text, value, truncated, repairs):
+    result = parse_json_lenient(text)
+    assert result.value == value
+    assert result.truncated == truncated
+    assert result.repairs == repairs
+
+
+@pytest.mark.parametrize("text", ["", "没有 JSON", "```\n```"])
+def test_parse_json_lenient_without_json(text):
+    result = parse_json_lenient(text)
+    assert result.value is None
+    assert result.truncated is False
+
+
+def test_parse_json_lenient_matches_json_loads_on_valid_input():
+    obj = {"beats": [{"beat_id": "beat_1", "dialogue": [
+        {"speaker": "hiro", "text_cn": "...你到底在隐瞒什么？\"别\"以为", "emotion": "suspicious"},
+        {"speaker": "narrator", "text_cn": "午后的阳光\n透过高窗", "stress": -3},
+    ]}]}
+    for indent in (None, 2):
+        text = json.dumps(obj, ensure_ascii=False, indent=indent)
+        result = parse_json_lenient(text)
+        assert result.value == json.loads(text)
+        assert result.repairs == [] and result.truncated is False
+
+
+def test_parse_json_with_diagnostics(capsys):
+    assert parse_json_with_diagnostics('{"a": 1') == {"a": 1}
+    assert "截断" in capsys.readouterr().out
+    with pytest.raises(json.JSONDecodeError):
+        parse_json_with_diagnostics("没有 JSON")
+
+
+# ============================================================================
+# StreamingJSONScanner
+# ============================================================================
+
+SCENE = {
+    "scene_id": "s1",
+    "beats": [
+        {"beat_id": "beat_1", "dialogue": [
+            {"speaker": "aima", "text_cn": "啊，希罗...早上好。", "emotion": "nervous"},
+            {"speaker": "hiro", "text_cn": "\"别\"以为我看不出来 {[", "emotion": "suspicious"},
+        ]},
+        {"beat_id": "beat_2", "dialogue": [
+            {"speaker": "narrator", "text_cn": "转义 \\ 反斜杠", "emotion": "peaceful"},
+        ]},
+    ],
+}
+WATCH = [("beats", "*", "dialogue", "*")]
+EXPECTED = [
+    (("beats", b, "dialogue", d), line)
+    for b, beat in enumerate(SCENE["beats"])
+    for d, line in enumerate(beat["dialogue"])
+]
+
+
+def _feed(text, size):
+    scanner = StreamingJSONScanner(WATCH)
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(scanner.feed(text[i:i + size]))
+    return scanner, events
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_scanner_split_chunks(size):
+    text = "```json\n" + json.dumps(SCENE, ensure_ascii=False, indent=2) + "\n```"
+    scanner, events = _feed(text, size)
+    assert events == EXPECTED
+    assert scanner.finished
+    # 顶层值闭合后的片段不再收下
+    assert text.startswith(scanner.text) and "}" in scanner.text[-size:]
+
+
+def test_scanner_watches_nested_paths_only():
+    scanner = StreamingJSONScanner([("beats", "*")])
+    events = scanner.feed(json.dumps(SCENE, ensure_ascii=False))
+    assert [path for path, _ in events] == [("beats", 0), ("beats", 1)]
+    assert events[1][1] == SCENE["beats"][1]
+
+
+def test_scanner_falls_back_to_lenient_parse():
+    text = '{"beats": [{"dialogue": [{"speaker": "hiro", "stress": +3,}]}]}'
+    _, events = _feed(text, 5)
+    assert events == [(("beats", 0, "dialogue", 0), {"speaker": "hiro", "stress": 3})]
+
+
+def test_scanner_truncated_stream_delivers_closed_items_only():
+    text = json.dumps(SCENE, ensure_ascii=False)
+    cut = text.index("narrator")
+    scanner, events = _feed(text[:cut], 4)
+    assert events == EXPECTED[:2]
+    assert not scanner.finished
+
+
+def test_scanner_ignores_input_after_top_level_value():
+    scanner = StreamingJSONScanner(WATCH)
+    scanner.feed(json.dumps(SCENE, ensure_ascii=False))
+    assert scanner.finished
+    assert scanner.feed('{"beats": [{"dialogue": [{}]}]}') == []
+
+
+# 续写：预填去掉末尾空白后，模型从去掉的地方接着输出
+# (说明, 断开前, 续写)
+CONTINUATION_CASES = [
+    ("字符串中的空格后断开", '{"beats": [{"dialogue": [{"text_cn": "你好 ', ' 世界"}]}]}'),
+    ("字符串中的多个空格后断开", '{"beats": [{"dialogue": [{"text_cn": "你好   ', '   世界"}]}]}'),
+    ("字符串外的空白后断开", '{"beats": [{"dialogue": [{"text_cn": "你好"},\n  ', '\n  {"text_cn": "世界"}]}]}'),
+    ("转义的反斜杠后断开", '{"beats": [{"dialogue": [{"text_cn": "a\\\\ ', ' b"}]}]}'),
+]
+
+
+@pytest.mark.parametrize("head, tail", [c[1:] for c in CONTINUATION_CASES],
+                         ids=[c[0] for c in CONTINUATION_CASES])
+def test_scanner_rstrip_before_continuation(head, tail):
+    scanner = StreamingJSONScanner(WATCH)
+    events = scanner.feed(head)
+    scanner.rstrip()
+    assert scanner.text == head.rstrip()
+    # 续写从预填的末尾接着输出（模型会把去掉的空白再输出一遍），空白不重复
+    events += scanner.feed(tail)
+    expected = json.loads(head + tail[len(head) - len(head.rstrip()):])
+    assert [value for _, value in events] == expected["beats"][0]["dialogue"]
@@ -0,0 +1,262 @@
+# ============================================================================
+# api/llm_scheduler.py：令牌桶 / 优先级 / 会话轮转 / 投机请求取消 / 限流
+# ============================================================================
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from api.llm_scheduler import (
+    KeyBuckets,
+    LLMScheduler,
+    RequestCancelled,
+    TokenBucket,
+    current_priority,
+    current_session,
+    llm_request,
+)
+
+ROLE = "character"
+KEY = "test-key"    # 显式 Key：令牌桶上限取 rate_limits["explicit"]，与本机的 API_KEY_POOLS 无关
+
+
+# ============================================================================
+# TokenBucket / KeyBuckets
+# ============================================================================
+
+def make_bucket(per_minute, now=0.0):
+    bucket = TokenBucket(per_minute)
+    bucket._updated = now
+    return bucket
+
+
+TOKEN_BUCKET_CASES = [
+    # (每分钟上限, 先取走, 经过秒数, 需要, 期望等待秒数)
+    (60, 0, 0, 1, 0.0),           # 满桶
+    (60, 60, 0, 1, 1.0),          # 空桶，1 个/秒回填
+    (60, 60, 0.5, 1, 0.5),
+    (60, 60, 5, 1, 0.0),          # 已回填 5 个
+    (60, 90, 0, 1, 31.0),         # 透支 30 个
+    (120, 120, 0, 30, 15.0),
+    (60, 0, 0, 1000, 0.0),        # 超过容量的按满桶算
+    (60, 1, 0, 1000, 1.0),
+    (None, 10 ** 9, 0, 10 ** 9, 0.0),   # 不限
+]
+
+
+@pytest.mark.parametrize("per_minute, taken, elapsed, amount, expected", TOKEN_BUCKET_CASES)
+def test_token_bucket_wait_time(per_minute, taken, elapsed, amount, expected):
+    bucket = make_bucket(per_minute)
+    bucket.take(taken)
+    assert bucket.wait_time(amount, elapsed) == pytest.approx(expected)
+
+
+def test_token_bucket_refill_and_give_cap_at_capacity():
+    bucket = make_bucket(60)
+    bucket.take(30)
+    assert bucket.fraction(0) == pytest.approx(0.5)
+    assert bucket.fraction(600) == pytest.approx(1.0)
+    bucket.give(100)
+    assert bucket.level == pytest.approx(60)
+
+
+def test_token_bucket_fraction_clamps_overdraft():
+    bucket = make_bucket(60)
+    bucket.take(100)
+    assert bucket.fraction(0) == 0.0
+    assert make_bucket(None).fraction(0) == 1.0
+
+
+def test_key_buckets_wait_for_the_slowest_bucket():
+    buckets = KeyBuckets("k", {"requests": 60, "input_tokens": 600, "output_tokens": 60})
+    for bucket in (buckets.requests, buckets.input_tokens, buckets.output_tokens):
+        bucket._updated = 0.0
+    assert buckets.wait_time(100, 0) == 0.0
+    buckets.input_tokens.take(600)
+    assert buckets.wait_time(100, 0) == pytest.approx(10.0)
+    buckets.output_tokens.take(120)               # 输出 token 事后扣除：余额回正即可
+    assert buckets.wait_time(100, 0) == pytest.approx(61.0)
+    assert buckets.headroom(0) == 0.0
+
+
+# ============================================================================
+# llm_request
+# ============================================================================
+
+def test_llm_request_nests_and_restores():
+    assert (current_priority(), current_session()) == ("interactive", None)
+    with llm_request(priority="speculative", session="s1"):
+        with llm_request(priority="offline"):
+            assert (current_priority(), current_session()) == ("offline", "s1")
+        assert (current_priority(), current_session()) == ("speculative", "s1")
+    assert (current_priority(), current_session()) == ("interactive", None)
+
+
+def test_llm_request_rejects_unknown_priority():
+    with pytest.raises(ValueError):
+        with llm_request(priority="urgent"):
+            pass
+
+
+# ============================================================================
+# 优先级 / 会话轮转 / 取消
+# ============================================================================
+
+def make_scheduler(limits=None, concurrency=1):
+    return LLMScheduler(concurrency={ROLE: concurrency}, rate_limits={"explicit": limits or {}},
+                        speculative_headroom=0.2)
+
+
+def queued(scheduler, priority):
+    return scheduler.report()["queued"].get(ROLE, {}).get(priority, 0)
+
+
+def start_waiter(scheduler, priority, session, label, order, errors):
+    """在线程中排队；等它真正进入队列后返回"""
+    before = queued(scheduler, priority)
+
+    def run():
+        with llm_request(priority=priority, session=session):
+            try:
+                ticket = scheduler.acquire(ROLE, KEY)
+            except RequestCancelled:
+                errors.append(label)
+                return
+        order.append(label)
+        scheduler.release(ticket)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while queued(scheduler, priority) <= before:
+        assert time.monotonic() < deadline, f"{label} 没有进入队列"
+        time.sleep(0.001)
+    return thread
+
+
+def run_queue(scheduler, waiters):
+    """占住唯一的名额，按顺序排队 waiters，再放开名额；返回拿到名额的顺序与被取消的请求"""
+    order, errors = [], []
+    ticket = scheduler.acquire(ROLE, KEY)
+    threads = [start_waiter(scheduler, p, s, label, order, errors) for p, s, label in waiters]
+    scheduler.release(ticket)
+    for thread in threads:
+        thread.join(5)
+    return order, errors
+
+
+def test_higher_priority_goes_first():
+    scheduler = make_scheduler()
+    order, errors = run_queue(scheduler, [
+        ("offline", None, "offline"),
+        ("choice", None, "choice"),
+        ("interactive", None, "interactive"),
+    ])
+    assert order == ["interactive", "choice", "offline"]
+    assert errors == []
+
+
+def test_sessions_take_turns_within_a_priority():
+    scheduler = make_scheduler()
+    order, _ = run_queue(scheduler, [
+        ("interactive", "A", "A1"),
+        ("interactive", "A", "A2"),
+        ("interactive", "A", "A3"),
+        ("interactive", "B", "B1"),
+    ])
+    assert order == ["A1", "B1", "A2", "A3"]
+
+
+def test_queued_speculative_is_cancelled_by_interactive():
+    scheduler = make_scheduler()
+    order, errors = run_queue(scheduler, [
+        ("speculative", "A", "speculative"),
+        ("interactive", "B", "interactive"),
+    ])
+    assert order == ["interactive"]
+    assert errors == ["speculative"]
+    assert scheduler.report()["classes"]["speculative"]["cancelled"] == 1
+
+
+def test_new_speculative_is_cancelled_while_interactive_waits():
+    scheduler = make_scheduler()
+    ticket = scheduler.acquire(ROLE, KEY)
+    order, errors = [], []
+    thread = start_waiter(scheduler, "interactive", None, "interactive", order, errors)
+    with llm_request(priority="speculative"):
+        with pytest.raises(RequestCancelled):
+            scheduler.acquire(ROLE, KEY)
+    scheduler.release(ticket)
+    thread.join(5)
+    assert order == ["interactive"]
+
+
+def test_speculative_runs_when_idle():
+    scheduler = make_scheduler()
+    with llm_request(priority="speculative"):
+        with scheduler.slot(ROLE, KEY) as ticket:
+            assert ticket.priority == "speculative"
+    assert scheduler.report()["active"] == {ROLE: 0}
+
+
+def test_speculative_is_cancelled_when_headroom_is_low():
+    scheduler = make_scheduler({"requests": 10}, concurrency=10)
+    for _ in range(9):              # 余量 10%
+        with scheduler.slot(ROLE, KEY):
+            pass
+    with llm_request(priority="speculative"):
+        with pytest.raises(RequestCancelled):
+            scheduler.acquire(ROLE, KEY)
+    # 非投机请求不受影响
+    with llm_request(priority="offline"):
+        with scheduler.slot(ROLE, KEY):
+            pass
+
+
+# ============================================================================
+# 限流
+# ============================================================================
+
+def usage(**tokens):
+    return SimpleNamespace(usage=SimpleNamespace(**tokens))
+
+
+def test_record_corrects_input_and_charges_output():
+    scheduler = make_scheduler({"input_tokens": 6000, "output_tokens": 6000})
+    request = {"messages": [{"role": "user", "content": "x" * 4000}]}
+    with scheduler.slot(ROLE, KEY, request) as ticket:
+        assert ticket.input_estimate > 1000
+        assert scheduler.report()["buckets"]["explicit"]["input_tokens"] < 0.9
+        ticket.record(usage(input_tokens=0, cache_read_input_tokens=5000, output_tokens=3000))
+        ticket.record(usage(output_tokens=3000))   # 每张票只记一次
+    buckets = scheduler.report()["buckets"]["explicit"]
+    assert buckets["input_tokens"] == pytest.approx(1.0, abs=0.01)
+    assert buckets["output_tokens"] == pytest.approx(0.5, abs=0.01)
+
+
+def test_throttled_request_waits_for_refill():
+    # 输出 token 每秒回填 10 个；透支 5 个后下一个请求约等 0.6 秒
+    scheduler = make_scheduler({"output_tokens": 600})
+
+    async def main():
+        async with scheduler.aslot(ROLE, KEY) as ticket:
+            ticket.record(usage(output_tokens=605))
+
+        # 排队中被取消：移出队列，不占名额
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.aacquire(ROLE, KEY), 0.05)
+        assert scheduler.report()["queued"] == {ROLE: {}}
+        assert scheduler.report()["active"] == {ROLE: 0}
+
+        start = time.monotonic()
+        async with scheduler.aslot(ROLE, KEY) as ticket:
+            waited = time.monotonic() - start
+        return waited, ticket
+
+    waited, ticket = asyncio.run(main())
+    assert 0.3 < waited < 3
+    assert ticket.wait_ms > 300
+    assert scheduler.report()["buckets"]["explicit"]["throttled"] == 1